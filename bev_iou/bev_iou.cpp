@@ -3,14 +3,20 @@
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#include <algorithm>
+#include <vector>
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
 #include <cuda.h>
 #include <cuda_runtime_api.h>
+#endif
 
 using namespace tensorflow;
 
 #define DIVUP(m,n) ((m) / (n) + ((m) % (n) > 0))
 
+#ifdef WITH_CUDA
 #define CHECK_ERROR(ans) { gpuAssert((ans), __FILE__, __LINE__); }
 inline void gpuAssert(cudaError_t code, const char *file, int line, bool abort=true)
 {
@@ -20,6 +26,7 @@ inline void gpuAssert(cudaError_t code, const char *file, int line, bool abort=t
       if (abort) exit(code);
    }
 }
+#endif
 
 
 const int THREADS_PER_BLOCK_NMS = sizeof(unsigned long long) * 8;
@@ -37,6 +44,52 @@ REGISTER_OP("OrientedNMS")
       return Status::OK();
   });
 
+int oriented_nms_cpu(const float *boxes, const int boxes_num, const float nms_overlap_thresh, int *keep);
+
+class OrientedNMSCpuOp: public OpKernel{
+  public:
+    explicit OrientedNMSCpuOp(OpKernelConstruction* context):OpKernel(context) {
+        OP_REQUIRES_OK(context,
+                    context->GetAttr("nms_threshold", &nms_threshold));
+        // Check that nms_threshold is positive
+        OP_REQUIRES(context, nms_threshold >= 0,
+                    errors::InvalidArgument("Need nms_threshold >= 0, got ",
+                                            nms_threshold));
+    }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& boxes = context->input(0);  // (N, 5)
+
+      OP_REQUIRES(context, boxes.dims()==2 && boxes.dim_size(0) > 0 && boxes.dim_size(1) == 5, errors::InvalidArgument("OrientendNMS expects (N, 5) boxes shape"));
+      const int boxes_num = boxes.dim_size(0);
+
+      auto boxes_flat = boxes.flat<float>();
+      const float * boxes_data = &(boxes_flat(0));
+
+      Tensor* keep = NULL;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{boxes_num}, &keep));
+
+      auto keep_flat = keep->flat<int32>();
+      int* keep_data = &(keep_flat(0));
+
+      // Same greedy suppression as the GPU op, the IoUs are only computed
+      // between the kept boxes and the boxes left after them
+      int num_to_keep = oriented_nms_cpu(boxes_data, boxes_num, nms_threshold, keep_data);
+
+      // pad the rest of keep data with the first value of selected
+      for (; num_to_keep < boxes_num; num_to_keep++) {
+        keep_data[num_to_keep] = keep_data[0];
+      }
+    }
+
+    private:
+    float nms_threshold;
+};
+
+REGISTER_KERNEL_BUILDER(Name("OrientedNMS").Device(DEVICE_CPU),OrientedNMSCpuOp);
+
+#ifdef WITH_CUDA
 void oriented_nms_gpu(const float* boxes, unsigned long long *mask,
                 const int boxes_num, const float nms_overlap_thresh);
 
@@ -122,6 +175,7 @@ class OrientedNMSOp: public OpKernel{
 };
 
 REGISTER_KERNEL_BUILDER(Name("OrientedNMS").Device(DEVICE_GPU),OrientedNMSOp);
+#endif
 
 REGISTER_OP("ComputeBevIOU")
   .Input("proposals: float32")
@@ -141,6 +195,51 @@ REGISTER_OP("ComputeBevIOU")
       return Status::OK();
   });
 
+void compute_bev_iou_cpu(const int a_start, const int a_end, const float *boxes_a,
+              const int num_b, const float *boxes_b, float *ans_overlap, float *ans_iou);
+
+class ComputeBevIOUCpuOp: public OpKernel{
+  public:
+    explicit ComputeBevIOUCpuOp(OpKernelConstruction* context):OpKernel(context) { }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& proposals = context->input(0);  // (N, 5)
+      const Tensor& gt_bboxes = context->input(1);  // (M, 5)
+
+      OP_REQUIRES(context, proposals.dims()==2 && proposals.dim_size(0) > 0 && proposals.dim_size(1) == 5, errors::InvalidArgument("ComputeIOU3D expects (N, 7) proposals shape"));
+      OP_REQUIRES(context, gt_bboxes.dims()==2 && gt_bboxes.dim_size(0) > 0 && gt_bboxes.dim_size(1) == 5, errors::InvalidArgument("ComputeIOU3D expects (M, 7) gt_bboxes shape"));
+      const int num_proposals = proposals.dim_size(0);
+      const int num_gt = gt_bboxes.dim_size(0);
+
+      auto proposals_flat = proposals.flat<float>();
+      auto gt_bboxes_flat = gt_bboxes.flat<float>();
+      const float * proposals_data = &(proposals_flat(0));
+      const float * gt_bboxes_data = &(gt_bboxes_flat(0));
+
+      Tensor* overlap_area = nullptr;
+      Tensor* bev_iou = nullptr;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{num_proposals, num_gt}, &overlap_area));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{num_proposals, num_gt}, &bev_iou));
+
+      auto overlap_area_flat = overlap_area->flat<float>();
+      auto bev_iou_flat = bev_iou->flat<float>();
+      float* overlap_area_data = &(overlap_area_flat(0));
+      float* bev_iou_data = &(bev_iou_flat(0));
+
+      // Rows of proposals are split between the worker threads
+      auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+      auto compute_rows = [&](int64 start, int64 end) {
+        compute_bev_iou_cpu(start, end, proposals_data, num_gt, gt_bboxes_data, overlap_area_data, bev_iou_data);
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers,
+            num_proposals, 200 * num_gt, compute_rows);
+    }
+};
+
+REGISTER_KERNEL_BUILDER(Name("ComputeBevIOU").Device(DEVICE_CPU),ComputeBevIOUCpuOp);
+
+#ifdef WITH_CUDA
 void compute_bev_iou_gpu(const int num_a, const float* boxes_a, 
                 const int num_b, const float* boxes_b, float* ans_overlap, float* ans_iou);
 
@@ -179,4 +278,281 @@ class ComputeBevIOUOp: public OpKernel{
 };
 
 REGISTER_KERNEL_BUILDER(Name("ComputeBevIOU").Device(DEVICE_GPU),ComputeBevIOUOp);
+#endif
+
+REGISTER_OP("BatchOrientedNMS")
+  .Attr("nms_threshold: float")
+  .Input("boxes: float32")
+  .Input("num_valid: int32")
+  .Output("keep: int32")
+  .Output("num_keep: int32")
+  .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+      ::tensorflow::shape_inference::ShapeHandle boxes_dims; // (B, N, 5)
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 3, &boxes_dims));
+      ::tensorflow::shape_inference::ShapeHandle num_valid_dims; // (B)
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 1, &num_valid_dims));
+
+      c->set_output(0, c->MakeShape({c->Dim(boxes_dims, 0), c->Dim(boxes_dims, 1)}));
+      c->set_output(1, c->MakeShape({c->Dim(boxes_dims, 0)}));
+      return Status::OK();
+  });
+
+// Checks the boxes and their numbers of valid boxes of the batched NMS
+void CheckBatchOrientedNMSInputs(OpKernelContext * context, const Tensor& boxes, const Tensor& num_valid) {
+  OP_REQUIRES(context, boxes.dims()==3 && boxes.dim_size(1) > 0 && boxes.dim_size(2) == 5, errors::InvalidArgument("BatchOrientedNMS expects (B, N, 5) boxes shape"));
+  OP_REQUIRES(context, num_valid.dims()==1 && num_valid.dim_size(0) == boxes.dim_size(0), errors::InvalidArgument("BatchOrientedNMS expects (B) num_valid shape"));
+  auto num_valid_flat = num_valid.flat<int32>();
+  for (int b = 0; b < num_valid.dim_size(0); b++) {
+    OP_REQUIRES(context, num_valid_flat(b) >= 0 && num_valid_flat(b) <= boxes.dim_size(1),
+                errors::InvalidArgument("BatchOrientedNMS expects num_valid in [0, N], got ", num_valid_flat(b)));
+  }
+}
+
+class BatchOrientedNMSCpuOp: public OpKernel{
+  public:
+    explicit BatchOrientedNMSCpuOp(OpKernelConstruction* context):OpKernel(context) {
+        OP_REQUIRES_OK(context,
+                    context->GetAttr("nms_threshold", &nms_threshold));
+        // Check that nms_threshold is positive
+        OP_REQUIRES(context, nms_threshold >= 0,
+                    errors::InvalidArgument("Need nms_threshold >= 0, got ",
+                                            nms_threshold));
+    }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& boxes = context->input(0);  // (B, N, 5)
+      const Tensor& num_valid = context->input(1);  // (B)
+      CheckBatchOrientedNMSInputs(context, boxes, num_valid);
+      if (!context->status().ok()) return;
+      const int batch_size = boxes.dim_size(0);
+      const int boxes_num = boxes.dim_size(1);
+
+      const float * boxes_data = boxes.flat<float>().data();
+      const int * num_valid_data = num_valid.flat<int32>().data();
+
+      Tensor* keep = NULL;
+      Tensor* num_keep = NULL;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{batch_size, boxes_num}, &keep));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{batch_size}, &num_keep));
+      int* keep_data = keep->flat<int32>().data();
+      int* num_keep_data = num_keep->flat<int32>().data();
+
+      // Batch items are split between the worker threads. The greedy
+      // suppression of an item is sequential, so the wall time is about
+      // ceil(B / num_threads) times the time of one item: it only grows
+      // sublinearly with the batch size while there are idle threads.
+      auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+      auto nms_batch_items = [&](int64 start, int64 end) {
+        for (int64 b = start; b < end; b++) {
+          int *batch_keep = keep_data + b * boxes_num;
+          int num_to_keep = oriented_nms_cpu(boxes_data + b * boxes_num * 5, num_valid_data[b], nms_threshold, batch_keep);
+          num_keep_data[b] = num_to_keep;
+          // pad the rest of keep data with the first value of selected
+          std::fill(batch_keep + num_to_keep, batch_keep + boxes_num, num_to_keep > 0 ? batch_keep[0] : 0);
+        }
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers,
+            batch_size, 200LL * boxes_num * boxes_num, nms_batch_items);
+    }
+
+    private:
+    float nms_threshold;
+};
+
+REGISTER_KERNEL_BUILDER(Name("BatchOrientedNMS").Device(DEVICE_CPU),BatchOrientedNMSCpuOp);
+
+#ifdef WITH_CUDA
+void batch_oriented_nms_gpu(const float* boxes, unsigned long long *mask,
+                const int batch_size, const int boxes_num, const float nms_overlap_thresh);
+
+class BatchOrientedNMSOp: public OpKernel{
+  public:
+    explicit BatchOrientedNMSOp(OpKernelConstruction* context):OpKernel(context) {
+        OP_REQUIRES_OK(context,
+                    context->GetAttr("nms_threshold", &nms_threshold));
+        // Check that nms_threshold is positive
+        OP_REQUIRES(context, nms_threshold >= 0,
+                    errors::InvalidArgument("Need nms_threshold >= 0, got ",
+                                            nms_threshold));
+    }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& boxes = context->input(0);  // (B, N, 5)
+      const Tensor& num_valid = context->input(1);  // (B), in host memory
+      CheckBatchOrientedNMSInputs(context, boxes, num_valid);
+      if (!context->status().ok()) return;
+      const int batch_size = boxes.dim_size(0);
+      const int boxes_num = boxes.dim_size(1);
+
+      const float * boxes_data = boxes.flat<float>().data();
+      const int * num_valid_data = num_valid.flat<int32>().data();
+
+      Tensor* keep = NULL;
+      Tensor* num_keep = NULL;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{batch_size, boxes_num}, &keep));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{batch_size}, &num_keep));
+      int* keep_data = keep->flat<int32>().data();
+      int* num_keep_data = num_keep->flat<int32>().data();
+      if (batch_size == 0) return;
+
+      // The suppression masks of all the batch items in one launch
+      const int col_blocks = DIVUP(boxes_num, THREADS_PER_BLOCK_NMS);
+      const long long mask_size = (long long)batch_size * boxes_num * col_blocks;
+
+      unsigned long long *mask_data = NULL;
+      CHECK_ERROR(cudaMalloc((void**)&mask_data, mask_size * sizeof(unsigned long long)));
+      batch_oriented_nms_gpu(boxes_data, mask_data, batch_size, boxes_num, nms_threshold);
+
+      std::vector<unsigned long long> mask_cpu(mask_size);
+      CHECK_ERROR(cudaMemcpy(&mask_cpu[0], mask_data, mask_size * sizeof(unsigned long long),
+                            cudaMemcpyDeviceToHost));
+      cudaFree(mask_data);
+
+      // temp cpu data for output
+      std::vector<int> keep_data_cpu(batch_size * boxes_num);
+      std::vector<unsigned long long> remv_cpu(col_blocks);
+
+      for (int b = 0; b < batch_size; b++){
+        const unsigned long long *batch_mask = &mask_cpu[0] + (long long)b * boxes_num * col_blocks;
+        int *batch_keep = &keep_data_cpu[0] + b * boxes_num;
+        std::fill(remv_cpu.begin(), remv_cpu.end(), 0);
+
+        // The boxes past the valid ones are never kept, so their bits
+        // are not looked at
+        int num_to_keep = 0;
+        for (int i = 0; i < num_valid_data[b]; i++){
+          int nblock = i / THREADS_PER_BLOCK_NMS;
+          int inblock = i % THREADS_PER_BLOCK_NMS;
+          if (!(remv_cpu[nblock] & (1ULL << inblock))){
+            batch_keep[num_to_keep] = i;
+            num_to_keep++;
+            const unsigned long long *p = batch_mask + i * col_blocks;
+            for (int j = nblock; j < col_blocks; j++){
+              remv_cpu[j] |= p[j];
+            }
+          }
+        }
+        num_keep_data[b] = num_to_keep;
+
+        // pad the rest of keep data with the first value of selected
+        std::fill(batch_keep + num_to_keep, batch_keep + boxes_num, num_to_keep > 0 ? batch_keep[0] : 0);
+      }
+
+      // copy output from cpu to gpu
+      CHECK_ERROR(cudaMemcpy(keep_data, &keep_data_cpu[0], batch_size * boxes_num * sizeof(int),
+                            cudaMemcpyHostToDevice));
+    }
+
+    private:
+    float nms_threshold;
+};
+
+REGISTER_KERNEL_BUILDER(Name("BatchOrientedNMS").Device(DEVICE_GPU).HostMemory("num_valid").HostMemory("num_keep"),BatchOrientedNMSOp);
+#endif
+
+REGISTER_OP("BatchComputeBevIOU")
+  .Input("proposals: float32")
+  .Input("gt_bboxes: float32")
+  .Output("overlap_area: float32")
+  .Output("bev_iou: float32")
+  .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+      ::tensorflow::shape_inference::ShapeHandle proposals_dims; // (B, N, 5)
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 3, &proposals_dims));
+      ::tensorflow::shape_inference::ShapeHandle gt_bboxes_dims; // (B, M, 5)
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 3, &gt_bboxes_dims));
+
+      ::tensorflow::shape_inference::ShapeHandle iou_dims = c->MakeShape(
+          {c->Dim(proposals_dims, 0), c->Dim(proposals_dims, 1), c->Dim(gt_bboxes_dims, 1)});
+      c->set_output(0, iou_dims);
+      c->set_output(1, iou_dims);
+      return Status::OK();
+  });
+
+// Checks the proposals and gt boxes of the batched IoUs
+void CheckBatchComputeBevIOUInputs(OpKernelContext * context, const Tensor& proposals, const Tensor& gt_bboxes) {
+  OP_REQUIRES(context, proposals.dims()==3 && proposals.dim_size(1) > 0 && proposals.dim_size(2) == 5, errors::InvalidArgument("BatchComputeBevIOU expects (B, N, 5) proposals shape"));
+  OP_REQUIRES(context, gt_bboxes.dims()==3 && gt_bboxes.dim_size(1) > 0 && gt_bboxes.dim_size(2) == 5, errors::InvalidArgument("BatchComputeBevIOU expects (B, M, 5) gt_bboxes shape"));
+  OP_REQUIRES(context, proposals.dim_size(0) == gt_bboxes.dim_size(0), errors::InvalidArgument("BatchComputeBevIOU expects proposals and gt_bboxes of the same batch size"));
+}
+
+class BatchComputeBevIOUCpuOp: public OpKernel{
+  public:
+    explicit BatchComputeBevIOUCpuOp(OpKernelConstruction* context):OpKernel(context) { }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& proposals = context->input(0);  // (B, N, 5)
+      const Tensor& gt_bboxes = context->input(1);  // (B, M, 5)
+      CheckBatchComputeBevIOUInputs(context, proposals, gt_bboxes);
+      if (!context->status().ok()) return;
+      const int batch_size = proposals.dim_size(0);
+      const int num_proposals = proposals.dim_size(1);
+      const int num_gt = gt_bboxes.dim_size(1);
+
+      const float * proposals_data = proposals.flat<float>().data();
+      const float * gt_bboxes_data = gt_bboxes.flat<float>().data();
+
+      Tensor* overlap_area = nullptr;
+      Tensor* bev_iou = nullptr;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{batch_size, num_proposals, num_gt}, &overlap_area));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{batch_size, num_proposals, num_gt}, &bev_iou));
+      float* overlap_area_data = overlap_area->flat<float>().data();
+      float* bev_iou_data = bev_iou->flat<float>().data();
+
+      // Rows of proposals of all the batch items are split between the
+      // worker threads
+      auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+      auto compute_rows = [&](int64 start, int64 end) {
+        for (int64 row = start; row < end; row++) {
+          const int64 b = row / num_proposals;
+          const int a_idx = row % num_proposals;
+          compute_bev_iou_cpu(a_idx, a_idx + 1, proposals_data + b * num_proposals * 5,
+                              num_gt, gt_bboxes_data + b * num_gt * 5,
+                              overlap_area_data + b * num_proposals * num_gt,
+                              bev_iou_data + b * num_proposals * num_gt);
+        }
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers,
+            (int64)batch_size * num_proposals, 200 * num_gt, compute_rows);
+    }
+};
+
+REGISTER_KERNEL_BUILDER(Name("BatchComputeBevIOU").Device(DEVICE_CPU),BatchComputeBevIOUCpuOp);
+
+#ifdef WITH_CUDA
+void batch_compute_bev_iou_gpu(const int batch_size, const int num_a, const float* boxes_a,
+                const int num_b, const float* boxes_b, float* ans_overlap, float* ans_iou);
+
+class BatchComputeBevIOUOp: public OpKernel{
+  public:
+    explicit BatchComputeBevIOUOp(OpKernelConstruction* context):OpKernel(context) { }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& proposals = context->input(0);  // (B, N, 5)
+      const Tensor& gt_bboxes = context->input(1);  // (B, M, 5)
+      CheckBatchComputeBevIOUInputs(context, proposals, gt_bboxes);
+      if (!context->status().ok()) return;
+      const int batch_size = proposals.dim_size(0);
+      const int num_proposals = proposals.dim_size(1);
+      const int num_gt = gt_bboxes.dim_size(1);
+
+      const float * proposals_data = proposals.flat<float>().data();
+      const float * gt_bboxes_data = gt_bboxes.flat<float>().data();
+
+      Tensor* overlap_area = nullptr;
+      Tensor* bev_iou = nullptr;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{batch_size, num_proposals, num_gt}, &overlap_area));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{batch_size, num_proposals, num_gt}, &bev_iou));
+      float* overlap_area_data = overlap_area->flat<float>().data();
+      float* bev_iou_data = bev_iou->flat<float>().data();
+      if (batch_size == 0) return;
+
+      batch_compute_bev_iou_gpu(batch_size, num_proposals, proposals_data, num_gt, gt_bboxes_data, overlap_area_data, bev_iou_data);
+    }
+};
 
+REGISTER_KERNEL_BUILDER(Name("BatchComputeBevIOU").Device(DEVICE_GPU),BatchComputeBevIOUOp);
+#endif
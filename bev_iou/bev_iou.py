@@ -42,6 +42,43 @@ def oriented_nms(boxes, thresh):
 ops.NoGradient("OrientedNMS")
 
 
+def batch_compute_bev_iou(proposals, gt_bboxes):
+    """
+    input:
+        proposals: (B, N, 5), [x1, y1, x2, y2, ry], float32
+        gt_bboxes: (B, M, 5), [x1, y1, x2, y2, ry]  float32
+    output:
+        overlap_area:   (B, N, M)   float32
+        bev_iou:   (B, N, M)   float32
+    """
+
+    overlap_area, bev_iou = bev_iou_lib.batch_compute_bev_iou(proposals, gt_bboxes)
+    return overlap_area, bev_iou
+
+
+ops.NoGradient("BatchComputeBevIOU")
+
+
+def batch_oriented_nms(boxes, num_valid, thresh):
+    """
+    input:
+        boxes: (B, N, 5), [x1, y1, x2, y2, ry], float32, sorted by score
+        num_valid: (B), int32, number of boxes of each batch item, the
+            boxes past them are left out
+    output:
+        keep_idx: (B, N), int32, padded with the first kept index
+        num_keep: (B), int32
+    """
+
+    keep_idxs, num_keep = bev_iou_lib.batch_oriented_nms(
+        boxes, num_valid, nms_threshold=thresh
+    )
+    return keep_idxs, num_keep
+
+
+ops.NoGradient("BatchOrientedNMS")
+
+
 if __name__ == "__main__":
 
     proposals = np.asarray([[0, 0, 1, 1, 0], [2, 2, 3, 3, 0]], dtype=np.float32)
@@ -0,0 +1,248 @@
+// CPU version of the bird's eye view IoU of bev_iou_g.cu, with the same
+// float arithmetic so that both devices give the same results.
+#include <cmath>
+#include <algorithm>
+#include <vector>
+
+const float EPS_CPU = 1e-8;
+
+struct PointCpu {
+    float x, y;
+    PointCpu() {}
+    PointCpu(double _x, double _y){
+        x = _x, y = _y;
+    }
+
+    void set(float _x, float _y){
+        x = _x; y = _y;
+    }
+
+    PointCpu operator +(const PointCpu &b)const{
+        return PointCpu(x + b.x, y + b.y);
+    }
+
+    PointCpu operator -(const PointCpu &b)const{
+        return PointCpu(x - b.x, y - b.y);
+    }
+};
+
+inline float cross_cpu(const PointCpu &a, const PointCpu &b){
+    return a.x * b.y - a.y * b.x;
+}
+
+inline float cross_cpu(const PointCpu &p1, const PointCpu &p2, const PointCpu &p0){
+    return (p1.x - p0.x) * (p2.y - p0.y) - (p2.x - p0.x) * (p1.y - p0.y);
+}
+
+inline int check_rect_cross_cpu(const PointCpu &p1, const PointCpu &p2, const PointCpu &q1, const PointCpu &q2){
+    int ret = std::min(p1.x,p2.x) <= std::max(q1.x,q2.x)  &&
+              std::min(q1.x,q2.x) <= std::max(p1.x,p2.x) &&
+              std::min(p1.y,p2.y) <= std::max(q1.y,q2.y) &&
+              std::min(q1.y,q2.y) <= std::max(p1.y,p2.y);
+    return ret;
+}
+
+inline int check_in_box2d_cpu(const float *box, const PointCpu &p){
+    //params: box (5) [x1, y1, x2, y2, angle]
+    const float MARGIN = 1e-5;
+
+    float center_x = (box[0] + box[2]) / 2;
+    float center_y = (box[1] + box[3]) / 2;
+    float angle_cos = std::cos(-box[4]), angle_sin = std::sin(-box[4]);  // rotate the point in the opposite direction of box
+    float rot_x = (p.x - center_x) * angle_cos + (p.y - center_y) * angle_sin + center_x;
+    float rot_y = -(p.x - center_x) * angle_sin + (p.y - center_y) * angle_cos + center_y;
+    return (rot_x > box[0] - MARGIN && rot_x < box[2] + MARGIN && rot_y > box[1] - MARGIN && rot_y < box[3] + MARGIN);
+}
+
+inline int intersection_cpu(const PointCpu &p1, const PointCpu &p0, const PointCpu &q1, const PointCpu &q0, PointCpu &ans){
+    // fast exclusion
+    if (check_rect_cross_cpu(p0, p1, q0, q1) == 0) return 0;
+
+    // check cross standing
+    float s1 = cross_cpu(q0, p1, p0);
+    float s2 = cross_cpu(p1, q1, p0);
+    float s3 = cross_cpu(p0, q1, q0);
+    float s4 = cross_cpu(q1, p1, q0);
+
+    if (!(s1 * s2 > 0 && s3 * s4 > 0)) return 0;
+
+    // calculate intersection of two lines
+    float s5 = cross_cpu(q1, p1, p0);
+    if(std::fabs(s5 - s1) > EPS_CPU){
+        ans.x = (s5 * q0.x - s1 * q1.x) / (s5 - s1);
+        ans.y = (s5 * q0.y - s1 * q1.y) / (s5 - s1);
+
+    }
+    else{
+        float a0 = p0.y - p1.y, b0 = p1.x - p0.x, c0 = p0.x * p1.y - p1.x * p0.y;
+        float a1 = q0.y - q1.y, b1 = q1.x - q0.x, c1 = q0.x * q1.y - q1.x * q0.y;
+        float D = a0 * b1 - a1 * b0;
+
+        ans.x = (b0 * c1 - b1 * c0) / D;
+        ans.y = (a1 * c0 - a0 * c1) / D;
+    }
+
+    return 1;
+}
+
+inline void rotate_around_center_cpu(const PointCpu &center, const float angle_cos, const float angle_sin, PointCpu &p){
+    float new_x = (p.x - center.x) * angle_cos + (p.y - center.y) * angle_sin + center.x;
+    float new_y = -(p.x - center.x) * angle_sin + (p.y - center.y) * angle_cos + center.y;
+    p.set(new_x, new_y);
+}
+
+inline int point_cmp_cpu(const PointCpu &a, const PointCpu &b, const PointCpu &center){
+    return std::atan2(a.y - center.y, a.x - center.x) > std::atan2(b.y - center.y, b.x - center.x);
+}
+
+float box_overlap_cpu(const float *box_a, const float *box_b){
+    // params: box_a (5) [x1, y1, x2, y2, angle]
+    // params: box_b (5) [x1, y1, x2, y2, angle]
+
+    float a_x1 = box_a[0], a_y1 = box_a[1], a_x2 = box_a[2], a_y2 = box_a[3], a_angle = box_a[4];
+    float b_x1 = box_b[0], b_y1 = box_b[1], b_x2 = box_b[2], b_y2 = box_b[3], b_angle = box_b[4];
+
+    PointCpu center_a((a_x1 + a_x2) / 2, (a_y1 + a_y2) / 2);
+    PointCpu center_b((b_x1 + b_x2) / 2, (b_y1 + b_y2) / 2);
+
+    PointCpu box_a_corners[5];
+    box_a_corners[0].set(a_x1, a_y1);
+    box_a_corners[1].set(a_x2, a_y1);
+    box_a_corners[2].set(a_x2, a_y2);
+    box_a_corners[3].set(a_x1, a_y2);
+
+    PointCpu box_b_corners[5];
+    box_b_corners[0].set(b_x1, b_y1);
+    box_b_corners[1].set(b_x2, b_y1);
+    box_b_corners[2].set(b_x2, b_y2);
+    box_b_corners[3].set(b_x1, b_y2);
+
+    // get oriented corners
+    float a_angle_cos = std::cos(a_angle), a_angle_sin = std::sin(a_angle);
+    float b_angle_cos = std::cos(b_angle), b_angle_sin = std::sin(b_angle);
+
+    for (int k = 0; k < 4; k++){
+        rotate_around_center_cpu(center_a, a_angle_cos, a_angle_sin, box_a_corners[k]);
+        rotate_around_center_cpu(center_b, b_angle_cos, b_angle_sin, box_b_corners[k]);
+    }
+
+    box_a_corners[4] = box_a_corners[0];
+    box_b_corners[4] = box_b_corners[0];
+
+    // get intersection of lines
+    PointCpu cross_points[16];
+    PointCpu poly_center;
+    int cnt = 0, flag = 0;
+
+    poly_center.set(0, 0);
+    for (int i = 0; i < 4; i++){
+        for (int j = 0; j < 4; j++){
+            flag = intersection_cpu(box_a_corners[i + 1], box_a_corners[i], box_b_corners[j + 1], box_b_corners[j], cross_points[cnt]);
+            if (flag){
+                poly_center = poly_center + cross_points[cnt];
+                cnt++;
+            }
+        }
+    }
+
+    // check corners
+    for (int k = 0; k < 4; k++){
+        if (check_in_box2d_cpu(box_a, box_b_corners[k])){
+            poly_center = poly_center + box_b_corners[k];
+            cross_points[cnt] = box_b_corners[k];
+            cnt++;
+        }
+        if (check_in_box2d_cpu(box_b, box_a_corners[k])){
+            poly_center = poly_center + box_a_corners[k];
+            cross_points[cnt] = box_a_corners[k];
+            cnt++;
+        }
+    }
+
+    if (cnt == 0) return 0;
+
+    poly_center.x /= cnt;
+    poly_center.y /= cnt;
+
+    // sort the points of polygon
+    PointCpu temp;
+    for (int j = 0; j < cnt - 1; j++){
+        for (int i = 0; i < cnt - j - 1; i++){
+            if (point_cmp_cpu(cross_points[i], cross_points[i + 1], poly_center)){
+                temp = cross_points[i];
+                cross_points[i] = cross_points[i + 1];
+                cross_points[i + 1] = temp;
+            }
+        }
+    }
+
+    // get the overlap areas
+    float area = 0;
+    for (int k = 0; k < cnt - 1; k++){
+        area += cross_cpu(cross_points[k] - cross_points[0], cross_points[k + 1] - cross_points[0]);
+    }
+
+    return std::fabs(area) / 2.0;
+}
+
+inline float box_area_cpu(const float *box){
+    return (box[2] - box[0]) * (box[3] - box[1]);
+}
+
+float iou_bev_cpu(const float *box_a, const float *box_b){
+    // params: box_a (5) [x1, y1, x2, y2, angle]
+    // params: box_b (5) [x1, y1, x2, y2, angle]
+    float s_overlap = box_overlap_cpu(box_a, box_b);
+    return s_overlap / std::max(box_area_cpu(box_a) + box_area_cpu(box_b) - s_overlap, EPS_CPU);
+}
+
+int boxes_may_overlap_cpu(const float *box_a, const float *box_b){
+    // Rotated boxes stay inside of the circle of their half diagonal, boxes
+    // whose circles are apart have no overlap
+    float a_dx = box_a[2] - box_a[0], a_dy = box_a[3] - box_a[1];
+    float b_dx = box_b[2] - box_b[0], b_dy = box_b[3] - box_b[1];
+    float radius = (std::sqrt(a_dx * a_dx + a_dy * a_dy) + std::sqrt(b_dx * b_dx + b_dy * b_dy)) / 2;
+    float center_dx = (box_a[0] + box_a[2] - box_b[0] - box_b[2]) / 2;
+    float center_dy = (box_a[1] + box_a[3] - box_b[1] - box_b[3]) / 2;
+    return center_dx * center_dx + center_dy * center_dy <= radius * radius + EPS_CPU;
+}
+
+void compute_bev_iou_cpu(const int a_start, const int a_end, const float *boxes_a,
+              const int num_b, const float *boxes_b, float *ans_overlap, float *ans_iou){
+    // Fills the rows [a_start, a_end) of the (num_a, num_b) outputs
+    for (int a_idx = a_start; a_idx < a_end; a_idx++){
+        const float * cur_box_a = boxes_a + a_idx * 5;
+        for (int b_idx = 0; b_idx < num_b; b_idx++){
+            const float * cur_box_b = boxes_b + b_idx * 5;
+            float s_overlap = 0;
+            if (boxes_may_overlap_cpu(cur_box_a, cur_box_b)){
+                s_overlap = box_overlap_cpu(cur_box_a, cur_box_b);
+            }
+            ans_overlap[a_idx * num_b + b_idx] = s_overlap;
+            ans_iou[a_idx * num_b + b_idx] = s_overlap / std::max(box_area_cpu(cur_box_a) + box_area_cpu(cur_box_b) - s_overlap, EPS_CPU);
+        }
+    }
+}
+
+int oriented_nms_cpu(const float *boxes, const int boxes_num, const float nms_overlap_thresh, int *keep){
+    // params: boxes (N, 5) [x1, y1, x2, y2, ry], sorted by score
+    // params: keep (N) filled with the indices of the kept boxes
+    // Greedy suppression of the GPU op, returns the number of kept boxes
+    std::vector<char> removed(boxes_num, 0);
+    int num_to_keep = 0;
+    for (int i = 0; i < boxes_num; i++){
+        if (removed[i]) continue;
+        keep[num_to_keep] = i;
+        num_to_keep++;
+
+        const float *cur_box = boxes + i * 5;
+        for (int j = i + 1; j < boxes_num; j++){
+            const float *other_box = boxes + j * 5;
+            if (!removed[j] && boxes_may_overlap_cpu(cur_box, other_box) &&
+                iou_bev_cpu(cur_box, other_box) > nms_overlap_thresh){
+                removed[j] = 1;
+            }
+        }
+    }
+    return num_to_keep;
+}
@@ -245,6 +245,12 @@ __global__ void boxes_iou_bev_kernel(const int num_a, const float *boxes_a, cons
         return;
     }
 
+    // Batch item of the block, 0 without a batch
+    boxes_a += blockIdx.z * num_a * 5;
+    boxes_b += blockIdx.z * num_b * 5;
+    ans_overlap += blockIdx.z * num_a * num_b;
+    ans_iou += blockIdx.z * num_a * num_b;
+
     const float * cur_box_a = boxes_a + a_idx * 5;
     const float * cur_box_b = boxes_b + b_idx * 5;
     float s_overlap = box_overlap(cur_box_a, cur_box_b);
@@ -261,6 +267,10 @@ __global__ void nms_kernel(const int boxes_num, const float nms_overlap_thresh,
     const int row_start = blockIdx.y;
     const int col_start = blockIdx.x;
 
+    // Batch item of the block, 0 without a batch
+    boxes += blockIdx.z * boxes_num * 5;
+    mask += blockIdx.z * boxes_num * DIVUP(boxes_num, THREADS_PER_BLOCK_NMS);
+
     // if (row_start > col_start) return;
 
     const int row_size = fminf(boxes_num - row_start * THREADS_PER_BLOCK_NMS, THREADS_PER_BLOCK_NMS);
@@ -320,4 +330,21 @@ void oriented_nms_gpu(const float *boxes, unsigned long long * mask, int boxes_n
     dim3 threads(THREADS_PER_BLOCK_NMS);
 
     nms_kernel<<<blocks, threads>>>(boxes_num, nms_overlap_thresh, boxes, mask);
-}
\ No newline at end of file
+}
+void batch_compute_bev_iou_gpu(const int batch_size, const int num_a, const float *boxes_a,
+              const int num_b, const float *boxes_b, float *ans_overlap, float *ans_iou){
+
+    dim3 blocks(DIVUP(num_b, THREADS_PER_BLOCK), DIVUP(num_a, THREADS_PER_BLOCK), batch_size);  // blockIdx.z(batch item)
+    dim3 threads(THREADS_PER_BLOCK, THREADS_PER_BLOCK);
+
+    boxes_iou_bev_kernel<<<blocks, threads>>>(num_a, boxes_a, num_b, boxes_b, ans_overlap, ans_iou);
+}
+
+void batch_oriented_nms_gpu(const float *boxes, unsigned long long * mask, int batch_size, int boxes_num, float nms_overlap_thresh){
+    dim3 blocks(DIVUP(boxes_num, THREADS_PER_BLOCK_NMS),
+                DIVUP(boxes_num, THREADS_PER_BLOCK_NMS),
+                batch_size);
+    dim3 threads(THREADS_PER_BLOCK_NMS);
+
+    nms_kernel<<<blocks, threads>>>(boxes_num, nms_overlap_thresh, boxes, mask);
+}
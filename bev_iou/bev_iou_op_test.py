@@ -0,0 +1,197 @@
+import numpy as np
+import tensorflow as tf
+
+from bev_iou import bev_iou
+from hf.core import compute_iou
+from hf.core import oriented_nms
+from hf.core import rotated_iou
+
+
+def random_boxes_bev(num_boxes, seed):
+    """(N, 5) [x1, y1, x2, y2, ry] boxes, overlapping each other"""
+    rng = np.random.RandomState(seed)
+    centers = rng.uniform(-5, 5, (num_boxes, 2))
+    sizes = rng.uniform(1, 4, (num_boxes, 2))
+    angles = rng.uniform(-np.pi, np.pi, (num_boxes, 1))
+    return np.hstack([centers - sizes / 2, centers + sizes / 2, angles]).astype(
+        np.float32
+    )
+
+
+class BevIouCpuTest(tf.test.TestCase):
+    def test_compute_bev_iou_golden(self):
+        proposals = np.asarray([[0, 0, 1, 1, 0], [2, 2, 3, 3, 0]], dtype=np.float32)
+        gt = np.asarray(
+            [[0, 0, 1, 1, 0], [2, 2, 4, 4, 0], [5, 5, 6, 6, 0]], dtype=np.float32
+        )
+
+        with tf.device("/cpu:0"):
+            overlap_area, iou = bev_iou.compute_bev_iou(proposals, gt)
+        with self.test_session() as sess:
+            overlap_area, iou = sess.run([overlap_area, iou])
+
+        np.testing.assert_allclose(overlap_area, [[1, 0, 0], [0, 1, 0]])
+        np.testing.assert_allclose(iou, [[1, 0, 0], [0, 0.25, 0]])
+
+    def test_compute_bev_iou(self):
+        proposals = random_boxes_bev(300, seed=0)
+        gt = random_boxes_bev(40, seed=1)
+
+        with tf.device("/cpu:0"):
+            overlap_area, iou = bev_iou.compute_bev_iou(proposals, gt)
+        with self.test_session() as sess:
+            overlap_area, iou = sess.run([overlap_area, iou])
+
+        expected_overlap_area, expected_iou = rotated_iou.compute_bev_iou(
+            proposals, gt
+        )
+        self.assertGreater(np.sum(expected_iou > 0), 0)
+        np.testing.assert_allclose(overlap_area, expected_overlap_area, atol=1e-4)
+        np.testing.assert_allclose(iou, expected_iou, atol=1e-5)
+
+    def test_box3d_iou_tf(self):
+        rng = np.random.RandomState(2)
+        boxes_a = rng.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (100, 7)
+        ).astype(np.float32)
+        boxes_b = rng.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (20, 7)
+        ).astype(np.float32)
+
+        with tf.device("/cpu:0"):
+            iou_3d, iou_2d = compute_iou.box3d_iou_tf(boxes_a, boxes_b)
+        with self.test_session() as sess:
+            iou_3d, iou_2d = sess.run([iou_3d, iou_2d])
+
+        expected_iou_3d, expected_iou_2d = rotated_iou.box_3d_iou_matrix(
+            boxes_a, boxes_b
+        )
+        np.testing.assert_allclose(iou_3d, expected_iou_3d, atol=1e-5)
+        np.testing.assert_allclose(iou_2d, expected_iou_2d, atol=1e-5)
+
+    def test_oriented_nms_golden(self):
+        boxes = np.asarray(
+            [[0, 0, 1, 1, 0], [2, 2, 3, 3, 0], [0, 0, 0.75, 0.75, 0]],
+            dtype=np.float32,
+        )
+
+        with tf.device("/cpu:0"):
+            keep_idxs = bev_iou.oriented_nms(boxes, 0.5)
+        with self.test_session() as sess:
+            keep_idxs = sess.run(keep_idxs)
+
+        # Suppressed boxes are padded with the first kept index
+        np.testing.assert_array_equal(keep_idxs, [0, 1, 0])
+
+    def test_oriented_nms(self):
+        boxes = random_boxes_bev(500, seed=3)
+
+        with tf.device("/cpu:0"):
+            keep_idxs = bev_iou.oriented_nms(boxes, 0.3)
+        with self.test_session() as sess:
+            keep_idxs = sess.run(keep_idxs)
+
+        # The op expects boxes sorted by score
+        boxes_3d = np.zeros((len(boxes), 7))
+        boxes_3d[:, 0] = (boxes[:, 0] + boxes[:, 2]) / 2
+        boxes_3d[:, 2] = (boxes[:, 1] + boxes[:, 3]) / 2
+        boxes_3d[:, 3] = boxes[:, 2] - boxes[:, 0]
+        boxes_3d[:, 4] = boxes[:, 3] - boxes[:, 1]
+        boxes_3d[:, 6] = boxes[:, 4]
+        expected_keep = oriented_nms.nms_boxes_3d(
+            boxes_3d, -np.arange(len(boxes)), 0.3, len(boxes)
+        )
+
+        self.assertGreater(len(expected_keep), 1)
+        self.assertLess(len(expected_keep), len(boxes))
+        np.testing.assert_array_equal(keep_idxs[: len(expected_keep)], expected_keep)
+        np.testing.assert_array_equal(keep_idxs[len(expected_keep) :], 0)
+
+    def test_batch_compute_bev_iou(self):
+        proposals = np.stack([random_boxes_bev(100, seed=4 + i) for i in range(3)])
+        gt = np.stack([random_boxes_bev(20, seed=7 + i) for i in range(3)])
+
+        with tf.device("/cpu:0"):
+            overlap_area, iou = bev_iou.batch_compute_bev_iou(proposals, gt)
+        with self.test_session() as sess:
+            overlap_area, iou = sess.run([overlap_area, iou])
+
+        self.assertEqual(iou.shape, (3, 100, 20))
+        for i in range(3):
+            expected_overlap_area, expected_iou = rotated_iou.compute_bev_iou(
+                proposals[i], gt[i]
+            )
+            np.testing.assert_allclose(
+                overlap_area[i], expected_overlap_area, atol=1e-4
+            )
+            np.testing.assert_allclose(iou[i], expected_iou, atol=1e-5)
+
+    def test_batch_oriented_nms(self):
+        boxes = np.stack([random_boxes_bev(300, seed=10 + i) for i in range(3)])
+        num_valid = np.asarray([300, 120, 0], dtype=np.int32)
+
+        with tf.device("/cpu:0"):
+            keep_idxs, num_keep = bev_iou.batch_oriented_nms(boxes, num_valid, 0.3)
+        with self.test_session() as sess:
+            keep_idxs, num_keep = sess.run([keep_idxs, num_keep])
+
+        np.testing.assert_array_equal(keep_idxs[2], 0)
+        self.assertEqual(num_keep[2], 0)
+        for i in range(2):
+            with tf.device("/cpu:0"):
+                expected_keep_idxs = bev_iou.oriented_nms(boxes[i, : num_valid[i]], 0.3)
+            with self.test_session() as sess:
+                expected_keep_idxs = sess.run(expected_keep_idxs)
+            expected_num_keep = np.sum(expected_keep_idxs != expected_keep_idxs[0]) + 1
+
+            self.assertEqual(num_keep[i], expected_num_keep)
+            np.testing.assert_array_equal(
+                keep_idxs[i, : num_valid[i]], expected_keep_idxs
+            )
+            np.testing.assert_array_equal(
+                keep_idxs[i, num_valid[i] :], expected_keep_idxs[0]
+            )
+
+    def test_gpu_batch_parity(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest("The GPU kernels are not available")
+        boxes = np.stack([random_boxes_bev(200, seed=20 + i) for i in range(3)])
+        num_valid = np.asarray([200, 150, 10], dtype=np.int32)
+
+        outputs = []
+        for device in ["/cpu:0", "/gpu:0"]:
+            with tf.device(device):
+                outputs.append(
+                    list(bev_iou.batch_oriented_nms(boxes, num_valid, 0.3))
+                    + list(bev_iou.batch_compute_bev_iou(boxes, boxes[:, :50]))
+                )
+        with self.test_session() as sess:
+            cpu_outputs, gpu_outputs = sess.run(outputs)
+
+        for cpu_output, gpu_output in zip(cpu_outputs, gpu_outputs):
+            np.testing.assert_allclose(cpu_output, gpu_output, atol=1e-5)
+
+    def test_batch_box3d_iou_tf(self):
+        rng = np.random.RandomState(5)
+        boxes_a = rng.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (2, 50, 7)
+        ).astype(np.float32)
+        boxes_b = rng.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (2, 10, 7)
+        ).astype(np.float32)
+
+        with tf.device("/cpu:0"):
+            iou_3d, iou_2d = compute_iou.batch_box3d_iou_tf(boxes_a, boxes_b)
+        with self.test_session() as sess:
+            iou_3d, iou_2d = sess.run([iou_3d, iou_2d])
+
+        for i in range(2):
+            expected_iou_3d, expected_iou_2d = rotated_iou.box_3d_iou_matrix(
+                boxes_a[i], boxes_b[i]
+            )
+            np.testing.assert_allclose(iou_3d[i], expected_iou_3d, atol=1e-5)
+            np.testing.assert_allclose(iou_2d[i], expected_iou_2d, atol=1e-5)
+
+
+if __name__ == "__main__":
+    tf.test.main()
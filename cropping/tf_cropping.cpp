@@ -7,7 +7,11 @@
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#include <vector>
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
+#endif
 
 using namespace tensorflow;
 
@@ -97,6 +101,159 @@ static inline Status ParseAndCheckBoxSizes(const Tensor& boxes,
   return Status::OK();
 }
 
+int point_grid_dim_cpu(int npts);
+
+void build_point_grid_cpu(const float* pts, int npts, int grid_dim,
+    float* grid_bounds, int* cell_starts, int* cell_points);
+
+void pccropandsample_cpu(
+    const float* pts_data, const float* fts_data, const float* intensities_data, const bool* mask_data, const float* boxes_data,
+    const int* box_ind_data, int box_start, int box_end, int npts, int resize, int channel, int intensity_channel,
+    int grid_dim, const float* grid_bounds_data, const int* cell_starts_data, const int* cell_points_data,
+    float* crop_pts_data, float* crop_fts_data, float* crop_intensities_data, bool* crop_mask_data, int* crop_ind_data, bool* non_empty_box_data);
+
+class PcCropAndSampleCpuOp: public OpKernel{
+  public:
+    explicit PcCropAndSampleCpuOp(OpKernelConstruction* context):OpKernel(context) {
+      OP_REQUIRES_OK(context, context->GetAttr("resize", &resize_));
+      OP_REQUIRES(context, resize_ > 0, errors::InvalidArgument("PcCropAndSample expects positive resize"));
+    }
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& pts = context->input(0);  // B * P * 3
+      const Tensor& fts = context->input(1);  // B * P * C
+      const Tensor& intensities = context->input(2);  // B * P * 1
+      const Tensor& mask = context->input(3);  // B * P
+      const Tensor& boxes = context->input(4);// N * 3 * 8
+      const Tensor& box_index = context->input(5);  // N
+
+      OP_REQUIRES(context, pts.dims()==3 && pts.dim_size(1) > 0 && pts.dim_size(2) == 3, errors::InvalidArgument("PcCropAndSample expects (B, P, 3) pts shape"));
+      OP_REQUIRES(context, fts.dims()==3 && fts.dim_size(1) > 0 && fts.dim_size(2) > 0,  errors::InvalidArgument("PcCropAndSample expects (B, P, C) fts shape"));
+      OP_REQUIRES(context, intensities.dims()==3 && intensities.dim_size(1) > 0 && intensities.dim_size(2) == 1,  errors::InvalidArgument("PcCropAndSample expects (B, P, 1) intensities shape"));
+      OP_REQUIRES(context, pts.dim_size(0) == fts.dim_size(0) && pts.dim_size(1) == fts.dim_size(1), errors::InvalidArgument("PcCropAndSample expects pts & fts has same (B, P, ...) shape"));
+      OP_REQUIRES(context, intensities.dim_size(0) == pts.dim_size(0) && intensities.dim_size(1) == fts.dim_size(1), errors::InvalidArgument("PcCropAndSample expects intensities & fts has same (B, P, ...) shape"));
+      const int batch_size = pts.dim_size(0);
+      const int npts = pts.dim_size(1);
+      const int channel = fts.dim_size(2);
+      const int intensity_channel = intensities.dim_size(2);
+      int num_boxes = 0;
+      OP_REQUIRES_OK(context, ParseAndCheckBoxSizes(boxes, box_index, &num_boxes));
+
+      auto box_ind_flat = box_index.flat<int>();
+      for (int b = 0; b < num_boxes; b++) {
+        OP_REQUIRES(context, box_ind_flat(b) >= 0 && box_ind_flat(b) < batch_size, errors::InvalidArgument("PcCropAndSample expects box_ind in [0, B)"));
+      }
+
+      Tensor* crop_pts = nullptr;
+      Tensor* crop_fts = nullptr;
+      Tensor* crop_intensities = nullptr;
+      Tensor* crop_mask = nullptr;
+      Tensor* crop_ind = nullptr;
+      Tensor* non_empty_box = nullptr;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{num_boxes, resize_, 3}, &crop_pts));
+      OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{num_boxes, resize_, channel}, &crop_fts));
+      OP_REQUIRES_OK(context, context->allocate_output(2, TensorShape{num_boxes, resize_, intensity_channel}, &crop_intensities));
+      OP_REQUIRES_OK(context, context->allocate_output(3, TensorShape{num_boxes, resize_}, &crop_mask));
+      OP_REQUIRES_OK(context, context->allocate_output(4, TensorShape{num_boxes, resize_}, &crop_ind));
+      OP_REQUIRES_OK(context, context->allocate_output(5, TensorShape{num_boxes}, &non_empty_box));
+      if (num_boxes == 0) return;
+
+      const float * pts_data = &(pts.flat<float>()(0));
+      const float * fts_data = &(fts.flat<float>()(0));
+      const float * intensities_data = &(intensities.flat<float>()(0));
+      const bool * mask_data = &(mask.flat<bool>()(0));
+      const float * boxes_data = &(boxes.flat<float>()(0));
+      const int * box_ind_data = &(box_ind_flat(0));
+
+      auto crop_pts_flat = crop_pts->flat<float>();
+      auto crop_fts_flat = crop_fts->flat<float>();
+      auto crop_intensities_flat = crop_intensities->flat<float>();
+      auto crop_mask_flat = crop_mask->flat<bool>();
+      auto crop_ind_flat = crop_ind->flat<int>();
+      crop_pts_flat.setZero();
+      crop_fts_flat.setZero();
+      crop_intensities_flat.setZero();
+      crop_mask_flat.setZero();
+      crop_ind_flat.setZero();
+      float* crop_pts_data = &(crop_pts_flat(0));
+      float* crop_fts_data = &(crop_fts_flat(0));
+      float* crop_intensities_data = &(crop_intensities_flat(0));
+      bool* crop_mask_data = &(crop_mask_flat(0));
+      int* crop_ind_data = &(crop_ind_flat(0));
+      bool* non_empty_box_data = &(non_empty_box->flat<bool>()(0));
+
+      // Bird's eye view grid index of the points of each batch item
+      const int grid_dim = point_grid_dim_cpu(npts);
+      std::vector<float> grid_bounds(batch_size * 4);
+      std::vector<int> cell_starts(batch_size * (grid_dim * grid_dim + 1));
+      std::vector<int> cell_points(batch_size * npts);
+
+      auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+      auto build_grids = [&](int64 start, int64 end) {
+        for (int64 bch = start; bch < end; bch++) {
+          build_point_grid_cpu(pts_data + bch * npts * 3, npts, grid_dim,
+                               &grid_bounds[bch * 4], &cell_starts[bch * (grid_dim * grid_dim + 1)], &cell_points[bch * npts]);
+        }
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers,
+            batch_size, 20 * npts, build_grids);
+
+      auto crop_boxes = [&](int64 start, int64 end) {
+        pccropandsample_cpu(pts_data, fts_data, intensities_data, mask_data, boxes_data, box_ind_data,
+                            start, end, npts, resize_, channel, intensity_channel,
+                            grid_dim, &grid_bounds[0], &cell_starts[0], &cell_points[0],
+                            crop_pts_data, crop_fts_data, crop_intensities_data, crop_mask_data, crop_ind_data, non_empty_box_data);
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers,
+            num_boxes, 100 * resize_ + 10 * resize_ * channel, crop_boxes);
+    }
+    private:
+        int resize_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("PcCropAndSample").Device(DEVICE_CPU),PcCropAndSampleCpuOp);
+
+void pccropandsamplegradfts_cpu(
+    const int* box_ind_data, const int* crop_ind_data, const float* grad_crop_fts_data,
+    int num_boxes, int npts, int resize, int channel,
+    float* grad_fts_data);
+
+class PcCropAndSampleGradFtsCpuOp: public OpKernel{
+  public:
+    explicit PcCropAndSampleGradFtsCpuOp(OpKernelConstruction* context):OpKernel(context) {}
+
+    void Compute(OpKernelContext * context) override {
+
+      const Tensor& fts = context->input(0);          // B * P * C
+      const Tensor& box_ind = context->input(1);      // N
+      const Tensor& crop_ind = context->input(2);     // N * R
+      const Tensor& grad_crop_fts = context->input(3);// N * R * C
+
+      OP_REQUIRES(context, fts.dims()==3 && grad_crop_fts.dims() == 3 && fts.dim_size(2) == grad_crop_fts.dim_size(2),  errors::InvalidArgument("PcCropAndSampleGradFts expects fts and grad_crop_fts has same shape(2)"));
+      OP_REQUIRES(context, box_ind.dim_size(0) == crop_ind.dim_size(0) && crop_ind.dim_size(0) == grad_crop_fts.dim_size(0), errors::InvalidArgument("PcCropAndSampleGradFts expects box_ind, crop_ind and grad_crop_fts has same shape(0)"));
+      OP_REQUIRES(context, crop_ind.dim_size(1) == grad_crop_fts.dim_size(1), errors::InvalidArgument("PcCropAndSampleGradFts expects crop_ind and grad_crop_fts has same shape(1)"));
+      const int batch_size = fts.dim_size(0);
+      const int npts = fts.dim_size(1);
+      const int channel = fts.dim_size(2);
+      const int num_boxes = box_ind.dim_size(0);
+      const int resize = crop_ind.dim_size(1);
+
+      Tensor* grad_fts = nullptr;
+      OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{batch_size, npts, channel}, &grad_fts));
+      auto grad_fts_flat = grad_fts->flat<float>();
+      grad_fts_flat.setZero();
+      if (num_boxes == 0) return;
+
+      pccropandsamplegradfts_cpu(&(box_ind.flat<int>()(0)), &(crop_ind.flat<int>()(0)), &(grad_crop_fts.flat<float>()(0)),
+                                 num_boxes, npts, resize, channel,
+                                 &(grad_fts_flat(0)));
+    }
+};
+
+REGISTER_KERNEL_BUILDER(Name("PcCropAndSampleGradFts").Device(DEVICE_CPU),PcCropAndSampleGradFtsCpuOp);
+
+#ifdef WITH_CUDA
 void pccropandsample_gpu(
     const float* pts_data, const float* fts_data, const float* intensities_data, const bool* mask_data, const float* boxes_data, 
     const int* box_ind_data, int num_boxes, int batch, int npts, int resize, int channel, int intensity_channel,
@@ -241,3 +398,4 @@ class PcCropAndSampleGradFtsGpuOp: public OpKernel{
 };
 
 REGISTER_KERNEL_BUILDER(Name("PcCropAndSampleGradFts").Device(DEVICE_GPU),PcCropAndSampleGradFtsGpuOp);
+#endif
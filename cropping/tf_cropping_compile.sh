@@ -1,8 +1,16 @@
 #/bin/bash
 PYTHON=python3
-CUDA_PATH=/usr/local/cuda
+CUDA_PATH=${CUDA_PATH:-/usr/local/cuda}
 TF_LIB=$($PYTHON -c 'import tensorflow as tf; print(tf.sysconfig.get_lib())')
 TF_PATH=$TF_LIB/include
 PYTHON_VERSION=$($PYTHON -c 'import sys; print("%d.%d"%(sys.version_info[0], sys.version_info[1]))')
-$CUDA_PATH/bin/nvcc tf_cropping_g.cu -o tf_cropping_g.cu.o -c -O2 -DGOOGLE_CUDA=1 -x cu -Xcompiler -fPIC
-g++ -std=c++11 tf_cropping.cpp tf_cropping_g.cu.o -o tf_cropping_so.so -shared -fPIC -L$TF_LIB -ltensorflow_framework -I $TF_PATH/external/nsync/public/ -I $TF_PATH -I $CUDA_PATH/include -lcudart -L $CUDA_PATH/lib64/ -O2 -D_GLIBCXX_USE_CXX11_ABI=0
+# The GPU kernels are built when nvcc is found, WITH_CUDA=0 only builds the CPU ones
+if [ -z "$WITH_CUDA" ]; then
+    if [ -x $CUDA_PATH/bin/nvcc ]; then WITH_CUDA=1; else WITH_CUDA=0; fi
+fi
+if [ "$WITH_CUDA" = "1" ]; then
+    $CUDA_PATH/bin/nvcc tf_cropping_g.cu -o tf_cropping_g.cu.o -c -O2 -DGOOGLE_CUDA=1 -x cu -Xcompiler -fPIC
+    g++ -std=c++11 tf_cropping.cpp tf_cropping_cpu.cpp tf_cropping_g.cu.o -o tf_cropping_so.so -shared -fPIC -DWITH_CUDA -L$TF_LIB -ltensorflow_framework -I $TF_PATH/external/nsync/public/ -I $TF_PATH -I $CUDA_PATH/include -lcudart -L $CUDA_PATH/lib64/ -O2 -D_GLIBCXX_USE_CXX11_ABI=0
+else
+    g++ -std=c++11 tf_cropping.cpp tf_cropping_cpu.cpp -o tf_cropping_so.so -shared -fPIC -L$TF_LIB -ltensorflow_framework -I $TF_PATH/external/nsync/public/ -I $TF_PATH -O2 -D_GLIBCXX_USE_CXX11_ABI=0
+fi
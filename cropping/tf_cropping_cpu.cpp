@@ -0,0 +1,195 @@
+// CPU version of the PcCropAndSample op of tf_cropping_g.cu.
+//
+// The points of each batch item are bucketed into a bird's eye view (x, z)
+// grid, so that a box only tests the points of the cells its bounds cover
+// instead of all of them. The GPU kernel keeps the first resize points
+// found inside of a box in any order, the CPU one keeps the resize inside
+// points of lowest index.
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+inline float dot_cpu(float x1, float y1, float z1, float x2, float y2, float z2) {
+    return (x1 * x2 + y1 * y2 + z1 * z2);
+}
+
+inline bool is_point_inside_cpu(float px, float py, float pz,
+                                float p1x, float p1y, float p1z,
+                                float p2x, float p2y, float p2z,
+                                float p4x, float p4y, float p4z,
+                                float p5x, float p5y, float p5z) {
+  float ux = p2x - p1x;
+  float uy = p2y - p1y;
+  float uz = p2z - p1z;
+
+  float vx = p4x - p1x;
+  float vy = p4y - p1y;
+  float vz = p4z - p1z;
+
+  float wx = p5x - p1x;
+  float wy = p5y - p1y;
+  float wz = p5z - p1z;
+
+  float u_dot_x = dot_cpu(ux, uy, uz, px, py, pz);
+  float u_dot_p1 = dot_cpu(ux, uy, uz, p1x, p1y, p1z);
+  float u_dot_p2 = dot_cpu(ux, uy, uz, p2x, p2y, p2z);
+
+  float v_dot_x = dot_cpu(vx, vy, vz, px, py, pz);
+  float v_dot_p1 = dot_cpu(vx, vy, vz, p1x, p1y, p1z);
+  float v_dot_p4 = dot_cpu(vx, vy, vz, p4x, p4y, p4z);
+
+  float w_dot_x = dot_cpu(wx, wy, wz, px, py, pz);
+  float w_dot_p1 = dot_cpu(wx, wy, wz, p1x, p1y, p1z);
+  float w_dot_p5 = dot_cpu(wx, wy, wz, p5x, p5y, p5z);
+
+  if (u_dot_p1 < u_dot_x && u_dot_x < u_dot_p2 &&
+      v_dot_p1 < v_dot_x && v_dot_x < v_dot_p4 &&
+      w_dot_p1 < w_dot_x && w_dot_x < w_dot_p5)
+    return true;
+  return false;
+}
+
+inline int grid_cell_cpu(float value, float min_value, float cell_size, int grid_dim) {
+  int cell = (int)std::floor((value - min_value) / cell_size);
+  return std::min(std::max(cell, 0), grid_dim - 1);
+}
+
+int point_grid_dim_cpu(int npts) {
+  // About 8 points per cell, evenly spread
+  return std::min(std::max((int)std::ceil(std::sqrt(npts / 8.0)), 1), 512);
+}
+
+void build_point_grid_cpu(const float* pts, int npts, int grid_dim,
+    float* grid_bounds, int* cell_starts, int* cell_points) {
+  // params: pts (P, 3)
+  // params: grid_bounds (4) [min_x, min_z, cell_size_x, cell_size_z]
+  // params: cell_starts (grid_dim * grid_dim + 1) start of the points of
+  //     each cell in cell_points
+  // params: cell_points (P) point indices, sorted by cell then index
+  float min_x = pts[0], max_x = pts[0], min_z = pts[2], max_z = pts[2];
+  for (int p = 1; p < npts; p++) {
+    min_x = std::min(min_x, pts[p*3]);
+    max_x = std::max(max_x, pts[p*3]);
+    min_z = std::min(min_z, pts[p*3 + 2]);
+    max_z = std::max(max_z, pts[p*3 + 2]);
+  }
+  grid_bounds[0] = min_x;
+  grid_bounds[1] = min_z;
+  grid_bounds[2] = std::max((max_x - min_x) / grid_dim, 1e-3f);
+  grid_bounds[3] = std::max((max_z - min_z) / grid_dim, 1e-3f);
+
+  // Counting sort of the points by cell, stable so that each cell keeps
+  // its points by increasing index
+  std::vector<int> point_cells(npts);
+  std::fill(cell_starts, cell_starts + grid_dim * grid_dim + 1, 0);
+  for (int p = 0; p < npts; p++) {
+    int cell_x = grid_cell_cpu(pts[p*3], grid_bounds[0], grid_bounds[2], grid_dim);
+    int cell_z = grid_cell_cpu(pts[p*3 + 2], grid_bounds[1], grid_bounds[3], grid_dim);
+    point_cells[p] = cell_x * grid_dim + cell_z;
+    cell_starts[point_cells[p] + 1]++;
+  }
+  for (int cell = 0; cell < grid_dim * grid_dim; cell++) {
+    cell_starts[cell + 1] += cell_starts[cell];
+  }
+  std::vector<int> cell_fill(cell_starts, cell_starts + grid_dim * grid_dim);
+  for (int p = 0; p < npts; p++) {
+    cell_points[cell_fill[point_cells[p]]++] = p;
+  }
+}
+
+void pccropandsample_cpu(
+    const float* pts_data, const float* fts_data, const float* intensities_data, const bool* mask_data, const float* boxes_data,
+    const int* box_ind_data, int box_start, int box_end, int npts, int resize, int channel, int intensity_channel,
+    int grid_dim, const float* grid_bounds_data, const int* cell_starts_data, const int* cell_points_data,
+    float* crop_pts_data, float* crop_fts_data, float* crop_intensities_data, bool* crop_mask_data, int* crop_ind_data, bool* non_empty_box_data) {
+  // Crops the boxes [box_start, box_end), the outputs are expected to be
+  // zero filled
+  std::vector<int> box_points;
+  for (int b = box_start; b < box_end; b++) {
+    const float* box = boxes_data + b * 24;
+    float p1x = box[0], p1y = box[8], p1z = box[16];
+    float p2x = box[1], p2y = box[8 + 1], p2z = box[16 + 1];
+    float p4x = box[3], p4y = box[8 + 3], p4z = box[16 + 3];
+    float p5x = box[4], p5y = box[8 + 4], p5z = box[16 + 4];
+
+    int bch = box_ind_data[b];
+    const float *pts = pts_data + bch * npts * 3;
+    const float *fts = fts_data + bch * npts * channel;
+    const float *intensities = intensities_data + bch * npts * intensity_channel;
+    const bool *mask = mask_data + bch * npts;
+    const float *grid_bounds = grid_bounds_data + bch * 4;
+    const int *cell_starts = cell_starts_data + bch * (grid_dim * grid_dim + 1);
+    const int *cell_points = cell_points_data + bch * npts;
+    float *crop_pts = crop_pts_data + b * resize * 3;
+    float *crop_fts = crop_fts_data + b * resize * channel;
+    float *crop_intensities = crop_intensities_data + b * resize * intensity_channel;
+    bool *crop_mask = crop_mask_data + b * resize;
+    int *crop_ind = crop_ind_data + b * resize;
+
+    // Points inside of the box, among the cells covered by its bounds
+    float box_min_x = *std::min_element(box, box + 8);
+    float box_max_x = *std::max_element(box, box + 8);
+    float box_min_z = *std::min_element(box + 16, box + 24);
+    float box_max_z = *std::max_element(box + 16, box + 24);
+    int min_cell_x = grid_cell_cpu(box_min_x, grid_bounds[0], grid_bounds[2], grid_dim);
+    int max_cell_x = grid_cell_cpu(box_max_x, grid_bounds[0], grid_bounds[2], grid_dim);
+    int min_cell_z = grid_cell_cpu(box_min_z, grid_bounds[1], grid_bounds[3], grid_dim);
+    int max_cell_z = grid_cell_cpu(box_max_z, grid_bounds[1], grid_bounds[3], grid_dim);
+
+    box_points.clear();
+    for (int cell_x = min_cell_x; cell_x <= max_cell_x; cell_x++) {
+      for (int cell_z = min_cell_z; cell_z <= max_cell_z; cell_z++) {
+        int cell = cell_x * grid_dim + cell_z;
+        for (int i = cell_starts[cell]; i < cell_starts[cell + 1]; i++) {
+          int p = cell_points[i];
+          if (is_point_inside_cpu(pts[p*3], pts[p*3+1], pts[p*3+2], p1x, p1y, p1z, p2x, p2y, p2z, p4x, p4y, p4z, p5x, p5y, p5z)) {
+            box_points.push_back(p);
+          }
+        }
+      }
+    }
+
+    int box_pts_num = std::min((int)box_points.size(), resize);
+    if (box_pts_num == 0) {
+      non_empty_box_data[b] = false;
+      continue;
+    }
+    non_empty_box_data[b] = true;
+    std::partial_sort(box_points.begin(), box_points.begin() + box_pts_num, box_points.end());
+
+    // Boxes with less than resize points repeat them, as the GPU op does
+    for (int pos = 0; pos < resize; pos++) {
+      int p = box_points[pos % box_pts_num];
+      crop_pts[pos*3] = pts[p*3];
+      crop_pts[pos*3 + 1] = pts[p*3 + 1];
+      crop_pts[pos*3 + 2] = pts[p*3 + 2];
+      for (int c=0; c < channel; c++) {
+        crop_fts[pos * channel + c] = fts[p * channel + c];
+      }
+      for (int c=0; c < intensity_channel; c++) {
+        crop_intensities[pos * intensity_channel + c] = intensities[p * intensity_channel + c];
+      }
+      crop_mask[pos] = mask[p];
+      crop_ind[pos] = p;
+    }
+  }
+}
+
+void pccropandsamplegradfts_cpu(
+    const int* box_ind_data, const int* crop_ind_data, const float* grad_crop_fts_data,
+    int num_boxes, int npts, int resize, int channel,
+    float* grad_fts_data) {
+  // The outputs are expected to be zero filled
+  for (int b = 0; b < num_boxes; b++) {
+    int bch = box_ind_data[b];
+    const int* crop_ind = crop_ind_data + b * resize;
+    const float* grad_crop_fts = grad_crop_fts_data + b * resize * channel;
+    float* grad_fts = grad_fts_data + bch * npts * channel;
+    for (int p = 0; p < resize; p++) {
+      int idx = crop_ind[p];
+      for (int c = 0; c < channel; c++) {
+        grad_fts[idx*channel + c] += grad_crop_fts[p*channel + c];
+      }
+    }
+  }
+}
@@ -0,0 +1,81 @@
+import numpy as np
+import tensorflow as tf
+
+from cropping import tf_cropping
+from hf.core import box_8c_encoder
+from hf.core import obj_utils
+
+
+def crop_and_sample(pts, fts, intensities, mask, boxes, box_ind, resize):
+    """Numpy reference of the CPU op, which keeps the inside points of
+    lowest index"""
+    num_boxes = len(boxes)
+    crop_ind = np.zeros((num_boxes, resize), dtype=np.int32)
+    non_empty_box_mask = np.zeros(num_boxes, dtype=bool)
+    for box_idx in range(num_boxes):
+        inside = obj_utils.is_point_inside(pts[box_ind[box_idx]].T, boxes[box_idx])
+        inside_indices = np.flatnonzero(inside)[:resize]
+        if len(inside_indices) > 0:
+            non_empty_box_mask[box_idx] = True
+            crop_ind[box_idx] = inside_indices[np.arange(resize) % len(inside_indices)]
+
+    def crop(values):
+        cropped = values[box_ind[:, np.newaxis], crop_ind]
+        cropped[~non_empty_box_mask] = 0
+        return cropped
+
+    return (
+        crop(pts),
+        crop(fts),
+        crop(intensities),
+        crop(mask),
+        np.where(non_empty_box_mask[:, np.newaxis], crop_ind, 0),
+        non_empty_box_mask,
+    )
+
+
+class PcCropAndSampleCpuTest(tf.test.TestCase):
+    def test_pc_crop_and_sample(self):
+        rng = np.random.RandomState(0)
+        batch_size, num_points, num_boxes, resize = 2, 4096, 64, 128
+        pts = rng.uniform(
+            [-20, -1, 0], [20, 2.5, 40], (batch_size, num_points, 3)
+        ).astype(np.float32)
+        fts = rng.rand(batch_size, num_points, 8).astype(np.float32)
+        intensities = rng.rand(batch_size, num_points, 1).astype(np.float32)
+        mask = rng.rand(batch_size, num_points) > 0.5
+
+        boxes_3d = rng.uniform(
+            [-18, 1.5, 2, 3, 1.5, 1.4, -np.pi],
+            [18, 1.8, 38, 8, 4, 3, np.pi],
+            (num_boxes, 7),
+        )
+        # A box with more points than resize, and an empty box
+        pts[0, :300] = boxes_3d[0, 0:3] + rng.uniform(
+            [-1, -1, -0.5], [1, 0, 0.5], (300, 3)
+        )
+        boxes_3d[1, 2] = 100.0
+        boxes = box_8c_encoder.np_box_3d_to_box_8co(boxes_3d).transpose((0, 2, 1))
+        boxes = boxes.astype(np.float32)
+        box_ind = rng.randint(batch_size, size=num_boxes).astype(np.int32)
+        box_ind[0:2] = 0
+
+        with tf.device("/cpu:0"):
+            outputs = tf_cropping.pc_crop_and_sample(
+                pts, fts, intensities, mask, boxes, box_ind, resize
+            )
+        with self.test_session() as sess:
+            outputs = sess.run(outputs)
+
+        expected_outputs = crop_and_sample(
+            pts, fts, intensities, mask, boxes, box_ind, resize
+        )
+        self.assertTrue(expected_outputs[5][0])
+        self.assertFalse(expected_outputs[5][1])
+        self.assertEqual(len(np.unique(expected_outputs[4][0])), resize)
+        for output, expected_output in zip(outputs, expected_outputs):
+            np.testing.assert_array_equal(output, expected_output)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -1,12 +1,7 @@
-import sys
-
 import numpy as np
 from sklearn.cluster import KMeans
 
-from hf.core import obj_utils
-
 from hf.builders.dataset_builder import DatasetBuilder
-from hf.core.label_cluster_utils import LabelClusterUtils
 
 
 def main():
@@ -22,29 +17,11 @@ def main():
 
     # Calculate the remaining clusters
     # Load labels corresponding to the sample list for clustering
-    sample_list = dataset.load_sample_names(dataset.cluster_split)
-    all_dims = []
-
-    num_samples = len(sample_list)
-    for sample_idx in range(num_samples):
-
-        sys.stdout.write(
-            "\rClustering labels {} / {}".format(sample_idx + 1, num_samples)
-        )
-        sys.stdout.flush()
-
-        sample_name = sample_list[sample_idx]
-        img_idx = int(sample_name)
-
-        obj_labels = obj_utils.read_labels(dataset.label_dir, img_idx)
-        filtered_lwh = LabelClusterUtils._filter_labels_by_class(
-            obj_labels, dataset.classes
-        )
-
-        if filtered_lwh[0]:
-            all_dims.extend(filtered_lwh[0])
+    labels = dataset.get_label_store(dataset.cluster_split).labels
+    labels = labels[labels["type"] == dataset.classes[0]]
 
-    all_dims = np.array(all_dims)
+    # l, w, h
+    all_dims = np.stack([labels["l"], labels["w"], labels["h"]], axis=1)
     print("\nFinished reading labels, clustering data...\n")
 
     # Print 3 decimal places
@@ -7,7 +7,11 @@
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#include <vector>
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
+#endif
 using namespace tensorflow;
 
 REGISTER_OP("QueryBallPoint")
@@ -63,6 +67,207 @@ REGISTER_OP("GroupPointGrad")
     });
 
 
+static inline Status CheckGroupIndices(const Tensor& idx_tensor, int n) {
+    auto idx_flat = idx_tensor.flat<int>();
+    for (int64 i = 0; i < idx_flat.size(); i++) {
+        if (idx_flat(i) < 0 || idx_flat(i) >= n)
+            return errors::InvalidArgument("GroupPoint expects idx in [0, num_points)");
+    }
+    return Status::OK();
+}
+
+int point_grid_max_cells_cpu(int n);
+void build_point_grid_cpu(const float *xyz, int n, float radius,
+    float *grid_bounds, int *grid_dims, int *cell_starts, int *cell_points);
+void query_ball_point_cpu(int query_start, int query_end, float radius, int nsample,
+    const float *xyz1, const float *xyz2,
+    const float *grid_bounds, const int *grid_dims, const int *cell_starts, const int *cell_points,
+    int *idx, int *pts_cnt);
+class QueryBallPointCpuOp : public OpKernel {
+    public:
+        explicit QueryBallPointCpuOp(OpKernelConstruction* context) : OpKernel(context) {
+            OP_REQUIRES_OK(context, context->GetAttr("radius", &radius_));
+            OP_REQUIRES(context, radius_ > 0, errors::InvalidArgument("QueryBallPoint expects positive radius"));
+
+            OP_REQUIRES_OK(context, context->GetAttr("nsample", &nsample_));
+            OP_REQUIRES(context, nsample_ > 0, errors::InvalidArgument("QueryBallPoint expects positive nsample"));
+        }
+
+        void Compute(OpKernelContext* context) override {
+            const Tensor& xyz1_tensor = context->input(0);
+            OP_REQUIRES(context, xyz1_tensor.dims()==3 && xyz1_tensor.shape().dim_size(2)==3, errors::InvalidArgument("QueryBallPoint expects (batch_size, ndataset, 3) xyz1 shape."));
+            int b = xyz1_tensor.shape().dim_size(0);
+            int n = xyz1_tensor.shape().dim_size(1);
+
+            const Tensor& xyz2_tensor = context->input(1);
+            OP_REQUIRES(context, xyz2_tensor.dims()==3 && xyz2_tensor.shape().dim_size(0)==b && xyz2_tensor.shape().dim_size(2)==3, errors::InvalidArgument("QueryBallPoint expects (batch_size, npoint, 3) xyz2 shape."));
+            int m = xyz2_tensor.shape().dim_size(1);
+
+            Tensor *idx_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{b,m,nsample_}, &idx_tensor));
+            Tensor *pts_cnt_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{b,m}, &pts_cnt_tensor));
+            if (b == 0 || m == 0) return;
+
+            const float *xyz1 = n > 0 ? &(xyz1_tensor.flat<float>()(0)) : nullptr;
+            const float *xyz2 = &(xyz2_tensor.flat<float>()(0));
+            int *idx = &(idx_tensor->flat<int>()(0));
+            int *pts_cnt = &(pts_cnt_tensor->flat<int>()(0));
+
+            // Voxel grid index of the points of each batch item
+            const int max_cells = point_grid_max_cells_cpu(n);
+            std::vector<float> grid_bounds(b * 4);
+            std::vector<int> grid_dims(b * 3);
+            std::vector<int> cell_starts(b * (max_cells + 1));
+            std::vector<int> cell_points(b * n + 1);
+
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto build_grids = [&](int64 start, int64 end) {
+                for (int64 i = start; i < end; i++) {
+                    build_point_grid_cpu(xyz1 + i * n * 3, n, radius_, &grid_bounds[i * 4], &grid_dims[i * 3],
+                                         &cell_starts[i * (max_cells + 1)], &cell_points[i * n]);
+                }
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b, 30 * n, build_grids);
+
+            auto query = [&](int64 start, int64 end) {
+                for (int64 i = start / m; i * m < end; i++) {
+                    int query_start = std::max(start - i * m, (int64)0);
+                    int query_end = std::min(end - i * m, (int64)m);
+                    query_ball_point_cpu(query_start, query_end, radius_, nsample_,
+                                         xyz1 + i * n * 3, xyz2 + i * m * 3,
+                                         &grid_bounds[i * 4], &grid_dims[i * 3], &cell_starts[i * (max_cells + 1)], &cell_points[i * n],
+                                         idx + i * m * nsample_, pts_cnt + i * m);
+                }
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * m, 200 * nsample_, query);
+        }
+    private:
+        float radius_;
+        int nsample_;
+};
+REGISTER_KERNEL_BUILDER(Name("QueryBallPoint").Device(DEVICE_CPU), QueryBallPointCpuOp);
+
+void selection_sort_cpu(int row_start, int row_end, int n, int k, const float *dist, int *outi, float *out);
+class SelectionSortCpuOp : public OpKernel {
+    public:
+        explicit SelectionSortCpuOp(OpKernelConstruction* context) : OpKernel(context) {
+            OP_REQUIRES_OK(context, context->GetAttr("k", &k_));
+            OP_REQUIRES(context, k_ > 0, errors::InvalidArgument("SelectionSort expects positive k"));
+        }
+
+        void Compute(OpKernelContext* context) override {
+            const Tensor& dist_tensor = context->input(0);
+            OP_REQUIRES(context, dist_tensor.dims()==3, errors::InvalidArgument("SelectionSort expects (b,m,n) dist shape."));
+            int b = dist_tensor.shape().dim_size(0);
+            int m = dist_tensor.shape().dim_size(1);
+            int n = dist_tensor.shape().dim_size(2);
+
+            Tensor *outi_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{b,m,n}, &outi_tensor));
+            Tensor *out_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{b,m,n}, &out_tensor));
+            if (b == 0 || m == 0 || n == 0) return;
+
+            const float *dist = &(dist_tensor.flat<float>()(0));
+            int *outi = &(outi_tensor->flat<int>()(0));
+            float *out = &(out_tensor->flat<float>()(0));
+
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto sort = [&](int64 start, int64 end) {
+                selection_sort_cpu(start, end, n, k_, dist, outi, out);
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * m, (int64)5 * n * std::min(k_, n), sort);
+        }
+    private:
+        int k_;
+};
+REGISTER_KERNEL_BUILDER(Name("SelectionSort").Device(DEVICE_CPU), SelectionSortCpuOp);
+
+void group_point_cpu(int group_start, int group_end, int n, int c, int m, int nsample,
+    const float *points, const int *idx, float *out);
+class GroupPointCpuOp: public OpKernel{
+    public:
+        explicit GroupPointCpuOp(OpKernelConstruction * context):OpKernel(context){}
+
+        void Compute(OpKernelContext * context) override {
+            const Tensor& points_tensor=context->input(0);
+            OP_REQUIRES(context, points_tensor.dims()==3, errors::InvalidArgument("GroupPoint expects (batch_size, num_points, channel) points shape"));
+            int b = points_tensor.shape().dim_size(0);
+            int n = points_tensor.shape().dim_size(1);
+            int c = points_tensor.shape().dim_size(2);
+
+            const Tensor& idx_tensor=context->input(1);
+            OP_REQUIRES(context,idx_tensor.dims()==3 && idx_tensor.shape().dim_size(0)==b, errors::InvalidArgument("GroupPoint expects (batch_size, npoints, nsample) idx shape"));
+            int m = idx_tensor.shape().dim_size(1);
+            int nsample = idx_tensor.shape().dim_size(2);
+            OP_REQUIRES_OK(context, CheckGroupIndices(idx_tensor, n));
+
+            Tensor * out_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0,TensorShape{b,m,nsample,c}, &out_tensor));
+            if (out_tensor->NumElements() == 0) return;
+
+            const float *points = &(points_tensor.flat<float>()(0));
+            const int *idx = &(idx_tensor.flat<int>()(0));
+            float *out = &(out_tensor->flat<float>()(0));
+
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto group = [&](int64 start, int64 end) {
+                group_point_cpu(start, end, n, c, m, nsample, points, idx, out);
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * m, 2 * nsample * c, group);
+        }
+};
+REGISTER_KERNEL_BUILDER(Name("GroupPoint").Device(DEVICE_CPU),GroupPointCpuOp);
+
+void group_point_grad_cpu(int batch_start, int batch_end, int n, int c, int m, int nsample,
+    const float *grad_out, const int *idx, float *grad_points);
+class GroupPointGradCpuOp: public OpKernel{
+    public:
+        explicit GroupPointGradCpuOp(OpKernelConstruction * context):OpKernel(context){}
+
+        void Compute(OpKernelContext * context) override {
+            const Tensor& points_tensor=context->input(0);
+            OP_REQUIRES(context, points_tensor.dims()==3, errors::InvalidArgument("GroupPointGrad expects (batch_size, num_points, channel) points shape"));
+            int b = points_tensor.shape().dim_size(0);
+            int n = points_tensor.shape().dim_size(1);
+            int c = points_tensor.shape().dim_size(2);
+
+            const Tensor& idx_tensor=context->input(1);
+            OP_REQUIRES(context,idx_tensor.dims()==3 && idx_tensor.shape().dim_size(0)==b, errors::InvalidArgument("GroupPointGrad expects (batch_size, npoints, nsample) idx shape"));
+            int m = idx_tensor.shape().dim_size(1);
+            int nsample = idx_tensor.shape().dim_size(2);
+            OP_REQUIRES_OK(context, CheckGroupIndices(idx_tensor, n));
+
+            const Tensor& grad_out_tensor=context->input(2);
+            OP_REQUIRES(context,grad_out_tensor.dims()==4 && grad_out_tensor.shape().dim_size(0)==b && grad_out_tensor.shape().dim_size(1)==m && grad_out_tensor.shape().dim_size(2)==nsample && grad_out_tensor.shape().dim_size(3)==c, errors::InvalidArgument("GroupPointGrad expects (batch_size, npoints, nsample, channel) grad_out shape"));
+
+            Tensor * grad_points_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0,TensorShape{b,n,c}, &grad_points_tensor));
+            auto grad_points_flat = grad_points_tensor->flat<float>();
+            grad_points_flat.setZero();
+            if (grad_out_tensor.NumElements() == 0) return;
+
+            const int *idx = &(idx_tensor.flat<int>()(0));
+            const float *grad_out = &(grad_out_tensor.flat<float>()(0));
+            float *grad_points = &(grad_points_flat(0));
+
+            // Batch items scatter to disjoint parts of grad_points
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto scatter = [&](int64 start, int64 end) {
+                group_point_grad_cpu(start, end, n, c, m, nsample, grad_out, idx, grad_points);
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b, (int64)2 * m * nsample * c, scatter);
+        }
+};
+REGISTER_KERNEL_BUILDER(Name("GroupPointGrad").Device(DEVICE_CPU),GroupPointGradCpuOp);
+
+#ifdef WITH_CUDA
 void queryBallPointLauncher(int b, int n, int m, float radius, int nsample, const float *xyz1, const float *xyz2, int *idx, int *pts_cnt);
 class QueryBallPointGpuOp : public OpKernel {
     public:
@@ -206,5 +411,4 @@ class GroupPointGradGpuOp: public OpKernel{
         }
 };
 REGISTER_KERNEL_BUILDER(Name("GroupPointGrad").Device(DEVICE_GPU),GroupPointGradGpuOp);
-
-
+#endif
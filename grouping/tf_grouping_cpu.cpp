@@ -0,0 +1,206 @@
+// CPU versions of the grouping ops of tf_grouping_g.cu.
+//
+// The ball query buckets the points of each batch item into a voxel grid of
+// cells at least as large as the radius, so that a query only visits the
+// points of the 27 cells around it. Those are merged by increasing index,
+// so that the query stops at the first nsample points inside of the ball
+// and returns the same indices as the GPU kernel.
+#include <algorithm>
+#include <cmath>
+#include <functional>
+#include <utility>
+#include <vector>
+
+inline int grid_cell_cpu(float value, float min_value, float cell_size, int grid_dim) {
+  float cell = std::floor((value - min_value) / cell_size);
+  if (!(cell >= 0)) return 0;
+  return (int)std::min(cell, (float)(grid_dim - 1));
+}
+
+int point_grid_max_cells_cpu(int n) {
+  return 2 * n + 27;
+}
+
+void build_point_grid_cpu(const float *xyz, int n, float radius,
+    float *grid_bounds, int *grid_dims, int *cell_starts, int *cell_points) {
+  // params: xyz (n, 3)
+  // params: grid_bounds (4) [min_x, min_y, min_z, cell_size]
+  // params: grid_dims (3) number of cells along each axis
+  // params: cell_starts (point_grid_max_cells_cpu(n) + 1) start of the
+  //     points of each cell in cell_points
+  // params: cell_points (n) point indices, sorted by cell then index
+  float min_xyz[3] = {0, 0, 0}, max_xyz[3] = {0, 0, 0};
+  for (int k = 0; k < n; k++) {
+    for (int d = 0; d < 3; d++) {
+      min_xyz[d] = k == 0 ? xyz[d] : std::min(min_xyz[d], xyz[k*3 + d]);
+      max_xyz[d] = k == 0 ? xyz[d] : std::max(max_xyz[d], xyz[k*3 + d]);
+    }
+  }
+  for (int d = 0; d < 3; d++) {
+    // Non finite coordinates end up in the border cells
+    if (!std::isfinite(max_xyz[d] - min_xyz[d])) {
+      min_xyz[d] = max_xyz[d] = 0;
+    }
+  }
+  // Cells slightly larger than the radius, so that float rounding can not
+  // move a point of the ball out of the neighbour cells, and coarser when
+  // the grid would have more cells than the budget
+  float cell_size = radius * 1.01f;
+  const int max_cells = point_grid_max_cells_cpu(n);
+  double num_cells;
+  while (true) {
+    num_cells = 1;
+    for (int d = 0; d < 3; d++) {
+      num_cells *= std::floor((max_xyz[d] - min_xyz[d]) / cell_size) + 1;
+    }
+    if (!(num_cells > max_cells)) break;
+    cell_size *= 1.5f;
+  }
+  for (int d = 0; d < 3; d++) {
+    grid_bounds[d] = min_xyz[d];
+    grid_dims[d] = (int)std::floor((max_xyz[d] - min_xyz[d]) / cell_size) + 1;
+  }
+  grid_bounds[3] = cell_size;
+
+  // Counting sort of the points by cell, stable so that each cell keeps
+  // its points by increasing index
+  const int grid_cells = grid_dims[0] * grid_dims[1] * grid_dims[2];
+  std::vector<int> point_cells(n);
+  std::fill(cell_starts, cell_starts + grid_cells + 1, 0);
+  for (int k = 0; k < n; k++) {
+    int cell_x = grid_cell_cpu(xyz[k*3], grid_bounds[0], cell_size, grid_dims[0]);
+    int cell_y = grid_cell_cpu(xyz[k*3 + 1], grid_bounds[1], cell_size, grid_dims[1]);
+    int cell_z = grid_cell_cpu(xyz[k*3 + 2], grid_bounds[2], cell_size, grid_dims[2]);
+    point_cells[k] = (cell_x * grid_dims[1] + cell_y) * grid_dims[2] + cell_z;
+    cell_starts[point_cells[k] + 1]++;
+  }
+  for (int cell = 0; cell < grid_cells; cell++) {
+    cell_starts[cell + 1] += cell_starts[cell];
+  }
+  std::vector<int> cell_fill(cell_starts, cell_starts + grid_cells);
+  for (int k = 0; k < n; k++) {
+    cell_points[cell_fill[point_cells[k]]++] = k;
+  }
+}
+
+inline bool in_ball_cpu(const float *p1, const float *p2, float radius) {
+  // Same test as the GPU kernel
+  float x1 = p1[0], y1 = p1[1], z1 = p1[2];
+  float x2 = p2[0], y2 = p2[1], z2 = p2[2];
+  float d = std::max(std::sqrt((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1)), 1e-20f);
+  return d < radius;
+}
+
+// input: xyz1 (n,3) and its grid, new_xyz (m,3) of one batch item
+// output: idx (m,nsample), pts_cnt (m) of the queries [query_start, query_end)
+void query_ball_point_cpu(int query_start, int query_end, float radius, int nsample,
+    const float *xyz1, const float *xyz2,
+    const float *grid_bounds, const int *grid_dims, const int *cell_starts, const int *cell_points,
+    int *idx, int *pts_cnt) {
+  // (point index, cell) of the next point of each neighbour cell
+  std::vector<std::pair<int, int> > heap;
+  std::vector<int> cell_pos(27), cell_end(27);
+  for (int j = query_start; j < query_end; j++) {
+    const float *q = xyz2 + j * 3;
+    int cell[3];
+    for (int d = 0; d < 3; d++) {
+      cell[d] = grid_cell_cpu(q[d], grid_bounds[d], grid_bounds[3], grid_dims[d]);
+    }
+    heap.clear();
+    for (int cell_x = std::max(cell[0] - 1, 0); cell_x <= std::min(cell[0] + 1, grid_dims[0] - 1); cell_x++) {
+      for (int cell_y = std::max(cell[1] - 1, 0); cell_y <= std::min(cell[1] + 1, grid_dims[1] - 1); cell_y++) {
+        for (int cell_z = std::max(cell[2] - 1, 0); cell_z <= std::min(cell[2] + 1, grid_dims[2] - 1); cell_z++) {
+          int c = (cell_x * grid_dims[1] + cell_y) * grid_dims[2] + cell_z;
+          if (cell_starts[c] < cell_starts[c + 1]) {
+            int h = heap.size();
+            cell_pos[h] = cell_starts[c];
+            cell_end[h] = cell_starts[c + 1];
+            heap.push_back(std::make_pair(cell_points[cell_pos[h]], h));
+          }
+        }
+      }
+    }
+    std::make_heap(heap.begin(), heap.end(), std::greater<std::pair<int, int> >());
+
+    int cnt = 0;
+    while (cnt < nsample && !heap.empty()) {
+      std::pop_heap(heap.begin(), heap.end(), std::greater<std::pair<int, int> >());
+      int k = heap.back().first;
+      int h = heap.back().second;
+      heap.pop_back();
+      if (++cell_pos[h] < cell_end[h]) {
+        heap.push_back(std::make_pair(cell_points[cell_pos[h]], h));
+        std::push_heap(heap.begin(), heap.end(), std::greater<std::pair<int, int> >());
+      }
+      if (in_ball_cpu(xyz1 + k * 3, q, radius)) {
+        if (cnt == 0) {
+          // Balls with less than nsample points repeat their first one, as
+          // the GPU kernel does
+          std::fill(idx + j * nsample, idx + (j + 1) * nsample, k);
+        }
+        idx[j*nsample + cnt] = k;
+        cnt++;
+      }
+    }
+    if (cnt == 0) {
+      std::fill(idx + j * nsample, idx + (j + 1) * nsample, 0);
+    }
+    pts_cnt[j] = cnt;
+  }
+}
+
+// input: dist (b*m,n) rows
+// output: outi (b*m,n), out (b*m,n) of the rows [row_start, row_end), with
+//     their first k values selection sorted, as the GPU kernel does
+void selection_sort_cpu(int row_start, int row_end, int n, int k, const float *dist, int *outi, float *out) {
+  for (int j = row_start; j < row_end; j++) {
+    float *p_dist = out + (long long)j * n;
+    int *p_idx = outi + (long long)j * n;
+    for (int s = 0; s < n; s++) {
+      p_dist[s] = dist[(long long)j * n + s];
+      p_idx[s] = s;
+    }
+    for (int s = 0; s < std::min(k, n); s++) {
+      int min = s;
+      for (int t = s + 1; t < n; t++) {
+        if (p_dist[t] < p_dist[min]) {
+          min = t;
+        }
+      }
+      if (min != s) {
+        std::swap(p_dist[min], p_dist[s]);
+        std::swap(p_idx[min], p_idx[s]);
+      }
+    }
+  }
+}
+
+// input: points (b,n,c), idx (b,m,nsample)
+// output: out (b,m,nsample,c) of the groups [group_start, group_end) of
+//     the b*m ones
+void group_point_cpu(int group_start, int group_end, int n, int c, int m, int nsample,
+    const float *points, const int *idx, float *out) {
+  for (int g = group_start; g < group_end; g++) {
+    const float *batch_points = points + (long long)(g / m) * n * c;
+    for (int k = 0; k < nsample; k++) {
+      int ii = idx[(long long)g * nsample + k];
+      std::copy(batch_points + ii * c, batch_points + (ii + 1) * c, out + ((long long)g * nsample + k) * c);
+    }
+  }
+}
+
+// input: grad_out (b,m,nsample,c), idx (b,m,nsample)
+// output: grad_points (b,n,c) of the batch items [batch_start, batch_end),
+//     expected to be zero filled
+void group_point_grad_cpu(int batch_start, int batch_end, int n, int c, int m, int nsample,
+    const float *grad_out, const int *idx, float *grad_points) {
+  for (int i = batch_start; i < batch_end; i++) {
+    for (int j = 0; j < m * nsample; j++) {
+      long long g = (long long)i * m * nsample + j;
+      float *grad_point = grad_points + ((long long)i * n + idx[g]) * c;
+      for (int l = 0; l < c; l++) {
+        grad_point[l] += grad_out[g * c + l];
+      }
+    }
+  }
+}
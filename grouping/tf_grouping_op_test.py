@@ -1,6 +1,26 @@
 import tensorflow as tf
 import numpy as np
-from tf_grouping import query_ball_point, group_point
+from tf_grouping import query_ball_point, group_point, select_top_k
+
+
+def query_ball_point_np(radius, nsample, xyz1, xyz2):
+    """Numpy reference of the GPU op, which keeps the first nsample points
+    by index inside of the balls and repeats the first one"""
+    batch_size, npoint = xyz2.shape[:2]
+    idx = np.zeros((batch_size, npoint, nsample), dtype=np.int32)
+    pts_cnt = np.zeros((batch_size, npoint), dtype=np.int32)
+    for i in range(batch_size):
+        for j in range(npoint):
+            dist = np.sqrt(
+                np.sum((xyz1[i] - xyz2[i, j]) ** 2, axis=1, dtype=np.float32)
+            )
+            in_ball = np.flatnonzero(np.maximum(dist, np.float32(1e-20)) < radius)
+            in_ball = in_ball[:nsample]
+            pts_cnt[i, j] = len(in_ball)
+            if len(in_ball) > 0:
+                idx[i, j] = in_ball[0]
+                idx[i, j, : len(in_ball)] = in_ball
+    return idx, pts_cnt
 
 
 class GroupPointTest(tf.test.TestCase):
@@ -28,5 +48,100 @@ class GroupPointTest(tf.test.TestCase):
             self.assertLess(err, 1e-4)
 
 
+class GroupingCpuTest(tf.test.TestCase):
+    def test_query_ball_point(self):
+        rng = np.random.RandomState(0)
+        xyz1 = rng.uniform([0, 0, 0], [20, 2, 20], (2, 2048, 3)).astype(np.float32)
+        # Duplicated points and queries without any point in their ball
+        xyz1[:, 100:120] = xyz1[:, 99:100]
+        xyz2 = np.concatenate(
+            [xyz1[:, ::16], rng.uniform(-10, 30, (2, 64, 3)).astype(np.float32)],
+            axis=1,
+        )
+
+        num_empty_balls = 0
+        for radius, nsample in [(1.0, 8), (2.0, 32), (40.0, 8)]:
+            with tf.device("/cpu:0"):
+                outputs = query_ball_point(radius, nsample, xyz1, xyz2)
+            with self.test_session() as sess:
+                idx, pts_cnt = sess.run(outputs)
+
+            expected_idx, expected_pts_cnt = query_ball_point_np(
+                radius, nsample, xyz1, xyz2
+            )
+            self.assertGreater(np.sum(expected_pts_cnt == nsample), 0)
+            np.testing.assert_array_equal(pts_cnt, expected_pts_cnt)
+            np.testing.assert_array_equal(idx, expected_idx)
+            num_empty_balls += np.sum(pts_cnt == 0)
+        self.assertGreater(num_empty_balls, 0)
+
+    def test_select_top_k(self):
+        dist = np.random.RandomState(1).rand(2, 16, 64).astype(np.float32)
+
+        with tf.device("/cpu:0"):
+            outputs = select_top_k(5, dist)
+        with self.test_session() as sess:
+            idx, dist_out = sess.run(outputs)
+
+        expected_idx = np.argsort(dist, axis=2, kind="stable")[:, :, :5]
+        np.testing.assert_array_equal(idx[:, :, :5], expected_idx)
+        np.testing.assert_array_equal(dist_out, np.take_along_axis(dist, idx, axis=2))
+        np.testing.assert_array_equal(
+            np.sort(idx, axis=2), np.tile(np.arange(64), (2, 16, 1))
+        )
+
+    def test_group_point(self):
+        rng = np.random.RandomState(2)
+        points = rng.rand(2, 128, 16).astype(np.float32)
+        idx = rng.randint(128, size=(2, 8, 32)).astype(np.int32)
+
+        with tf.device("/cpu:0"):
+            grouped_points = group_point(points, idx)
+        with self.test_session() as sess:
+            grouped_points = sess.run(grouped_points)
+
+        np.testing.assert_array_equal(
+            grouped_points, points[np.arange(2)[:, None, None], idx]
+        )
+
+    def test_grad(self):
+        with tf.device("/cpu:0"):
+            points = tf.constant(np.random.random((1, 128, 16)).astype("float32"))
+            xyz1 = tf.constant(np.random.random((1, 128, 3)).astype("float32"))
+            xyz2 = tf.constant(np.random.random((1, 8, 3)).astype("float32"))
+            radius = 0.3
+            nsample = 32
+            idx, pts_cnt = query_ball_point(radius, nsample, xyz1, xyz2)
+            grouped_points = group_point(points, idx)
+
+        with self.test_session():
+            err = tf.test.compute_gradient_error(
+                points, (1, 128, 16), grouped_points, (1, 8, 32, 16)
+            )
+            self.assertLess(err, 1e-4)
+
+    def test_gpu_parity(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest("The GPU kernels are not available")
+        rng = np.random.RandomState(3)
+        points = rng.rand(2, 1024, 8).astype(np.float32)
+        xyz1 = rng.rand(2, 1024, 3).astype(np.float32)
+        xyz2 = xyz1[:, ::8]
+
+        outputs = []
+        for device in ["/cpu:0", "/gpu:0"]:
+            with tf.device(device):
+                points_tensor = tf.constant(points)
+                idx, pts_cnt = query_ball_point(0.2, 32, xyz1, xyz2)
+                grouped_points = group_point(points_tensor, idx)
+                grad = tf.gradients(grouped_points, points_tensor, grouped_points)[0]
+                outputs.append([idx, pts_cnt, grouped_points, grad])
+        with self.test_session() as sess:
+            cpu_outputs, gpu_outputs = sess.run(outputs)
+
+        for cpu_output, gpu_output in zip(cpu_outputs, gpu_outputs):
+            np.testing.assert_allclose(cpu_output, gpu_output, rtol=1e-5)
+
+
 if __name__ == "__main__":
     tf.test.main()
@@ -0,0 +1,67 @@
+"""Background writing of evaluation outputs."""
+
+import collections
+import concurrent.futures
+
+
+class AsyncWriter:
+    """Runs write functions in a thread pool, so that text formatting and
+    disk latency overlap the inference of the next samples.
+
+    At most `max_pending` writes are pending, submit waits for the oldest
+    ones beyond that. The error of a failed write is raised by the submit or
+    flush call which collects it. With `num_threads` 0, writes run
+    synchronously in submit.
+    """
+
+    def __init__(self, num_threads=2, max_pending=32):
+        """
+        Args:
+            num_threads: number of writer threads, 0 to write synchronously
+            max_pending: maximum number of writes not collected yet
+        """
+        self.num_threads = num_threads
+        self.max_pending = max(max_pending, 1)
+
+        self._executor = None
+        if num_threads > 0:
+            self._executor = concurrent.futures.ThreadPoolExecutor(num_threads)
+        # Writes in submission order
+        self._futures = collections.deque()
+
+    def _collect_done(self):
+        while self._futures and self._futures[0].done():
+            self._futures.popleft().result()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules fn(*args, **kwargs). The arguments must not be modified
+        until the write is done.
+
+        Returns:
+            future: concurrent.futures.Future of the write
+        """
+        self._collect_done()
+        if self._executor is None:
+            future = concurrent.futures.Future()
+            future.set_result(fn(*args, **kwargs))
+            return future
+
+        while len(self._futures) >= self.max_pending:
+            self._futures.popleft().result()
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def flush(self):
+        """Waits for all the pending writes, raising the first error"""
+        while self._futures:
+            self._futures.popleft().result()
+
+    def close(self):
+        """Flushes the pending writes and stops the threads"""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
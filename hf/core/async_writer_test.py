@@ -0,0 +1,71 @@
+"""AsyncWriter unit test module."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from hf.core.async_writer import AsyncWriter
+
+
+class AsyncWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_writes_after_flush(self):
+        arrays = [np.random.RandomState(i).rand(10, 8) for i in range(20)]
+        paths = [os.path.join(self.output_dir, "{}.txt".format(i)) for i in range(20)]
+
+        for num_threads in [0, 3]:
+            writer = AsyncWriter(num_threads, max_pending=4)
+            for path, array in zip(paths, arrays):
+                writer.submit(np.savetxt, path, array, fmt="%.3f")
+            writer.close()
+
+            for path, array in zip(paths, arrays):
+                np.testing.assert_allclose(np.loadtxt(path), array, atol=5e-4)
+                os.remove(path)
+
+    def test_bounded_pending_writes(self):
+        release = threading.Event()
+        writer = AsyncWriter(1, max_pending=2)
+        writer.submit(release.wait)
+        writer.submit(release.wait)
+
+        # The third write waits for the first one
+        submitted = threading.Event()
+        thread = threading.Thread(
+            target=lambda: (writer.submit(release.wait), submitted.set())
+        )
+        thread.start()
+        self.assertFalse(submitted.wait(0.2))
+        release.set()
+        thread.join()
+        self.assertTrue(submitted.is_set())
+        writer.close()
+
+    def test_errors_surface(self):
+        missing_path = os.path.join(self.output_dir, "missing", "0.txt")
+        writer = AsyncWriter(2)
+        writer.submit(np.savetxt, missing_path, np.zeros(3))
+        with self.assertRaises(IOError):
+            writer.flush()
+        # The error is raised once
+        writer.flush()
+
+        # Or by the next submit
+        future = writer.submit(np.savetxt, missing_path, np.zeros(3))
+        future.exception()
+        with self.assertRaises(IOError):
+            writer.submit(np.savetxt, missing_path, np.zeros(3))
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
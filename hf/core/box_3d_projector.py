@@ -5,10 +5,6 @@ Returns the 4 points (x, y) of the corresponding box
 import numpy as np
 import tensorflow as tf
 
-from hf.core import calib_utils
-from hf.core import obj_utils
-
-from hf.core import box_3d_encoder
 from hf.core import box_8c_encoder
 from hf.core import format_checker
 
@@ -108,17 +104,80 @@ def project_to_image_space(
 
     format_checker.check_box_3d_format(box_3d)
 
-    obj_label = box_3d_encoder.box_3d_to_object_label(box_3d)
-    corners_3d = obj_utils.compute_box_corners_3d(obj_label)
+    img_boxes, valid_mask = project_boxes_to_image_space(
+        np.reshape(box_3d, (1, 7)),
+        calib_p2,
+        truncate=truncate,
+        image_size=image_size,
+        discard_before_truncation=discard_before_truncation,
+    )
+    if not valid_mask[0]:
+        return None
+
+    return img_boxes[0]
+
+
+def project_boxes_to_image_space(
+    boxes_3d, calib_p2, truncate=False, image_size=None, discard_before_truncation=True
+):
+    """ Projects an array of box_3d into image space
 
-    projected = calib_utils.project_to_image(corners_3d, calib_p2)
+    Args:
+        boxes_3d: N x [x, y, z, l, w, h, ry] boxes to project
+        calib_p2: stereo calibration p2 matrix
+        truncate: if True, 2D projections are truncated to be inside the image
+        image_size: [w, h] must be provided if truncate is True,
+            used for truncation
+        discard_before_truncation: If True, discard boxes that are larger than
+            80% of the image in width OR height BEFORE truncation. If False,
+            discard boxes that are larger than 80% of the width AND
+            height AFTER truncation.
 
-    x1 = np.amin(projected[0])
-    y1 = np.amin(projected[1])
-    x2 = np.amax(projected[0])
-    y2 = np.amax(projected[1])
+    Returns:
+        img_boxes: N x [x1, y1, x2, y2] projected boxes in image space
+        valid_mask: (N,) bool mask, False for the boxes that are not inside
+            the image, i.e. the ones project_to_image_space returns None for
+    """
 
-    img_box = np.array([x1, y1, x2, y2])
+    format_checker.check_box_3d_format(boxes_3d)
+    boxes_3d = np.asarray(boxes_3d, dtype=np.float64).reshape(-1, 7)
+
+    l = boxes_3d[:, 3:4]
+    w = boxes_3d[:, 4:5]
+    h = boxes_3d[:, 5:6]
+    ry = boxes_3d[:, 6:7]
+
+    # 3D BB corners, (N, 8) each, as obj_utils.compute_box_corners_3d
+    x_corners = l * np.array([0.5, 0.5, -0.5, -0.5, 0.5, 0.5, -0.5, -0.5])
+    y_corners = -h * np.array([0, 0, 0, 0, 1, 1, 1, 1])
+    z_corners = w * np.array([0.5, -0.5, -0.5, 0.5, 0.5, -0.5, -0.5, 0.5])
+
+    cos_ry = np.cos(ry)
+    sin_ry = np.sin(ry)
+    corners_3d = np.stack(
+        [
+            cos_ry * x_corners + sin_ry * z_corners + boxes_3d[:, 0:1],
+            y_corners + boxes_3d[:, 1:2],
+            -sin_ry * x_corners + cos_ry * z_corners + boxes_3d[:, 2:3],
+        ],
+        axis=-1,
+    )
+
+    # (N, 8, 3) homogeneous image points
+    projected = np.dot(corners_3d, calib_p2[:, 0:3].T) + calib_p2[:, 3]
+    projected_x = projected[..., 0] / projected[..., 2]
+    projected_y = projected[..., 1] / projected[..., 2]
+
+    img_boxes = np.stack(
+        [
+            np.amin(projected_x, axis=1),
+            np.amin(projected_y, axis=1),
+            np.amax(projected_x, axis=1),
+            np.amax(projected_y, axis=1),
+        ],
+        axis=1,
+    )
+    valid_mask = np.ones(len(img_boxes), dtype=bool)
 
     if truncate:
         if not image_size:
@@ -128,36 +187,32 @@ def project_to_image_space(
         image_h = image_size[1]
 
         # Discard invalid boxes (outside image space)
-        if (
-            img_box[0] > image_w
-            or img_box[1] > image_h
-            or img_box[2] < 0
-            or img_box[3] < 0
-        ):
-            return None
+        valid_mask &= (
+            (img_boxes[:, 0] <= image_w)
+            & (img_boxes[:, 1] <= image_h)
+            & (img_boxes[:, 2] >= 0)
+            & (img_boxes[:, 3] >= 0)
+        )
 
         # Discard boxes that are larger than 80% of the image width OR height
         if discard_before_truncation:
-            img_box_w = img_box[2] - img_box[0]
-            img_box_h = img_box[3] - img_box[1]
-            if img_box_w > (image_w * 0.8) or img_box_h > (image_h * 0.8):
-                return None
+            img_boxes_w = img_boxes[:, 2] - img_boxes[:, 0]
+            img_boxes_h = img_boxes[:, 3] - img_boxes[:, 1]
+            valid_mask &= (img_boxes_w <= image_w * 0.8) & (
+                img_boxes_h <= image_h * 0.8
+            )
 
         # Truncate remaining boxes into image space
-        if img_box[0] < 0:
-            img_box[0] = 0
-        if img_box[1] < 0:
-            img_box[1] = 0
-        if img_box[2] > image_w:
-            img_box[2] = image_w
-        if img_box[3] > image_h:
-            img_box[3] = image_h
+        img_boxes[:, 0:2] = np.maximum(img_boxes[:, 0:2], 0)
+        img_boxes[:, 2] = np.minimum(img_boxes[:, 2], image_w)
+        img_boxes[:, 3] = np.minimum(img_boxes[:, 3], image_h)
 
         # Discard boxes that are covering the the whole image after truncation
         if not discard_before_truncation:
-            img_box_w = img_box[2] - img_box[0]
-            img_box_h = img_box[3] - img_box[1]
-            if img_box_w > (image_w * 0.8) and img_box_h > (image_h * 0.8):
-                return None
+            img_boxes_w = img_boxes[:, 2] - img_boxes[:, 0]
+            img_boxes_h = img_boxes[:, 3] - img_boxes[:, 1]
+            valid_mask &= (img_boxes_w <= image_w * 0.8) | (
+                img_boxes_h <= image_h * 0.8
+            )
 
-    return img_box
+    return img_boxes, valid_mask
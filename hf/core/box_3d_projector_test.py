@@ -2,7 +2,57 @@ import unittest
 
 import numpy as np
 
+from hf.core import box_3d_encoder
 from hf.core import box_3d_projector
+from hf.core import calib_utils
+from hf.core import obj_utils
+
+
+def project_to_image_space_reference(
+    box_3d, calib_p2, truncate, image_size, discard_before_truncation
+):
+    """Projects a single box_3d through its ObjectLabel corners, with the
+    truncation rules applied box by box"""
+    obj_label = box_3d_encoder.box_3d_to_object_label(box_3d)
+    corners_3d = obj_utils.compute_box_corners_3d(obj_label)
+    projected = calib_utils.project_to_image(corners_3d, calib_p2)
+    img_box = np.array(
+        [
+            np.amin(projected[0]),
+            np.amin(projected[1]),
+            np.amax(projected[0]),
+            np.amax(projected[1]),
+        ]
+    )
+    if not truncate:
+        return img_box
+
+    image_w, image_h = image_size
+    if (
+        img_box[0] > image_w
+        or img_box[1] > image_h
+        or img_box[2] < 0
+        or img_box[3] < 0
+    ):
+        return None
+
+    img_box_w = img_box[2] - img_box[0]
+    img_box_h = img_box[3] - img_box[1]
+    if discard_before_truncation and (
+        img_box_w > image_w * 0.8 or img_box_h > image_h * 0.8
+    ):
+        return None
+
+    img_box = np.clip(img_box, 0, [image_w, image_h, image_w, image_h])
+
+    img_box_w = img_box[2] - img_box[0]
+    img_box_h = img_box[3] - img_box[1]
+    if not discard_before_truncation and (
+        img_box_w > image_w * 0.8 and img_box_h > image_h * 0.8
+    ):
+        return None
+
+    return img_box
 
 
 class Box3dProjectorTest(unittest.TestCase):
@@ -30,3 +80,57 @@ class Box3dProjectorTest(unittest.TestCase):
 
         for box, exp_box in zip(box_points, expected_boxes):
             np.testing.assert_allclose(box, exp_box, rtol=1e-5)
+
+    def test_project_boxes_to_image_space(self):
+        calib_p2 = np.array(
+            [
+                [721.5377, 0.0, 609.5593, 44.85728],
+                [0.0, 721.5377, 172.854, 0.2163791],
+                [0.0, 0.0, 1.0, 0.002745884],
+            ]
+        )
+        image_size = (1242, 375)
+
+        random_state = np.random.RandomState(0)
+        num_boxes = 200
+        boxes_3d = np.column_stack(
+            [
+                random_state.uniform(-30, 30, num_boxes),
+                random_state.uniform(0, 3, num_boxes),
+                random_state.uniform(1, 50, num_boxes),
+                random_state.uniform(1, 5, num_boxes),
+                random_state.uniform(1, 3, num_boxes),
+                random_state.uniform(1, 3, num_boxes),
+                random_state.uniform(-np.pi, np.pi, num_boxes),
+            ]
+        )
+
+        for truncate in [False, True]:
+            for discard_before_truncation in [False, True]:
+                img_boxes, valid_mask = box_3d_projector.project_boxes_to_image_space(
+                    boxes_3d,
+                    calib_p2,
+                    truncate=truncate,
+                    image_size=image_size,
+                    discard_before_truncation=discard_before_truncation,
+                )
+
+                for box_3d, img_box, valid in zip(boxes_3d, img_boxes, valid_mask):
+                    expected_box = project_to_image_space_reference(
+                        box_3d, calib_p2, truncate, image_size, discard_before_truncation
+                    )
+                    single_box = box_3d_projector.project_to_image_space(
+                        box_3d,
+                        calib_p2,
+                        truncate=truncate,
+                        image_size=image_size,
+                        discard_before_truncation=discard_before_truncation,
+                    )
+                    self.assertEqual(valid, expected_box is not None)
+                    self.assertEqual(valid, single_box is not None)
+                    if valid:
+                        np.testing.assert_allclose(img_box, expected_box, rtol=1e-6)
+                        np.testing.assert_array_equal(single_box, img_box)
+
+        # Some boxes of each kind
+        self.assertTrue(0 < np.sum(valid_mask) < num_boxes)
@@ -9,7 +9,7 @@ import tensorflow as tf
 import numpy as np
 from scipy.spatial import ConvexHull
 from hf.core import box_8c_encoder
-from hf.core import oriented_nms
+from hf.core import rotated_iou
 
 
 def polygon_clip(subjectPolygon, clipPolygon):
@@ -115,10 +115,11 @@ def box3d_iou(corners1, corners2):
     todo (rqi): add more description on corner points' orders.
     """
     # corner points are in counter clockwise order
-    rect1 = [(corners1[i, 0], corners1[i, 2]) for i in range(3, -1, -1)]
-    rect2 = [(corners2[i, 0], corners2[i, 2]) for i in range(3, -1, -1)]
-    # iou_2d, inter_area = polygon_iou(rect1, rect2)
-    iou_2d, inter_area = oriented_nms.polygon_iou(rect1, rect2)
+    rect1 = corners1[3::-1, [0, 2]]
+    rect2 = corners2[3::-1, [0, 2]]
+    inter_area = rotated_iou.rect_overlap_area(rect1, rect2)
+    area1, area2 = rotated_iou.rect_area(np.asarray([rect1, rect2]))
+    iou_2d = inter_area / max(area1 + area2 - inter_area, rotated_iou.EPS)
     ymax = min(corners1[0, 1], corners2[0, 1])
     ymin = max(corners1[4, 1], corners2[4, 1])
     inter_vol = inter_area * max(0.0, ymax - ymin)
@@ -154,6 +155,8 @@ def compute_recall_iou(
     iou3ds = np.zeros((n), dtype=np.float32)
     iou3ds_gt_boxes = np.zeros((n, 7), dtype=np.float32)
     iou3ds_gt_cls = np.zeros((n), dtype=np.float32)
+    recall_50 = 0
+    recall_70 = 0
 
     if m * n > 0:
         recall_50 = np.sum(np.max(mx_iou3ds, axis=0) > 0.5)
@@ -0,0 +1,262 @@
+"""Process-wide cache of per-frame calibrations and road planes.
+
+Calibration text files are parsed once per image index and kept with the
+precomposed velodyne -> rect and velodyne -> image transforms. The least
+recently used entries are evicted once the store is full. The calibrations
+of a whole split can also be snapshotted to a single .npz file and loaded
+back without parsing any text file.
+"""
+
+import collections
+import os
+import threading
+
+import numpy as np
+
+from hf.core import calib_utils
+
+CALIB_FIELDS = ("p0", "p1", "p2", "p3", "r0_rect", "tr_velodyne_to_cam")
+
+
+class CalibEntry:
+    """Cached calibration of a frame
+
+        frame_calib     FrameCalibrationData, with read-only matrices
+        velo_to_rect    3x4 R0_rect * Tr_velo_to_cam
+        velo_to_image   3x4 P2 * [velo_to_rect; 0 0 0 1]
+    """
+
+    def __init__(self, frame_calib):
+        for field in CALIB_FIELDS:
+            matrix = np.array(getattr(frame_calib, field), dtype=np.float64)
+            matrix.flags.writeable = False
+            setattr(frame_calib, field, matrix)
+        self.frame_calib = frame_calib
+
+        velo_to_rect = calib_utils.velo_to_rect_matrix(frame_calib)
+        velo_to_image = np.dot(frame_calib.p2[:, 0:3], velo_to_rect)
+        velo_to_image[:, 3] += frame_calib.p2[:, 3]
+
+        velo_to_rect.flags.writeable = False
+        velo_to_image.flags.writeable = False
+        self.velo_to_rect = velo_to_rect
+        self.velo_to_image = velo_to_image
+
+
+class CalibrationStore:
+    """LRU store of CalibEntry objects and road planes, keyed by their
+    source directory and image index."""
+
+    def __init__(self, max_entries=8192):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key, load_fn):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        # Load outside of the lock, files may be slow to read
+        value = load_fn()
+        self._put(key, value)
+        return value
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_calib_entry(self, calib_dir, img_idx, read_fn=None):
+        """Returns the CalibEntry of a frame, reading it on a miss
+
+        Args:
+            calib_dir: directory of the calibration files, or any unique
+                name of the calibration source when read_fn is given
+            img_idx: image index
+            read_fn: (optional) function returning the FrameCalibrationData
+                of an image index, calib_utils.read_calibration by default
+
+        Returns:
+            CalibEntry, shared with other callers, must not be modified
+        """
+        if read_fn is None:
+
+            def read_fn(idx):
+                return calib_utils.read_calibration(calib_dir, idx)
+
+        return self._get(
+            ("calib", calib_dir, int(img_idx)),
+            lambda: CalibEntry(read_fn(int(img_idx))),
+        )
+
+    def get_road_plane(self, planes_dir, img_idx):
+        """Returns the read-only road plane of a frame, reading it on a miss"""
+        # Imported here, obj_utils depends on this module
+        from hf.core import obj_utils
+
+        def load_plane():
+            plane = obj_utils.get_road_plane(int(img_idx), planes_dir)
+            plane.flags.writeable = False
+            return plane
+
+        return self._get(("plane", planes_dir, int(img_idx)), load_plane)
+
+    def save_snapshot(
+        self, snapshot_path, calib_dir, img_indices, planes_dir=None, split=""
+    ):
+        """Saves the calibrations, and optionally the road planes, of a set
+        of frames to a .npz file
+
+        Args:
+            snapshot_path: path of the .npz file
+            calib_dir: directory of the calibration files
+            img_indices: image indices to save
+            planes_dir: (optional) directory of the road plane files
+            split: (optional) name of the data split of the frames
+        """
+        img_indices = np.asarray(img_indices, dtype=np.int64)
+        entries = [self.get_calib_entry(calib_dir, idx) for idx in img_indices]
+
+        arrays = {
+            field: np.stack([getattr(entry.frame_calib, field) for entry in entries])
+            for field in CALIB_FIELDS
+        }
+        arrays["img_indices"] = img_indices
+        arrays["calib_dir"] = np.array(calib_dir)
+        arrays["split"] = np.array(split)
+        if planes_dir is not None:
+            arrays["planes"] = np.stack(
+                [self.get_road_plane(planes_dir, idx) for idx in img_indices]
+            )
+            arrays["planes_dir"] = np.array(planes_dir)
+
+        snapshot_dir = os.path.dirname(snapshot_path)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+        # Write to a temporary file first, so concurrent readers never see a
+        # partial snapshot
+        tmp_snapshot_path = "{}.{}.tmp".format(snapshot_path, os.getpid())
+        with open(tmp_snapshot_path, "wb") as snapshot_file:
+            np.savez(snapshot_file, **arrays)
+        os.replace(tmp_snapshot_path, snapshot_path)
+
+    @staticmethod
+    def snapshot_matches(
+        snapshot_path, calib_dir, img_indices, planes_dir=None, split=""
+    ):
+        """Returns whether the .npz file at snapshot_path is a snapshot of the
+        same split, directories and image indices"""
+        if not os.path.exists(snapshot_path):
+            return False
+
+        with np.load(snapshot_path) as snapshot:
+            if "split" not in snapshot or str(snapshot["split"]) != split:
+                return False
+            if str(snapshot["calib_dir"]) != calib_dir:
+                return False
+            if not np.array_equal(
+                snapshot["img_indices"], np.asarray(img_indices, dtype=np.int64)
+            ):
+                return False
+            if planes_dir is None:
+                return "planes" not in snapshot
+            return "planes" in snapshot and str(snapshot["planes_dir"]) == planes_dir
+
+    def load_or_save_snapshot(
+        self, snapshot_path, calib_dir, img_indices, planes_dir=None, split=""
+    ):
+        """Fills the store from the snapshot at snapshot_path, or saves a new
+        snapshot there when it is missing or was saved for another split,
+        other directories or other image indices.
+
+        Args:
+            snapshot_path: path of the .npz file
+            calib_dir: directory of the calibration files
+            img_indices: image indices of the snapshot
+            planes_dir: (optional) directory of the road plane files
+            split: (optional) name of the data split of the frames
+        """
+        if self.snapshot_matches(
+            snapshot_path, calib_dir, img_indices, planes_dir, split
+        ):
+            self.load_snapshot(snapshot_path)
+        else:
+            self.save_snapshot(snapshot_path, calib_dir, img_indices, planes_dir, split)
+
+    def load_snapshot(self, snapshot_path):
+        """Fills the store from a .npz file written by save_snapshot. The
+        store grows to hold the whole snapshot.
+
+        Args:
+            snapshot_path: path of the .npz file
+        """
+        with np.load(snapshot_path) as snapshot:
+            img_indices = snapshot["img_indices"]
+            calib_dir = str(snapshot["calib_dir"])
+            matrices = {field: snapshot[field] for field in CALIB_FIELDS}
+            if "planes" in snapshot:
+                planes = snapshot["planes"]
+                planes_dir = str(snapshot["planes_dir"])
+            else:
+                planes = None
+
+        num_entries = len(img_indices) * (1 if planes is None else 2)
+        self.max_entries = max(self.max_entries, len(self._entries) + num_entries)
+
+        for frame_idx, img_idx in enumerate(img_indices):
+            frame_calib = calib_utils.FrameCalibrationData()
+            for field in CALIB_FIELDS:
+                setattr(frame_calib, field, matrices[field][frame_idx])
+            self._put(("calib", calib_dir, int(img_idx)), CalibEntry(frame_calib))
+
+            if planes is not None:
+                plane = planes[frame_idx]
+                plane.flags.writeable = False
+                self._put(("plane", planes_dir, int(img_idx)), plane)
+
+
+# Store shared by the whole process
+_store = CalibrationStore()
+
+
+def get_store():
+    return _store
+
+
+def read_calibration(calib_dir, img_idx, read_fn=None):
+    """Cached equivalent of calib_utils.read_calibration
+
+    Returns:
+        frame_calib: FrameCalibrationData with writable copies of the cached
+            matrices
+    """
+    entry = _store.get_calib_entry(calib_dir, img_idx, read_fn)
+
+    frame_calib = calib_utils.FrameCalibrationData()
+    for field in CALIB_FIELDS:
+        setattr(frame_calib, field, np.array(getattr(entry.frame_calib, field)))
+    return frame_calib
+
+
+def get_velo_transforms(calib_dir, img_idx, read_fn=None):
+    """Returns the precomposed, read-only (velo_to_rect, velo_to_image)
+    3x4 transforms of a frame"""
+    entry = _store.get_calib_entry(calib_dir, img_idx, read_fn)
+    return entry.velo_to_rect, entry.velo_to_image
+
+
+def get_road_plane(planes_dir, img_idx):
+    """Cached equivalent of obj_utils.get_road_plane, returns a copy"""
+    return np.array(_store.get_road_plane(planes_dir, img_idx))
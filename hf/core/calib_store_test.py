@@ -0,0 +1,136 @@
+"""CalibrationStore unit test module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import hf.tests as tests
+
+from hf.core import calib_store
+from hf.core import calib_utils
+from hf.core import obj_utils
+
+
+class CalibStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tests.test_path() + "/datasets/Kitti/object/training"
+        cls.calib_dir = cls.data_dir + "/calib"
+        cls.planes_dir = cls.data_dir + "/planes"
+        cls.img_indices = [0, 1, 2, 3]
+
+    def test_cached_calibration(self):
+        store = calib_store.CalibrationStore()
+        for img_idx in self.img_indices:
+            expected_calib = calib_utils.read_calibration(self.calib_dir, img_idx)
+            entry = store.get_calib_entry(self.calib_dir, img_idx)
+
+            np.testing.assert_array_equal(entry.frame_calib.p2, expected_calib.p2)
+            np.testing.assert_allclose(
+                entry.velo_to_rect,
+                np.dot(expected_calib.r0_rect, expected_calib.tr_velodyne_to_cam),
+            )
+
+            # The same entry is returned on a hit
+            self.assertIs(store.get_calib_entry(self.calib_dir, img_idx), entry)
+
+    def test_returned_calibration_is_a_copy(self):
+        frame_calib = calib_store.read_calibration(self.calib_dir, 0)
+        frame_calib.p2[0, 0] = 0.0
+
+        expected_p2 = calib_utils.read_calibration(self.calib_dir, 0).p2
+        np.testing.assert_array_equal(
+            calib_store.read_calibration(self.calib_dir, 0).p2, expected_p2
+        )
+
+    def test_lru_eviction(self):
+        store = calib_store.CalibrationStore(max_entries=2)
+        store.get_calib_entry(self.calib_dir, 0)
+        store.get_calib_entry(self.calib_dir, 1)
+        # Make 0 the most recently used
+        store.get_calib_entry(self.calib_dir, 0)
+        store.get_calib_entry(self.calib_dir, 2)
+
+        self.assertEqual(len(store), 2)
+
+        # 1 was evicted, reading it again calls read_fn
+        read_indices = []
+
+        def read_fn(img_idx):
+            read_indices.append(img_idx)
+            return calib_utils.read_calibration(self.calib_dir, img_idx)
+
+        store.get_calib_entry(self.calib_dir, 0, read_fn)
+        store.get_calib_entry(self.calib_dir, 1, read_fn)
+        self.assertEqual(read_indices, [1])
+
+    def test_snapshot(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, "calib.npz")
+            calib_store.CalibrationStore().save_snapshot(
+                snapshot_path, self.calib_dir, self.img_indices, self.planes_dir
+            )
+
+            store = calib_store.CalibrationStore(max_entries=1)
+            store.load_snapshot(snapshot_path)
+
+            def read_fn(img_idx):
+                raise AssertionError("Calibration should come from the snapshot")
+
+            for img_idx in self.img_indices:
+                entry = store.get_calib_entry(self.calib_dir, img_idx, read_fn)
+                expected_calib = calib_utils.read_calibration(self.calib_dir, img_idx)
+                np.testing.assert_array_equal(entry.frame_calib.p2, expected_calib.p2)
+
+                np.testing.assert_array_equal(
+                    store.get_road_plane(self.planes_dir, img_idx),
+                    obj_utils.get_road_plane(img_idx, self.planes_dir),
+                )
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_stale_snapshot_is_saved_again(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(snapshot_dir, "calib.npz")
+            calib_store.CalibrationStore().save_snapshot(
+                snapshot_path, self.calib_dir, self.img_indices[:2], split="train"
+            )
+            self.assertTrue(
+                calib_store.CalibrationStore.snapshot_matches(
+                    snapshot_path, self.calib_dir, self.img_indices[:2], split="train"
+                )
+            )
+
+            # Another split, other frames or other directories
+            for calib_dir, img_indices, planes_dir, split in [
+                (self.calib_dir, self.img_indices[:2], None, "val"),
+                (self.calib_dir, self.img_indices, None, "train"),
+                (self.data_dir + "/missing", self.img_indices[:2], None, "train"),
+                (self.calib_dir, self.img_indices[:2], self.planes_dir, "train"),
+            ]:
+                self.assertFalse(
+                    calib_store.CalibrationStore.snapshot_matches(
+                        snapshot_path, calib_dir, img_indices, planes_dir, split
+                    )
+                )
+
+            store = calib_store.CalibrationStore()
+            store.load_or_save_snapshot(
+                snapshot_path, self.calib_dir, self.img_indices, split="val"
+            )
+            self.assertTrue(
+                calib_store.CalibrationStore.snapshot_matches(
+                    snapshot_path, self.calib_dir, self.img_indices, split="val"
+                )
+            )
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -367,6 +367,50 @@ def read_lidar(velo_dir, img_idx):
         return []
 
 
+def memmap_lidar(velo_dir, img_idx):
+    """Memory maps a PointCloud from Kitti Dataset without reading it.
+
+        Keyword Arguments:
+        ------------------
+        velo_dir : Str
+                    Directory of the velodyne files.
+
+        img_idx : Int
+                  Index of the image.
+
+        Returns:
+        --------
+        xyzi : N x 4 read-only float32 Numpy memmap
+                   Contains the x, y, z coordinates and intensity values
+                   of the pointcloud.
+
+        """
+    velo_path = velo_dir + "/%06d.bin" % img_idx
+
+    if os.path.getsize(velo_path) == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+
+    return np.memmap(velo_path, dtype=np.float32, mode="r").reshape(-1, 4)
+
+
+def velo_to_rect_matrix(frame_calib):
+    """Composes the velodyne to rectified camera frame transform.
+
+        Keyword Arguments:
+        ------------------
+        frame_calib : FrameCalibrationData
+                  Contains calibration information for a given frame
+
+        Returns:
+        --------
+        velo_to_rect : 3 x 4 Numpy Array
+                   R0_rect * Tr_velo_to_cam, such that
+                   p_rect = velo_to_rect * [p_velo, 1].
+
+        """
+    return np.dot(frame_calib.r0_rect, frame_calib.tr_velodyne_to_cam)
+
+
 def lidar_to_cam_frame(xyz_lidar, frame_calib):
     """Transforms the pointclouds to the camera 0 frame.
 
@@ -385,23 +429,11 @@ def lidar_to_cam_frame(xyz_lidar, frame_calib):
 
         """
 
-    # Pad the r0_rect matrix to a 4x4
-    r0_rect_mat = frame_calib.r0_rect
-    r0_rect_mat = np.pad(r0_rect_mat, ((0, 1), (0, 1)), "constant", constant_values=0)
-    r0_rect_mat[3, 3] = 1
-
-    # Pad the tr_vel_to_cam matrix to a 4x4
-    tf_mat = frame_calib.tr_velodyne_to_cam
-    tf_mat = np.pad(tf_mat, ((0, 1), (0, 0)), "constant", constant_values=0)
-    tf_mat[3, 3] = 1
-
-    # Pad the pointcloud with 1's for the transformation matrix multiplication
-    one_pad = np.ones(xyz_lidar.shape[0]).reshape(-1, 1)
-    xyz_lidar = np.append(xyz_lidar, one_pad, axis=1)
+    # p_cam = R0_rect * Tr_velo_to_cam * p_velo
+    rectified = velo_to_rect_matrix(frame_calib)
 
-    # p_cam = P2 * R0_rect * Tr_velo_to_cam * p_velo
-    rectified = np.dot(r0_rect_mat, tf_mat)
-    ret_xyz = np.dot(rectified, xyz_lidar.T)
+    # Apply the translation instead of padding the pointcloud with 1's
+    ret_xyz = np.dot(xyz_lidar, rectified[:, 0:3].T)
+    ret_xyz += rectified[:, 3]
 
-    # Change to N x 3 array for consistency.
-    return ret_xyz[0:3].T
+    return ret_xyz
@@ -2,21 +2,22 @@ from __future__ import print_function
 
 import tensorflow as tf
 from bev_iou import bev_iou
+from hf.core import ops
 
 
 def boxes3d_to_bev_tf(boxes3d):
     """
     Input:
-        boxes3d: (N, 7) [x, y, z, l, w, h, ry]
+        boxes3d: (..., N, 7) [x, y, z, l, w, h, ry]
     Output:
-        boxes_bev: (N, 5) [x1, y1, x2, y2, ry]
+        boxes_bev: (..., N, 5) [x1, y1, x2, y2, ry]
     """
-    cu, cv = boxes3d[:, 0], boxes3d[:, 2]
-    half_l, half_w = boxes3d[:, 3] / 2, boxes3d[:, 4] / 2
+    cu, cv = boxes3d[..., 0], boxes3d[..., 2]
+    half_l, half_w = boxes3d[..., 3] / 2, boxes3d[..., 4] / 2
     x1, y1 = cu - half_l, cv - half_w
     x2, y2 = cu + half_l, cv + half_w
-    ry = boxes3d[:, 6]
-    boxes_bev = tf.stack([x1, y1, x2, y2, ry], axis=1)
+    ry = boxes3d[..., 6]
+    boxes_bev = tf.stack([x1, y1, x2, y2, ry], axis=-1)
     return boxes_bev
 
 
@@ -35,15 +36,45 @@ def box3d_iou_tf(boxes_a, boxes_b):
 
     overlaps_bev, iou_2d = bev_iou.compute_bev_iou(boxes_a_bev, boxes_b_bev)
 
+    iou_3d = _iou_3d_from_bev_overlaps(boxes_a, boxes_b, overlaps_bev)
+
+    return iou_3d, iou_2d
+
+
+def batch_box3d_iou_tf(boxes_a, boxes_b):
+    """ Compute 3D bounding box IoU for Oriented BBox of each batch item.
+    Tensorflow version.
+
+    Input:
+        boxes_a: (B, N, 7) [x, y, z, h, w, l, ry]
+        boxes_b: (B, M, 7) [x, y, z, h, w, l, ry]
+    Output:
+        iou_3d: (B, N, M) 3D bounding box IoU
+        iou_2d: (B, N, M) bird's eye view 2D bounding box IoU
+    """
+    boxes_a_bev = boxes3d_to_bev_tf(boxes_a)
+    boxes_b_bev = boxes3d_to_bev_tf(boxes_b)
+
+    overlaps_bev, iou_2d = bev_iou.batch_compute_bev_iou(boxes_a_bev, boxes_b_bev)
+    iou_3d = _iou_3d_from_bev_overlaps(boxes_a, boxes_b, overlaps_bev)
+
+    return iou_3d, iou_2d
+
+
+def _iou_3d_from_bev_overlaps(boxes_a, boxes_b, overlaps_bev):
+    """
+    Input:
+        boxes_a: (..., N, 7) [x, y, z, h, w, l, ry]
+        boxes_b: (..., M, 7) [x, y, z, h, w, l, ry]
+        overlaps_bev: (..., N, M) bird's eye view overlap areas
+    Output:
+        iou_3d: (..., N, M) 3D bounding box IoU
+    """
     # height overlap
-    boxes_a_height_min = tf.reshape(boxes_a[:, 1] - boxes_a[:, 5], [-1, 1])
-    boxes_a_height_min = tf.tile(boxes_a_height_min, [1, tf.shape(boxes_b)[0]])
-    boxes_a_height_max = tf.reshape(boxes_a[:, 1], [-1, 1])
-    boxes_a_height_max = tf.tile(boxes_a_height_max, [1, tf.shape(boxes_b)[0]])
-    boxes_b_height_min = tf.reshape(boxes_b[:, 1] - boxes_b[:, 5], [1, -1])
-    boxes_b_height_min = tf.tile(boxes_b_height_min, [tf.shape(boxes_a)[0], 1])
-    boxes_b_height_max = tf.reshape(boxes_b[:, 1], [1, -1])
-    boxes_b_height_max = tf.tile(boxes_b_height_max, [tf.shape(boxes_a)[0], 1])
+    boxes_a_height_min = tf.expand_dims(boxes_a[..., 1] - boxes_a[..., 5], -1)
+    boxes_a_height_max = tf.expand_dims(boxes_a[..., 1], -1)
+    boxes_b_height_min = tf.expand_dims(boxes_b[..., 1] - boxes_b[..., 5], -2)
+    boxes_b_height_max = tf.expand_dims(boxes_b[..., 1], -2)
 
     max_of_min = tf.maximum(boxes_a_height_min, boxes_b_height_min)
     min_of_max = tf.minimum(boxes_a_height_max, boxes_b_height_max)
@@ -52,16 +83,13 @@ def box3d_iou_tf(boxes_a, boxes_b):
     # 3d iou
     overlaps_3d = overlaps_bev * overlaps_h
 
-    vol_a = tf.reshape(boxes_a[:, 3] * boxes_a[:, 4] * boxes_a[:, 5], [-1, 1])
-    vol_a = tf.tile(vol_a, [1, tf.shape(boxes_b)[0]])
-    vol_b = tf.reshape(boxes_b[:, 3] * boxes_b[:, 4] * boxes_b[:, 5], [1, -1])
-    vol_b = tf.tile(vol_b, [tf.shape(boxes_a)[0], 1])
+    vol_a = tf.expand_dims(boxes_a[..., 3] * boxes_a[..., 4] * boxes_a[..., 5], -1)
+    vol_b = tf.expand_dims(boxes_b[..., 3] * boxes_b[..., 4] * boxes_b[..., 5], -2)
 
     iou_3d = overlaps_3d / tf.clip_by_value(
         vol_a + vol_b - overlaps_3d, 1e-7, tf.float32.max
     )
-
-    return iou_3d, iou_2d
+    return iou_3d
 
 
 def oriented_nms_tf(boxes, scores, thresh):
@@ -80,6 +108,35 @@ def oriented_nms_tf(boxes, scores, thresh):
     return tf.gather(sorted_idxs, keep_idx)
 
 
+def batch_oriented_nms_tf(boxes, scores, thresh, num_valid=None):
+    """
+    Inputs:
+        boxes: (B, N, 7) [x, y, z, h, w, l, ry]
+        scores: (B, N)
+        thresh: scalar. float
+        num_valid: (B) int32, number of boxes of each batch item, the boxes
+            past them are left out. All the boxes if None
+    Outputs:
+        keep_idx: (B, N), padded with the first kept index
+        num_keep: (B)
+    """
+    scores_shape = tf.shape(scores)
+    batch_size = scores_shape[0]
+    num_boxes = scores_shape[1]
+    if num_valid is None:
+        num_valid = tf.fill([batch_size], num_boxes)
+    else:
+        # The boxes past the valid ones are sorted last
+        valid = tf.expand_dims(tf.range(num_boxes), 0) < tf.expand_dims(num_valid, 1)
+        scores = tf.where(valid, scores, tf.fill(scores_shape, -tf.float32.max))
+
+    boxes_bev = boxes3d_to_bev_tf(boxes)
+    _, sorted_idxs = tf.nn.top_k(scores, k=num_boxes)
+    boxes_bev = ops.batch_gather(boxes_bev, sorted_idxs)
+    keep_idx, num_keep = bev_iou.batch_oriented_nms(boxes_bev, num_valid, thresh)
+    return ops.batch_gather(sorted_idxs, keep_idx), num_keep
+
+
 if __name__ == "__main__":
 
     boxes_a = tf.constant([[[1, 2, 3, 4, 5, 6, 7]]], dtype=tf.float32)
@@ -8,13 +8,10 @@ from multiprocessing import Process
 
 import tensorflow as tf
 
-from hf.core import obj_utils
-
-from hf.core import box_3d_encoder
 from hf.core import evaluator_utils
 from hf.core import summary_utils
 from hf.core import trainer_utils
-from hf.core import box_util
+from hf.core.async_writer import AsyncWriter
 
 from hf.core.models.rcnn_model import RcnnModel
 from hf.core.models.rpn_model import RpnModel
@@ -34,6 +31,17 @@ KEY_SUM_RPN_IOU2D = "sum_rpn_iou2d"
 KEY_SUM_RPN_IOU3D = "sum_rpn_iou3d"
 KEY_SUM_RPN_ANGLE_RES = "sum_rpn_angel_residual"
 
+# Sums of eval_rpn_stats of each evaluator_utils.compute_proposal_stats value
+PROPOSAL_STAT_KEYS = {
+    "recall_50": KEY_SUM_RPN_RECALL_50,
+    "recall_70": KEY_SUM_RPN_RECALL_70,
+    "num_labels": KEY_SUM_RPN_LABEL,
+    "num_proposals": KEY_SUM_RPN_PROPOSAL,
+    "iou2d": KEY_SUM_RPN_IOU2D,
+    "iou3d": KEY_SUM_RPN_IOU3D,
+    "angle_res": KEY_SUM_RPN_ANGLE_RES,
+}
+
 KEY_SUM_RCNN_CLS_LOSS = "sum_rcnn_cls_loss"
 KEY_SUM_RCNN_BIN_CLS_LOSS = "sum_rcnn_bin_cls_loss"
 KEY_SUM_RCNN_REG_LOSS = "sum_rcnn_reg_loss"
@@ -101,10 +109,13 @@ class Evaluator:
 
         if self.do_kitti_native_eval:
             if self.eval_config.eval_mode == "val":
-                # Copy kitti native eval code into the predictions folder
-                evaluator_utils.copy_kitti_native_code(
-                    self.model_config.checkpoint_name
-                )
+                if self.eval_config.python_kitti_eval:
+                    evaluator_utils.make_kitti_results_dirs()
+                else:
+                    # Copy kitti native eval code into the predictions folder
+                    evaluator_utils.copy_kitti_native_code(
+                        self.model_config.checkpoint_name
+                    )
 
         allow_gpu_mem_growth = self.eval_config.allow_gpu_mem_growth
         if allow_gpu_mem_growth:
@@ -136,6 +147,14 @@ class Evaluator:
 
         self._saver = tf.train.Saver()
 
+        # Predictions are written in the background while the next samples
+        # are evaluated, by a writer opened for each checkpoint
+        self._writer = None
+
+        # Ground truth evaluation state of the split, loaded on the first
+        # kitti evaluation and reused for all the following checkpoints
+        self._gt_eval_cache = None
+
         # Add maximum memory usage summary op
         # This op can only be run on device with gpu
         # so it's skipped on travis
@@ -153,6 +172,23 @@ class Evaluator:
             checkpoint_to_restore: The directory of the checkpoint to restore.
         """
 
+        eval_start_time = time.time()
+        self._writer = AsyncWriter(
+            self.eval_config.num_writer_threads, self.eval_config.writer_queue_size
+        )
+        try:
+            self._evaluate_checkpoint(checkpoint_to_restore)
+        finally:
+            self._writer.close()
+            self._writer = None
+
+        print(
+            "Evaluated {} in {:.3f} s".format(
+                checkpoint_to_restore, time.time() - eval_start_time
+            )
+        )
+
+    def _evaluate_checkpoint(self, checkpoint_to_restore):
         self._saver.restore(self._sess, checkpoint_to_restore)
 
         data_split = self.dataset_config.data_split
@@ -301,13 +337,7 @@ class Evaluator:
                         for sample_name in sample_names
                     ]
                     self.calculate_proposals_info(
-                        predictions[RpnModel.PRED_IOU_2D],
-                        predictions[RpnModel.PRED_IOU_3D],
-                        rpn_file_paths,
-                        sample_names,
-                        prop_iou_files,
-                        eval_rpn_stats,
-                        global_step,
+                        predictions, prop_iou_files, eval_rpn_stats, global_step
                     )
 
                 # Calculate accuracies
@@ -344,6 +374,15 @@ class Evaluator:
 
         # end while current_epoch == model.dataset.epochs_completed:
 
+        # Wait for the pending writes before using the saved predictions
+        flush_start_time = time.time()
+        self._writer.flush()
+        print(
+            "Step {}: Waited {:.3f} s for the prediction writes".format(
+                global_step, time.time() - flush_start_time
+            )
+        )
+
         if validation:
             if self.full_model:
                 self.save_prediction_stats(
@@ -931,23 +970,30 @@ class Evaluator:
         accuracy = np.mean(correct_prediction)
         return accuracy
 
-    def save_rpn_proposals_and_scores(self, predictions, rpn_file_paths):
-        """Returns the proposals and scores stacked for saving to file.
+    def get_num_rpn_proposals(self, predictions):
+        """Returns the number of proposals of each sample before padding.
 
         Args:
             predictions: A dictionary containing the model outputs.
 
         Returns:
-            proposals_and_scores: A numpy array of shape (number_of_proposals,
-                8), containing the rpn proposal boxes and scores.
+            num_proposals: A list of the number of proposals of each sample.
         """
         proposals = predictions[RpnModel.PRED_PROPOSALS]
-        softmax_scores = predictions[RpnModel.PRED_OBJECTNESS_SOFTMAX]
-        num_proposals_before_padding = [len(sb_proposals) for sb_proposals in proposals]
         if not self.model_config.rpn_config.rpn_fixed_num_proposal_nms:
-            num_proposals_before_padding = predictions[
-                RpnModel.PRED_NUM_PROPOSALS_BEFORE_PADDING
-            ]
+            return predictions[RpnModel.PRED_NUM_PROPOSALS_BEFORE_PADDING]
+        return [len(sb_proposals) for sb_proposals in proposals]
+
+    def save_rpn_proposals_and_scores(self, predictions, rpn_file_paths):
+        """Saves the proposals and scores stacked, in the background.
+
+        Args:
+            predictions: A dictionary containing the model outputs.
+            rpn_file_paths: A list of the proposal file path of each sample.
+        """
+        proposals = predictions[RpnModel.PRED_PROPOSALS]
+        softmax_scores = predictions[RpnModel.PRED_OBJECTNESS_SOFTMAX]
+        num_proposals_before_padding = self.get_num_rpn_proposals(predictions)
 
         batch = proposals.shape[0]
         assert batch == len(rpn_file_paths)
@@ -958,7 +1004,9 @@ class Evaluator:
             ]
             proposals_and_scores = np.hstack((top_proposals, top_scores))
 
-            np.savetxt(rpn_file_paths[b], proposals_and_scores, fmt="%.3f")
+            self._writer.submit(
+                np.savetxt, rpn_file_paths[b], proposals_and_scores, fmt="%.3f"
+            )
 
     def save_rpn_features(self, predictions, rpn_feature_paths):
         batch_rpn_pts = predictions[RpnModel.SAVE_RPN_PTS]
@@ -976,49 +1024,47 @@ class Evaluator:
             rpn_fg_mask = batch_rpn_fg_mask[b, :].reshape((-1, 1))
             rpn_img_fts = batch_rpn_img_fts[b, :]
 
-            np.save(
+            self._writer.submit(
+                np.save,
                 rpn_feature_paths[b],
                 np.hstack((rpn_pts, rpn_intensity, rpn_fg_mask, rpn_fts, rpn_img_fts)),
             )
 
     def calculate_proposals_info(
-        self,
-        proposal_gt_iou2ds,
-        proposal_gt_iou3ds,
-        rpn_file_paths,
-        sample_names,
-        prop_iou_files,
-        eval_rpn_stats,
-        global_step,
+        self, predictions, prop_iou_files, eval_rpn_stats, global_step
     ):
-        assert len(rpn_file_paths) == len(sample_names)
+        """Updates the proposal recall, IoU and angle residual sums, and saves
+        the proposal IoUs with the GT boxes.
 
-        for i in range(len(rpn_file_paths)):
-            rpn_file = rpn_file_paths[i]
-            sample_name = sample_names[i]
-            prop_iou_file = prop_iou_files[i]
+        The stats are computed from the predicted proposals and the labels of
+        the current batch.
 
-            top_proposals = np.loadtxt(rpn_file).reshape((-1, 8))[:, 0:7]
+        Args:
+            predictions: A dictionary containing the model outputs.
+            prop_iou_files: A list of the proposal IoU file path of each sample.
+            eval_rpn_stats: A dictionary containing all the rpn averaged
+                losses.
+            global_step: Current global step that is being evaluated.
+        """
+        proposals = predictions[RpnModel.PRED_PROPOSALS]
+        proposal_gt_iou2ds = predictions[RpnModel.PRED_IOU_2D]
+        proposal_gt_iou3ds = predictions[RpnModel.PRED_IOU_3D]
+        num_proposals_before_padding = self.get_num_rpn_proposals(predictions)
 
-            obj_labels = obj_utils.read_labels(
-                self.model.dataset.label_dir, int(sample_name)
-            )
-            # Only use objects that match dataset classes
-            obj_labels = self.model.dataset.kitti_utils.filter_labels(obj_labels)
+        # Only objects that match dataset classes, as fed to the model
+        batch_label_boxes_3d = self.model.label_boxes_3d
+        batch_label_classes = self.model.label_classes
+        assert len(batch_label_classes) == len(prop_iou_files)
 
-            label_boxes_3d = np.asarray(
-                [
-                    box_3d_encoder.object_label_to_box_3d(obj_label)
-                    for obj_label in obj_labels
-                ]
-            )
-            label_classes = [
-                self.model.dataset.kitti_utils.class_str_to_index(obj_label.type)
-                for obj_label in obj_labels
-            ]
-            label_classes = np.asarray(label_classes, dtype=np.int32)
+        for i in range(len(prop_iou_files)):
+            prop_iou_file = prop_iou_files[i]
 
-            recall_50, recall_70, iou2ds, iou3ds, iou3ds_gt_boxes, iou3ds_gt_cls, mx_iou3ds = box_util.compute_recall_iou(
+            top_proposals = proposals[i, : num_proposals_before_padding[i], 0:7]
+
+            label_classes = batch_label_classes[i]
+            label_boxes_3d = batch_label_boxes_3d[i, : len(label_classes)]
+
+            proposal_stats, mx_iou3ds = evaluator_utils.compute_proposal_stats(
                 top_proposals,
                 label_boxes_3d,
                 label_classes,
@@ -1026,40 +1072,17 @@ class Evaluator:
                 proposal_gt_iou3ds[i, ...],
             )
 
-            num_props = top_proposals.shape[0]
-            num_labels = label_boxes_3d.shape[0]
-
-            np.savetxt(prop_iou_file, mx_iou3ds, fmt="%.3f")
-
-            sum_rpn_recall_50 = eval_rpn_stats[KEY_SUM_RPN_RECALL_50]
-            sum_rpn_recall_70 = eval_rpn_stats[KEY_SUM_RPN_RECALL_70]
-            sum_rpn_label = eval_rpn_stats[KEY_SUM_RPN_LABEL]
-            sum_rpn_proposal = eval_rpn_stats[KEY_SUM_RPN_PROPOSAL]
-            sum_rpn_iou2d = eval_rpn_stats[KEY_SUM_RPN_IOU2D]
-            sum_rpn_iou3d = eval_rpn_stats[KEY_SUM_RPN_IOU3D]
-            sum_rpn_angle_res = eval_rpn_stats[KEY_SUM_RPN_ANGLE_RES]
-            sum_rpn_recall_50 += recall_50
-            sum_rpn_recall_70 += recall_70
-            sum_rpn_label += num_labels
-            sum_rpn_proposal += num_props
-            sum_rpn_iou2d += np.sum(iou2ds)
-            sum_rpn_iou3d += np.sum(iou3ds)
-            sum_rpn_angle_res += np.sum(
-                np.absolute(top_proposals[:, 6] - iou3ds_gt_boxes[:, 6])
-            )
-            eval_rpn_stats.update({KEY_SUM_RPN_RECALL_50: sum_rpn_recall_50})
-            eval_rpn_stats.update({KEY_SUM_RPN_RECALL_70: sum_rpn_recall_70})
-            eval_rpn_stats.update({KEY_SUM_RPN_LABEL: sum_rpn_label})
-            eval_rpn_stats.update({KEY_SUM_RPN_PROPOSAL: sum_rpn_proposal})
-            eval_rpn_stats.update({KEY_SUM_RPN_IOU2D: sum_rpn_iou2d})
-            eval_rpn_stats.update({KEY_SUM_RPN_IOU3D: sum_rpn_iou3d})
-            eval_rpn_stats.update({KEY_SUM_RPN_ANGLE_RES: sum_rpn_angle_res})
+            self._writer.submit(np.savetxt, prop_iou_file, mx_iou3ds, fmt="%.3f")
+
+            for name, value in proposal_stats.items():
+                eval_rpn_stats[PROPOSAL_STAT_KEYS[name]] += value
+
             print(
                 "Step {}: RPN Recall@3DIoU=0.5: {:.3f}  Recall@3DIoU=0.7: {:.3f}, num proposals: {:.3f}".format(
                     global_step,
-                    recall_50 / num_labels,
-                    recall_70 / num_labels,
-                    num_props,
+                    proposal_stats["recall_50"] / proposal_stats["num_labels"],
+                    proposal_stats["recall_70"] / proposal_stats["num_labels"],
+                    proposal_stats["num_proposals"],
                 )
             )
 
@@ -1086,38 +1109,16 @@ class Evaluator:
 
         Batch = batch_nms_indices.shape[0]
         for b in range(Batch):
-            sb_pred_boxes_3d = batch_pred_boxes_3d[b]
-            sb_pred_softmax = batch_pred_softmax[b]
-            sb_non_empty_box_mask = batch_non_empty_box_mask[b]
-            sb_nms_indices = batch_nms_indices[b]
-            # filter out empty preds
-            non_empty_boxes_3d = sb_pred_boxes_3d[sb_non_empty_box_mask]
-            non_empty_softmax = sb_pred_softmax[sb_non_empty_box_mask]
-            # apply nms filter
-            final_pred_boxes_3d = non_empty_boxes_3d[
-                sb_nms_indices[: num_boxes_before_padding[b]]
-            ]
-            final_pred_softmax = non_empty_softmax[
-                sb_nms_indices[: num_boxes_before_padding[b]]
-            ]
-            # remove duplicate preds
-            final_pred_boxes_3d, uniq_idx = np.unique(
-                final_pred_boxes_3d, axis=0, return_index=True
+            predictions_and_scores = evaluator_utils.get_final_predictions_and_scores(
+                batch_pred_boxes_3d[b],
+                batch_pred_softmax[b],
+                batch_non_empty_box_mask[b],
+                batch_nms_indices[b],
+                num_boxes_before_padding[b],
             )
-            final_pred_softmax = final_pred_softmax[uniq_idx]
-
-            # Find max class score index
-            not_bkg_scores = final_pred_softmax[:, 1:]
-            final_pred_types = np.argmax(not_bkg_scores, axis=1)
-            final_pred_scores = np.max(not_bkg_scores, axis=1)
-
-            # Stack into prediction format
-            predictions_and_scores = np.column_stack(
-                [final_pred_boxes_3d, final_pred_scores, final_pred_types]
+            self._writer.submit(
+                np.savetxt, rcnn_file_paths[b], predictions_and_scores, fmt="%.5f"
             )
-            sort_by_score = np.argsort(-predictions_and_scores[:, -2])
-            predictions_and_scores = predictions_and_scores[sort_by_score]
-            np.savetxt(rcnn_file_paths[b], predictions_and_scores, fmt="%.5f")
 
     def get_rcnn_predicted_box_corners_and_scores(self, predictions, box_rep):
 
@@ -1152,10 +1153,11 @@ class Evaluator:
     def run_kitti_native_eval(self, global_step):
         """Calls the kitti native C++ evaluation code.
 
-        It first saves the predictions in kitti format. It then creates two
-        child processes to run the evaluation code. The native evaluation
-        hard-codes the IoU threshold inside the code, so hence its called
-        twice for each IoU separately.
+        It first saves the predictions in kitti format. With python_kitti_eval
+        they are then evaluated in process by kitti_eval, for both IoU
+        settings at once. Otherwise it creates two child processes to run the
+        evaluation code. The native evaluation hard-codes the IoU threshold
+        inside the code, so hence its called twice for each IoU separately.
 
         Args:
             global_step: Global step of the current checkpoint to be evaluated.
@@ -1170,11 +1172,33 @@ class Evaluator:
             self.dataset_config.data_split,
             self.eval_config.kitti_score_threshold,
             global_step,
+            num_workers=self.eval_config.num_kitti_workers,
         )
 
         checkpoint_name = self.model_config.checkpoint_name
         kitti_score_threshold = self.eval_config.kitti_score_threshold
 
+        if self.eval_config.python_kitti_eval:
+            eval_start_time = time.time()
+            if self._gt_eval_cache is None:
+                self._gt_eval_cache = evaluator_utils.load_kitti_gt_cache(
+                    self.model.dataset
+                )
+            evaluator_utils.run_kitti_python_eval(
+                checkpoint_name,
+                self.model.dataset.label_dir,
+                kitti_score_threshold,
+                global_step,
+                gt_cache=self._gt_eval_cache,
+                num_workers=self.eval_config.num_kitti_workers,
+            )
+            print(
+                "Step {}: Kitti evaluation took {:.3f} s".format(
+                    global_step, time.time() - eval_start_time
+                )
+            )
+            return
+
         # Create a separate processes to run the native evaluation
         native_eval_proc = Process(
             target=evaluator_utils.run_kitti_native_script,
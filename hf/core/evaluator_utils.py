@@ -1,25 +1,28 @@
 import sys
 import datetime
+import multiprocessing
 import subprocess
 from distutils import dir_util
 
 import numpy as np
 import os
-from PIL import Image
 import tensorflow as tf
 
-from hf.core import calib_utils
-
 import hf
 from hf.core import box_3d_projector
+from hf.core import box_util
+from hf.core import kitti_eval
 from hf.core import summary_utils
 
 
 def save_predictions_in_kitti_format(
-    model, checkpoint_name, data_split, score_threshold, global_step
+    model, checkpoint_name, data_split, score_threshold, global_step, num_workers=0
 ):
     """ Converts a set of network predictions into text files required for
     KITTI evaluation.
+
+    The samples are converted in parallel by num_workers processes, or on
+    the calling process if num_workers is 0.
     """
 
     dataset = model.dataset
@@ -52,16 +55,14 @@ def save_predictions_in_kitti_format(
 
     # Do conversion
     num_samples = dataset.num_samples
-    num_valid_samples = 0
 
     print("\nGlobal step:", global_step)
     print("Converting detections from:", final_predictions_dir)
 
     print("3D Detections being saved to:", kitti_predictions_3d_dir)
 
-    for sample_idx in range(num_samples):
-
-        sample_name = dataset.sample_names[sample_idx]
+    sample_tasks = []
+    for sample_name in dataset.sample_names:
 
         prediction_file = sample_name + ".txt"
 
@@ -76,105 +77,203 @@ def save_predictions_in_kitti_format(
             np.savetxt(kitti_predictions_3d_file_path, [])
             continue
 
-        all_predictions = np.loadtxt(predictions_file_path).reshape((-1, 9))
+        # Calibrations and image sizes are cached by the dataset
+        sample_tasks.append(
+            (
+                predictions_file_path,
+                kitti_predictions_3d_file_path,
+                dataset.read_calibration(sample_name).p2,
+                dataset.read_image_size(sample_name),
+                dataset.classes,
+                score_threshold,
+            )
+        )
 
-        # # Swap l, w for predictions where w > l
-        # swapped_indices = all_predictions[:, 4] > all_predictions[:, 3]
-        # fixed_predictions = np.copy(all_predictions)
-        # fixed_predictions[swapped_indices, 3] = all_predictions[
-        #     swapped_indices, 4]
-        # fixed_predictions[swapped_indices, 4] = all_predictions[
-        #     swapped_indices, 3]
+    if num_workers > 0 and len(sample_tasks) > 1:
+        # The workers are spawned, forking the evaluator process with its
+        # session and writer threads running can deadlock
+        with multiprocessing.get_context("spawn").Pool(num_workers) as pool:
+            valid_samples = pool.map(
+                _save_sample_predictions_in_kitti_format, sample_tasks, chunksize=16
+            )
+    else:
+        valid_samples = [
+            _save_sample_predictions_in_kitti_format(sample_task)
+            for sample_task in sample_tasks
+        ]
+    num_valid_samples = sum(valid_samples)
 
-        score_filter = all_predictions[:, 7] >= score_threshold
-        all_predictions = all_predictions[score_filter]
+    print("\nNum valid:", num_valid_samples)
+    print("Num samples:", num_samples)
 
-        # If no predictions, skip to next file
-        if len(all_predictions) == 0:
-            np.savetxt(kitti_predictions_3d_file_path, [])
-            continue
 
-        # Project to image space
-        sample_name = prediction_file.split(".")[0]
-        img_idx = int(sample_name)
+def _save_sample_predictions_in_kitti_format(sample_task):
+    """Converts the predictions of a sample into a KITTI text file.
 
-        # Load image for truncation
-        image = Image.open(dataset.get_rgb_image_path(sample_name))
+    Args:
+        sample_task: tuple of the predictions file path, the KITTI file path,
+            the stereo calibration p2 matrix, the (w, h) image size, the
+            dataset classes and the score threshold
 
-        stereo_calib_p2 = calib_utils.read_calibration(dataset.calib_dir, img_idx).p2
+    Returns:
+        valid: True if any predictions were saved
+    """
+    (
+        predictions_file_path,
+        kitti_predictions_3d_file_path,
+        stereo_calib_p2,
+        image_size,
+        classes,
+        score_threshold,
+    ) = sample_task
+
+    all_predictions = np.loadtxt(predictions_file_path).reshape((-1, 9))
+
+    score_filter = all_predictions[:, 7] >= score_threshold
+    all_predictions = all_predictions[score_filter]
+
+    # If no predictions, skip to next file
+    if len(all_predictions) == 0:
+        np.savetxt(kitti_predictions_3d_file_path, [])
+        return False
+
+    # Project to image space, skipping invalid boxes (outside image space)
+    boxes, image_filter = box_3d_projector.project_boxes_to_image_space(
+        all_predictions[:, 0:7], stereo_calib_p2, truncate=True, image_size=image_size
+    )
+    boxes = boxes[image_filter]
+    all_predictions = all_predictions[image_filter]
 
-        boxes = []
-        image_filter = []
-        for i in range(len(all_predictions)):
-            box_3d = all_predictions[i, 0:7]
-            img_box = box_3d_projector.project_to_image_space(
-                box_3d, stereo_calib_p2, truncate=True, image_size=image.size
-            )
+    # If no predictions, skip to next file
+    if len(boxes) == 0:
+        np.savetxt(kitti_predictions_3d_file_path, [])
+        return False
 
-            # Skip invalid boxes (outside image space)
-            if img_box is None:
-                image_filter.append(False)
-                continue
+    # To keep each value in its appropriate position, an array of zeros
+    # (N, 16) is allocated but only values [4:16] are used
+    kitti_predictions = np.zeros([len(boxes), 16])
 
-            image_filter.append(True)
-            boxes.append(img_box)
+    # Get object types
+    all_pred_classes = all_predictions[:, 8].astype(np.int32)
+    obj_types = [classes[class_idx] for class_idx in all_pred_classes]
 
-        boxes = np.asarray(boxes)
-        all_predictions = all_predictions[image_filter]
+    # Truncation and Occlusion are always empty (see below)
 
-        # If no predictions, skip to next file
-        if len(boxes) == 0:
-            np.savetxt(kitti_predictions_3d_file_path, [])
-            continue
+    # Alpha (Not computed)
+    kitti_predictions[:, 3] = -10 * np.ones((len(kitti_predictions)), dtype=np.int32)
 
-        num_valid_samples += 1
+    # 2D predictions
+    kitti_predictions[:, 4:8] = boxes[:, 0:4]
 
-        # To keep each value in its appropriate position, an array of zeros
-        # (N, 16) is allocated but only values [4:16] are used
-        kitti_predictions = np.zeros([len(boxes), 16])
+    # 3D predictions
+    # (l, w, h)
+    kitti_predictions[:, 8] = all_predictions[:, 5]
+    kitti_predictions[:, 9] = all_predictions[:, 4]
+    kitti_predictions[:, 10] = all_predictions[:, 3]
+    # (x, y, z)
+    kitti_predictions[:, 11:14] = all_predictions[:, 0:3]
+    # (ry, score)
+    kitti_predictions[:, 14:16] = all_predictions[:, 6:8]
 
-        # Get object types
-        all_pred_classes = all_predictions[:, 8].astype(np.int32)
-        obj_types = [dataset.classes[class_idx] for class_idx in all_pred_classes]
+    # Round detections to 3 decimal places
+    kitti_predictions = np.round(kitti_predictions, 3)
 
-        # Truncation and Occlusion are always empty (see below)
+    # Empty Truncation, Occlusion
+    kitti_empty_1 = -1 * np.ones((len(kitti_predictions), 2), dtype=np.int32)
 
-        # Alpha (Not computed)
-        kitti_predictions[:, 3] = -10 * np.ones(
-            (len(kitti_predictions)), dtype=np.int32
-        )
+    # Stack 3D predictions text
+    kitti_text_3d = np.column_stack(
+        [obj_types, kitti_empty_1, kitti_predictions[:, 3:16]]
+    )
 
-        # 2D predictions
-        kitti_predictions[:, 4:8] = boxes[:, 0:4]
+    # Save to text files
+    np.savetxt(kitti_predictions_3d_file_path, kitti_text_3d, newline="\r\n", fmt="%s")
+    return True
 
-        # 3D predictions
-        # (l, w, h)
-        kitti_predictions[:, 8] = all_predictions[:, 5]
-        kitti_predictions[:, 9] = all_predictions[:, 4]
-        kitti_predictions[:, 10] = all_predictions[:, 3]
-        # (x, y, z)
-        kitti_predictions[:, 11:14] = all_predictions[:, 0:3]
-        # (ry, score)
-        kitti_predictions[:, 14:16] = all_predictions[:, 6:8]
 
-        # Round detections to 3 decimal places
-        kitti_predictions = np.round(kitti_predictions, 3)
+def get_final_predictions_and_scores(
+    pred_boxes_3d, pred_softmax, non_empty_box_mask, nms_indices, num_boxes
+):
+    """Selects the final RCNN predictions of a single sample.
 
-        # Empty Truncation, Occlusion
-        kitti_empty_1 = -1 * np.ones((len(kitti_predictions), 2), dtype=np.int32)
+    Args:
+        pred_boxes_3d: (N, 7) regressed boxes
+        pred_softmax: (N, num_classes + 1) class softmax, background first
+        non_empty_box_mask: (N,) mask of the boxes with points inside
+        nms_indices: NMS indices into the non empty boxes, padded
+        num_boxes: number of NMS indices before padding
 
-        # Stack 3D predictions text
-        kitti_text_3d = np.column_stack(
-            [obj_types, kitti_empty_1, kitti_predictions[:, 3:16]]
-        )
+    Returns:
+        predictions_and_scores: (M, 9) unique kept boxes, with their class
+            score and class index, sorted by decreasing score
+    """
+    # filter out empty preds
+    non_empty_boxes_3d = pred_boxes_3d[non_empty_box_mask]
+    non_empty_softmax = pred_softmax[non_empty_box_mask]
+    # apply nms filter
+    final_pred_boxes_3d = non_empty_boxes_3d[nms_indices[:num_boxes]]
+    final_pred_softmax = non_empty_softmax[nms_indices[:num_boxes]]
+    # remove duplicate preds
+    final_pred_boxes_3d, uniq_idx = np.unique(
+        final_pred_boxes_3d, axis=0, return_index=True
+    )
+    final_pred_softmax = final_pred_softmax[uniq_idx]
 
-        # Save to text files
-        np.savetxt(
-            kitti_predictions_3d_file_path, kitti_text_3d, newline="\r\n", fmt="%s"
-        )
+    # Find max class score index
+    not_bkg_scores = final_pred_softmax[:, 1:]
+    final_pred_types = np.argmax(not_bkg_scores, axis=1)
+    final_pred_scores = np.max(not_bkg_scores, axis=1)
 
-    print("\nNum valid:", num_valid_samples)
-    print("Num samples:", num_samples)
+    # Stack into prediction format
+    predictions_and_scores = np.column_stack(
+        [final_pred_boxes_3d, final_pred_scores, final_pred_types]
+    )
+    sort_by_score = np.argsort(-predictions_and_scores[:, -2])
+    return predictions_and_scores[sort_by_score]
+
+
+def compute_proposal_stats(
+    proposals, label_boxes_3d, label_classes, proposal_gt_iou2d, proposal_gt_iou3d
+):
+    """Computes the recall, IoU and angle residual stats of the RPN proposals
+    of a sample.
+
+    Args:
+        proposals: (N, 7) proposals before padding [x, y, z, l, w, h, ry]
+        label_boxes_3d: (M, 7) label boxes [x, y, z, l, w, h, ry]
+        label_classes: (M,) label classes
+        proposal_gt_iou2d: 2D IoUs between the proposals and the label boxes,
+            at least (N, M)
+        proposal_gt_iou3d: 3D IoUs between the proposals and the label boxes,
+            at least (N, M)
+
+    Returns:
+        stats: dictionary of the recall_50, recall_70, num_labels,
+            num_proposals, iou2d, iou3d and angle_res sums of the sample
+        mx_iou3ds: (N, M) 3D IoUs between the proposals and the label boxes
+    """
+    (
+        recall_50,
+        recall_70,
+        iou2ds,
+        iou3ds,
+        iou3ds_gt_boxes,
+        _,
+        mx_iou3ds,
+    ) = box_util.compute_recall_iou(
+        proposals, label_boxes_3d, label_classes, proposal_gt_iou2d, proposal_gt_iou3d
+    )
+
+    stats = {
+        "recall_50": recall_50,
+        "recall_70": recall_70,
+        "num_labels": label_boxes_3d.shape[0],
+        "num_proposals": proposals.shape[0],
+        "iou2d": np.sum(iou2ds),
+        "iou3d": np.sum(iou3ds),
+        "angle_res": np.sum(np.absolute(proposals[:, 6] - iou3ds_gt_boxes[:, 6])),
+    }
+    return stats, mx_iou3ds
 
 
 def set_up_summary_writer(model_config, sess):
@@ -271,7 +370,12 @@ def copy_kitti_native_code(checkpoint_name):
         make_script = script_folder + "run_make.sh"
         subprocess.call([make_script, script_folder])
 
-    # Set up the results folders if they don't exist
+    make_kitti_results_dirs()
+
+
+def make_kitti_results_dirs():
+    """Sets up the results folders of the kitti evaluation if they don't
+    exist."""
     results_dir = hf.top_dir() + "/scripts/offline_eval/results"
     results_05_dir = hf.top_dir() + "/scripts/offline_eval/results_05_iou"
     if not os.path.exists(results_dir):
@@ -280,6 +384,73 @@ def copy_kitti_native_code(checkpoint_name):
         os.makedirs(results_05_dir)
 
 
+def load_kitti_gt_cache(dataset):
+    """Loads the kitti_eval.GroundTruthCache of the dataset's split, building
+    it on first use. The cache is shared by all the checkpoints evaluated on
+    the split.
+    """
+    cache_dir = (
+        hf.root_dir()
+        + "/data/eval_caches/"
+        + dataset.name
+        + "/"
+        + dataset.data_split
+    )
+    return kitti_eval.GroundTruthCache.load_or_build(
+        cache_dir, dataset.label_dir, dataset.sample_names
+    )
+
+
+def run_kitti_python_eval(
+    checkpoint_name,
+    label_dir,
+    score_threshold,
+    global_step,
+    gt_cache=None,
+    num_workers=0,
+):
+    """Evaluates the kitti format predictions in process with kitti_eval.
+
+    Both minimum overlap settings of the native code are evaluated in the
+    same pass, their results are appended to the files run_eval.sh and
+    run_eval_05_iou.sh write to. The ground truth is read from gt_cache
+    if given, a kitti_eval.GroundTruthCache of the label files. The samples
+    are evaluated by num_workers processes, or on the calling process if 0.
+    """
+
+    # Round this because protobuf encodes default values as full decimal
+    score_threshold = round(score_threshold, 3)
+
+    result_dir = (
+        hf.root_dir()
+        + "/data/outputs/"
+        + checkpoint_name
+        + "/predictions/kitti_native_eval/"
+        + str(score_threshold)
+        + "/"
+        + str(global_step)
+    )
+    results = kitti_eval.evaluate_dir(
+        label_dir, result_dir, num_workers=num_workers, gt_cache=gt_cache
+    )
+
+    results_files = [
+        hf.top_dir()
+        + "/scripts/offline_eval/results/{}_results_{}.txt".format(
+            checkpoint_name, score_threshold
+        ),
+        hf.top_dir()
+        + "/scripts/offline_eval/results_05_iou/{}_results_05_iou_{}.txt".format(
+            checkpoint_name, score_threshold
+        ),
+    ]
+    for setting_idx, results_file in enumerate(results_files):
+        lines = [str(global_step)] + kitti_eval.format_results(results, setting_idx)
+        print("\n".join(lines))
+        with open(results_file, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
 def run_kitti_native_script(checkpoint_name, score_threshold, global_step):
     """Runs the kitti native code script."""
 
@@ -0,0 +1,100 @@
+"""evaluator_utils unit test module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import hf.tests as tests
+
+from hf.core import evaluator_utils
+from hf.datasets.kitti import kitti_labels
+
+
+def _read_car_boxes(label_dir, sample_name):
+    labels = kitti_labels.read_label_array(label_dir, int(sample_name))
+    labels = labels[labels["type"] == "Car"]
+    return kitti_labels.labels_to_boxes_3d(labels), np.ones(len(labels), np.int32)
+
+
+class EvaluatorUtilsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.label_dir = tests.test_path() + "/datasets/Kitti/object/training/label_2"
+        cls.sample_names = ["000000", "000001", "000002", "000003"]
+
+    def test_proposal_stats_same_as_from_files(self):
+        rng = np.random.default_rng(0)
+
+        # Batch as fed to the model, the label boxes are padded to the most
+        # labels and the proposals to a fixed number
+        num_proposals = 6
+        sample_labels = [
+            _read_car_boxes(self.label_dir, sample_name)
+            for sample_name in self.sample_names
+        ]
+        max_labels = max(len(classes) for _, classes in sample_labels)
+        batch_label_boxes_3d = np.zeros((len(self.sample_names), max_labels, 7))
+        batch_label_classes = []
+        for i, (boxes_3d, classes) in enumerate(sample_labels):
+            batch_label_boxes_3d[i, : len(boxes_3d)] = boxes_3d
+            batch_label_classes.append(classes)
+
+        proposals = rng.uniform(-10.0, 10.0, size=(len(self.sample_names), 8, 7))
+        for i, (boxes_3d, _) in enumerate(sample_labels):
+            num_jittered = min(len(boxes_3d), num_proposals)
+            proposals[i, :num_jittered] = boxes_3d[:num_jittered] + rng.normal(
+                scale=0.1, size=(num_jittered, 7)
+            )
+        scores = rng.uniform(size=(len(self.sample_names), 8))
+        iou2ds = rng.uniform(size=(len(self.sample_names), 8, max_labels))
+        iou3ds = rng.uniform(size=(len(self.sample_names), 8, max_labels))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for i, sample_name in enumerate(self.sample_names):
+                top_proposals = proposals[i, :num_proposals]
+                label_classes = batch_label_classes[i]
+                stats, mx_iou3ds = evaluator_utils.compute_proposal_stats(
+                    top_proposals,
+                    batch_label_boxes_3d[i, : len(label_classes)],
+                    label_classes,
+                    iou2ds[i],
+                    iou3ds[i],
+                )
+
+                # Proposals read back from their file, and labels read again
+                rpn_file = os.path.join(tmp_dir, sample_name + ".txt")
+                np.savetxt(
+                    rpn_file,
+                    np.hstack((top_proposals, scores[i, :num_proposals, None])),
+                    fmt="%.3f",
+                )
+                file_proposals = np.loadtxt(rpn_file).reshape((-1, 8))[:, 0:7]
+                label_boxes_3d, label_classes = _read_car_boxes(
+                    self.label_dir, sample_name
+                )
+                file_stats, file_mx_iou3ds = evaluator_utils.compute_proposal_stats(
+                    file_proposals, label_boxes_3d, label_classes, iou2ds[i], iou3ds[i]
+                )
+
+                np.testing.assert_array_equal(mx_iou3ds, file_mx_iou3ds)
+                self.assertEqual(sorted(stats.keys()), sorted(file_stats.keys()))
+                for name in ["recall_50", "recall_70", "num_labels", "num_proposals"]:
+                    self.assertEqual(stats[name], file_stats[name], name)
+                for name in ["iou2d", "iou3d"]:
+                    self.assertAlmostEqual(stats[name], file_stats[name], msg=name)
+                # The proposal files are rounded to 3 decimals
+                self.assertAlmostEqual(
+                    stats["angle_res"],
+                    file_stats["angle_res"],
+                    delta=num_proposals * 5e-4,
+                )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
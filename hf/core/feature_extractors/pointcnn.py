@@ -29,6 +29,8 @@ def xconv(
     depth_multiplier,
     sorting_method=None,
     with_global=False,
+    knn_tile_size=0,
+    knn_unique=False,
 ):
     """Xconv, the basic operation block of PointCNN. This implements the Algorithm 1 in paper.
     For a sampled representative point p, its k-nearest neighbors are P. The features associated
@@ -63,13 +65,19 @@ def xconv(
            with two fully connected layers will be concantenated with the
            xconv feature. Thus changes the dimension of the final feature.
            Currently, this will only be true for the last layer of the PointCNN encoder.
+       knn_tile_size: int. If positive, the k-nearest points are searched this
+           many query points at a time, see pf.knn_indices_general.
+       knn_unique: bool. If true, the duplicated points are left out of the
+           k-nearest neighbors, see pf.knn_indices_general.
     Returns:
        fts_conv_3d: (B, P, C) when with_global is false,
                     (B, P, C + C//4) when with_global is true
                      
     """
     # Get k-nearest points
-    _, indices_dilated = pf.knn_indices_general(qrs, pts, K * D, True)
+    _, indices_dilated = pf.knn_indices_general(
+        qrs, pts, K * D, True, unique=knn_unique, tile_size=knn_tile_size
+    )
     indices = indices_dilated[:, :, ::D, :]  # (B, P, K, 2)
 
     if sorting_method:
@@ -192,6 +200,8 @@ class PointCNN(pc_feature_extractor.PcFeatureExtractor):
             with_X_transformation = self.config.with_X_transformation
             sorting_method = self.config.sorting_method
             multi_scale_grouping = self.config.multi_scale_grouping
+            knn_tile_size = self.config.knn_tile_size
+            knn_unique = self.config.knn_unique
             B = tf.shape(points)[0]
 
             if self.config.sampling == "fps":
@@ -227,7 +237,7 @@ class PointCNN(pc_feature_extractor.PcFeatureExtractor):
                         qrs = tf.gather_nd(pts, indices, name=tag + "qrs")  # (B, P, 3)
                     elif self.config.sampling == "ids":
                         indices = pf.inverse_density_sampling(
-                            pts, layer_param[0]["K"], P
+                            pts, layer_param[0]["K"], P, tile_size=knn_tile_size
                         )
                         qrs = tf.gather_nd(pts, indices)
                     elif self.config.sampling == "random":
@@ -275,6 +285,8 @@ class PointCNN(pc_feature_extractor.PcFeatureExtractor):
                         depth_multiplier,
                         sorting_method,
                         with_global,
+                        knn_tile_size=knn_tile_size,
+                        knn_unique=knn_unique,
                     )
                     fts_xconv_list.append(fts_xconv)
                 self.layer_fts.append(
@@ -322,6 +334,8 @@ class PointCNN(pc_feature_extractor.PcFeatureExtractor):
                         with_X_transformation,
                         depth_multiplier,
                         sorting_method,
+                        knn_tile_size=knn_tile_size,
+                        knn_unique=knn_unique,
                     )
                     fts_concat = tf.concat(
                         [fts_xdconv, fts_qrs], axis=-1, name=tag + "fts_concat"
@@ -364,6 +378,8 @@ class PointCNN(pc_feature_extractor.PcFeatureExtractor):
                         with_X_transformation,
                         depth_multiplier,
                         sorting_method,
+                        knn_tile_size=knn_tile_size,
+                        knn_unique=knn_unique,
                     )
 
             output_ft = (
@@ -0,0 +1,882 @@
+"""In-process KITTI object detection evaluation.
+
+A vectorized equivalent of the evaluate_object_3d_offline tool in
+scripts/offline_eval/kitti_native_eval. The ground truth and detections of each
+sample are loaded once, their 2D, bird's eye view and 3D overlaps are computed
+once as matrices, and the 2D/BEV/3D AP of all classes, difficulties and
+minimum overlap settings are computed in the same pass, the settings and
+difficulties being stacked along the first axis of the matching arrays. The
+samples are spread over a process pool.
+
+The ground truth side of the evaluation, its boxes, difficulty and ignore
+masks and DontCare areas, does not depend on the detections. GroundTruthCache
+keeps it for a whole split in memory mapped files, reused by the evaluations
+of all checkpoints.
+
+The matching rules, difficulty filters, DontCare handling, recall
+discretization and 11 point AP are the ones of the C++ tool.
+"""
+
+import contextlib
+import functools
+import multiprocessing
+import os
+import shutil
+
+import numpy as np
+
+from hf.core import rotated_iou
+from hf.datasets.kitti import kitti_labels
+
+# Evaluated classes, lower case as types are compared case insensitively
+CLASS_NAMES = ["car", "pedestrian", "cyclist"]
+
+# Neighbouring classes count neither as false negatives nor false positives
+NEIGHBOR_CLASSES = {"car": "van", "pedestrian": "person_sitting"}
+
+# Easy, moderate and hard ground truth filters
+DIFFICULTIES = ["easy", "moderate", "hard"]
+MIN_HEIGHT = np.array([40, 25, 25])
+MAX_OCCLUSION = np.array([0, 1, 2])
+MAX_TRUNCATION = np.array([0.15, 0.3, 0.5])
+
+METRICS = ["2d", "bev", "3d"]
+
+# Number of recall steps of the precision curves
+N_SAMPLE_PTS = 41
+
+# Minimum overlaps [setting, metric, class], the first setting is the one of
+# evaluate_object_3d_offline, the second the one of
+# evaluate_object_3d_offline_05_iou
+MIN_OVERLAPS = np.array(
+    [
+        [[0.7, 0.5, 0.5], [0.7, 0.5, 0.5], [0.7, 0.5, 0.5]],
+        [[0.7, 0.5, 0.5], [0.5, 0.25, 0.25], [0.5, 0.25, 0.25]],
+    ]
+)
+
+# Names of the results, as printed by the C++ tool
+RESULT_NAMES = {"2d": "detection", "bev": "detection_BEV", "3d": "detection_3D"}
+SIMILARITY_NAMES = {"2d": "orientation", "bev": "heading_BEV", "3d": "heading_3D"}
+
+
+def _image_overlaps(boxes_a, boxes_b):
+    """Computes the intersection over union and over the area of a of 2D
+    boxes
+
+    Args:
+        boxes_a: (N, 4) boxes [x1, y1, x2, y2]
+        boxes_b: (M, 4) boxes [x1, y1, x2, y2]
+
+    Returns:
+        iou: (N, M) intersections over union
+        ioa: (N, M) intersections over the areas of boxes_a
+    """
+    inter_w = np.minimum(boxes_a[:, np.newaxis, 2], boxes_b[np.newaxis, :, 2]) - (
+        np.maximum(boxes_a[:, np.newaxis, 0], boxes_b[np.newaxis, :, 0])
+    )
+    inter_h = np.minimum(boxes_a[:, np.newaxis, 3], boxes_b[np.newaxis, :, 3]) - (
+        np.maximum(boxes_a[:, np.newaxis, 1], boxes_b[np.newaxis, :, 1])
+    )
+    overlapping = (inter_w > 0) & (inter_h > 0)
+    inter = np.where(overlapping, inter_w * inter_h, 0.0)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, np.newaxis] + area_b[np.newaxis] - inter
+
+    # Boxes with an intersection have positive areas
+    iou = np.divide(inter, union, out=np.zeros_like(inter), where=overlapping)
+    ioa = np.divide(
+        inter,
+        np.broadcast_to(area_a[:, np.newaxis], inter.shape),
+        out=np.zeros_like(inter),
+        where=overlapping,
+    )
+    return iou, ioa
+
+
+def _box_3d_overlaps(boxes_a, corners_a, boxes_b, corners_b):
+    """Computes the bird's eye view and 3D intersections over union and over
+    the area or volume of a of boxes_3d
+
+    Args:
+        boxes_a: (N, 7) boxes [x, y, z, l, w, h, ry]
+        corners_a: (N, 4, 2) bird's eye view corners of boxes_a
+        boxes_b: (M, 7) boxes [x, y, z, l, w, h, ry]
+        corners_b: (M, 4, 2) bird's eye view corners of boxes_b
+
+    Returns:
+        bev_iou, bev_ioa, iou_3d, ioa_3d: (N, M) overlaps
+    """
+    inter_area = rotated_iou.rect_overlap_matrix(corners_a, corners_b)
+    area_a = (boxes_a[:, 3] * boxes_a[:, 4])[:, np.newaxis]
+    area_b = (boxes_b[:, 3] * boxes_b[:, 4])[np.newaxis]
+
+    # Boxes extend up from their bottom y, along -y
+    bottom_a = boxes_a[:, np.newaxis, 1]
+    bottom_b = boxes_b[np.newaxis, :, 1]
+    overlap_h = np.minimum(bottom_a, bottom_b) - np.maximum(
+        bottom_a - boxes_a[:, np.newaxis, 5], bottom_b - boxes_b[np.newaxis, :, 5]
+    )
+    inter_volume = inter_area * np.maximum(overlap_h, 0.0)
+    volume_a = area_a * boxes_a[:, np.newaxis, 5]
+    volume_b = area_b * boxes_b[np.newaxis, :, 5]
+
+    def divide(numerator, denominator):
+        return np.divide(
+            numerator,
+            np.broadcast_to(denominator, numerator.shape),
+            out=np.zeros_like(numerator),
+            where=numerator > 0,
+        )
+
+    return (
+        divide(inter_area, area_a + area_b - inter_area),
+        divide(inter_area, area_a),
+        divide(inter_volume, volume_a + volume_b - inter_volume),
+        divide(inter_volume, volume_a),
+    )
+
+
+def _boxes_2d(labels):
+    return np.column_stack(
+        [labels["x1"], labels["y1"], labels["x2"], labels["y2"]]
+    ).reshape(-1, 4)
+
+
+class GroundTruth:
+    """Ground truth of a sample, with everything its evaluation needs that
+    does not depend on the detections.
+
+        labels          (G,) kitti_labels.LABEL_DTYPE ground truth, without
+                        the DontCare areas
+        boxes_2d        (G, 4) boxes [x1, y1, x2, y2]
+        boxes_3d        (G, 7) boxes [x, y, z, l, w, h, ry]
+        bev_corners     (G, 4, 2) bird's eye view corners
+        ignored         (3, 3, G) per class and difficulty, 0 for the valid
+                        ground truth, 1 for the ignored ones of the class or
+                        of its neighbouring class, -1 for the other classes
+        dontcare_boxes_2d, dontcare_boxes_3d, dontcare_bev_corners
+                        (C, ...) boxes of the DontCare areas
+    """
+
+    def __init__(
+        self,
+        labels,
+        boxes_2d,
+        boxes_3d,
+        bev_corners,
+        ignored,
+        dontcare_boxes_2d,
+        dontcare_boxes_3d,
+        dontcare_bev_corners,
+    ):
+        self.labels = labels
+        self.boxes_2d = boxes_2d
+        self.boxes_3d = boxes_3d
+        self.bev_corners = bev_corners
+        self.ignored = ignored
+        self.dontcare_boxes_2d = dontcare_boxes_2d
+        self.dontcare_boxes_3d = dontcare_boxes_3d
+        self.dontcare_bev_corners = dontcare_bev_corners
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Classifies the ground truth of a label array, as the C++ tool's
+        cleanData"""
+        types = np.char.lower(labels["type"])
+        dontcare = types == "dontcare"
+        gt = labels[~dontcare]
+        gt_types = types[~dontcare]
+
+        ignore = (
+            (gt["occlusion"] > MAX_OCCLUSION[:, np.newaxis])
+            | (gt["truncation"] > MAX_TRUNCATION[:, np.newaxis])
+            | ((gt["y2"] - gt["y1"]) <= MIN_HEIGHT[:, np.newaxis])
+        )
+        ignored = np.zeros((len(CLASS_NAMES), len(DIFFICULTIES), len(gt)), np.int8)
+        for class_idx, class_name in enumerate(CLASS_NAMES):
+            gt_class = gt_types == class_name
+            gt_neighbor = gt_types == NEIGHBOR_CLASSES.get(class_name, "")
+            ignored[class_idx] = np.where(
+                gt_class & ~ignore, 0, np.where(gt_class | gt_neighbor, 1, -1)
+            )
+
+        boxes_3d = kitti_labels.labels_to_boxes_3d(gt)
+        dontcare_boxes_3d = kitti_labels.labels_to_boxes_3d(labels[dontcare])
+        return cls(
+            gt,
+            _boxes_2d(gt),
+            boxes_3d,
+            rotated_iou.boxes_3d_to_bev_corners(boxes_3d).reshape(-1, 4, 2),
+            ignored,
+            _boxes_2d(labels[dontcare]),
+            dontcare_boxes_3d,
+            rotated_iou.boxes_3d_to_bev_corners(dontcare_boxes_3d).reshape(-1, 4, 2),
+        )
+
+
+class EvalSample:
+    """Ground truth and detections of a sample, with the overlaps of the
+    detections with the ground truth and DontCare areas.
+
+        gt              GroundTruth
+        det             (D,) kitti_labels.LABEL_DTYPE detections, with scores
+        overlaps        (3, D, G) 2D, BEV and 3D IoUs of the detections with
+                        the ground truth
+        dontcare_overlaps
+                        (3, D, C) 2D, BEV and 3D overlaps of the detections
+                        with the DontCare areas, over the detection areas
+    """
+
+    def __init__(self, gt, det):
+        self.gt = gt
+        self.det = det
+        self.det_types = np.char.lower(det["type"])
+        # Detection heights are truncated to integers
+        self.det_heights = np.abs(det["y1"] - det["y2"]).astype(np.int32)
+
+        det_boxes_2d = _boxes_2d(det)
+        det_boxes_3d = kitti_labels.labels_to_boxes_3d(det)
+        det_corners = rotated_iou.boxes_3d_to_bev_corners(det_boxes_3d).reshape(
+            -1, 4, 2
+        )
+
+        iou_2d, _ = _image_overlaps(det_boxes_2d, gt.boxes_2d)
+        iou_bev, _, iou_3d, _ = _box_3d_overlaps(
+            det_boxes_3d, det_corners, gt.boxes_3d, gt.bev_corners
+        )
+        self.overlaps = np.stack([iou_2d, iou_bev, iou_3d])
+
+        _, ioa_2d = _image_overlaps(det_boxes_2d, gt.dontcare_boxes_2d)
+        _, ioa_bev, _, ioa_3d = _box_3d_overlaps(
+            det_boxes_3d, det_corners, gt.dontcare_boxes_3d, gt.dontcare_bev_corners
+        )
+        self.dontcare_overlaps = np.stack([ioa_2d, ioa_bev, ioa_3d])
+
+    def ignored_gt_and_det(self, class_idx):
+        """Classifies the ground truth and detections for a class, as the
+        C++ tool's cleanData
+
+        Returns:
+            ignored_gt: (3, G) per difficulty, see GroundTruth.ignored
+            ignored_det: (3, D) per difficulty, 0 for the valid detections of
+                the class, 1 for the too small ones, -1 for the other classes
+        """
+        det_class = self.det_types == CLASS_NAMES[class_idx]
+        ignored_det = np.where(
+            self.det_heights < MIN_HEIGHT[:, np.newaxis], 1, np.where(det_class, 0, -1)
+        )
+        return self.gt.ignored[class_idx], ignored_det
+
+
+class GroundTruthCache:
+    """GroundTruth of all samples of a split, as concatenated arrays with
+    per-sample offsets, saved as .npy files which are memory mapped when
+    loaded"""
+
+    # Arrays of the ground truth and of the DontCare areas, concatenated
+    # along their first axis
+    GT_ARRAYS = ["labels", "boxes_2d", "boxes_3d", "bev_corners", "ignored"]
+    DONTCARE_ARRAYS = [
+        "dontcare_boxes_2d",
+        "dontcare_boxes_3d",
+        "dontcare_bev_corners",
+    ]
+
+    def __init__(self, sample_names, arrays, gt_offsets, dontcare_offsets):
+        """
+        Args:
+            sample_names: (S,) sample names
+            arrays: dict of the GT_ARRAYS and DONTCARE_ARRAYS of all samples,
+                ignored being (N, 3, 3)
+            gt_offsets: (S + 1,) offsets of each sample's ground truth
+            dontcare_offsets: (S + 1,) offsets of each sample's DontCare areas
+        """
+        self.sample_names = np.asarray(sample_names)
+        self.arrays = arrays
+        self.gt_offsets = np.asarray(gt_offsets, dtype=np.int64)
+        self.dontcare_offsets = np.asarray(dontcare_offsets, dtype=np.int64)
+        self._sample_indices = {
+            sample_name: sample_idx
+            for sample_idx, sample_name in enumerate(self.sample_names)
+        }
+
+    @classmethod
+    def build(cls, label_dir, sample_names):
+        """Reads the label files of the samples and classifies their ground
+        truth"""
+        label_store = kitti_labels.KittiLabelStore.build(label_dir, sample_names)
+        ground_truth = [
+            GroundTruth.from_labels(label_store.get_labels(sample_name))
+            for sample_name in label_store.sample_names
+        ]
+
+        # Starts with an empty sample, for the shapes of empty splits
+        empty = GroundTruth.from_labels(np.zeros(0, dtype=kitti_labels.LABEL_DTYPE))
+        arrays = dict()
+        for name in cls.GT_ARRAYS + cls.DONTCARE_ARRAYS:
+            sample_arrays = [getattr(gt, name) for gt in [empty] + ground_truth]
+            if name == "ignored":
+                # Concatenated along the ground truth axis
+                sample_arrays = [
+                    np.moveaxis(ignored, -1, 0) for ignored in sample_arrays
+                ]
+            arrays[name] = np.concatenate(sample_arrays)
+
+        gt_offsets = np.zeros(len(ground_truth) + 1, dtype=np.int64)
+        gt_offsets[1:] = np.cumsum([len(gt.labels) for gt in ground_truth])
+        dontcare_offsets = np.zeros(len(ground_truth) + 1, dtype=np.int64)
+        dontcare_offsets[1:] = np.cumsum(
+            [len(gt.dontcare_boxes_2d) for gt in ground_truth]
+        )
+
+        return cls(label_store.sample_names, arrays, gt_offsets, dontcare_offsets)
+
+    @classmethod
+    def load_or_build(cls, cache_dir, label_dir, sample_names):
+        """Memory maps the cache of the samples, or builds and saves it when
+        the cache is missing or stale, as KittiLabelStore.load_or_build
+
+        Args:
+            cache_dir: directory of the .npy cache files
+            label_dir: directory of the label files
+            sample_names: samples to cache
+
+        Returns:
+            GroundTruthCache
+        """
+        sample_names = np.asarray(sample_names)
+        label_dir = os.path.realpath(label_dir)
+
+        index_path = os.path.join(cache_dir, "index.npz")
+        if os.path.exists(index_path) and os.path.getmtime(
+            index_path
+        ) >= os.path.getmtime(label_dir):
+            with np.load(index_path) as index:
+                if str(index["label_dir"]) == label_dir and np.array_equal(
+                    index["sample_names"], sample_names
+                ):
+                    return cls(
+                        sample_names,
+                        {
+                            name: _load_array(os.path.join(cache_dir, name + ".npy"))
+                            for name in cls.GT_ARRAYS + cls.DONTCARE_ARRAYS
+                        },
+                        index["gt_offsets"],
+                        index["dontcare_offsets"],
+                    )
+
+        gt_cache = cls.build(label_dir, sample_names)
+
+        # Write to a temporary directory first, so concurrent readers never
+        # see a partial cache
+        tmp_cache_dir = "{}.{}.tmp".format(cache_dir.rstrip("/"), os.getpid())
+        os.makedirs(tmp_cache_dir)
+        for name, array in gt_cache.arrays.items():
+            np.save(os.path.join(tmp_cache_dir, name + ".npy"), array)
+        np.savez(
+            os.path.join(tmp_cache_dir, "index.npz"),
+            label_dir=np.array(label_dir),
+            sample_names=gt_cache.sample_names,
+            gt_offsets=gt_cache.gt_offsets,
+            dontcare_offsets=gt_cache.dontcare_offsets,
+        )
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_cache_dir, cache_dir)
+
+        return gt_cache
+
+    def __contains__(self, sample_name):
+        return sample_name in self._sample_indices
+
+    def get(self, sample_name):
+        """Returns the GroundTruth of a sample, views into the cache"""
+        sample_idx = self._sample_indices[sample_name]
+        gt_start, gt_end = self.gt_offsets[sample_idx : sample_idx + 2]
+        dontcare_start, dontcare_end = self.dontcare_offsets[
+            sample_idx : sample_idx + 2
+        ]
+
+        arrays = {
+            name: self.arrays[name][gt_start:gt_end] for name in self.GT_ARRAYS
+        }
+        arrays["ignored"] = np.moveaxis(arrays["ignored"], 0, -1)
+        for name in self.DONTCARE_ARRAYS:
+            arrays[name] = self.arrays[name][dontcare_start:dontcare_end]
+        return GroundTruth(**arrays)
+
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Empty arrays cannot be memory mapped
+        return np.load(path)
+
+
+def _load_sample(gt_dir, det_dir, sample_name):
+    img_idx = int(sample_name)
+    return EvalSample(
+        GroundTruth.from_labels(kitti_labels.read_label_array(gt_dir, img_idx)),
+        kitti_labels.read_label_array(det_dir, img_idx),
+    )
+
+
+def _load_cached_sample(det_dir, gt_and_sample_name):
+    gt, sample_name = gt_and_sample_name
+    return EvalSample(gt, kitti_labels.read_label_array(det_dir, int(sample_name)))
+
+
+def _configs(sample, class_idx, metric_idx, min_overlaps):
+    """Stacks the settings and difficulties of a class and metric along a
+    first config axis, of index setting * 3 + difficulty"""
+    ignored_gt, ignored_det = sample.ignored_gt_and_det(class_idx)
+    num_settings = len(min_overlaps)
+    return (
+        np.tile(ignored_gt, (num_settings, 1)),
+        np.tile(ignored_det, (num_settings, 1)),
+        np.repeat(min_overlaps[:, metric_idx, class_idx], len(DIFFICULTIES)),
+    )
+
+
+def _matched_gt_indices(ignored_gt, ignored_det):
+    """Returns the indices of the ground truth of the class or of its
+    neighbouring class, in order, none if there are no detections"""
+    if ignored_det.shape[1] == 0:
+        return []
+    return np.nonzero(ignored_gt[0] != -1)[0]
+
+
+def _sample_tp_scores(sample, eval_keys, min_overlaps):
+    """Matches each ground truth with its highest scored candidate, to find
+    the scores of the recall steps
+
+    Returns:
+        tp_scores: dict of (class_idx, metric_idx) to a list of the true
+            positive scores of each config
+        num_gt: (3, 3) number of valid ground truth per class and difficulty
+    """
+    scores = sample.det["score"]
+
+    tp_scores = dict()
+    num_gt = np.sum(sample.gt.ignored == 0, axis=-1)
+
+    for class_idx, metric_idx in eval_keys:
+        ignored_gt, ignored_det, min_overlap = _configs(
+            sample, class_idx, metric_idx, min_overlaps
+        )
+        overlaps = sample.overlaps[metric_idx]
+
+        assigned = np.zeros(ignored_det.shape, dtype=bool)
+        tp_dets = np.zeros(ignored_det.shape, dtype=bool)
+        for gt_idx in _matched_gt_indices(ignored_gt, ignored_det):
+            candidates = (
+                (ignored_det != -1)
+                & ~assigned
+                & (overlaps[:, gt_idx] > min_overlap[:, np.newaxis])
+            )
+            configs = np.nonzero(np.any(candidates, axis=1))[0]
+            det_indices = np.argmax(
+                np.where(candidates[configs], scores, -np.inf), axis=1
+            )
+
+            assigned[configs, det_indices] = True
+            tp = (ignored_gt[configs, gt_idx] == 0) & (
+                ignored_det[configs, det_indices] == 0
+            )
+            tp_dets[configs[tp], det_indices[tp]] = True
+
+        tp_scores[(class_idx, metric_idx)] = [
+            scores[config_tp_dets] for config_tp_dets in tp_dets
+        ]
+
+    return tp_scores, num_gt
+
+
+def _sample_statistics(sample, thresholds, min_overlaps):
+    """Matches the ground truth with the detections above each recall step
+    threshold
+
+    Args:
+        sample: EvalSample
+        thresholds: dict of (class_idx, metric_idx) to the (configs, T) score
+            thresholds, padded with inf
+        min_overlaps: (settings, 3, 3) minimum overlaps
+
+    Returns:
+        statistics: dict of (class_idx, metric_idx) to the (configs, T)
+            tp, fp, orientation similarity and heading similarity sums
+    """
+    det = sample.det
+    scores = det["score"]
+
+    statistics = dict()
+    for (class_idx, metric_idx), key_thresholds in thresholds.items():
+        ignored_gt, ignored_det, min_overlap = _configs(
+            sample, class_idx, metric_idx, min_overlaps
+        )
+        overlaps = sample.overlaps[metric_idx]
+
+        kept = scores >= key_thresholds[:, :, np.newaxis]
+        valid_det = (ignored_det == 0)[:, np.newaxis]
+        small_det = (ignored_det == 1)[:, np.newaxis]
+        assigned = np.zeros(kept.shape, dtype=bool)
+
+        stats_shape = key_thresholds.shape
+        tp = np.zeros(stats_shape, dtype=np.int64)
+        similarity = np.zeros(stats_shape)
+        heading_similarity = np.zeros(stats_shape)
+
+        for gt_idx in _matched_gt_indices(ignored_gt, ignored_det):
+            gt_overlaps = overlaps[:, gt_idx]
+            candidates = (
+                kept
+                & ~assigned
+                & (gt_overlaps > min_overlap[:, np.newaxis])[:, np.newaxis]
+            )
+            valid_candidates = candidates & valid_det
+            small_candidates = candidates & small_det
+
+            # The valid detection with the greatest overlap, else the first
+            # too small one
+            has_valid = np.any(valid_candidates, axis=-1)
+            has_det = has_valid | np.any(small_candidates, axis=-1)
+            det_indices = np.where(
+                has_valid,
+                np.argmax(np.where(valid_candidates, gt_overlaps, -1.0), axis=-1),
+                np.argmax(small_candidates, axis=-1),
+            )
+
+            is_tp = has_valid & (ignored_gt[:, gt_idx] == 0)[:, np.newaxis]
+            tp += is_tp
+
+            config_indices, threshold_indices = np.nonzero(has_det)
+            assigned[
+                config_indices,
+                threshold_indices,
+                det_indices[config_indices, threshold_indices],
+            ] = True
+
+            gt_labels = sample.gt.labels
+            similarity += is_tp * (
+                (1.0 + np.cos(gt_labels["alpha"][gt_idx] - det["alpha"][det_indices]))
+                / 2.0
+            )
+            heading_similarity += is_tp * (
+                (1.0 + np.cos(np.abs(gt_labels["ry"][gt_idx] - det["ry"][det_indices])))
+                / 2.0
+            )
+
+        # Detections on DontCare areas are not false positives
+        in_dontcare = np.any(
+            sample.dontcare_overlaps[metric_idx]
+            > min_overlap[:, np.newaxis, np.newaxis],
+            axis=-1,
+        )
+        fp = np.sum(kept & ~assigned & valid_det & ~in_dontcare[:, np.newaxis], -1)
+
+        statistics[(class_idx, metric_idx)] = (tp, fp, similarity, heading_similarity)
+
+    return statistics
+
+
+def get_thresholds(scores, num_gt):
+    """Finds the scores of the N_SAMPLE_PTS linearly spaced recall steps, as
+    the C++ tool's getThresholds
+
+    Args:
+        scores: true positive scores, when each ground truth takes its
+            highest scored candidate
+        num_gt: number of valid ground truth
+
+    Returns:
+        thresholds: (T,) decreasing score thresholds
+    """
+    scores = np.sort(scores)[::-1]
+    num_scores = len(scores)
+
+    thresholds = []
+    current_recall = 0.0
+    for score_idx in range(num_scores):
+        last = score_idx == num_scores - 1
+        l_recall = (score_idx + 1) / num_gt
+        r_recall = l_recall if last else (score_idx + 2) / num_gt
+
+        # Skip the score if the next one is closer to the current recall step
+        if (r_recall - current_recall) < (current_recall - l_recall) and not last:
+            continue
+
+        thresholds.append(scores[score_idx])
+        current_recall += 1.0 / (N_SAMPLE_PTS - 1.0)
+
+    return np.asarray(thresholds[:N_SAMPLE_PTS], dtype=np.float64)
+
+
+def _evaluated_keys(samples):
+    """Finds the (class_idx, metric_idx) that are evaluated, a class is only
+    evaluated for a metric if it is detected at least once with a valid box
+
+    Returns:
+        eval_keys: list of (class_idx, metric_idx)
+        compute_aos: True if all detections have a valid alpha
+    """
+    if samples:
+        det = np.concatenate([sample.det for sample in samples])
+    else:
+        det = np.zeros(0, dtype=kitti_labels.LABEL_DTYPE)
+    det_types = np.char.lower(det["type"])
+
+    valid_2d = det["x1"] >= 0
+    valid_bev = (
+        (det["t"][:, 0] != -1000)
+        & (det["t"][:, 2] != -1000)
+        & (det["w"] > 0)
+        & (det["l"] > 0)
+    )
+    valid_3d = valid_bev & (det["t"][:, 1] != -1000) & (det["h"] > 0)
+
+    eval_keys = []
+    for metric_idx, valid in enumerate([valid_2d, valid_bev, valid_3d]):
+        for class_idx, class_name in enumerate(CLASS_NAMES):
+            if np.any(valid & (det_types == class_name)):
+                eval_keys.append((class_idx, metric_idx))
+
+    compute_aos = not np.any(det["alpha"] == -10)
+    return eval_keys, compute_aos
+
+
+def _precision_curve(numerators, tp, fp, num_thresholds):
+    """Computes the (configs, N_SAMPLE_PTS) precision (or similarity) curves,
+    filtered with the maximum over the next recall steps"""
+    curves = np.zeros((len(tp), N_SAMPLE_PTS))
+    for config_idx, config_num_thresholds in enumerate(num_thresholds):
+        num_dets = tp[config_idx, :config_num_thresholds] + (
+            fp[config_idx, :config_num_thresholds]
+        )
+        curves[config_idx, :config_num_thresholds] = np.divide(
+            numerators[config_idx, :config_num_thresholds],
+            num_dets,
+            out=np.zeros(config_num_thresholds),
+            where=num_dets > 0,
+        )
+    return np.maximum.accumulate(curves[:, ::-1], axis=1)[:, ::-1]
+
+
+def _average_precision(curves):
+    """11 point average precision, in percent, of (..., N_SAMPLE_PTS) curves"""
+    return np.sum(curves[..., ::4], axis=-1) / 11.0 * 100.0
+
+
+@contextlib.contextmanager
+def _sample_map(num_workers):
+    """Yields a map function running on num_workers processes, one per cpu
+    if None, or on the calling process if 0"""
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    if num_workers > 0:
+        # Spawned, forking a process with running threads can deadlock
+        with multiprocessing.get_context("spawn").Pool(num_workers) as pool:
+            yield functools.partial(pool.map, chunksize=32)
+    else:
+        yield lambda fn, items: [fn(item) for item in items]
+
+
+def _evaluate_samples(sample_map, samples, min_overlaps):
+    min_overlaps = np.asarray(min_overlaps, dtype=np.float64).reshape(-1, 3, 3)
+    num_settings = len(min_overlaps)
+    eval_keys, compute_aos = _evaluated_keys(samples)
+
+    # Scores of the recall steps
+    sample_tp_scores = sample_map(
+        functools.partial(
+            _sample_tp_scores, eval_keys=eval_keys, min_overlaps=min_overlaps
+        ),
+        samples,
+    )
+    num_gt = sum(
+        (sample_num_gt for _, sample_num_gt in sample_tp_scores),
+        np.zeros((len(CLASS_NAMES), len(DIFFICULTIES)), dtype=np.int64),
+    )
+
+    thresholds = dict()
+    num_thresholds = dict()
+    for class_idx, metric_idx in eval_keys:
+        key_thresholds = []
+        for config_idx in range(num_settings * len(DIFFICULTIES)):
+            scores = [
+                tp_scores[(class_idx, metric_idx)][config_idx]
+                for tp_scores, _ in sample_tp_scores
+            ]
+            key_thresholds.append(
+                get_thresholds(
+                    np.concatenate(scores) if scores else np.zeros(0),
+                    num_gt[class_idx, config_idx % len(DIFFICULTIES)],
+                )
+            )
+
+        num_thresholds[(class_idx, metric_idx)] = [
+            len(config_thresholds) for config_thresholds in key_thresholds
+        ]
+        padded_thresholds = np.full((len(key_thresholds), N_SAMPLE_PTS), np.inf)
+        for config_idx, config_thresholds in enumerate(key_thresholds):
+            padded_thresholds[config_idx, : len(config_thresholds)] = config_thresholds
+        thresholds[(class_idx, metric_idx)] = padded_thresholds
+
+    # Precision at each recall step
+    sample_statistics = sample_map(
+        functools.partial(
+            _sample_statistics, thresholds=thresholds, min_overlaps=min_overlaps
+        ),
+        samples,
+    )
+
+    results = {metric: dict() for metric in METRICS}
+    for key in eval_keys:
+        tp, fp, similarity, heading_similarity = [
+            sum(statistics[key][stat_idx] for statistics in sample_statistics)
+            for stat_idx in range(4)
+        ]
+        class_idx, metric_idx = key
+        metric = METRICS[metric_idx]
+
+        precision = _precision_curve(tp, tp, fp, num_thresholds[key])
+        if metric == "2d":
+            similarity_curve = (
+                _precision_curve(similarity, tp, fp, num_thresholds[key])
+                if compute_aos
+                else None
+            )
+        else:
+            similarity_curve = _precision_curve(
+                heading_similarity, tp, fp, num_thresholds[key]
+            )
+
+        class_results = {
+            "precision": precision.reshape(num_settings, len(DIFFICULTIES), -1),
+            "ap": _average_precision(precision).reshape(num_settings, -1),
+            "similarity": None,
+            "similarity_ap": None,
+        }
+        if similarity_curve is not None:
+            class_results["similarity"] = similarity_curve.reshape(
+                num_settings, len(DIFFICULTIES), -1
+            )
+            class_results["similarity_ap"] = _average_precision(
+                similarity_curve
+            ).reshape(num_settings, -1)
+        results[metric][CLASS_NAMES[class_idx]] = class_results
+
+    return results
+
+
+def evaluate(gt_labels, det_labels, min_overlaps=MIN_OVERLAPS, num_workers=None):
+    """Evaluates detections against ground truth
+
+    Args:
+        gt_labels: list of the (G,) kitti_labels.LABEL_DTYPE ground truth of
+            each sample
+        det_labels: list of the (D,) kitti_labels.LABEL_DTYPE detections of
+            each sample, with their scores
+        min_overlaps: (settings, 3, 3) minimum overlaps of a true positive,
+            indexed by [setting, metric, class]
+        num_workers: number of processes, one per cpu if None, 0 to evaluate
+            on the calling process
+
+    Returns:
+        results: dict of metric ('2d', 'bev', '3d') to a dict of the
+            evaluated class names to a dict of
+                precision       (settings, 3, N_SAMPLE_PTS) precision curves,
+                                per difficulty
+                ap              (settings, 3) 11 point average precisions,
+                                in percent
+                similarity      (settings, 3, N_SAMPLE_PTS) orientation
+                                similarity curves for '2d', None if any
+                                detection has no alpha, heading similarity
+                                curves for 'bev' and '3d'
+                similarity_ap   (settings, 3) similarity average precisions
+    """
+    with _sample_map(num_workers) as sample_map:
+        samples = sample_map(_make_sample, list(zip(gt_labels, det_labels)))
+        return _evaluate_samples(sample_map, samples, min_overlaps)
+
+
+def _make_sample(labels):
+    gt_labels, det_labels = labels
+    return EvalSample(GroundTruth.from_labels(gt_labels), det_labels)
+
+
+def get_result_sample_names(result_dir):
+    """Returns the names of the samples with a detection file in
+    result_dir/data, the samples the C++ tool evaluates"""
+    return sorted(
+        file_name[:-4]
+        for file_name in os.listdir(result_dir + "/data")
+        if file_name.endswith(".txt")
+    )
+
+
+def evaluate_dir(
+    gt_dir, result_dir, min_overlaps=MIN_OVERLAPS, num_workers=None, gt_cache=None
+):
+    """Evaluates the detection files of result_dir/data against the label
+    files of gt_dir, as `evaluate_object_3d_offline gt_dir result_dir`
+
+    Args:
+        gt_dir: directory of the label files
+        result_dir: directory of the data directory of detection files
+        min_overlaps: see evaluate
+        num_workers: see evaluate
+        gt_cache: (optional) GroundTruthCache of the label files, the ground
+            truth is read from it instead of gt_dir
+
+    Returns:
+        results: see evaluate
+    """
+    sample_names = get_result_sample_names(result_dir)
+    det_dir = result_dir + "/data"
+    with _sample_map(num_workers) as sample_map:
+        if gt_cache is None:
+            samples = sample_map(
+                functools.partial(_load_sample, gt_dir, det_dir), sample_names
+            )
+        else:
+            samples = sample_map(
+                functools.partial(_load_cached_sample, det_dir),
+                [(gt_cache.get(name), name) for name in sample_names],
+            )
+        return _evaluate_samples(sample_map, samples, min_overlaps)
+
+
+def format_results(results, setting_idx=0):
+    """Formats the results of a minimum overlap setting as the AP lines
+    printed by the C++ tool, e.g. 'car_detection_3D AP: 88.1 77.9 76.2'
+
+    Returns:
+        lines: list of strings
+    """
+    lines = []
+    for metric in METRICS:
+        for class_name in CLASS_NAMES:
+            class_results = results[metric].get(class_name)
+            if class_results is None:
+                continue
+
+            names_and_aps = [
+                (RESULT_NAMES[metric], class_results["ap"][setting_idx])
+            ]
+            if class_results["similarity_ap"] is not None:
+                names_and_aps.append(
+                    (
+                        SIMILARITY_NAMES[metric],
+                        class_results["similarity_ap"][setting_idx],
+                    )
+                )
+            for name, aps in names_and_aps:
+                lines.append(
+                    "{}_{} AP: {:f} {:f} {:f}".format(class_name, name, *aps)
+                )
+    return lines
@@ -0,0 +1,255 @@
+"""kitti_eval unit test module."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import numpy as np
+
+import hf
+import hf.tests as tests
+
+from hf.core import kitti_eval
+from hf.datasets.kitti import kitti_labels
+
+
+def _write_labels(file_path, labels, with_scores):
+    with open(file_path, "w") as label_file:
+        for label in labels:
+            values = [
+                label["truncation"],
+                label["occlusion"],
+                label["alpha"],
+                label["x1"],
+                label["y1"],
+                label["x2"],
+                label["y2"],
+                label["h"],
+                label["w"],
+                label["l"],
+                label["t"][0],
+                label["t"][1],
+                label["t"][2],
+                label["ry"],
+            ]
+            if with_scores:
+                values.append(label["score"])
+            label_file.write(
+                label["type"] + " " + " ".join("%.4f" % value for value in values)
+            )
+            label_file.write("\n")
+
+
+def _jittered_detections(gt, rng):
+    """Jitters the ground truth of the evaluated and neighbouring classes,
+    drops some of it and adds false positives"""
+    gt_types = np.char.lower(gt["type"])
+    objects = gt[gt_types != "dontcare"]
+    det = objects[rng.uniform(size=len(objects)) > 0.15].copy()
+    num_dets = len(det)
+
+    box_shift = rng.normal(scale=2.0, size=(num_dets, 2))
+    det["x1"] += box_shift[:, 0] + rng.normal(scale=1.0, size=num_dets)
+    det["y1"] += box_shift[:, 1] + rng.normal(scale=1.0, size=num_dets)
+    det["x2"] += box_shift[:, 0] + rng.normal(scale=1.0, size=num_dets)
+    det["y2"] += box_shift[:, 1] + rng.normal(scale=1.0, size=num_dets)
+    det["t"] += rng.normal(scale=0.15, size=(num_dets, 3))
+    for dim in ["h", "w", "l"]:
+        det[dim] *= rng.uniform(0.93, 1.07, size=num_dets)
+    det["ry"] += rng.normal(scale=0.2, size=num_dets)
+    det["alpha"] += rng.normal(scale=0.2, size=num_dets)
+    det["score"] = rng.uniform(0.3, 1.0, size=num_dets)
+
+    # False positives, some of them on the ground truth
+    false_positives = objects[rng.integers(0, len(objects), size=4)].copy()
+    false_positives["type"] = rng.choice(["Car", "Pedestrian", "Cyclist"], size=4)
+    false_positives["x1"] += rng.uniform(-20.0, 20.0, size=4)
+    false_positives["x2"] += rng.uniform(-20.0, 20.0, size=4)
+    false_positives["t"][:, 0] += rng.uniform(-1.0, 1.0, size=4)
+    false_positives["h"] = np.maximum(false_positives["h"], 1.0)
+    false_positives["w"] = np.maximum(false_positives["w"], 1.0)
+    false_positives["l"] = np.maximum(false_positives["l"], 1.0)
+    false_positives["score"] = rng.uniform(0.0, 0.7, size=4)
+
+    det = np.concatenate([det, false_positives])
+    return det[rng.permutation(len(det))]
+
+
+def _parse_ap_lines(output):
+    aps = dict()
+    for line in output.splitlines():
+        if " AP: " in line:
+            name, values = line.split(" AP: ")
+            aps[name] = [float(value) for value in values.split()]
+    return aps
+
+
+class KittiEvalTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gt_dir = tests.test_path() + "/datasets/Kitti/object/training/label_2"
+        cls.sample_names = sorted(
+            file_name[:-4] for file_name in os.listdir(cls.gt_dir)
+        )
+        cls.gt_labels = [
+            kitti_labels.read_label_array(cls.gt_dir, int(sample_name))
+            for sample_name in cls.sample_names
+        ]
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def _write_results(self, result_dir, det_labels):
+        os.makedirs(result_dir + "/data")
+        for sample_name, det in zip(self.sample_names, det_labels):
+            _write_labels(
+                result_dir + "/data/" + sample_name + ".txt", det, with_scores=True
+            )
+
+    def _compile_native_eval(self, name):
+        source = (
+            hf.top_dir() + "/scripts/offline_eval/kitti_native_eval/" + name + ".cpp"
+        )
+        binary = self.tmp_dir + "/" + name
+        if not os.path.exists(binary):
+            try:
+                subprocess.check_call(
+                    [
+                        "g++",
+                        "-O2",
+                        "-o",
+                        binary,
+                        source,
+                        "-lboost_system",
+                        "-lboost_filesystem",
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            except (OSError, subprocess.CalledProcessError):
+                self.skipTest("Could not compile " + name)
+        return binary
+
+    def test_perfect_detections(self):
+        det_labels = []
+        for gt in self.gt_labels:
+            det = gt[np.char.lower(gt["type"]) != "dontcare"].copy()
+            det["score"] = 1.0
+            det_labels.append(det)
+
+        results = kitti_eval.evaluate(self.gt_labels, det_labels, num_workers=0)
+
+        # The precision is 1 up to the last recall step reached, with few
+        # ground truth the recall steps stop before 1
+        for metric in kitti_eval.METRICS:
+            self.assertIn("car", results[metric])
+            for class_results in results[metric].values():
+                precision = class_results["precision"]
+                self.assertTrue(np.all((precision == 0.0) | (precision == 1.0)))
+                np.testing.assert_array_equal(
+                    np.diff(precision, axis=-1) <= 0.0, True
+                )
+                np.testing.assert_allclose(class_results["similarity"], precision)
+        np.testing.assert_array_equal(results["3d"]["car"]["precision"][..., 0], 1.0)
+
+    def test_no_detections(self):
+        det_labels = [
+            np.zeros(0, dtype=kitti_labels.LABEL_DTYPE) for _ in self.gt_labels
+        ]
+        results = kitti_eval.evaluate(self.gt_labels, det_labels, num_workers=0)
+
+        self.assertEqual(results, {metric: dict() for metric in kitti_eval.METRICS})
+        self.assertEqual(kitti_eval.format_results(results), [])
+
+    def test_get_thresholds(self):
+        # Each score is a recall step when there are N_SAMPLE_PTS - 1 ground
+        # truth
+        scores = np.linspace(0.0, 1.0, kitti_eval.N_SAMPLE_PTS - 1)
+        thresholds = kitti_eval.get_thresholds(
+            scores, kitti_eval.N_SAMPLE_PTS - 1
+        )
+        np.testing.assert_array_equal(thresholds, scores[::-1])
+
+    def test_ground_truth_cache(self):
+        cache_dir = os.path.join(self.tmp_dir, "gt_cache")
+        gt_cache = kitti_eval.GroundTruthCache.load_or_build(
+            cache_dir, self.gt_dir, self.sample_names
+        )
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, "index.npz")))
+
+        # Memory mapped from the cache
+        cached_gt_cache = kitti_eval.GroundTruthCache.load_or_build(
+            cache_dir, self.gt_dir, self.sample_names
+        )
+        self.assertIsInstance(cached_gt_cache.arrays["boxes_3d"], np.memmap)
+
+        for sample_name, labels in zip(self.sample_names, self.gt_labels):
+            self.assertIn(sample_name, cached_gt_cache)
+            gt = kitti_eval.GroundTruth.from_labels(labels)
+            cached_gt = cached_gt_cache.get(sample_name)
+            for name in (
+                kitti_eval.GroundTruthCache.GT_ARRAYS
+                + kitti_eval.GroundTruthCache.DONTCARE_ARRAYS
+            ):
+                np.testing.assert_array_equal(
+                    getattr(cached_gt, name), getattr(gt, name), err_msg=name
+                )
+
+        # The ground truth is read from the cache
+        rng = np.random.default_rng(1)
+        det_labels = [_jittered_detections(gt, rng) for gt in self.gt_labels]
+        result_dir = self.tmp_dir + "/results_cached"
+        self._write_results(result_dir, det_labels)
+
+        results = kitti_eval.evaluate_dir(self.gt_dir, result_dir, num_workers=0)
+        for cache in [gt_cache, cached_gt_cache]:
+            cached_results = kitti_eval.evaluate_dir(
+                self.tmp_dir + "/missing",
+                result_dir,
+                num_workers=2,
+                gt_cache=cache,
+            )
+            self.assertEqual(
+                kitti_eval.format_results(cached_results),
+                kitti_eval.format_results(results),
+            )
+
+    def test_same_as_native_eval(self):
+        binaries = [
+            self._compile_native_eval("evaluate_object_3d_offline"),
+            self._compile_native_eval("evaluate_object_3d_offline_05_iou"),
+        ]
+
+        rng = np.random.default_rng(0)
+        for run_idx in range(3):
+            det_labels = [_jittered_detections(gt, rng) for gt in self.gt_labels]
+            result_dir = self.tmp_dir + "/results_" + str(run_idx)
+            self._write_results(result_dir, det_labels)
+
+            results = kitti_eval.evaluate_dir(self.gt_dir, result_dir, num_workers=2)
+            self.assertIn("car", results["3d"])
+
+            for setting_idx, binary in enumerate(binaries):
+                output = subprocess.check_output(
+                    [binary, self.gt_dir, result_dir],
+                    cwd=result_dir,
+                    stderr=subprocess.DEVNULL,
+                ).decode()
+                native_aps = _parse_ap_lines(output)
+                aps = _parse_ap_lines(
+                    "\n".join(kitti_eval.format_results(results, setting_idx))
+                )
+
+                self.assertEqual(sorted(aps.keys()), sorted(native_aps.keys()))
+                for name, native_ap in native_aps.items():
+                    np.testing.assert_allclose(
+                        aps[name], native_ap, atol=1e-4, err_msg=name
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,8 @@
 import os
-import sys
 
 import numpy as np
 from sklearn.cluster import KMeans
 
-from hf.core import obj_utils
-
 import hf
 
 
@@ -20,32 +17,6 @@ class LabelClusterUtils:
         self.clusters = []
         self.std_devs = []
 
-    @staticmethod
-    def _filter_labels_by_class(obj_labels, classes):
-        """
-        Splits ground truth labels based on provided classes
-
-        Args:
-            obj_labels: ObjectLabel list for an image
-            classes: Classes to save
-
-        Returns:
-            A list of (l, w, h) of the objects, for each class
-        """
-        filtered = [[] for _ in range(len(classes))]
-
-        for obj_label in obj_labels:
-            if obj_label.type in classes:
-                class_idx = classes.index(obj_label.type)
-
-                # l, w, h
-                obj_l = obj_label.l
-                obj_w = obj_label.w
-                obj_h = obj_label.h
-                filtered[class_idx].append([obj_l, obj_w, obj_h])
-
-        return filtered
-
     def _get_cluster_file_path(self, dataset, cls, num_clusters):
         """
         Returns a unique file path for a text file based on
@@ -176,27 +147,20 @@ class LabelClusterUtils:
 
         # Calculate the remaining clusters
         # Load labels corresponding to the sample list for clustering
-        sample_list = self._dataset.load_sample_names(self.cluster_split)
-        all_labels = [[] for _ in range(len(classes))]
-
-        num_samples = len(sample_list)
-        for sample_idx in range(num_samples):
-
-            sys.stdout.write(
-                "\rClustering labels {} / {}".format(sample_idx + 1, num_samples)
+        labels = self._dataset.get_label_store(self.cluster_split).labels
+
+        # l, w, h of the objects, for each class
+        all_labels = [
+            np.stack(
+                [
+                    labels["l"][labels["type"] == cls],
+                    labels["w"][labels["type"] == cls],
+                    labels["h"][labels["type"] == cls],
+                ],
+                axis=1,
             )
-            sys.stdout.flush()
-
-            sample_name = sample_list[sample_idx]
-            img_idx = int(sample_name)
-
-            obj_labels = obj_utils.read_labels(self._dataset.label_dir, img_idx)
-            filtered_labels = LabelClusterUtils._filter_labels_by_class(
-                obj_labels, self._dataset.classes
-            )
-
-            for class_idx in range(len(classes)):
-                all_labels[class_idx].extend(filtered_labels[class_idx])
+            for cls in classes
+        ]
 
         print("\nFinished reading labels, clustering data...\n")
 
@@ -4,10 +4,6 @@ import os
 
 from PIL import Image
 
-from hf.core import obj_utils
-
-from hf.core import box_3d_encoder
-
 
 class LabelSegPreprocessor(object):
     def __init__(self, dataset, label_seg_dir, expand_gt_size):
@@ -66,17 +62,14 @@ class LabelSegPreprocessor(object):
                 )
                 continue
 
-            # Get ground truth and filter based on difficulty
-            obj_labels = obj_utils.read_labels(dataset.label_dir, img_idx)
-
-            # Filter objects to dataset classes
-            obj_labels = dataset_utils.filter_labels(obj_labels)
+            # Get ground truth filtered to dataset classes
+            label_boxes_3d, label_classes = dataset.get_label_boxes(sample_name)
 
             image = Image.open(dataset.get_rgb_image_path(sample_name))
             image_shape = [image.size[1], image.size[0]]
             point_cloud, _ = dataset_utils.get_point_cloud(img_idx, image_shape)
             # Filtering by class has no valid ground truth, skip this image
-            if len(obj_labels) == 0:
+            if len(label_boxes_3d) == 0:
                 print(
                     "{} / {} No {}s for sample {} "
                     "(Ground Truth Filter)".format(
@@ -87,19 +80,6 @@ class LabelSegPreprocessor(object):
                 self._save_to_file(classes_name, expand_gt_size, sample_name, label_seg)
                 continue
 
-            label_boxes_3d = np.asarray(
-                [
-                    box_3d_encoder.object_label_to_box_3d(obj_label)
-                    for obj_label in obj_labels
-                ]
-            )
-
-            label_classes = [
-                dataset_utils.class_str_to_index(obj_label.type)
-                for obj_label in obj_labels
-            ]
-            label_classes = np.asarray(label_classes, dtype=np.int32)
-
             label_seg = self.label_seg_utils.label_point_cloud(
                 point_cloud, label_boxes_3d, label_classes, expand_gt_size
             )
@@ -111,7 +91,7 @@ class LabelSegPreprocessor(object):
                     sample_idx + 1,
                     num_samples,
                     foreground_points.shape[0],
-                    len(obj_labels),
+                    len(label_boxes_3d),
                     classes_name,
                     sample_name,
                 )
@@ -19,13 +19,14 @@ class LabelSegUtils:
         # Parse KittiUtils config
         ##############################
         self.kitti_utils_config = dataset.config.kitti_utils_config
-        self._area_extents = self.kitti_utils_config.area_extents
+        self._area_extents = list(self.kitti_utils_config.area_extents)
 
         ##############################
         # Parse MiniBatchUtils config
         ##############################
-        self.config = self.kitti_utils_config.label_seg_config
-        self._expand_gt_size = self.config.expand_gt_size
+        # The sub-message isn't kept, it can't be pickled on its own
+        label_seg_config = self.kitti_utils_config.label_seg_config
+        self._expand_gt_size = label_seg_config.expand_gt_size
 
         # Setup paths
         self.label_seg_dir = (
@@ -1,4 +1,3 @@
-import numpy as np
 import tensorflow as tf
 from hf.core import compute_iou
 from hf.core import box_3d_encoder
@@ -8,35 +7,52 @@ from hf.core import box_3d_encoder
 # --------------------------------------
 
 
-def point_cloud_masking(mask, npoint=2048):
+def point_cloud_masking(mask, npoint=2048, seed=None):
     """ Select point cloud with predicted 3D mask
     Input:
         mask: TF tensor in shape (B,P) of False (not pick) or True (pick)
         npoint: int scalar, maximum number of points to keep (default: 2048)
+        seed: int scalar, seed of the random sampling (default: None)
     Output:
         indices: TF tensor in shape (B,npoint,2)
+
+    Masks with more than npoint points are sampled without replacement,
+    others keep all their points plus random ones of them, in a random
+    order. Empty masks pick the first point.
     """
-    mask = tf.to_float(mask)  # (B,P)
-
-    def mask_to_indices(mask):
-        indices = np.zeros((mask.shape[0], npoint, 2), dtype=np.int32)
-        for i in range(mask.shape[0]):
-            pos_indices = np.where(mask[i, :] > 0.5)[0]
-            # skip cases when pos_indices is empty
-            if len(pos_indices) > 0:
-                if len(pos_indices) > npoint:
-                    choice = np.random.choice(len(pos_indices), npoint, replace=False)
-                else:
-                    choice = np.random.choice(
-                        len(pos_indices), npoint - len(pos_indices), replace=True
-                    )
-                    choice = np.concatenate((np.arange(len(pos_indices)), choice))
-                np.random.shuffle(choice)
-                indices[i, :, 1] = pos_indices[choice]
-            indices[i, :, 0] = i
-        return indices
-
-    indices = tf.py_func(mask_to_indices, [mask], tf.int32)
+    mask = tf.to_float(mask) > 0.5  # (B,P)
+    mask_shape = tf.shape(mask)
+    batch_size = mask_shape[0]
+    num_points = mask_shape[1]
+    seeds = [None] * 3 if seed is None else [seed, seed + 1, seed + 2]
+
+    # Picked points first in a random order, by random keys in [1, 2) for
+    # them and [0, 1) for the others
+    keys = tf.random_uniform([batch_size, num_points], seed=seeds[0])
+    keys += tf.to_float(mask)
+    _, candidates = tf.nn.top_k(keys, k=tf.minimum(npoint, num_points))  # (B,C)
+    num_picked = tf.reduce_sum(tf.to_int32(mask), axis=1, keep_dims=True)  # (B,1)
+
+    # Each slot takes the next picked point, then random ones of them
+    # once they are all taken
+    slots = tf.tile(tf.expand_dims(tf.range(npoint), 0), [batch_size, 1])
+    random_slots = tf.to_int32(
+        tf.random_uniform([batch_size, npoint], seed=seeds[1])
+        * tf.to_float(num_picked)
+    )
+    random_slots = tf.clip_by_value(random_slots, 0, tf.maximum(num_picked - 1, 0))
+    slots = tf.where(slots < num_picked + tf.zeros_like(slots), slots, random_slots)
+
+    # Shuffle the slots
+    _, order = tf.nn.top_k(
+        tf.random_uniform([batch_size, npoint], seed=seeds[2]), k=npoint
+    )
+    batch_indices = tf.tile(tf.expand_dims(tf.range(batch_size), 1), [1, npoint])
+    slots = tf.gather_nd(slots, tf.stack([batch_indices, order], axis=2))
+    point_indices = tf.gather_nd(candidates, tf.stack([batch_indices, slots], axis=2))
+    point_indices *= tf.to_int32(num_picked > 0)
+
+    indices = tf.stack([batch_indices, point_indices], axis=2)
     return indices
 
 
@@ -51,11 +67,12 @@ def foreground_masking(
     seg_scores,
     label_box_3d,
     label_cls,
+    seed=None,
 ):
     """ Select foreground points and their features, segmentation scores etc. according to a given mask.
     Note the output number of foreground points is fixed by a given parameter. This is achived by sampling or padding.
     """
-    fg_indices = point_cloud_masking(mask, num_fg_point)  # (B,F,2)
+    fg_indices = point_cloud_masking(mask, num_fg_point, seed)  # (B,F,2)
     foreground_pts = tf.reshape(
         tf.gather_nd(pc_pts, fg_indices),
         [batch_size, num_fg_point, pc_pts.shape[2].value],
@@ -91,21 +108,11 @@ def foreground_masking(
     )
 
 
-def gather_top_n(sb_data):
-    sb_proposals, sb_confidences, sb_sorted_idxs = sb_data
-    sorted_confidences = tf.gather(sb_confidences, sb_sorted_idxs)
-    sorted_proposals = tf.gather(sb_proposals, sb_sorted_idxs)
-    return sorted_proposals, sorted_confidences
-
-
-def sb_nms_fn(
-    boxes_and_scores, nms_iou_thresh, nms_size, fixed_num_proposal_nms, bev_extents
-):
-    """NMS on singel batch.
+def batch_nms_fn(boxes, scores, nms_iou_thresh, nms_size, fixed_num_proposal_nms):
+    """NMS on all the batch items at once.
     Input:
-        boxes_and_scores: A tuple with following elements:
-            sb_boxes: (P, 7) [x, y, z, h, w, l, ry]
-            sb_scores: (P). Scores for each 3d box
+        boxes: (B, P, 7) [x, y, z, h, w, l, ry]
+        scores: (B, P). Scores for each 3d box
         nms_iou_thresh: float. The IoU threshold used for NMS
         nms_size: int. The number of output box indices.
         fixed_num_proposal_nms: bool. For oriented NMS,
@@ -115,43 +122,33 @@ def sb_nms_fn(
             indices of selected boxes) will be of size of nms_size. This is achived by padding -1 if the
             number of selected boxes after NMS is less than nms_size.
     Output:
-        sb_nms_indices_padded: (N). The indices of selected boxes, whose size is equal to nms_size. If the
+        nms_indices_padded: (B, N). The indices of selected boxes, whose size is equal to nms_size. If the
             indice is -1, it means no selection and used just for padding.
-        num_selected_boexs_before_padding: int. The number of selected boxes after NMS, i.e., before padding -1.
+        num_selected_boexs_before_padding: (B). The number of selected boxes after NMS, i.e., before padding -1.
     """
-    (sb_boxes, sb_scores) = boxes_and_scores
-    sb_nms_indices = compute_iou.oriented_nms_tf(sb_boxes, sb_scores, nms_iou_thresh)
-    sb_nms_indices = sb_nms_indices[: tf.minimum(nms_size, tf.shape(sb_nms_indices)[0])]
-    if not fixed_num_proposal_nms:
-        # sb_nms_indices append duplicated indices to make
-        # sure sb_nms_indices has the same size as sb_boxes.
-        # In case variable number proposals is desired,
-        # use tf.unique to remove duplicates
-        sb_nms_indices, _ = tf.unique(sb_nms_indices)
-
-    sb_nms_indices_padded = tf.cond(
-        tf.greater(nms_size, tf.shape(sb_nms_indices)[0]),
-        true_fn=lambda: tf.pad(
-            sb_nms_indices,
-            [[0, nms_size - tf.shape(sb_nms_indices)[0]]],
-            mode="CONSTANT",
-            constant_values=-1,
-        ),
-        false_fn=lambda: sb_nms_indices,
+    nms_indices, num_keep = compute_iou.batch_oriented_nms_tf(
+        boxes, scores, nms_iou_thresh
     )
-    return sb_nms_indices_padded, tf.shape(sb_nms_indices)[0]
-
-
-def sb_nms_selection(args):
-    sb_proposals, sb_scores, sb_nms_indices = args
-    sb_post_nms_proposals = tf.gather(sb_proposals, sb_nms_indices, axis=0)
-    sb_post_nms_scores = tf.gather(sb_scores, sb_nms_indices, axis=0)
-    return sb_post_nms_proposals, sb_post_nms_scores
-
-
-def sb_compute_iou(args):
-    proposal_boxes, gt_boxes = args
-    return compute_iou.box3d_iou_tf(proposal_boxes, gt_boxes)
+    num_indices = tf.minimum(nms_size, tf.shape(nms_indices)[1])
+    nms_indices = nms_indices[:, :num_indices]
+    if fixed_num_proposal_nms:
+        # The indices past the kept ones duplicate the first kept one
+        num_selected = tf.fill(tf.shape(num_keep), num_indices)
+    else:
+        # Drop the duplicated indices past the kept ones
+        num_selected = tf.minimum(num_keep, num_indices)
+        selected = tf.expand_dims(tf.range(num_indices), 0) < tf.expand_dims(
+            num_selected, 1
+        )
+        nms_indices = tf.where(selected, nms_indices, -tf.ones_like(nms_indices))
+
+    nms_indices_padded = tf.pad(
+        nms_indices,
+        [[0, 0], [0, nms_size - num_indices]],
+        mode="CONSTANT",
+        constant_values=-1,
+    )
+    return nms_indices_padded, num_selected
 
 
 def x_z_theta_one_hot_encoding(
@@ -0,0 +1,117 @@
+"""Tests for hf.core.models.model_util"""
+
+import numpy as np
+import tensorflow as tf
+
+from hf.core import compute_iou
+from hf.core.models import model_util
+
+
+class PointCloudMaskingTest(tf.test.TestCase):
+    def test_point_cloud_masking(self):
+        mask = np.zeros((4, 100), dtype=bool)
+        mask[0, [3, 50, 97]] = True
+        mask[1, 10:90] = True
+        mask[2, ::2] = True
+
+        indices = model_util.point_cloud_masking(tf.constant(mask), 32)
+        with self.test_session() as sess:
+            indices = sess.run(indices)
+
+        self.assertEqual(indices.shape, (4, 32, 2))
+        np.testing.assert_array_equal(
+            indices[:, :, 0], np.tile(np.arange(4), (32, 1)).T
+        )
+        for i in range(3):
+            self.assertTrue(np.all(mask[i, indices[i, :, 1]]))
+        # All the points of small masks, and no repeats of large ones
+        self.assertEqual(set(indices[0, :, 1]), {3, 50, 97})
+        self.assertEqual(len(np.unique(indices[1, :, 1])), 32)
+        self.assertEqual(len(np.unique(indices[2, :, 1])), 32)
+        np.testing.assert_array_equal(indices[3, :, 1], 0)
+
+    def test_more_points_than_the_cloud(self):
+        mask = np.zeros((1, 10), dtype=bool)
+        mask[0, 2:8] = True
+
+        indices = model_util.point_cloud_masking(tf.constant(mask), 64)
+        with self.test_session() as sess:
+            indices = sess.run(indices)
+
+        self.assertEqual(set(indices[0, :, 1]), set(range(2, 8)))
+
+    def test_seed(self):
+        mask = np.random.RandomState(0).rand(2, 1000) > 0.5
+
+        outputs = []
+        for _ in range(2):
+            outputs.append(
+                model_util.point_cloud_masking(tf.constant(mask), 256, seed=7)
+            )
+        with self.test_session() as sess:
+            outputs = sess.run(outputs)
+
+        np.testing.assert_array_equal(outputs[0], outputs[1])
+
+
+def sb_nms_fn(boxes_and_scores, nms_iou_thresh, nms_size, fixed_num_proposal_nms):
+    """Reference NMS on a single batch item, the former per batch item path
+    of the RPN. See model_util.batch_nms_fn for the outputs."""
+    (sb_boxes, sb_scores) = boxes_and_scores
+    sb_nms_indices = compute_iou.oriented_nms_tf(sb_boxes, sb_scores, nms_iou_thresh)
+    sb_nms_indices = sb_nms_indices[: tf.minimum(nms_size, tf.shape(sb_nms_indices)[0])]
+    if not fixed_num_proposal_nms:
+        # sb_nms_indices append duplicated indices to make
+        # sure sb_nms_indices has the same size as sb_boxes.
+        # In case variable number proposals is desired,
+        # use tf.unique to remove duplicates
+        sb_nms_indices, _ = tf.unique(sb_nms_indices)
+
+    sb_nms_indices_padded = tf.cond(
+        tf.greater(nms_size, tf.shape(sb_nms_indices)[0]),
+        true_fn=lambda: tf.pad(
+            sb_nms_indices,
+            [[0, nms_size - tf.shape(sb_nms_indices)[0]]],
+            mode="CONSTANT",
+            constant_values=-1,
+        ),
+        false_fn=lambda: sb_nms_indices,
+    )
+    return sb_nms_indices_padded, tf.shape(sb_nms_indices)[0]
+
+
+class BatchNmsTest(tf.test.TestCase):
+    def test_batch_nms_fn(self):
+        rng = np.random.RandomState(1)
+        centers = rng.uniform([-5, 1, 10], [5, 2, 20], (3, 300, 3))
+        sizes = rng.uniform([3, 1.5, 1.4], [4, 1.8, 1.7], (3, 300, 3))
+        angles = rng.uniform(-np.pi, np.pi, (3, 300, 1))
+        boxes = tf.constant(
+            np.concatenate([centers, sizes, angles], axis=-1), tf.float32
+        )
+        scores = tf.constant(rng.rand(3, 300), tf.float32)
+
+        outputs = []
+        for fixed_num_proposal_nms in [True, False]:
+            outputs.append(
+                model_util.batch_nms_fn(boxes, scores, 0.3, 100, fixed_num_proposal_nms)
+            )
+            outputs.append(
+                tf.map_fn(
+                    lambda x: sb_nms_fn(x, 0.3, 100, fixed_num_proposal_nms),
+                    elems=[boxes, scores],
+                    dtype=(tf.int32, tf.int32),
+                )
+            )
+        with self.test_session() as sess:
+            outputs = sess.run(outputs)
+
+        # Some batch items keep less than 100 boxes
+        self.assertTrue(np.any(outputs[3][1] < 100))
+        for i in [0, 2]:
+            np.testing.assert_array_equal(outputs[i][0], outputs[i + 1][0])
+            np.testing.assert_array_equal(outputs[i][1], outputs[i + 1][1])
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -3,7 +3,6 @@ import numpy as np
 import tensorflow as tf
 
 from hf.builders import feature_extractor_builder
-from hf.core import anchor_projector
 from hf.core import box_3d_encoder
 from hf.core import box_8c_encoder
 from hf.core import projection
@@ -430,27 +429,15 @@ class RcnnModel(model.DetectionModel):
 
             tf_box_indices = get_box_indices(proposals)
 
-            def sb_project_to_image_space(args):
-                (sb_proposal, sb_calib, sb_image_shape) = args
-                return projection.tf_project_to_image_space(
-                    sb_proposal, sb_calib, sb_image_shape
-                )
-
-            _, proj_proposals_box2d_norm = tf.map_fn(
-                sb_project_to_image_space,
-                elems=[
-                    proposals,
-                    self.placeholders[self.PL_CALIB_P2],
-                    tf.tile(
-                        tf.expand_dims(tf.constant([self._img_h, self._img_w]), axis=0),
-                        [self._batch_size, 1],
-                    ),
-                ],
-                dtype=(tf.float32, tf.float32),
-            )  # (B,n,4)
             # y1, x1, y2, x2
-            proj_proposals_box2d_norm_reorder = anchor_projector.reorder_projected_boxes(
-                tf.reshape(proj_proposals_box2d_norm, [-1, 4])
+            _, proj_proposals_box2d_norm_reorder = projection.tf_batch_project_to_image_space(
+                proposals,
+                self.placeholders[self.PL_CALIB_P2],
+                [self._img_h, self._img_w],
+                reorder=True,
+            )  # (B,n,4)
+            proj_proposals_box2d_norm_reorder = tf.reshape(
+                proj_proposals_box2d_norm_reorder, [-1, 4]
             )  # (N=Bn,4)
 
             proposals = tf.reshape(proposals, [-1, 7])  # (N=Bn,7)
@@ -6,6 +6,7 @@ from hf.core import bin_based_box3d_encoder
 from hf.core import constants
 from hf.core import losses
 from hf.core import model
+from hf.core import ops
 from hf.core import projection
 from hf.core import pointfly as pf
 from hf.core import compute_iou
@@ -134,6 +135,8 @@ class RpnModel(model.DetectionModel):
 
         # Information about the current sample
         self._sample_names = []
+        self._label_boxes_3d = []
+        self._label_classes = []
 
         # Dataset
         self.dataset = dataset
@@ -157,6 +160,17 @@ class RpnModel(model.DetectionModel):
             self._path_drop_probabilities[0] = 1.0
             self._path_drop_probabilities[1] = 1.0
 
+    @property
+    def label_boxes_3d(self):
+        """Label boxes of each sample of the current batch, padded to the
+        most labels"""
+        return self._label_boxes_3d
+
+    @property
+    def label_classes(self):
+        """Label classes of each sample of the current batch"""
+        return self._label_classes
+
     def _add_placeholder(self, dtype, shape, name):
         placeholder = tf.placeholder(dtype, shape, name)
         self.placeholders[name] = placeholder
@@ -648,11 +662,8 @@ class RpnModel(model.DetectionModel):
                         confidences, k=self._pre_nms_size, sorted=True
                     )
 
-                    pre_nms_proposals, pre_nms_confidences = tf.map_fn(
-                        model_util.gather_top_n,
-                        elems=(proposals, confidences, sorted_idxs),
-                        dtype=(tf.float32, tf.float32),
-                    )
+                    pre_nms_proposals = ops.batch_gather(proposals, sorted_idxs)
+                    pre_nms_confidences = ops.batch_gather(confidences, sorted_idxs)
                 else:
                     """
                     bin_x_scores = tf.reduce_max(tf.nn.softmax(bin_x_logits), axis=-1)
@@ -670,37 +681,26 @@ class RpnModel(model.DetectionModel):
                 # while get significant higher proposal recall@IoU=0.7
                 # BEV-NMS and ignore multiclass
                 with tf.variable_scope("bev_nms"):
-
-                    def sb_nms_fn(x):
-                        return model_util.sb_nms_fn(
-                            x,
-                            self._nms_iou_thresh,
-                            self._post_nms_size,
-                            self._fixed_num_proposal_nms,
-                            self._bev_extents,
-                        )
-
-                    nms_indices, num_proposals_before_padding = tf.map_fn(
-                        sb_nms_fn,
-                        elems=[pre_nms_proposals, pre_nms_confidences],
-                        dtype=(tf.int32, tf.int32),
+                    nms_indices, num_proposals_before_padding = model_util.batch_nms_fn(
+                        pre_nms_proposals,
+                        pre_nms_confidences,
+                        self._nms_iou_thresh,
+                        self._post_nms_size,
+                        self._fixed_num_proposal_nms,
+                    )
+                    # The -1 padding indices give zero proposals
+                    post_nms_proposals = ops.batch_gather(
+                        pre_nms_proposals, nms_indices
                     )
-                    post_nms_proposals, post_nms_confidences = tf.map_fn(
-                        model_util.sb_nms_selection,
-                        elems=(pre_nms_proposals, pre_nms_confidences, nms_indices),
-                        dtype=(tf.float32, tf.float32),
+                    post_nms_confidences = ops.batch_gather(
+                        pre_nms_confidences, nms_indices
                     )
 
                 # Compute IOUs
                 if self._train_val_test == "val":
                     with tf.variable_scope("compute_ious"):
-                        iou3ds, iou2ds = tf.map_fn(
-                            model_util.sb_compute_iou,
-                            elems=(
-                                post_nms_proposals,
-                                self.placeholders[self.PL_LABEL_BOXES],
-                            ),
-                            dtype=(tf.float32, tf.float32),
+                        iou3ds, iou2ds = compute_iou.batch_box3d_iou_tf(
+                            post_nms_proposals, self.placeholders[self.PL_LABEL_BOXES]
                         )
 
         predictions = dict()
@@ -1029,6 +1029,9 @@ class RpnModel(model.DetectionModel):
         ]
         # Sample Info
         self._sample_names = sample_names
+        # Labels of each sample, the boxes are padded to the most labels
+        self._label_boxes_3d = batch_data[constants.KEY_LABEL_BOXES_3D]
+        self._label_classes = batch_data[constants.KEY_LABEL_CLASSES]
 
         # Create a feed_dict and fill it with input values
         feed_dict = dict()
@@ -2,6 +2,7 @@ import os
 
 import numpy as np
 
+from hf.core import calib_store
 from hf.core import calib_utils
 
 
@@ -235,9 +236,30 @@ def get_lidar_point_cloud(
     """
 
     # Read calibration info
-    frame_calib = calib_utils.read_calibration(calib_dir, img_idx)
+    frame_calib = calib_store.read_calibration(calib_dir, img_idx)
     x, y, z, i = calib_utils.read_lidar(velo_dir=velo_dir, img_idx=img_idx)
 
+    return lidar_xyzi_to_point_cloud(
+        x, y, z, i, frame_calib, im_size=im_size, min_intensity=min_intensity
+    )
+
+
+def lidar_xyzi_to_point_cloud(
+    x, y, z, i, frame_calib, im_size=None, min_intensity=None
+):
+    """ Transforms raw lidar points to the camera frame, and optionally returns
+    only the points that are projected to the image.
+
+    :param x, y, z, i: lidar coordinates and intensities, as returned by
+                       calib_utils.read_lidar
+    :param frame_calib: FrameCalibrationData of the frame
+    :param im_size: (optional) 2 x 1 list containing the size of the image
+                      to filter the point cloud [w, h]
+    :param min_intensity: (optional) minimum intensity required to keep a point
+
+    :return: (N, 4) point_cloud in the form [x,y,z,i]
+    """
+
     # Calculate the point cloud
     pts = np.vstack((x, y, z)).T
     pts = calib_utils.lidar_to_cam_frame(pts, frame_calib)
@@ -277,6 +299,59 @@ def get_lidar_point_cloud(
         return pts[point_filter]
 
 
+def lidar_to_rect_fov(xyzi, velo_to_rect, velo_to_image, im_size):
+    """ Transforms raw lidar points to the rectified camera frame and keeps
+    the points that are projected inside the image, in a single pass.
+
+    The velodyne to rect and image transforms are stacked into one 4 x 7 float32
+    matrix, so a single matmul over the (N, 4) lidar array gives the rect
+    points, the intensities and the homogeneous image coordinates. The image
+    filter is computed on that buffer in place, and the kept rows are copied
+    out once.
+
+    :param xyzi: (N, 4) float32 lidar points [x, y, z, i], e.g. the memmap
+                 from calib_utils.memmap_lidar
+    :param velo_to_rect: (3, 4) velodyne to rect transform
+    :param velo_to_image: (3, 4) velodyne to image transform, see
+                          calib_store.get_velo_transforms
+    :param im_size: 2 x 1 list containing the size of the image
+                    to filter the point cloud [w, h]
+
+    :return: pts_rect: (M, 3) float32 view of the points in rect frame
+             intensity: (M, 1) float32 view of their intensities
+    """
+    # Columns of the output: x, y, z (rect), i, u * w, v * w, w
+    # Rows of the input: x, y, z (velodyne), i, and the constant 1 is folded
+    # in as a translation added afterwards
+    transform = np.zeros((4, 7), dtype=np.float32)
+    transform[0:3, 0:3] = velo_to_rect[:, 0:3].T
+    transform[3, 3] = 1.0
+    transform[0:3, 4:7] = velo_to_image[:, 0:3].T
+
+    translation = np.zeros(7, dtype=np.float32)
+    translation[0:3] = velo_to_rect[:, 3]
+    translation[4:7] = velo_to_image[:, 3]
+
+    points = np.dot(xyzi, transform)
+    points += translation
+
+    # Image coordinates, in place
+    points[:, 4] /= points[:, 6]
+    points[:, 5] /= points[:, 6]
+
+    # Only keep points in front of camera (positive z) and inside the image
+    fov_filter = (
+        (points[:, 2] > 0)
+        & (points[:, 4] > 0)
+        & (points[:, 4] < im_size[0])
+        & (points[:, 5] > 0)
+        & (points[:, 5] < im_size[1])
+    )
+
+    point_cloud = points[fov_filter, 0:4]
+    return point_cloud[:, 0:3], point_cloud[:, 3:4]
+
+
 def get_road_plane(img_idx, planes_dir):
     """Reads the road plane from file
 
@@ -482,6 +557,93 @@ def is_point_inside(points, box_corners):
     return point_mask
 
 
+def expand_ranges(starts, sizes):
+    """Returns (range_indices, values) enumerating the integer ranges
+    [starts[i], starts[i] + sizes[i]) one after the other"""
+    range_indices = np.repeat(np.arange(len(starts)), sizes)
+    range_offsets = np.cumsum(sizes) - sizes
+    values = np.arange(len(range_indices)) + np.repeat(starts - range_offsets, sizes)
+    return range_indices, values
+
+
+def get_points_in_boxes(points, boxes_corners, cell_size=1.0):
+    """Batched equivalent of is_point_inside, checks every point against
+    every box at once
+
+    The points are bucketed into a bird's eye view grid, so that each box is
+    only checked against the points of the cells its axis aligned bounds
+    overlap.
+
+    :param points: (N, 3) point cloud
+    :param boxes_corners: (M, 8, 3) 3D corners of the bounding boxes, in the
+        order of box_8c_encoder.np_box_3d_to_box_8co
+    :param cell_size: size of the grid cells along x and z
+
+    :return (box_indices, point_indices) of the (box, point) pairs where the
+        point lies within the box
+    """
+    points = np.asarray(points)
+    boxes_corners = np.asarray(boxes_corners)
+    num_boxes = boxes_corners.shape[0]
+
+    if num_boxes == 0 or len(points) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Bucket the points by x, z cell, cells of a same x row are contiguous
+    points_xz = points[:, [0, 2]]
+    grid_origin = points_xz.min(axis=0)
+    point_cells = np.floor((points_xz - grid_origin) / cell_size).astype(np.int64)
+    max_cells = point_cells.max(axis=0)
+    num_z_cells = max_cells[1] + 1
+    cell_ids = point_cells[:, 0] * num_z_cells + point_cells[:, 1]
+    sorted_order = np.argsort(cell_ids)
+    sorted_cell_ids = cell_ids[sorted_order]
+
+    # Cells overlapped by the axis aligned bounds of each box
+    boxes_xz = boxes_corners[:, :, [0, 2]]
+    min_cells = np.floor((boxes_xz.min(axis=1) - grid_origin) / cell_size)
+    max_box_cells = np.floor((boxes_xz.max(axis=1) - grid_origin) / cell_size)
+    min_cells = np.maximum(min_cells, 0).astype(np.int64)
+    max_box_cells = np.minimum(max_box_cells, max_cells).astype(np.int64)
+
+    # One range of sorted points per box and x row
+    num_rows = np.maximum(max_box_cells[:, 0] - min_cells[:, 0] + 1, 0)
+    row_boxes, row_x = expand_ranges(min_cells[:, 0], num_rows)
+    row_starts = np.searchsorted(
+        sorted_cell_ids, row_x * num_z_cells + min_cells[row_boxes, 1], side="left"
+    )
+    row_ends = np.searchsorted(
+        sorted_cell_ids,
+        row_x * num_z_cells + max_box_cells[row_boxes, 1],
+        side="right",
+    )
+    candidate_rows, sorted_indices = expand_ranges(
+        row_starts, np.maximum(row_ends - row_starts, 0)
+    )
+    box_indices = row_boxes[candidate_rows]
+    point_indices = sorted_order[sorted_indices]
+    candidate_x = points[point_indices, 0]
+    candidate_y = points[point_indices, 1]
+    candidate_z = points[point_indices, 2]
+
+    p1 = boxes_corners[:, 0]
+    inside = np.ones(len(box_indices), dtype=bool)
+    # Same u, v and w directions as is_point_inside
+    for corner_idx in [1, 3, 4]:
+        corner = boxes_corners[:, corner_idx]
+        direction = corner - p1
+        dot_p1 = np.sum(direction * p1, axis=1)[box_indices]
+        dot_corner = np.sum(direction * corner, axis=1)[box_indices]
+        dot_x = (
+            direction[box_indices, 0] * candidate_x
+            + direction[box_indices, 1] * candidate_y
+            + direction[box_indices, 2] * candidate_z
+        )
+        inside &= (dot_p1 < dot_x) & (dot_x < dot_corner)
+
+    return box_indices[inside], point_indices[inside]
+
+
 def get_point_filter(point_cloud, extents, ground_plane=None, offset_dist=2.0):
     """
     Creates a point filter using the 3D extents and ground plane
@@ -59,6 +59,49 @@ class ObjUtilsTest(unittest.TestCase):
         point_inside = obj_utils.is_point_inside(y, cube_corners)
         self.assertFalse(point_inside)
 
+    def test_expand_ranges(self):
+        range_indices, values = obj_utils.expand_ranges(
+            np.array([3, 0, 7]), np.array([2, 0, 3])
+        )
+        np.testing.assert_array_equal(range_indices, [0, 0, 2, 2, 2])
+        np.testing.assert_array_equal(values, [3, 4, 7, 8, 9])
+
+    def test_get_points_in_boxes(self):
+        np.random.seed(0)
+        num_boxes = 20
+        points = np.random.uniform([-20, -1, 0], [20, 3, 40], (4096, 3))
+        points = points.astype(np.float32)
+
+        # Random rotated boxes, in np_box_3d_to_box_8co corner order
+        boxes_corners = []
+        for _ in range(num_boxes):
+            x, z = np.random.uniform([-20, 0], [20, 40])
+            l, w, h = np.random.uniform([3, 1.5, 1.4], [5, 2, 2])
+            ry = np.random.uniform(-np.pi, np.pi)
+            x_corners = np.array([l, l, -l, -l, l, l, -l, -l]) / 2.0
+            z_corners = np.array([w, -w, -w, w, w, -w, -w, w]) / 2.0
+            y_corners = np.array([0, 0, 0, 0, -h, -h, -h, -h])
+            rotation = np.array(
+                [[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]]
+            )
+            corners = np.dot(rotation, [x_corners, y_corners, z_corners])
+            boxes_corners.append(corners.T + [x, 1.5, z])
+        boxes_corners = np.asarray(boxes_corners, dtype=np.float32)
+
+        box_indices, point_indices = obj_utils.get_points_in_boxes(
+            points, boxes_corners
+        )
+        point_mask = np.zeros((num_boxes, len(points)), dtype=bool)
+        point_mask[box_indices, point_indices] = True
+
+        for box_idx in range(num_boxes):
+            expected_mask = obj_utils.is_point_inside(
+                points.T, boxes_corners[box_idx].T
+            )
+            np.testing.assert_array_equal(point_mask[box_idx], expected_mask)
+        self.assertEqual(len(box_indices), np.sum(point_mask))
+        self.assertGreater(len(box_indices), 0)
+
     def test_get_point_filter(self):
 
         xz_plane = [0, -1, 0, 0]
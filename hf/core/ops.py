@@ -32,3 +32,44 @@ def indices_to_dense_vector(
     values = tf.ones_like(indices, dtype=dtype) * indices_value
 
     return tf.dynamic_stitch([tf.range(size), tf.to_int32(indices)], [zeros, values])
+
+
+def batch_gather(params, indices):
+    """Gathers the slices of each batch item at its own indices.
+
+      This is tf.gather on each batch item, as a single gather over the
+      flattened batch instead of a tf.map_fn loop. Negative indices, used to
+      pad some indices, give zeros.
+
+    Args:
+      params: Tensor of shape [batch_size, num_elements, ...].
+      indices: int32 Tensor of shape [batch_size, num_indices].
+
+    Returns:
+      Tensor of shape [batch_size, num_indices, ...] with
+          params[b, indices[b, i], ...] at [b, i, ...].
+    """
+    params = tf.convert_to_tensor(params)
+    indices = tf.convert_to_tensor(indices)
+    params_shape = tf.shape(params)
+    batch_size = params_shape[0]
+    num_elements = params_shape[1]
+
+    flat_params = tf.reshape(
+        params, tf.concat([[batch_size * num_elements], params_shape[2:]], axis=0)
+    )
+    valid = indices >= 0
+    offsets = tf.expand_dims(tf.range(batch_size) * num_elements, 1)
+    gathered = tf.gather(flat_params, tf.maximum(indices, 0) + offsets)
+
+    # Zeros for the negative indices, broadcast over the slices
+    valid = tf.reshape(
+        tf.cast(valid, params.dtype),
+        tf.concat(
+            [tf.shape(indices), tf.ones([tf.rank(params) - 2], dtype=tf.int32)],
+            axis=0,
+        ),
+    )
+    gathered *= valid
+    gathered.set_shape(indices.get_shape().concatenate(params.get_shape()[2:]))
+    return gathered
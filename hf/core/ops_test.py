@@ -114,5 +114,35 @@ class OpsTestIndicesToDenseVector(tf.test.TestCase):
             self.assertEqual(output.dtype, expected_output.dtype)
 
 
+class OpsTestBatchGather(tf.test.TestCase):
+    def test_batch_gather(self):
+        params = np.random.rand(3, 20, 7).astype(np.float32)
+        indices = np.random.randint(20, size=(3, 5)).astype(np.int32)
+        indices[1, 3:] = -1
+
+        output = ops.batch_gather(tf.constant(params), tf.constant(indices))
+        self.assertEqual(output.shape.as_list(), [3, 5, 7])
+
+        with self.test_session() as sess:
+            output = sess.run(output)
+
+        for i in range(3):
+            for j in range(5):
+                if indices[i, j] < 0:
+                    self.assertAllEqual(output[i, j], np.zeros(7))
+                else:
+                    self.assertAllEqual(output[i, j], params[i, indices[i, j]])
+
+    def test_batch_gather_2d(self):
+        params = np.arange(12, dtype=np.int32).reshape(3, 4)
+        indices = np.array([[3, 0], [1, 1], [-1, 2]], dtype=np.int32)
+
+        output = ops.batch_gather(params, indices)
+
+        with self.test_session() as sess:
+            output = sess.run(output)
+            self.assertAllEqual(output, [[3, 0], [5, 5], [0, 10]])
+
+
 if __name__ == "__main__":
     tf.test.main()
@@ -3,34 +3,26 @@
 
 thanks https://github.com/MhLiao/TextBoxes_plusplus/blob/master/examples/text/nms.py
 """
+
 import numpy as np
-import shapely
-from shapely.geometry import Polygon, MultiPoint
+
+from hf.core import obj_utils
+from hf.core import rotated_iou
 
 
 def polygon_iou(pts1, pts2):
     """
-    Intersection over union between two shapely polygons.
+    Intersection over union between two rectangles, given as their 4
+    corners in order.
     """
-    poly1 = Polygon(pts1).convex_hull
-    poly2 = Polygon(pts2).convex_hull
-    # union_poly = np.concatenate((pts1, pts2))
-    if not poly1.intersects(poly2):  # this test is fast and can accelerate calculation
-        iou = 0
-        inter_area = 0
-    else:
-        try:
-            inter_area = poly1.intersection(poly2).area
-            union_area = poly1.area + poly2.area - inter_area
-            # union_area = MultiPoint(union_poly).convex_hull.area
-            if union_area == 0:
-                return 0, 0
-            iou = float(inter_area) / union_area
-        except shapely.geos.TopologicalError:
-            print("shapely.geos.TopologicalError occured, iou set to 0")
-            iou = 0
-            inter_area = 0
-    return iou, inter_area
+    corners = np.asarray([pts1, pts2], dtype=np.float64)
+    inter_area = rotated_iou.rect_overlap_area(corners[0], corners[1])
+    area1, area2 = rotated_iou.rect_area(corners)
+    union_area = area1 + area2 - inter_area
+    if union_area == 0:
+        return 0, 0
+    iou = float(inter_area) / union_area
+    return iou, float(inter_area)
 
 
 def nms(boxes, scores, iou_thresh, max_output_size):
@@ -62,6 +54,214 @@ def nms(boxes, scores, iou_thresh, max_output_size):
     return np.array(selected, dtype=np.int32)
 
 
+def _box_cells(min_cells, max_cells, num_z_cells):
+    """Returns (box_indices, cell_ids) of the grid cells covered by boxes,
+    given the (N, 2) indices of their first and last cells"""
+    box_cell_dims = max_cells - min_cells + 1
+    box_indices, cell_offsets = obj_utils.expand_ranges(
+        np.zeros(len(min_cells), dtype=np.int64), np.prod(box_cell_dims, axis=1)
+    )
+    cell_x = min_cells[box_indices, 0] + cell_offsets // box_cell_dims[box_indices, 1]
+    cell_z = min_cells[box_indices, 1] + cell_offsets % box_cell_dims[box_indices, 1]
+    return box_indices, cell_x * num_z_cells + cell_z
+
+
+def _iou_upper_bound(bounds_min, bounds_max, areas, first, second):
+    """Upper bound of the IoU of pairs of boxes, from the intersection of
+    their axis aligned bounds, which contains their overlap"""
+    bounds_overlap = np.prod(
+        np.maximum(
+            np.minimum(bounds_max[first], bounds_max[second])
+            - np.maximum(bounds_min[first], bounds_min[second]),
+            0.0,
+        ),
+        axis=1,
+    )
+    overlap = np.minimum(bounds_overlap, np.minimum(areas[first], areas[second]))
+    union = areas[first] + areas[second] - overlap
+    return overlap / np.maximum(union, rotated_iou.EPS)
+
+
+def _neighbour_pairs(min_cells, max_cells, num_z_cells):
+    """Finds the pairs of boxes sharing a grid cell
+
+    Args:
+        min_cells: (N, 2) indices of the first grid cell of the boxes
+        max_cells: (N, 2) indices of the last grid cell of the boxes
+        num_z_cells: number of cells of the grid along z
+
+    Returns:
+        (first, second) indices of the pairs, first < second
+    """
+    num_boxes = len(min_cells)
+    entry_boxes, cell_ids = _box_cells(min_cells, max_cells, num_z_cells)
+
+    # Pair each entry with the following entries of the same cell
+    entry_order = np.argsort(cell_ids, kind="stable")
+    entry_boxes = entry_boxes[entry_order]
+    cell_ids = cell_ids[entry_order]
+    entry_indices = np.arange(len(cell_ids))
+    cell_ends = np.searchsorted(cell_ids, cell_ids, side="right")
+    pair_entries, second_entries = obj_utils.expand_ranges(
+        entry_indices + 1, cell_ends - entry_indices - 1
+    )
+    first = entry_boxes[pair_entries]
+    second = entry_boxes[second_entries]
+
+    # Boxes sharing several cells are paired once
+    pair_keys = np.unique(
+        np.minimum(first, second) * num_boxes + np.maximum(first, second)
+    )
+    return pair_keys // num_boxes, pair_keys % num_boxes
+
+
+def _bev_iou_pairs(corners, areas, first, second):
+    overlap = rotated_iou.rect_overlap_area(corners[first], corners[second])
+    union = areas[first] + areas[second] - overlap
+    return overlap / np.maximum(union, rotated_iou.EPS)
+
+
+def nms_boxes_3d(
+    boxes_3d,
+    scores,
+    iou_thresh,
+    max_output_size,
+    classes=None,
+    cell_size=None,
+    block_size=256,
+):
+    """
+    Oriented NMS on the bird's eye view of box_3d boxes, as the CUDA
+    OrientedNMS op: boxes are visited by decreasing score and kept unless
+    their IoU with a kept box is over iou_thresh.
+
+    Boxes are bucketed into a bird's eye view grid and only compared with
+    the boxes sharing one of their cells. They are visited in blocks of
+    block_size boxes, first checked against the boxes kept so far, then
+    against each other, and no more blocks are visited once
+    max_output_size boxes are kept.
+
+    Input:
+        boxes_3d: (N,7) [x,y,z,l,w,h,ry]
+        scores: (N)
+        iou_thresh: boxes with a higher IoU with a kept box are suppressed
+        max_output_size: maximum number of kept boxes
+        classes: (optional) (N) classes, boxes only suppress boxes of their
+            own class
+        cell_size: (optional) grid cell size, the median box diagonal by
+            default
+        block_size: number of boxes visited at once
+    Return:
+        keep_indices: (K) int32 indices of the kept boxes, by decreasing
+            score
+    """
+    boxes_3d = np.asarray(boxes_3d, dtype=np.float64).reshape(-1, 7)
+    num_boxes = len(boxes_3d)
+    if num_boxes == 0 or max_output_size <= 0:
+        return np.zeros(0, dtype=np.int32)
+
+    # Work in decreasing score order, ties kept in index order
+    sorted_indices = np.argsort(-np.asarray(scores), kind="stable")
+    boxes_3d = boxes_3d[sorted_indices]
+    if classes is not None:
+        classes = np.asarray(classes)[sorted_indices]
+
+    corners = rotated_iou.boxes_3d_to_bev_corners(boxes_3d)
+    areas = boxes_3d[:, 3] * boxes_3d[:, 4]
+    bounds_min = corners.min(axis=1)
+    bounds_max = corners.max(axis=1)
+
+    if cell_size is None:
+        cell_size = max(np.median(np.hypot(boxes_3d[:, 3], boxes_3d[:, 4])), 1e-3)
+    grid_origin = bounds_min.min(axis=0)
+    min_cells = np.floor((bounds_min - grid_origin) / cell_size).astype(np.int64)
+    max_cells = np.floor((bounds_max - grid_origin) / cell_size).astype(np.int64)
+    num_z_cells = max_cells[:, 1].max() + 1
+
+    def over_thresh(first, second):
+        """Checks which pairs of boxes have an IoU over iou_thresh, the
+        exact IoU is only computed when its upper bound is over it"""
+        candidates = (
+            _iou_upper_bound(bounds_min, bounds_max, areas, first, second) > iou_thresh
+        )
+        if classes is not None:
+            candidates &= classes[first] == classes[second]
+        candidate_indices = np.flatnonzero(candidates)
+        candidates[candidate_indices] = (
+            _bev_iou_pairs(
+                corners, areas, first[candidate_indices], second[candidate_indices]
+            )
+            > iou_thresh
+        )
+        return candidates
+
+    keep = []
+    # Grid cells of the kept boxes, sorted by cell id
+    kept_cell_ids = np.zeros(0, dtype=np.int64)
+    kept_cell_boxes = np.zeros(0, dtype=np.int64)
+    for block_start in range(0, num_boxes, block_size):
+        block_indices = np.arange(block_start, min(block_start + block_size, num_boxes))
+        suppressed = np.zeros(len(block_indices), dtype=bool)
+
+        # Suppression by the boxes kept in the previous blocks
+        if len(keep) > 0:
+            entry_boxes, cell_ids = _box_cells(
+                min_cells[block_indices], max_cells[block_indices], num_z_cells
+            )
+            cell_starts = np.searchsorted(kept_cell_ids, cell_ids, side="left")
+            cell_ends = np.searchsorted(kept_cell_ids, cell_ids, side="right")
+            pair_entries, kept_entries = obj_utils.expand_ranges(
+                cell_starts, cell_ends - cell_starts
+            )
+            pair_keys = np.unique(
+                entry_boxes[pair_entries] * num_boxes + kept_cell_boxes[kept_entries]
+            )
+            first = block_indices[pair_keys // num_boxes]
+            second = pair_keys % num_boxes
+            suppressed[first[over_thresh(first, second)] - block_start] = True
+
+        # Suppression within the block, in score order
+        remaining = block_indices[~suppressed]
+        first, second = _neighbour_pairs(
+            min_cells[remaining], max_cells[remaining], num_z_cells
+        )
+        suppressing = over_thresh(remaining[first], remaining[second])
+        first = first[suppressing]
+        second = second[suppressing]
+        pair_order = np.argsort(first, kind="stable")
+        first = first[pair_order]
+        second = second[pair_order]
+        pair_starts = np.searchsorted(first, np.arange(len(remaining) + 1))
+
+        remaining_suppressed = np.zeros(len(remaining), dtype=bool)
+        block_keep = []
+        for remaining_idx in range(len(remaining)):
+            if remaining_suppressed[remaining_idx]:
+                continue
+            block_keep.append(remaining_idx)
+            if len(keep) + len(block_keep) >= max_output_size:
+                break
+            remaining_suppressed[
+                second[pair_starts[remaining_idx] : pair_starts[remaining_idx + 1]]
+            ] = True
+
+        block_keep = remaining[block_keep]
+        keep.extend(block_keep)
+        if len(keep) >= max_output_size:
+            break
+
+        entry_boxes, cell_ids = _box_cells(
+            min_cells[block_keep], max_cells[block_keep], num_z_cells
+        )
+        kept_cell_ids = np.concatenate([kept_cell_ids, cell_ids])
+        kept_cell_boxes = np.concatenate([kept_cell_boxes, block_keep[entry_boxes]])
+        cell_order = np.argsort(kept_cell_ids, kind="stable")
+        kept_cell_ids = kept_cell_ids[cell_order]
+        kept_cell_boxes = kept_cell_boxes[cell_order]
+
+    return sorted_indices[keep].astype(np.int32)
+
+
 if __name__ == "__main__":
     import timeit
 
@@ -0,0 +1,73 @@
+"""oriented_nms unit test module."""
+
+import unittest
+
+import numpy as np
+
+from hf.core import oriented_nms
+from hf.core import rotated_iou
+
+
+def random_boxes_3d(num_boxes, num_objects=10):
+    """Boxes scattered around a few objects, so that some overlap"""
+    objects = np.random.uniform(
+        [-20, 1.5, 5, 3.5, 1.5, 1.4, -np.pi],
+        [20, 1.8, 50, 4.5, 1.8, 1.7, np.pi],
+        (num_objects, 7),
+    )
+    noise = np.random.normal(0, [0.3, 0.1, 0.3, 0.2, 0.1, 0.1, 0.1], (num_boxes, 7))
+    return objects[np.random.randint(num_objects, size=num_boxes)] + noise
+
+
+class OrientedNmsTest(unittest.TestCase):
+    def test_same_as_nms(self):
+        np.random.seed(0)
+        boxes_3d = random_boxes_3d(200)
+        # Rounded scores, to check that ties are visited in index order
+        scores = np.round(np.random.rand(200), 1)
+        corners = rotated_iou.boxes_3d_to_bev_corners(boxes_3d)
+
+        for iou_thresh in [0.1, 0.5, 0.8]:
+            expected_keep = oriented_nms.nms(corners, scores, iou_thresh, 200)
+            for block_size in [1, 16, 256]:
+                keep = oriented_nms.nms_boxes_3d(
+                    boxes_3d, scores, iou_thresh, 200, block_size=block_size
+                )
+                self.assertEqual(keep.dtype, np.int32)
+                np.testing.assert_array_equal(keep, expected_keep)
+
+    def test_max_output_size(self):
+        np.random.seed(1)
+        boxes_3d = random_boxes_3d(200)
+        scores = np.random.rand(200)
+
+        all_keep = oriented_nms.nms_boxes_3d(boxes_3d, scores, 0.5, 200)
+        self.assertGreater(len(all_keep), 10)
+        for max_output_size in [1, 10, len(all_keep)]:
+            keep = oriented_nms.nms_boxes_3d(
+                boxes_3d, scores, 0.5, max_output_size, block_size=4
+            )
+            np.testing.assert_array_equal(keep, all_keep[:max_output_size])
+
+    def test_classes(self):
+        box = [0.0, 1.5, 10.0, 4.0, 1.6, 1.5, 0.3]
+        boxes_3d = np.array([box, box, box, box])
+        scores = np.array([0.9, 0.8, 0.7, 0.6])
+        classes = np.array([1, 2, 1, 2])
+
+        np.testing.assert_array_equal(
+            oriented_nms.nms_boxes_3d(boxes_3d, scores, 0.5, 10), [0]
+        )
+        np.testing.assert_array_equal(
+            oriented_nms.nms_boxes_3d(boxes_3d, scores, 0.5, 10, classes=classes),
+            [0, 1],
+        )
+
+    def test_empty(self):
+        keep = oriented_nms.nms_boxes_3d(np.zeros((0, 7)), np.zeros(0), 0.5, 10)
+        self.assertEqual(keep.shape, (0,))
+        self.assertEqual(keep.dtype, np.int32)
+
+
+if __name__ == "__main__":
+    unittest.main()
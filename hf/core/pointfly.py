@@ -8,6 +8,8 @@ import numpy as np
 import tensorflow as tf
 from transforms3d.euler import euler2mat
 
+from hf.core import ops
+
 
 # the returned indices will be used by tf.gather_nd
 def get_indices(batch_size, sample_num, point_num, pool_setting=None):
@@ -147,32 +149,63 @@ def batch_distance_matrix_general(A, B):
     return D
 
 
+def _batch_argsort(values):
+    """Argsort of (N, P) values along P, ties kept in index order"""
+    # top_k keeps the lower index first on ties
+    return tf.nn.top_k(-values, k=tf.shape(values)[1]).indices
+
+
 # A shape is (N, P, C)
 def find_duplicate_columns(A):
-    N = A.shape[0]
-    P = A.shape[1]
-    indices_duplicated = np.fill((N, 1, P), 1, dtype=np.int32)
-    for idx in range(N):
-        _, indices = np.unique(A[idx], return_index=True, axis=0)
-        indices_duplicated[idx, :, indices] = 0
-    return indices_duplicated
+    """Flags the points equal to a point of lower index, in the graph
+
+    The points are sorted by their coordinates with stable sorts, the last
+    coordinate first, so that equal points are next to each other and in
+    index order. The ones equal to their predecessor are duplicates.
+
+    Inputs:
+      A: (N, P, C) points.
+    Returns:
+      indices_duplicated: (N, 1, P) int32, 1 for the duplicated points.
+    """
+    A = tf.convert_to_tensor(A)
+    A_shape = tf.shape(A)
+    batch_size = A_shape[0]
+    point_num = A_shape[1]
+
+    order = tf.tile(tf.expand_dims(tf.range(point_num), 0), (batch_size, 1))
+    for channel in reversed(range(A.get_shape()[2].value)):
+        channel_values = ops.batch_gather(A[:, :, channel], order)
+        order = ops.batch_gather(order, _batch_argsort(channel_values))
+    A_sorted = ops.batch_gather(A, order)  # (N, P, C)
+
+    equal_to_previous = tf.reduce_all(
+        tf.equal(A_sorted[:, 1:], A_sorted[:, :-1]), axis=2
+    )  # (N, P - 1)
+    duplicated_sorted = tf.pad(tf.cast(equal_to_previous, tf.int32), [[0, 0], [1, 0]])
+    batch_indices = tf.tile(tf.expand_dims(tf.range(batch_size), 1), (1, point_num))
+    indices_duplicated = tf.scatter_nd(
+        tf.stack([batch_indices, order], axis=2), duplicated_sorted, A_shape[:2]
+    )
+    return tf.expand_dims(indices_duplicated, axis=1)
 
 
 # add a big value to duplicate columns
-def prepare_for_unique_top_k(D, A):
-    indices_duplicated = tf.py_func(find_duplicate_columns, [A], tf.int32)
-    D += tf.reduce_max(D) * tf.cast(indices_duplicated, tf.float32)
+def prepare_for_unique_top_k(D, A, indices_duplicated=None):
+    if indices_duplicated is None:
+        indices_duplicated = find_duplicate_columns(A)
+    return D + tf.reduce_max(D) * tf.cast(indices_duplicated, tf.float32)
 
 
 # return shape is (N, P, K, 2)
-def knn_indices(points, k, sort=True, unique=True):
+def knn_indices(points, k, sort=True, unique=False):
     points_shape = tf.shape(points)
     batch_size = points_shape[0]
     point_num = points_shape[1]
 
     D = batch_distance_matrix(points)
     if unique:
-        prepare_for_unique_top_k(D, points)
+        D = prepare_for_unique_top_k(D, points)
     distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)
     batch_indices = tf.tile(
         tf.reshape(tf.range(batch_size), [-1, 1, 1, 1]), (1, point_num, k, 1)
@@ -181,8 +214,57 @@ def knn_indices(points, k, sort=True, unique=True):
     return -distances, indices
 
 
+def _knn_top_k_tiled(queries, points, k, sort, unique, tile_size):
+    """top_k of the negated distances, tile_size queries at a time
+
+    Only the (B, tile_size, N) distance matrix of one tile of queries is
+    alive at a time, instead of the (B, P, N) one of all the queries.
+    """
+    queries = tf.convert_to_tensor(queries)
+    queries_shape = tf.shape(queries)
+    batch_size = queries_shape[0]
+    point_num = queries_shape[1]
+
+    # Pad the queries to a whole number of tiles, the padded ones are dropped
+    num_tiles = (point_num + tile_size - 1) // tile_size
+    padding = num_tiles * tile_size - point_num
+    queries_padded = tf.pad(queries, [[0, 0], [0, padding], [0, 0]])
+    query_tiles = tf.transpose(
+        tf.reshape(queries_padded, (batch_size, num_tiles, tile_size, 3)),
+        perm=(1, 0, 2, 3),
+    )  # (T, B, tile_size, 3)
+
+    # The duplicated points do not depend on the queries
+    if unique:
+        indices_duplicated = find_duplicate_columns(points)
+
+    def tile_top_k(query_tile):
+        D = batch_distance_matrix_general(query_tile, points)
+        if unique:
+            D = prepare_for_unique_top_k(D, points, indices_duplicated)
+        distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)
+        return distances, point_indices
+
+    # One tile after the other, so that the tiles do not run in parallel
+    distances, point_indices = tf.map_fn(
+        tile_top_k,
+        query_tiles,
+        dtype=(tf.float32, tf.int32),
+        parallel_iterations=1,
+    )  # (T, B, tile_size, K)
+    distances = tf.reshape(
+        tf.transpose(distances, perm=(1, 0, 2, 3)), (batch_size, -1, k)
+    )[:, :point_num]
+    point_indices = tf.reshape(
+        tf.transpose(point_indices, perm=(1, 0, 2, 3)), (batch_size, -1, k)
+    )[:, :point_num]
+    distances.set_shape([queries.get_shape()[0], queries.get_shape()[1], k])
+    point_indices.set_shape([queries.get_shape()[0], queries.get_shape()[1], k])
+    return distances, point_indices
+
+
 # return shape is (N, P, K, 2)
-def knn_indices_general(queries, points, k, sort=True, unique=True):
+def knn_indices_general(queries, points, k, sort=True, unique=False, tile_size=0):
     """Find indices of k-nearest neighbors given query points.
 
     Inputs:
@@ -190,7 +272,12 @@ def knn_indices_general(queries, points, k, sort=True, unique=True):
       points: (B, N, 3). The whole set of points.
       K: The number of k-nearest points.
       sort: bool. If true, the neighbors will be sorted by their distances in ascending order.
-      unique: bool.
+      unique: bool. If true, the points equal to a point of lower index are
+          never neighbors. False by default, the trained models were built
+          without it.
+      tile_size: int. If positive, the neighbors are searched tile_size queries
+          at a time, which bounds the distance matrix to (B, tile_size, N)
+          instead of (B, P, N), at the cost of a sequential loop over the tiles.
     Return:
       distances: (B, P, K). The distances of each query point to its k neighbors.
       indices: (B, P, K, 2). The indices of each query point's K neighbors.
@@ -201,10 +288,15 @@ def knn_indices_general(queries, points, k, sort=True, unique=True):
     batch_size = queries_shape[0]
     point_num = queries_shape[1]
 
-    D = batch_distance_matrix_general(queries, points)
-    if unique:
-        prepare_for_unique_top_k(D, points)
-    distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)  # (B, P, K)
+    if tile_size > 0:
+        distances, point_indices = _knn_top_k_tiled(
+            queries, points, k, sort, unique, tile_size
+        )  # (B, P, K)
+    else:
+        D = batch_distance_matrix_general(queries, points)
+        if unique:
+            D = prepare_for_unique_top_k(D, points)
+        distances, point_indices = tf.nn.top_k(-D, k=k, sorted=sort)  # (B, P, K)
     batch_indices = tf.tile(
         tf.reshape(tf.range(batch_size), [-1, 1, 1, 1]), (1, point_num, k, 1)
     )
@@ -341,23 +433,33 @@ def curvature_based_sample(nn_pts, k):
     return indices
 
 
-def random_choice_2d(size, prob_matrix):
-    n_row = prob_matrix.shape[0]
-    n_col = prob_matrix.shape[1]
-    choices = np.ones((n_row, size), dtype=np.int32)
-    for idx_row in range(n_row):
-        choices[idx_row] = np.random.choice(
-            n_col, size=size, replace=False, p=prob_matrix[idx_row]
-        )
-    return choices
-
+def inverse_density_sampling(points, k, sample_num, tile_size=0, seed=None):
+    """Sample points with probabilities proportional to their mean squared
+    distance to their k nearest points, without replacement.
 
-def inverse_density_sampling(points, k, sample_num):
-    D = batch_distance_matrix(points)
-    distances, _ = tf.nn.top_k(-D, k=k, sorted=False)
-    distances_avg = tf.abs(tf.reduce_mean(distances, axis=-1)) + 1e-8
-    prob_matrix = distances_avg / tf.reduce_sum(distances_avg, axis=-1, keep_dims=True)
-    point_indices = tf.py_func(random_choice_2d, [sample_num, prob_matrix], tf.int32)
+    Inputs:
+      points: (B, N, 3).
+      k: int. The number of nearest points of the density estimate.
+      sample_num: int. The number of sampled points.
+      tile_size: int. If positive, the nearest points are searched tile_size
+          points at a time, see knn_indices_general.
+      seed: int. The seed of the sampling.
+    Returns:
+      indices: (B, sample_num, 2). The indices of the sampled points, for
+          tf.gather_nd(points, indices).
+    """
+    distances, _ = knn_indices_general(
+        points, points, k, sort=False, unique=False, tile_size=tile_size
+    )  # (B, N, k)
+    distances_avg = tf.abs(tf.reduce_mean(distances, axis=-1)) + 1e-8  # (B, N)
+
+    # Gumbel top-k: the sample_num largest log probabilities perturbed by
+    # Gumbel noise are a weighted sample without replacement
+    uniform = tf.random_uniform(
+        tf.shape(distances_avg), minval=1e-20, maxval=1.0, seed=seed
+    )
+    gumbel = -tf.log(-tf.log(uniform))
+    _, point_indices = tf.nn.top_k(tf.log(distances_avg) + gumbel, k=sample_num)
     point_indices.set_shape([points.get_shape()[0], sample_num])
 
     batch_size = tf.shape(points)[0]
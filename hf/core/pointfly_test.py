@@ -0,0 +1,114 @@
+import numpy as np
+import tensorflow as tf
+
+from hf.core import pointfly as pf
+
+
+def find_duplicate_columns_np(A):
+    indices_duplicated = np.ones((A.shape[0], 1, A.shape[1]), dtype=np.int32)
+    for idx in range(A.shape[0]):
+        _, indices = np.unique(A[idx], return_index=True, axis=0)
+        indices_duplicated[idx, :, indices] = 0
+    return indices_duplicated
+
+
+class KnnIndicesGeneralTest(tf.test.TestCase):
+    def test_find_duplicate_columns(self):
+        rng = np.random.RandomState(1)
+        # Few distinct coordinates, so that points share some of them
+        points = rng.randint(3, size=(3, 100, 3)).astype(np.float32)
+        points[2] = rng.rand(100, 3)
+
+        points_pl = tf.placeholder(tf.float32, (None, None, 3))
+        indices_duplicated = pf.find_duplicate_columns(points_pl)
+        with self.test_session() as sess:
+            indices_duplicated = sess.run(
+                indices_duplicated, feed_dict={points_pl: points}
+            )
+
+        expected_indices_duplicated = find_duplicate_columns_np(points)
+        self.assertEqual(np.sum(expected_indices_duplicated[2]), 0)
+        np.testing.assert_array_equal(indices_duplicated, expected_indices_duplicated)
+
+    def test_unique_knn(self):
+        rng = np.random.RandomState(2)
+        points = rng.rand(2, 64, 3).astype(np.float32)
+        points[:, 32:] = points[:, :32]
+        queries = points[:, :8]
+
+        outputs = []
+        for tile_size in [0, 3]:
+            outputs.append(
+                pf.knn_indices_general(
+                    queries, points, 8, unique=True, tile_size=tile_size
+                )[1]
+            )
+        # Both copies are neighbours by default
+        default_indices = pf.knn_indices_general(queries, points, 8)[1]
+        with self.test_session() as sess:
+            outputs, default_indices = sess.run([outputs, default_indices])
+
+        for indices in outputs:
+            # Only the first copy of each point is a neighbour
+            np.testing.assert_array_less(indices[..., 1], 32)
+            np.testing.assert_array_equal(
+                indices[:, :, 0, 1], np.tile(range(8), (2, 1))
+            )
+        self.assertTrue(np.any(default_indices[..., 1] >= 32))
+
+    def test_tiled_knn(self):
+        rng = np.random.RandomState(0)
+        queries = rng.rand(2, 50, 3).astype(np.float32)
+        points = rng.rand(2, 200, 3).astype(np.float32)
+
+        distances, indices = pf.knn_indices_general(queries, points, 16)
+        outputs = []
+        # Tile sizes not dividing the number of queries, and larger than it
+        for tile_size in [1, 16, 64]:
+            outputs.append(
+                pf.knn_indices_general(queries, points, 16, tile_size=tile_size)
+            )
+        self.assertEqual(outputs[0][1].shape.as_list(), [2, 50, 16, 2])
+
+        with self.test_session() as sess:
+            distances, indices, outputs = sess.run([distances, indices, outputs])
+
+        expected_distances = np.sort(
+            np.sum((queries[:, :, None] - points[:, None]) ** 2, axis=-1), axis=-1
+        )[:, :, :16]
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-5)
+        for tiled_distances, tiled_indices in outputs:
+            np.testing.assert_allclose(tiled_distances, distances, atol=1e-5)
+            np.testing.assert_array_equal(tiled_indices, indices)
+
+
+class InverseDensitySamplingTest(tf.test.TestCase):
+    def test_inverse_density_sampling(self):
+        rng = np.random.RandomState(3)
+        # A dense cluster and a few sparse points
+        points = np.concatenate(
+            [rng.rand(2, 900, 3) * 0.1, rng.rand(2, 100, 3) * 10 + 1], axis=1
+        ).astype(np.float32)
+
+        outputs = []
+        for tile_size in [0, 128]:
+            outputs.append(
+                pf.inverse_density_sampling(
+                    tf.constant(points), 8, 64, tile_size=tile_size, seed=5
+                )
+            )
+        with self.test_session() as sess:
+            outputs = sess.run(outputs)
+
+        for indices in outputs:
+            self.assertEqual(indices.shape, (2, 64, 2))
+            np.testing.assert_array_equal(indices[:, :, 0], [[0] * 64, [1] * 64])
+            for i in range(2):
+                self.assertEqual(len(np.unique(indices[i, :, 1])), 64)
+            # Sparse points are far more likely
+            self.assertGreater(np.mean(indices[:, :, 1] >= 900), 0.9)
+        np.testing.assert_array_equal(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    tf.test.main()
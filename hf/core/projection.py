@@ -87,3 +87,56 @@ def tf_project_to_image_space(boxes, calib, image_shape):
     box_corners_norm = box_corners / tf.to_float(image_shape_tiled)
 
     return box_corners, box_corners_norm
+
+
+def tf_batch_project_to_image_space(boxes, calib, image_shape, reorder=False):
+    """
+    Projects the 3D tensor boxes of each batch item into image space with
+    its own calibration, all at once
+
+    Args:
+        boxes: a tensor of anchors in the shape [B,n,7].
+            The anchors are in the format [x, y, z, l, h, w, ry]
+        calib: tensor [B,3,4] stereo camera calibration p2 matrices
+        image_shape: a tensor of shape [2]. This is dimension of
+            the images [h,w]
+        reorder: if True, the corners are in the [y1, x1, y2, x2] order of
+            tf.image.crop_and_resize
+
+    Returns:
+        box_corners: a float32 tensor corners in image space -
+            B x n x [x1, y1, x2, y2], or [y1, x1, y2, x2] with reorder
+        box_corners_norm: a float32 tensor corners as a percentage
+            of the image size - B x n x [x1, y1, x2, y2], or
+            [y1, x1, y2, x2] with reorder
+    """
+    boxes_shape = tf.shape(boxes)
+    batch_size = boxes_shape[0]
+    n = boxes_shape[1]
+    corners_3d = tf.matrix_transpose(
+        box_8c_encoder.tf_box_3d_to_box_8co(tf.reshape(boxes, [-1, 7]))
+    )  # (Bn,8,3)
+    corners_3d = tf.reshape(corners_3d, [batch_size, -1, 3])  # (B,n8,3)
+
+    # One batched matmul for the corners of all the boxes of each batch item
+    rotation = tf.matrix_transpose(calib[:, :, :3])  # (B,3,3)
+    translation = tf.expand_dims(calib[:, :, 3], 1)  # (B,1,3)
+    projected_pts = tf.matmul(corners_3d, rotation) + translation  # (B,n8,3)
+    projected_pts = tf.reshape(projected_pts, [batch_size, n, 8, 3])
+
+    corners_2d = projected_pts[..., :2] / projected_pts[..., 2:]  # (B,n,8,2)
+
+    pts_2d_min = tf.reduce_min(corners_2d, axis=2)
+    pts_2d_max = tf.reduce_max(corners_2d, axis=2)  # (B,n,2)
+    if reorder:
+        pts_2d_min = tf.reverse(pts_2d_min, axis=[-1])
+        pts_2d_max = tf.reverse(pts_2d_max, axis=[-1])
+        image_shape_2d = tf.to_float(image_shape)
+    else:
+        image_shape_2d = tf.to_float(tf.reverse(image_shape, axis=[0]))
+    box_corners = tf.concat([pts_2d_min, pts_2d_max], axis=-1)  # (B,n,4)
+
+    # Normalize
+    box_corners_norm = box_corners / tf.tile(image_shape_2d, [2])
+
+    return box_corners, box_corners_norm
@@ -0,0 +1,60 @@
+"""Tests for hf.core.projection"""
+
+import numpy as np
+import tensorflow as tf
+
+from hf.core import projection
+
+
+class ProjectionTest(tf.test.TestCase):
+    def test_batch_project_to_image_space(self):
+        rng = np.random.RandomState(0)
+        boxes = rng.uniform(
+            [-10, 1, 5, 3, 1.5, 1.4, -np.pi],
+            [10, 2, 40, 4, 1.8, 1.7, np.pi],
+            (3, 20, 7),
+        ).astype(np.float32)
+        calib = np.tile(
+            np.asarray(
+                [[721.5, 0, 609.6, 44.9], [0, 721.5, 172.9, 0.2], [0, 0, 1, 0.003]],
+                dtype=np.float32,
+            ),
+            (3, 1, 1),
+        )
+        calib[1, :2, :3] *= 1.1
+        image_shape = [360, 1200]
+
+        box_corners, box_corners_norm = projection.tf_batch_project_to_image_space(
+            boxes, calib, image_shape
+        )
+        _, box_corners_norm_reorder = projection.tf_batch_project_to_image_space(
+            boxes, calib, image_shape, reorder=True
+        )
+        expected_outputs = [
+            projection.tf_project_to_image_space(boxes[i], calib[i], image_shape)
+            for i in range(3)
+        ]
+        with self.test_session() as sess:
+            outputs = sess.run(
+                [box_corners, box_corners_norm, box_corners_norm_reorder]
+            )
+            expected_outputs = sess.run(expected_outputs)
+
+        for i in range(3):
+            expected_box_corners, expected_box_corners_norm = expected_outputs[i]
+            np.testing.assert_allclose(
+                outputs[0][i], expected_box_corners, rtol=1e-4, atol=1e-2
+            )
+            np.testing.assert_allclose(
+                outputs[1][i], expected_box_corners_norm, rtol=1e-4, atol=1e-5
+            )
+            np.testing.assert_allclose(
+                outputs[2][i],
+                expected_box_corners_norm[:, [1, 0, 3, 2]],
+                rtol=1e-4,
+                atol=1e-5,
+            )
+
+
+if __name__ == "__main__":
+    tf.test.main()
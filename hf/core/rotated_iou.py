@@ -0,0 +1,308 @@
+"""Vectorized IoU of rotated boxes, in numpy.
+
+Boxes are rectangles in the bird's eye view (x, z) plane rotated by ry, with
+a vertical extent of h above their bottom y. The overlap of two rectangles is
+computed as the CUDA ComputeBevIOU op does: the intersection polygon is made
+of the edge crossings and of the corners of each rectangle inside the other,
+sorted by angle around their center. All pairs are computed at once, with
+arrays of any leading shape, or as (N, M) matrices where pairs whose axis
+aligned bounds do not overlap are skipped.
+"""
+
+import numpy as np
+
+EPS = 1e-8
+
+# Margin of the corner in rectangle check, as in the CUDA op
+INSIDE_MARGIN = 1e-5
+
+
+def boxes_3d_to_bev_corners(boxes_3d):
+    """Computes the bird's eye view corners of boxes
+
+    Args:
+        boxes_3d: (..., 7) boxes [x, y, z, l, w, h, ry]
+
+    Returns:
+        corners: (..., 4, 2) [x, z] corners, in the order of the bottom
+            corners of box_8c_encoder.np_box_3d_to_box_8co
+    """
+    boxes_3d = np.asarray(boxes_3d, dtype=np.float64)
+    half_l = boxes_3d[..., 3:4] / 2.0
+    half_w = boxes_3d[..., 4:5] / 2.0
+    x_corners = np.concatenate([half_l, half_l, -half_l, -half_l], axis=-1)
+    z_corners = np.concatenate([half_w, -half_w, -half_w, half_w], axis=-1)
+
+    cos_ry = np.cos(boxes_3d[..., 6:7])
+    sin_ry = np.sin(boxes_3d[..., 6:7])
+    corners_x = boxes_3d[..., 0:1] + x_corners * cos_ry + z_corners * sin_ry
+    corners_z = boxes_3d[..., 2:3] - x_corners * sin_ry + z_corners * cos_ry
+
+    return np.stack([corners_x, corners_z], axis=-1)
+
+
+def boxes_bev_to_corners(boxes_bev):
+    """Computes the corners of boxes in the format of the CUDA bev_iou ops
+
+    Args:
+        boxes_bev: (..., 5) boxes [x1, y1, x2, y2, ry], as made by
+            compute_iou.boxes3d_to_bev_tf
+
+    Returns:
+        corners: (..., 4, 2) corners, in the same order as
+            boxes_3d_to_bev_corners
+    """
+    boxes_bev = np.asarray(boxes_bev, dtype=np.float64)
+    boxes_3d = np.zeros(boxes_bev.shape[:-1] + (7,))
+    boxes_3d[..., 0] = (boxes_bev[..., 0] + boxes_bev[..., 2]) / 2.0
+    boxes_3d[..., 2] = (boxes_bev[..., 1] + boxes_bev[..., 3]) / 2.0
+    boxes_3d[..., 3] = boxes_bev[..., 2] - boxes_bev[..., 0]
+    boxes_3d[..., 4] = boxes_bev[..., 3] - boxes_bev[..., 1]
+    boxes_3d[..., 6] = boxes_bev[..., 4]
+    return boxes_3d_to_bev_corners(boxes_3d)
+
+
+def _cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def rect_area(corners):
+    """Computes the areas of (..., 4, 2) rectangles from their corners"""
+    corners = np.asarray(corners, dtype=np.float64)
+    return np.abs(np.sum(_cross(corners, np.roll(corners, -1, axis=-2)), axis=-1)) / 2.0
+
+
+def _corners_in_rect(x, y, rect_x, rect_y):
+    """Checks which (..., K) corners are inside of the (..., 4) rectangles,
+    with a margin"""
+    center_x = (rect_x[..., 0:1] + rect_x[..., 2:3]) / 2.0
+    center_y = (rect_y[..., 0:1] + rect_y[..., 2:3]) / 2.0
+    offsets_x = x - center_x
+    offsets_y = y - center_y
+
+    inside = np.ones(x.shape, dtype=bool)
+    for edge_start, edge_end in [(0, 1), (1, 2)]:
+        edge_x = rect_x[..., edge_end : edge_end + 1] - rect_x[..., edge_start:edge_end]
+        edge_y = rect_y[..., edge_end : edge_end + 1] - rect_y[..., edge_start:edge_end]
+        edge_length = np.sqrt(edge_x * edge_x + edge_y * edge_y)
+        projection = (offsets_x * edge_x + offsets_y * edge_y) / np.maximum(
+            edge_length, EPS
+        )
+        inside &= np.abs(projection) < edge_length / 2.0 + INSIDE_MARGIN
+
+    return inside
+
+
+def _pseudo_angle(x, y):
+    """Monotonic function of the angle of (x, y), in [0, 4), cheaper than
+    arctan2 for sorting"""
+    ratio = y / np.maximum(np.abs(x) + np.abs(y), EPS)
+    return np.where(x < 0, 2.0 - ratio, np.where(y < 0, 4.0 + ratio, ratio))
+
+
+def rect_overlap_area(corners_a, corners_b):
+    """Computes the overlap area of pairs of rectangles
+
+    Args:
+        corners_a: (..., 4, 2) corners of the first rectangles, in order
+        corners_b: (..., 4, 2) corners of the second rectangles, broadcast
+            against corners_a
+
+    Returns:
+        overlap: (...) intersection areas
+    """
+    corners_a, corners_b = np.broadcast_arrays(
+        np.asarray(corners_a, dtype=np.float64),
+        np.asarray(corners_b, dtype=np.float64),
+    )
+    # x and y are kept apart, arrays with a last dimension of 2 are slow
+    a_x = np.ascontiguousarray(corners_a[..., 0])
+    a_y = np.ascontiguousarray(corners_a[..., 1])
+    b_x = np.ascontiguousarray(corners_b[..., 0])
+    b_y = np.ascontiguousarray(corners_b[..., 1])
+
+    # Crossings of each edge of a (rows) with each edge of b (columns)
+    edge_a_x = (np.roll(a_x, -1, axis=-1) - a_x)[..., :, np.newaxis]
+    edge_a_y = (np.roll(a_y, -1, axis=-1) - a_y)[..., :, np.newaxis]
+    edge_b_x = (np.roll(b_x, -1, axis=-1) - b_x)[..., np.newaxis, :]
+    edge_b_y = (np.roll(b_y, -1, axis=-1) - b_y)[..., np.newaxis, :]
+    offset_x = b_x[..., np.newaxis, :] - a_x[..., :, np.newaxis]
+    offset_y = b_y[..., np.newaxis, :] - a_y[..., :, np.newaxis]
+
+    denom = edge_a_x * edge_b_y - edge_a_y * edge_b_x
+    non_parallel = np.abs(denom) > EPS
+    safe_denom = np.where(non_parallel, denom, 1.0)
+    t = (offset_x * edge_b_y - offset_y * edge_b_x) / safe_denom
+    u = (offset_x * edge_a_y - offset_y * edge_a_x) / safe_denom
+    crossing_valid = non_parallel & (t > 0) & (t < 1) & (u > 0) & (u < 1)
+    crossing_x = a_x[..., :, np.newaxis] + t * edge_a_x
+    crossing_y = a_y[..., :, np.newaxis] + t * edge_a_y
+
+    leading_shape = a_x.shape[:-1]
+    points_x = np.concatenate(
+        [crossing_x.reshape(leading_shape + (16,)), a_x, b_x], axis=-1
+    )
+    points_y = np.concatenate(
+        [crossing_y.reshape(leading_shape + (16,)), a_y, b_y], axis=-1
+    )
+    valid = np.concatenate(
+        [
+            crossing_valid.reshape(leading_shape + (16,)),
+            _corners_in_rect(a_x, a_y, b_x, b_y),
+            _corners_in_rect(b_x, b_y, a_x, a_y),
+        ],
+        axis=-1,
+    )
+
+    num_valid = np.sum(valid, axis=-1, keepdims=True)
+    safe_num_valid = np.maximum(num_valid, 1)
+    points_x = points_x - np.sum(points_x * valid, axis=-1, keepdims=True) / (
+        safe_num_valid
+    )
+    points_y = points_y - np.sum(points_y * valid, axis=-1, keepdims=True) / (
+        safe_num_valid
+    )
+
+    # Sort the polygon vertices by angle around their center, invalid ones
+    # last, then replace them by the first vertex so that they add no area
+    angles = np.where(valid, _pseudo_angle(points_x, points_y), np.inf)
+    order = np.argsort(angles, axis=-1)
+    points_x = np.take_along_axis(points_x, order, axis=-1)
+    points_y = np.take_along_axis(points_y, order, axis=-1)
+    sorted_valid = np.take_along_axis(valid, order, axis=-1)
+    points_x = np.where(sorted_valid, points_x, points_x[..., 0:1])
+    points_y = np.where(sorted_valid, points_y, points_y[..., 0:1])
+
+    area = np.sum(
+        points_x * np.roll(points_y, -1, axis=-1)
+        - points_y * np.roll(points_x, -1, axis=-1),
+        axis=-1,
+    )
+    return np.where(num_valid[..., 0] > 2, np.abs(area) / 2.0, 0.0)
+
+
+def box_3d_iou_aligned(boxes_a, boxes_b):
+    """Computes the 3D and bird's eye view IoUs of pairs of boxes
+
+    Args:
+        boxes_a: (..., 7) boxes [x, y, z, l, w, h, ry]
+        boxes_b: (..., 7) boxes, broadcast against boxes_a
+
+    Returns:
+        iou_3d: (...) 3D IoUs
+        iou_bev: (...) bird's eye view IoUs
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64)
+
+    overlap_bev = rect_overlap_area(
+        boxes_3d_to_bev_corners(boxes_a), boxes_3d_to_bev_corners(boxes_b)
+    )
+    area_a = boxes_a[..., 3] * boxes_a[..., 4]
+    area_b = boxes_b[..., 3] * boxes_b[..., 4]
+    iou_bev = overlap_bev / np.maximum(area_a + area_b - overlap_bev, EPS)
+
+    # Boxes extend up from their bottom y, along -y
+    overlap_h = np.minimum(boxes_a[..., 1], boxes_b[..., 1]) - np.maximum(
+        boxes_a[..., 1] - boxes_a[..., 5], boxes_b[..., 1] - boxes_b[..., 5]
+    )
+    overlap_3d = overlap_bev * np.maximum(overlap_h, 0.0)
+    volume_a = area_a * boxes_a[..., 5]
+    volume_b = area_b * boxes_b[..., 5]
+    iou_3d = overlap_3d / np.maximum(volume_a + volume_b - overlap_3d, EPS)
+
+    return iou_3d, iou_bev
+
+
+def rect_overlap_matrix(corners_a, corners_b):
+    """Computes the overlap areas of all pairs of two sets of rectangles
+
+    Args:
+        corners_a: (N, 4, 2) corners of the first rectangles
+        corners_b: (M, 4, 2) corners of the second rectangles
+
+    Returns:
+        overlap: (N, M) intersection areas
+    """
+    corners_a = np.asarray(corners_a, dtype=np.float64)
+    corners_b = np.asarray(corners_b, dtype=np.float64)
+    overlap = np.zeros((len(corners_a), len(corners_b)))
+
+    # Only pairs with overlapping axis aligned bounds can intersect
+    min_a = corners_a.min(axis=1)[:, np.newaxis]
+    max_a = corners_a.max(axis=1)[:, np.newaxis]
+    min_b = corners_b.min(axis=1)[np.newaxis]
+    max_b = corners_b.max(axis=1)[np.newaxis]
+    candidates = np.all((min_a < max_b) & (min_b < max_a), axis=-1)
+    indices_a, indices_b = np.nonzero(candidates)
+
+    if len(indices_a) > 0:
+        overlap[indices_a, indices_b] = rect_overlap_area(
+            corners_a[indices_a], corners_b[indices_b]
+        )
+    return overlap
+
+
+def compute_bev_iou(boxes_bev_a, boxes_bev_b):
+    """Numpy equivalent of the CUDA bev_iou.compute_bev_iou op
+
+    Args:
+        boxes_bev_a: (N, 5) boxes [x1, y1, x2, y2, ry]
+        boxes_bev_b: (M, 5) boxes [x1, y1, x2, y2, ry]
+
+    Returns:
+        overlap_area: (N, M) intersection areas
+        bev_iou: (N, M) bird's eye view IoUs
+    """
+    boxes_bev_a = np.asarray(boxes_bev_a, dtype=np.float64).reshape(-1, 5)
+    boxes_bev_b = np.asarray(boxes_bev_b, dtype=np.float64).reshape(-1, 5)
+
+    overlap_area = rect_overlap_matrix(
+        boxes_bev_to_corners(boxes_bev_a), boxes_bev_to_corners(boxes_bev_b)
+    )
+    area_a = (boxes_bev_a[:, 2] - boxes_bev_a[:, 0]) * (
+        boxes_bev_a[:, 3] - boxes_bev_a[:, 1]
+    )
+    area_b = (boxes_bev_b[:, 2] - boxes_bev_b[:, 0]) * (
+        boxes_bev_b[:, 3] - boxes_bev_b[:, 1]
+    )
+    bev_iou = overlap_area / np.maximum(
+        area_a[:, np.newaxis] + area_b[np.newaxis] - overlap_area, EPS
+    )
+    return overlap_area, bev_iou
+
+
+def box_3d_iou_matrix(boxes_a, boxes_b):
+    """Numpy equivalent of compute_iou.box3d_iou_tf, computes the IoUs of
+    all pairs of two sets of boxes
+
+    Args:
+        boxes_a: (N, 7) boxes [x, y, z, l, w, h, ry]
+        boxes_b: (M, 7) boxes [x, y, z, l, w, h, ry]
+
+    Returns:
+        iou_3d: (N, M) 3D IoUs
+        iou_bev: (N, M) bird's eye view IoUs
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 7)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 7)
+
+    overlap_bev = rect_overlap_matrix(
+        boxes_3d_to_bev_corners(boxes_a), boxes_3d_to_bev_corners(boxes_b)
+    )
+    area_a = (boxes_a[:, 3] * boxes_a[:, 4])[:, np.newaxis]
+    area_b = (boxes_b[:, 3] * boxes_b[:, 4])[np.newaxis]
+    iou_bev = overlap_bev / np.maximum(area_a + area_b - overlap_bev, EPS)
+
+    # Boxes extend up from their bottom y, along -y
+    bottom_a = boxes_a[:, 1:2]
+    bottom_b = boxes_b[np.newaxis, :, 1]
+    overlap_h = np.minimum(bottom_a, bottom_b) - np.maximum(
+        bottom_a - boxes_a[:, 5:6], bottom_b - boxes_b[np.newaxis, :, 5]
+    )
+    overlap_3d = overlap_bev * np.maximum(overlap_h, 0.0)
+    volume_a = area_a * boxes_a[:, 5:6]
+    volume_b = area_b * boxes_b[np.newaxis, :, 5]
+    iou_3d = overlap_3d / np.maximum(volume_a + volume_b - overlap_3d, EPS)
+
+    return iou_3d, iou_bev
@@ -0,0 +1,111 @@
+"""rotated_iou unit test module."""
+
+import unittest
+
+import numpy as np
+from shapely.geometry import Polygon
+
+from hf.core import rotated_iou
+
+
+class RotatedIouTest(unittest.TestCase):
+    def test_simple_overlaps(self):
+        box = [0.0, 1.0, 0.0, 2.0, 2.0, 1.0, 0.0]
+        boxes_a = np.array([box, box, box, box, box])
+        boxes_b = np.array(
+            [
+                # Same box
+                box,
+                # Shifted by half its length
+                [1.0, 1.0, 0.0, 2.0, 2.0, 1.0, 0.0],
+                # Rotated by 90 degrees, same square
+                [0.0, 1.0, 0.0, 2.0, 2.0, 1.0, np.pi / 2],
+                # Disjoint
+                [5.0, 1.0, 0.0, 2.0, 2.0, 1.0, 0.3],
+                # Half the height above
+                [0.0, 0.5, 0.0, 2.0, 2.0, 1.0, 0.0],
+            ]
+        )
+
+        iou_3d, iou_bev = rotated_iou.box_3d_iou_aligned(boxes_a, boxes_b)
+        np.testing.assert_allclose(iou_bev, [1.0, 1.0 / 3.0, 1.0, 0.0, 1.0])
+        np.testing.assert_allclose(iou_3d, [1.0, 1.0 / 3.0, 1.0, 0.0, 1.0 / 3.0])
+
+    def test_rotated_square(self):
+        # A square rotated by 45 degrees inside of an axis aligned one, the
+        # overlap is an octagon
+        corners_a = rotated_iou.boxes_3d_to_bev_corners(
+            [0.0, 0.0, 0.0, 2.0, 2.0, 1.0, 0.0]
+        )
+        corners_b = rotated_iou.boxes_3d_to_bev_corners(
+            [0.0, 0.0, 0.0, 2.0, 2.0, 1.0, np.pi / 4]
+        )
+
+        expected_area = 8.0 * (np.sqrt(2.0) - 1.0)
+        np.testing.assert_allclose(
+            rotated_iou.rect_overlap_area(corners_a, corners_b), expected_area
+        )
+
+    def test_same_as_shapely(self):
+        np.random.seed(0)
+        num_boxes = 200
+        boxes = np.random.uniform(
+            [-3, 1, -3, 1, 1, 1, -np.pi], [3, 2, 3, 5, 3, 2, np.pi], (2, num_boxes, 7)
+        )
+
+        _, iou_bev = rotated_iou.box_3d_iou_aligned(boxes[0], boxes[1])
+
+        corners = rotated_iou.boxes_3d_to_bev_corners(boxes)
+        expected_iou_bev = []
+        for box_idx in range(num_boxes):
+            poly_a = Polygon(corners[0, box_idx])
+            poly_b = Polygon(corners[1, box_idx])
+            inter_area = poly_a.intersection(poly_b).area
+            expected_iou_bev.append(
+                inter_area / (poly_a.area + poly_b.area - inter_area)
+            )
+        np.testing.assert_allclose(iou_bev, expected_iou_bev, atol=1e-6)
+
+    def test_matrices(self):
+        np.random.seed(0)
+        boxes_a = np.random.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (30, 7)
+        )
+        boxes_b = np.random.uniform(
+            [-10, 1, -10, 1, 1, 1, -np.pi], [10, 2, 10, 5, 3, 2, np.pi], (20, 7)
+        )
+
+        iou_3d, iou_bev = rotated_iou.box_3d_iou_matrix(boxes_a, boxes_b)
+        expected_iou_3d, expected_iou_bev = rotated_iou.box_3d_iou_aligned(
+            boxes_a[:, np.newaxis], boxes_b[np.newaxis]
+        )
+        np.testing.assert_allclose(iou_3d, expected_iou_3d)
+        np.testing.assert_allclose(iou_bev, expected_iou_bev)
+        self.assertGreater(np.sum(iou_bev > 0), 0)
+
+        # Same boxes in the format of the CUDA op
+        def to_bev(boxes_3d):
+            return np.stack(
+                [
+                    boxes_3d[:, 0] - boxes_3d[:, 3] / 2,
+                    boxes_3d[:, 2] - boxes_3d[:, 4] / 2,
+                    boxes_3d[:, 0] + boxes_3d[:, 3] / 2,
+                    boxes_3d[:, 2] + boxes_3d[:, 4] / 2,
+                    boxes_3d[:, 6],
+                ],
+                axis=1,
+            )
+
+        _, bev_iou = rotated_iou.compute_bev_iou(to_bev(boxes_a), to_bev(boxes_b))
+        np.testing.assert_allclose(bev_iou, expected_iou_bev, atol=1e-12)
+
+    def test_empty_matrices(self):
+        iou_3d, iou_bev = rotated_iou.box_3d_iou_matrix(
+            np.zeros((0, 7)), np.ones((3, 7))
+        )
+        self.assertEqual(iou_3d.shape, (0, 3))
+        self.assertEqual(iou_bev.shape, (0, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
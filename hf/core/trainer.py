@@ -198,6 +198,10 @@ def train(model, train_config):
         else:
             # Run the train op only
             sess.run(train_op, feed_dict)
+
+    # Stop the loader workers
+    model.dataset.close_prefetcher()
+
     if hvd.rank() == 0:
         # Close the summary writers
         train_writer.close()
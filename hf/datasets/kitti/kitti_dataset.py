@@ -6,15 +6,21 @@ import os
 
 import numpy as np
 import cv2
+from PIL import Image
 
-from hf.core import calib_utils
+import hf
+from hf.core import calib_store
 from hf.core import obj_utils
 
-from hf.core import box_3d_encoder
 from hf.core import box_8c_encoder
-from hf.core import box_util
 from hf.core import constants
+from hf.core import rotated_iou
 from hf.datasets.kitti import kitti_aug
+from hf.datasets.kitti import kitti_labels
+from hf.datasets.kitti.kitti_labels import KittiLabelStore
+from hf.datasets.kitti.kitti_point_cloud_cache import PointCloudCache
+from hf.datasets.kitti.kitti_prefetcher import KittiPrefetcher
+from hf.datasets.kitti.kitti_shards import KittiShards
 from hf.datasets.kitti.kitti_utils import KittiUtils
 
 
@@ -53,7 +59,8 @@ class KittiDataset:
         self.num_classes = len(self.classes)
         self.num_clusters = np.asarray(self.config.num_clusters)
 
-        self.aug_list = self.config.aug_list
+        # A list, repeated proto fields can't be pickled
+        self.aug_list = list(self.config.aug_list)
         self.aug_roi_method = self.config.aug_roi_method
 
         # Determines the network mode. This is initialized to 'train' but
@@ -131,6 +138,13 @@ class KittiDataset:
         print("Number of samples in dataset: ", self.num_samples)
 
         self._set_up_directories()
+        self._set_up_calib_snapshot(loaded_sample_names)
+
+        # Label stores, by data split. The store of this split is built
+        # before any loader worker is started
+        self._label_stores = {}
+        if self.has_labels:
+            self.get_label_store()
 
         # Setup utils object
         self.kitti_utils = KittiUtils(self)
@@ -161,6 +175,16 @@ class KittiDataset:
 
         self._stats_rcnn_sample = None
 
+        # Batch prefetching, batches are loaded on the calling thread when
+        # there are no loader workers
+        self.num_loader_workers = self.config.num_loader_workers
+        self.loader_queue_size = self.config.loader_queue_size
+        self.loader_seed = self.config.loader_seed
+        self._prefetcher = None
+
+        # (w, h) image sizes by sample name
+        self._image_sizes = dict()
+
     # Paths
     @property
     def rgb_image_dir(self):
@@ -199,6 +223,42 @@ class KittiDataset:
         # Labels are always in the training folder
         self.label_dir = self.dataset_dir + "/training/label_" + str(self._cam_idx)
 
+        # Packed shards of the split, the per-file layout is read if not set
+        if self.config.shard_dir:
+            self.shards = KittiShards(self.config.shard_dir, self.data_split)
+        else:
+            self.shards = None
+
+        # Cache of the field of view point clouds, disabled if not set
+        if self.config.point_cloud_cache_dir:
+            self.point_cloud_cache = PointCloudCache(
+                os.path.join(
+                    os.path.expanduser(self.config.point_cloud_cache_dir),
+                    self.config.data_split_dir,
+                ),
+                self.config.point_cloud_cache_dtype,
+            )
+        else:
+            self.point_cloud_cache = None
+
+    def _set_up_calib_snapshot(self, sample_names):
+        """Fills the calibration store from the split's snapshot, creating
+        the snapshot first if it does not exist yet or was created for
+        another split."""
+        snapshot_path = os.path.expanduser(self.config.calib_snapshot_path)
+        # Shards already hold the calibrations in a single file
+        if not snapshot_path or self.shards is not None:
+            return
+
+        planes_dir = self.planes_dir if os.path.isdir(self.planes_dir) else None
+        calib_store.get_store().load_or_save_snapshot(
+            snapshot_path,
+            self.calib_dir,
+            [int(sample_name) for sample_name in sample_names],
+            planes_dir=planes_dir,
+            split=self.data_split,
+        )
+
     def _set_up_classes_name(self):
         # Unique identifier for multiple classes
         if self.num_classes > 1:
@@ -251,6 +311,106 @@ class KittiDataset:
         proposals_iou = np.loadtxt(self.get_proposal_iou_path(sample_name))
         return proposals_iou
 
+    # Read sample data, from the shards if the split is packed
+    def read_image(self, sample_name):
+        """Reads the BGR image of a sample, as cv2.imread"""
+        if self.shards is not None:
+            return self.shards.read_image(int(sample_name))
+        return cv2.imread(self.get_rgb_image_path(sample_name))
+
+    def read_image_size(self, sample_name):
+        """Returns the (w, h) image size of a sample, the image is only read
+        the first time"""
+        if sample_name not in self._image_sizes:
+            if self.shards is not None:
+                image_size = self.shards.read_image_size(int(sample_name))
+            else:
+                with Image.open(self.get_rgb_image_path(sample_name)) as image:
+                    image_size = image.size
+            self._image_sizes[sample_name] = tuple(image_size)
+        return self._image_sizes[sample_name]
+
+    def read_calibration(self, sample_name):
+        """Reads the FrameCalibrationData of a sample"""
+        if self.shards is not None:
+            return calib_store.read_calibration(
+                self.shards.split_dir, int(sample_name), self.shards.read_calibration
+            )
+        return calib_store.read_calibration(self.calib_dir, int(sample_name))
+
+    def get_velo_transforms(self, sample_name):
+        """Returns the read-only (velo_to_rect, velo_to_image) transforms of
+        a sample"""
+        if self.shards is not None:
+            return calib_store.get_velo_transforms(
+                self.shards.split_dir, int(sample_name), self.shards.read_calibration
+            )
+        return calib_store.get_velo_transforms(self.calib_dir, int(sample_name))
+
+    def read_labels(self, sample_name):
+        """Reads the ObjectLabels of a sample, None if there are none"""
+        if self.shards is not None:
+            return self.shards.read_labels(int(sample_name))
+        return obj_utils.read_labels(self.label_dir, int(sample_name))
+
+    def get_label_store(self, data_split=None):
+        """Returns the KittiLabelStore of a data split, loading it from its
+        cache file or building it on first use.
+
+        Args:
+            data_split: (optional) split of the store, this dataset's split
+                by default
+
+        Returns:
+            KittiLabelStore
+        """
+        if data_split is None:
+            data_split = self.data_split
+
+        if data_split not in self._label_stores:
+            if self.shards is not None and data_split == self.data_split:
+                label_store = self.shards.get_label_store()
+            else:
+                cache_path = (
+                    hf.root_dir()
+                    + "/data/label_stores/"
+                    + self.name
+                    + "/"
+                    + data_split
+                    + ".npz"
+                )
+                label_store = KittiLabelStore.load_or_build(
+                    cache_path, self.label_dir, self.load_sample_names(data_split)
+                )
+            self._label_stores[data_split] = label_store
+
+        return self._label_stores[data_split]
+
+    def get_label_boxes(self, sample_name, difficulty=None, max_occlusion=None):
+        """Returns the labels of a sample which match the dataset classes
+
+        Args:
+            sample_name: name of the sample, e.g. '000123'
+            difficulty: (optional) KITTI difficulty rating as integer
+            max_occlusion: (optional) maximum occlusion to filter objects
+
+        Returns:
+            boxes_3d: (N, 7) label boxes [x, y, z, l, w, h, ry]
+            classes: (N,) int32 class indices, starting at 1
+        """
+        label_store = self.get_label_store()
+        if sample_name in label_store:
+            labels = label_store.get_labels(sample_name)
+        else:
+            labels = kitti_labels.read_label_array(self.label_dir, int(sample_name))
+
+        labels = self.kitti_utils.filter_label_array(
+            labels, difficulty=difficulty, max_occlusion=max_occlusion
+        )
+        boxes_3d = kitti_labels.labels_to_boxes_3d(labels)
+        classes = self.kitti_utils.class_strs_to_indices(labels["type"])
+        return boxes_3d, classes
+
     # Cluster info
     def get_cluster_info(self):
         return self.kitti_utils.clusters, self.kitti_utils.std_devs
@@ -305,34 +465,19 @@ class KittiDataset:
             sample = self.sample_list[sample_idx]
 
             if self.has_labels:
-                obj_labels = obj_utils.read_labels(self.label_dir, int(sample.name))
                 # Only use objects that match dataset classes
-                obj_labels = self.kitti_utils.filter_labels(obj_labels)
-                if len(obj_labels) <= 0:
+                label_boxes_3d, label_classes = self.get_label_boxes(sample.name)
+                if len(label_boxes_3d) <= 0:
                     continue
-                label_boxes_3d = np.asarray(
-                    [
-                        box_3d_encoder.object_label_to_box_3d(obj_label)
-                        for obj_label in obj_labels
-                    ]
-                )
-                label_classes = np.asarray(
-                    [
-                        self.kitti_utils.class_str_to_index(obj_label.type)
-                        for obj_label in obj_labels
-                    ]
-                )
 
             # Load image (BGR -> RGB)
-            cv_bgr_image = cv2.imread(self.get_rgb_image_path(sample.name))
+            cv_bgr_image = self.read_image(sample.name)
             rgb_image = cv_bgr_image[..., ::-1]
             image_shape = rgb_image.shape[0:2]
             image_input = rgb_image
 
             # Get calibration
-            stereo_calib_p2 = calib_utils.read_calibration(
-                self.calib_dir, int(sample.name)
-            ).p2
+            stereo_calib_p2 = self.read_calibration(sample.name).p2
             # Load PC in rect image space
             pts_rect, pts_intensity = self.kitti_utils.get_point_cloud(
                 int(sample.name), image_shape
@@ -392,6 +537,7 @@ class KittiDataset:
                 )
             else:
                 label_boxes_3d = np.zeros((1, 7))
+                label_classes = np.zeros(1, dtype=np.int32)
                 label_seg = np.zeros(pc_sample_pts)
                 label_reg = np.zeros((pc_sample_pts, 7))
 
@@ -403,6 +549,7 @@ class KittiDataset:
                 constants.KEY_LABEL_SEG: label_seg,
                 constants.KEY_LABEL_REG: label_reg,
                 constants.KEY_LABEL_BOXES_3D: label_boxes_3d,
+                constants.KEY_LABEL_CLASSES: label_classes,
                 constants.KEY_POINT_CLOUD: sampled_pc,
                 constants.KEY_IMAGE_INPUT: image_input_resized,
                 constants.KEY_STEREO_CALIB_P2: stereo_calib_p2,
@@ -420,22 +567,43 @@ class KittiDataset:
         extend_gt_boxes3d[:, 3:6] += self.kitti_utils.expand_gt_size * 2
         extend_gt_boxes3d[:, 1] += self.kitti_utils.expand_gt_size
 
+        num_boxes = gt_boxes3d.shape[0]
+        if num_boxes == 0:
+            return cls_label, reg_label
+
         gt_corners = box_8c_encoder.np_box_3d_to_box_8co(gt_boxes3d)
         extend_gt_corners = box_8c_encoder.np_box_3d_to_box_8co(extend_gt_boxes3d)
 
-        for k in range(gt_boxes3d.shape[0]):
-            box_corners = gt_corners[k]
-            fg_pt_flag = obj_utils.is_point_inside(pts_rect.T, box_corners.T)
-            cls_label[fg_pt_flag] = gt_classes[k]
-            reg_label[fg_pt_flag, :] = gt_boxes3d[k]
+        # (box, point) pairs of the points inside of each box, boxes
+        # [M, 2M) are the enlarged ones
+        num_points = pts_rect.shape[0]
+        box_indices, point_indices = obj_utils.get_points_in_boxes(
+            pts_rect, np.concatenate([gt_corners, extend_gt_corners])
+        )
+        fg_pairs = box_indices < num_boxes
+        fg_boxes = box_indices[fg_pairs]
+        fg_points = point_indices[fg_pairs]
+
+        # enlarge the bbox3d, ignore nearby points
+        fg_keys = fg_boxes * num_points + fg_points
+        fg_enlarge_keys = (box_indices[~fg_pairs] - num_boxes) * num_points + (
+            point_indices[~fg_pairs]
+        )
+        ignore_keys = np.setxor1d(fg_keys, fg_enlarge_keys, assume_unique=True)
+
+        # Boxes are labelled in order, each point keeps the labels written by
+        # the last box it is inside of
+        last_fg_box = np.full(num_points, -1, dtype=np.int64)
+        np.maximum.at(last_fg_box, fg_points, fg_boxes)
+        last_ignore_box = np.full(num_points, -1, dtype=np.int64)
+        np.maximum.at(
+            last_ignore_box, ignore_keys % num_points, ignore_keys // num_points
+        )
 
-            # enlarge the bbox3d, ignore nearby points
-            extend_box_corners = extend_gt_corners[k]
-            fg_enlarge_flag = obj_utils.is_point_inside(
-                pts_rect.T, extend_box_corners.T
-            )
-            ignore_flag = np.logical_xor(fg_pt_flag, fg_enlarge_flag)
-            cls_label[ignore_flag] = -1
+        fg = last_fg_box >= 0
+        cls_label[fg] = np.asarray(gt_classes)[last_fg_box[fg]]
+        reg_label[fg] = gt_boxes3d[last_fg_box[fg]]
+        cls_label[last_ignore_box > last_fg_box] = -1
 
         return cls_label, reg_label
 
@@ -445,39 +613,23 @@ class KittiDataset:
             sample = self.sample_list[sample_idx]
 
             if self.has_labels:
-                obj_labels = obj_utils.read_labels(self.label_dir, int(sample.name))
                 # Only use objects that match dataset classes
-                obj_labels = self.kitti_utils.filter_labels(obj_labels)
-                if len(obj_labels) <= 0:
+                gt_boxes3d, gt_classes = self.get_label_boxes(sample.name)
+                if len(gt_boxes3d) <= 0:
                     continue
 
-                gt_boxes3d = np.asarray(
-                    [
-                        box_3d_encoder.object_label_to_box_3d(obj_label)
-                        for obj_label in obj_labels
-                    ]
-                )
-                gt_classes = np.asarray(
-                    [
-                        self.kitti_utils.class_str_to_index(obj_label.type)
-                        for obj_label in obj_labels
-                    ]
-                )
-
                 iou3d = self.get_proposal_iou(sample.name).reshape(
                     (-1, gt_boxes3d.shape[0])
                 )
 
             # Load image (BGR -> RGB)
-            cv_bgr_image = cv2.imread(self.get_rgb_image_path(sample.name))
+            cv_bgr_image = self.read_image(sample.name)
             rgb_image = cv_bgr_image[..., ::-1]
             image_shape = rgb_image.shape[0:2]
             image_input = rgb_image
 
             # Get calibration
-            stereo_calib_p2 = calib_utils.read_calibration(
-                self.calib_dir, int(sample.name)
-            ).p2
+            stereo_calib_p2 = self.read_calibration(sample.name).p2
 
             # Load PC & RPN features
             rpn_pts, rpn_intensity, rpn_fg_mask, rpn_fts = self.get_rpn_features(
@@ -686,32 +838,39 @@ class KittiDataset:
 
     def aug_roi_by_noise(self, roi_boxes3d, gt_boxes3d, aug_times=10):
         """
+        Each roi is replaced by the first of up to aug_times noisy candidates
+        reaching the positive iou threshold with its gt, or by the last one.
+        Each candidate keeps the original roi with p=0.2. All the candidates
+        are drawn and scored at once.
+
         :param roi_boxes3d: (N, 7)
         :param gt_boxes3d: (N, 7)
         :return:
         """
-        iou_of_rois = np.zeros(roi_boxes3d.shape[0], dtype=np.float32)
-        for k in range(roi_boxes3d.__len__()):
-            temp_iou = cnt = 0
-            roi_box3d = roi_boxes3d[k]
-            gt_box3d = gt_boxes3d[k]
-            pos_thresh = min(self.reg_pos_iou_range[0], self.cls_pos_iou_range[0])
-            gt_corners = box_8c_encoder.np_box_3d_to_box_8co(gt_box3d.reshape(1, 7))
-            aug_box3d = roi_box3d
-            while temp_iou < pos_thresh and cnt < aug_times:
-                if np.random.rand() < 0.2:
-                    aug_box3d = roi_box3d  # p=0.2 to keep the original roi box
-                else:
-                    aug_box3d = self.random_aug_box3d(roi_box3d)
-                aug_corners = box_8c_encoder.np_box_3d_to_box_8co(
-                    aug_box3d.reshape(1, 7)
-                )
-                temp_iou, _ = box_util.box3d_iou(
-                    aug_corners[0, :, :], gt_corners[0, :, :]
-                )
-                cnt += 1
-            roi_boxes3d[k] = aug_box3d
-            iou_of_rois[k] = temp_iou
+        num_rois = roi_boxes3d.shape[0]
+        if num_rois == 0:
+            return roi_boxes3d, np.zeros(0, dtype=np.float32)
+        pos_thresh = min(self.reg_pos_iou_range[0], self.cls_pos_iou_range[0])
+
+        # (N, aug_times, 7) candidates
+        src_boxes3d = np.repeat(roi_boxes3d[:, np.newaxis], aug_times, axis=1)
+        aug_boxes3d = self.random_aug_boxes3d(src_boxes3d.reshape(-1, 7))
+        keep_original = np.random.rand(num_rois * aug_times) < 0.2
+        aug_boxes3d[keep_original] = src_boxes3d.reshape(-1, 7)[keep_original]
+        aug_boxes3d = aug_boxes3d.reshape(num_rois, aug_times, 7)
+
+        aug_iou3d, _ = rotated_iou.box_3d_iou_aligned(
+            aug_boxes3d, gt_boxes3d[:, np.newaxis]
+        )
+
+        # First candidate over the threshold, the last one if none is
+        accepted = aug_iou3d >= pos_thresh
+        choice = np.where(
+            accepted.any(axis=1), np.argmax(accepted, axis=1), aug_times - 1
+        )
+        roi_indices = np.arange(num_rois)
+        roi_boxes3d[:] = aug_boxes3d[roi_indices, choice]
+        iou_of_rois = aug_iou3d[roi_indices, choice].astype(np.float32)
         return roi_boxes3d, iou_of_rois
 
     def random_aug_box3d(self, box3d):
@@ -719,57 +878,69 @@ class KittiDataset:
         :param box3d: (7) [x, y, z, h, w, l, ry]
         random shift, scale, orientation
         """
+        return self.random_aug_boxes3d(box3d.reshape(1, 7))[0]
+
+    def random_aug_boxes3d(self, boxes3d):
+        """
+        :param boxes3d: (N, 7) [x, y, z, h, w, l, ry]
+        random shift, scale, orientation of each box
+        """
+        num_boxes = boxes3d.shape[0]
         if self.aug_roi_method == "single":
-            pos_shift = np.random.rand(3) - 0.5  # [-0.5 ~ 0.5]
-            hwl_scale = (np.random.rand(3) - 0.5) / (0.5 / 0.15) + 1.0  #
-            angle_rot = (np.random.rand(1) - 0.5) / (
+            pos_shift = np.random.rand(num_boxes, 3) - 0.5  # [-0.5 ~ 0.5]
+            hwl_scale = (np.random.rand(num_boxes, 3) - 0.5) / (0.5 / 0.15) + 1.0
+            angle_rot = (np.random.rand(num_boxes, 1) - 0.5) / (
                 0.5 / (np.pi / 12)
             )  # [-pi/12 ~ pi/12]
 
-            aug_box3d = np.concatenate(
-                [box3d[0:3] + pos_shift, box3d[3:6] * hwl_scale, box3d[6:7] + angle_rot]
+            aug_boxes3d = np.concatenate(
+                [
+                    boxes3d[:, 0:3] + pos_shift,
+                    boxes3d[:, 3:6] * hwl_scale,
+                    boxes3d[:, 6:7] + angle_rot,
+                ],
+                axis=1,
             )
-            return aug_box3d
+            return aug_boxes3d
         elif self.aug_roi_method == "multiple":
             # pos_range, hwl_range, angle_range, mean_iou
-            range_config = [
-                [0.2, 0.1, np.pi / 12, 0.7],
-                [0.3, 0.15, np.pi / 12, 0.6],
-                [0.5, 0.15, np.pi / 9, 0.5],
-                [0.8, 0.15, np.pi / 6, 0.3],
-                [1.0, 0.15, np.pi / 3, 0.2],
-            ]
-            idx = np.random.randint(len(range_config))
-
-            pos_shift = ((np.random.rand(3) - 0.5) / 0.5) * range_config[idx][0]
-            hwl_scale = ((np.random.rand(3) - 0.5) / 0.5) * range_config[idx][1] + 1.0
-            angle_rot = ((np.random.rand(1) - 0.5) / 0.5) * range_config[idx][2]
-
-            aug_box3d = np.concatenate(
-                [box3d[0:3] + pos_shift, box3d[3:6] * hwl_scale, box3d[6:7] + angle_rot]
-            )
-            return aug_box3d
-        elif self.aug_roi_method == "normal":
-            x_shift = np.random.normal(loc=0, scale=0.3)
-            y_shift = np.random.normal(loc=0, scale=0.2)
-            z_shift = np.random.normal(loc=0, scale=0.3)
-            h_shift = np.random.normal(loc=0, scale=0.25)
-            w_shift = np.random.normal(loc=0, scale=0.15)
-            l_shift = np.random.normal(loc=0, scale=0.5)
-            ry_shift = ((np.random.rand() - 0.5) / 0.5) * np.pi / 12
-
-            aug_box3d = np.array(
+            range_config = np.array(
                 [
-                    box3d[0] + x_shift,
-                    box3d[1] + y_shift,
-                    box3d[2] + z_shift,
-                    box3d[3] + h_shift,
-                    box3d[4] + w_shift,
-                    box3d[5] + l_shift,
-                    box3d[6] + ry_shift,
+                    [0.2, 0.1, np.pi / 12, 0.7],
+                    [0.3, 0.15, np.pi / 12, 0.6],
+                    [0.5, 0.15, np.pi / 9, 0.5],
+                    [0.8, 0.15, np.pi / 6, 0.3],
+                    [1.0, 0.15, np.pi / 3, 0.2],
                 ]
             )
-            return aug_box3d
+            idx = np.random.randint(len(range_config), size=num_boxes)
+            pos_range = range_config[idx, 0:1]
+            hwl_range = range_config[idx, 1:2]
+            angle_range = range_config[idx, 2:3]
+
+            pos_shift = ((np.random.rand(num_boxes, 3) - 0.5) / 0.5) * pos_range
+            hwl_scale = ((np.random.rand(num_boxes, 3) - 0.5) / 0.5) * hwl_range + 1.0
+            angle_rot = ((np.random.rand(num_boxes, 1) - 0.5) / 0.5) * angle_range
+
+            aug_boxes3d = np.concatenate(
+                [
+                    boxes3d[:, 0:3] + pos_shift,
+                    boxes3d[:, 3:6] * hwl_scale,
+                    boxes3d[:, 6:7] + angle_rot,
+                ],
+                axis=1,
+            )
+            return aug_boxes3d
+        elif self.aug_roi_method == "normal":
+            # x, y, z, h, w, l shifts
+            shift_scales = np.array([0.3, 0.2, 0.3, 0.25, 0.15, 0.5])
+            shifts = np.random.normal(loc=0, scale=shift_scales, size=(num_boxes, 6))
+            ry_shift = ((np.random.rand(num_boxes, 1) - 0.5) / 0.5) * np.pi / 12
+
+            aug_boxes3d = np.concatenate(
+                [boxes3d[:, 0:6] + shifts, boxes3d[:, 6:7] + ry_shift], axis=1
+            )
+            return aug_boxes3d
         else:
             raise NotImplementedError
 
@@ -778,10 +949,61 @@ class KittiDataset:
         np.random.shuffle(perm)
         self.sample_list = self.sample_list[perm]
 
+    def _get_prefetcher(self, batch_size, shuffle, **kwargs):
+        """Returns the prefetcher for these batch arguments, restarting
+        it if the arguments changed since the last batch.
+        """
+        prefetcher = self._prefetcher
+        if prefetcher is not None and (
+            prefetcher.batch_size != batch_size
+            or prefetcher.shuffle != shuffle
+            or prefetcher.load_kwargs != kwargs
+        ):
+            prefetcher.close()
+            prefetcher = None
+
+        if prefetcher is None:
+            prefetcher = KittiPrefetcher(
+                self,
+                batch_size,
+                shuffle,
+                self.num_loader_workers,
+                queue_size=self.loader_queue_size,
+                seed=self.loader_seed,
+                **kwargs
+            )
+            self._prefetcher = prefetcher
+
+        return prefetcher
+
+    def close_prefetcher(self):
+        """Stops the loader workers, if any were started."""
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    def __getstate__(self):
+        # Loader workers get a copy of the dataset without the prefetcher
+        state = self.__dict__.copy()
+        state["_prefetcher"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # The calibration store is per process, fill it from the snapshot
+        # checked when the dataset was created
+        snapshot_path = os.path.expanduser(self.config.calib_snapshot_path)
+        if snapshot_path and self.shards is None and os.path.exists(snapshot_path):
+            calib_store.get_store().load_snapshot(snapshot_path)
+
     def next_batch(self, batch_size, shuffle, **kwargs):
         """
         Retrieve the next `batch_size` samples from this data set.
 
+        Samples are loaded by `num_loader_workers` prefetching processes when
+        configured, otherwise on the calling thread.
+
         Args:
             batch_size: number of samples in the batch
             shuffle: whether to shuffle the indices after an epoch is completed
@@ -789,6 +1011,8 @@ class KittiDataset:
         Returns:
             list of dictionaries containing sample information
         """
+        if self.num_loader_workers > 0:
+            return self._get_prefetcher(batch_size, shuffle, **kwargs).next_batch()
 
         # Create empty set of samples
         samples_in_batch = []
@@ -852,6 +1076,10 @@ class KittiDataset:
                 continue
             if key == constants.KEY_SAMPLE_AUGS:
                 continue
+            if key == constants.KEY_LABEL_CLASSES:
+                # Number of labels varies, keep the arrays of each sample
+                batch_data[key] = [samples[k][key] for k in range(batch_size)]
+                continue
 
             if key == constants.KEY_LABEL_BOXES_3D:
                 max_gt = 0
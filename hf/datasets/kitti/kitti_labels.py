@@ -0,0 +1,181 @@
+"""Columnar store of the KITTI labels of a data split.
+
+All object labels of a split are kept in one structured array, with per-sample
+offsets, instead of one list of ObjectLabel per sample. The store is built once
+from the label files and cached to disk as a .npz file.
+"""
+
+import os
+
+import numpy as np
+
+LABEL_DTYPE = np.dtype(
+    [
+        ("type", "U16"),
+        ("truncation", np.float64),
+        ("occlusion", np.float64),
+        ("alpha", np.float64),
+        ("x1", np.float64),
+        ("y1", np.float64),
+        ("x2", np.float64),
+        ("y2", np.float64),
+        ("h", np.float64),
+        ("w", np.float64),
+        ("l", np.float64),
+        ("t", np.float64, (3,)),
+        ("ry", np.float64),
+        ("score", np.float64),
+    ]
+)
+
+
+def read_label_array(label_dir, img_idx):
+    """Reads a label file into a structured array, the columnar equivalent of
+    obj_utils.read_labels
+
+    Args:
+        label_dir: directory of the label files
+        img_idx: image index
+
+    Returns:
+        labels: (N,) array of LABEL_DTYPE, empty if the file has no objects
+    """
+    with open(label_dir + "/%06d.txt" % img_idx, "r") as label_file:
+        rows = [line.split() for line in label_file.read().splitlines()]
+    rows = [row for row in rows if row]
+
+    labels = np.zeros(len(rows), dtype=LABEL_DTYPE)
+    for label_idx, row in enumerate(rows):
+        values = [float(value) for value in row[1:15]]
+        labels[label_idx] = (
+            row[0],
+            values[0],
+            values[1],
+            values[2],
+            values[3],
+            values[4],
+            values[5],
+            values[6],
+            values[7],
+            values[8],
+            values[9],
+            values[10:13],
+            values[13],
+            float(row[15]) if len(row) > 15 else 0.0,
+        )
+
+    return labels
+
+
+def labels_to_boxes_3d(labels):
+    """Converts a label array to box_3d format, the columnar equivalent of
+    box_3d_encoder.object_label_to_box_3d
+
+    Args:
+        labels: (N,) array of LABEL_DTYPE
+
+    Returns:
+        boxes_3d: (N, 7) boxes [x, y, z, l, w, h, ry]
+    """
+    boxes_3d = np.zeros((len(labels), 7))
+    boxes_3d[:, 0:3] = labels["t"]
+    boxes_3d[:, 3] = labels["l"]
+    boxes_3d[:, 4] = labels["w"]
+    boxes_3d[:, 5] = labels["h"]
+    boxes_3d[:, 6] = labels["ry"]
+    return boxes_3d
+
+
+class KittiLabelStore:
+    """Labels of a set of samples, as one structured array with offsets"""
+
+    def __init__(self, sample_names, labels, offsets):
+        """
+        Args:
+            sample_names: (S,) sample names
+            labels: (N,) array of LABEL_DTYPE, labels of all samples
+            offsets: (S + 1,) offsets of each sample's labels in `labels`
+        """
+        self.sample_names = np.asarray(sample_names)
+        self.labels = labels
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._sample_indices = {
+            sample_name: sample_idx
+            for sample_idx, sample_name in enumerate(self.sample_names)
+        }
+
+    @classmethod
+    def build(cls, label_dir, sample_names):
+        """Reads the label files of the samples into a store"""
+        all_labels = [
+            read_label_array(label_dir, int(sample_name))
+            for sample_name in sample_names
+        ]
+        offsets = np.zeros(len(sample_names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(labels) for labels in all_labels])
+
+        if all_labels:
+            labels = np.concatenate(all_labels)
+        else:
+            labels = np.zeros(0, dtype=LABEL_DTYPE)
+
+        return cls(sample_names, labels, offsets)
+
+    @classmethod
+    def load_or_build(cls, cache_path, label_dir, sample_names):
+        """Loads the store from its cache file, or builds and caches it when
+        the cache is missing or stale.
+
+        The cache is stale when it was built for other samples or another
+        label directory, or when files were added to or removed from the label
+        directory since.
+
+        Args:
+            cache_path: path of the .npz cache file
+            label_dir: directory of the label files
+            sample_names: samples to store
+
+        Returns:
+            KittiLabelStore
+        """
+        sample_names = np.asarray(sample_names)
+        label_dir = os.path.realpath(label_dir)
+
+        if os.path.exists(cache_path) and os.path.getmtime(
+            cache_path
+        ) >= os.path.getmtime(label_dir):
+            with np.load(cache_path) as cache:
+                if str(cache["label_dir"]) == label_dir and np.array_equal(
+                    cache["sample_names"], sample_names
+                ):
+                    return cls(sample_names, cache["labels"], cache["offsets"])
+
+        label_store = cls.build(label_dir, sample_names)
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # Write to a temporary file first, so concurrent readers never see a
+        # partial cache
+        tmp_cache_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(tmp_cache_path, "wb") as cache_file:
+            np.savez(
+                cache_file,
+                label_dir=np.array(label_dir),
+                sample_names=label_store.sample_names,
+                labels=label_store.labels,
+                offsets=label_store.offsets,
+            )
+        os.replace(tmp_cache_path, cache_path)
+
+        return label_store
+
+    def __contains__(self, sample_name):
+        return sample_name in self._sample_indices
+
+    def get_labels(self, sample_name):
+        """Returns the (N,) label array of a sample, a view into the store"""
+        sample_idx = self._sample_indices[sample_name]
+        start, end = self.offsets[sample_idx : sample_idx + 2]
+        return self.labels[start:end]
@@ -0,0 +1,92 @@
+"""KittiLabelStore unit test module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import hf.tests as tests
+
+from hf.builders.dataset_builder import DatasetBuilder
+from hf.core import box_3d_encoder
+from hf.core import obj_utils
+from hf.datasets.kitti import kitti_labels
+from hf.datasets.kitti.kitti_labels import KittiLabelStore
+
+
+class KittiLabelsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        dataset_config = DatasetBuilder.copy_config(DatasetBuilder.KITTI_UNITTEST)
+        dataset_config.dataset_dir = tests.test_path() + "/datasets/Kitti/object"
+        cls.dataset = DatasetBuilder.build_kitti_dataset(dataset_config)
+        cls.label_dir = cls.dataset.label_dir
+        cls.sample_names = cls.dataset.load_sample_names("trainval")
+
+        cls.cache_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cache_dir)
+
+    def test_same_as_object_labels(self):
+        cache_path = os.path.join(self.cache_dir, "trainval.npz")
+        label_store = KittiLabelStore.load_or_build(
+            cache_path, self.label_dir, self.sample_names
+        )
+        self.assertTrue(os.path.exists(cache_path))
+
+        # Loaded from the cache
+        cached_label_store = KittiLabelStore.load_or_build(
+            cache_path, self.label_dir, self.sample_names
+        )
+        np.testing.assert_array_equal(cached_label_store.labels, label_store.labels)
+
+        for sample_name in self.sample_names:
+            obj_labels = obj_utils.read_labels(self.label_dir, int(sample_name))
+            obj_labels = [] if obj_labels is None else obj_labels
+            labels = cached_label_store.get_labels(sample_name)
+
+            self.assertEqual(len(labels), len(obj_labels))
+            if len(obj_labels) == 0:
+                continue
+
+            np.testing.assert_array_equal(
+                kitti_labels.labels_to_boxes_3d(labels),
+                [box_3d_encoder.object_label_to_box_3d(obj) for obj in obj_labels],
+            )
+            self.assertEqual(list(labels["type"]), [obj.type for obj in obj_labels])
+
+    def test_filter_label_array(self):
+        kitti_utils = self.dataset.kitti_utils
+        label_store = KittiLabelStore.build(self.label_dir, self.sample_names)
+        classes = ["Car", "Pedestrian", "Cyclist"]
+
+        for sample_name in self.sample_names:
+            obj_labels = obj_utils.read_labels(self.label_dir, int(sample_name))
+            if obj_labels is None:
+                continue
+            labels = label_store.get_labels(sample_name)
+
+            for difficulty in [None, 0, 1, 2]:
+                for max_occlusion in [None, 1]:
+                    expected_labels = kitti_utils.filter_labels(
+                        obj_labels, classes, difficulty, max_occlusion
+                    )
+                    filtered_labels = kitti_utils.filter_label_array(
+                        labels, classes, difficulty, max_occlusion
+                    )
+                    self.assertEqual(
+                        list(filtered_labels["type"]),
+                        [obj.type for obj in expected_labels],
+                    )
+                    np.testing.assert_array_equal(
+                        filtered_labels["t"],
+                        np.reshape([obj.t for obj in expected_labels], (-1, 3)),
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
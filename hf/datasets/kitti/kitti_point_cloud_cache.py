@@ -0,0 +1,101 @@
+"""On-disk cache of the camera field of view point clouds of the samples.
+
+Projecting a velodyne scan into the image and keeping the points inside of it
+only depends on the scan, the calibration and the image size, so the result
+is stored once per sample and image shape as an (N, 4) [x, y, z, i] .npy file
+in rect camera coordinates. The files are memory mapped on read, and rebuilt
+when they are older than any of their source files.
+"""
+
+import os
+
+import numpy as np
+
+POINT_CLOUD_CACHE_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+class PointCloudCache:
+    """Cache of (points_rect, points_intensity) per sample and image shape"""
+
+    def __init__(self, cache_dir, dtype="float32"):
+        """
+        Args:
+            cache_dir: directory of the cache files
+            dtype: storage type of the points, 'float32' or 'float16'
+        """
+        if dtype not in POINT_CLOUD_CACHE_DTYPES:
+            raise ValueError(
+                "Invalid point cloud cache dtype {}, not in {}".format(
+                    dtype, sorted(POINT_CLOUD_CACHE_DTYPES)
+                )
+            )
+
+        self.cache_dir = cache_dir
+        self.dtype = np.dtype(POINT_CLOUD_CACHE_DTYPES[dtype])
+
+    def get_file_path(self, sample_name, image_shape):
+        return os.path.join(
+            self.cache_dir,
+            "{}x{}".format(image_shape[0], image_shape[1]),
+            "{}.npy".format(sample_name),
+        )
+
+    def get_point_cloud(self, sample_name, image_shape, source_paths, compute_fn):
+        """Returns the cached point cloud of a sample, computing and caching
+        it on a miss
+
+        Args:
+            sample_name: sample name, e.g. '000123'
+            image_shape: image dimensions (h, w)
+            source_paths: files the point cloud is computed from, the cache
+                file is rebuilt when any of them is newer
+            compute_fn: function returning (points_rect, points_intensity)
+
+        Returns:
+            points_rect: (N, 3) float32 points in rect camera coordinates
+            points_intensity: (N, 1) float32 intensities
+            Both are read-only views of the memory mapped file when the
+                cache is stored as float32
+        """
+        cache_path = self.get_file_path(sample_name, image_shape)
+
+        point_cloud = self._load(cache_path, source_paths)
+        if point_cloud is None:
+            points_rect, points_intensity = compute_fn()
+            point_cloud = np.hstack([points_rect, points_intensity]).astype(self.dtype)
+            self._save(cache_path, point_cloud)
+
+        if point_cloud.dtype != np.float32:
+            point_cloud = point_cloud.astype(np.float32)
+
+        return point_cloud[:, 0:3], point_cloud[:, 3:4]
+
+    def _load(self, cache_path, source_paths):
+        """Memory maps a cache file, returns None when it is missing, stale
+        or stored with another dtype"""
+        if not os.path.exists(cache_path):
+            return None
+
+        cache_mtime = os.path.getmtime(cache_path)
+        if any(os.path.getmtime(path) > cache_mtime for path in source_paths):
+            return None
+
+        try:
+            point_cloud = np.load(cache_path, mmap_mode="r")
+        except ValueError:
+            # Empty arrays cannot be memory mapped
+            point_cloud = np.load(cache_path)
+
+        if point_cloud.dtype != self.dtype:
+            return None
+        return point_cloud
+
+    def _save(self, cache_path, point_cloud):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        # Write to a temporary file first, loader workers may read or write
+        # the same sample concurrently
+        tmp_cache_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(tmp_cache_path, "wb") as cache_file:
+            np.save(cache_file, point_cloud)
+        os.replace(tmp_cache_path, cache_path)
@@ -0,0 +1,94 @@
+"""PointCloudCache unit test module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import hf.tests as tests
+
+from hf.builders.dataset_builder import DatasetBuilder
+from hf.datasets.kitti.kitti_point_cloud_cache import PointCloudCache
+
+
+class PointCloudCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        dataset_config = DatasetBuilder.copy_config(DatasetBuilder.KITTI_UNITTEST)
+        dataset_config.dataset_dir = tests.test_path() + "/datasets/Kitti/object"
+        cls.dataset = DatasetBuilder.build_kitti_dataset(dataset_config)
+        cls.kitti_utils = cls.dataset.kitti_utils
+
+        cls.image_shape = (375, 1242)
+        cls.sample_name = "000001"
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.dataset.point_cloud_cache = None
+        shutil.rmtree(self.cache_dir)
+
+    def test_same_as_projected(self):
+        expected_pts, expected_intensity = self.kitti_utils.get_point_cloud(
+            int(self.sample_name), self.image_shape
+        )
+
+        self.dataset.point_cloud_cache = PointCloudCache(self.cache_dir)
+        for _ in range(2):
+            pts, intensity = self.kitti_utils.get_point_cloud(
+                int(self.sample_name), self.image_shape
+            )
+            np.testing.assert_array_equal(pts, expected_pts)
+            np.testing.assert_array_equal(intensity, expected_intensity)
+
+        self.assertTrue(
+            os.path.exists(
+                self.dataset.point_cloud_cache.get_file_path(
+                    self.sample_name, self.image_shape
+                )
+            )
+        )
+
+    def test_float16(self):
+        expected_pts, expected_intensity = self.kitti_utils.get_point_cloud(
+            int(self.sample_name), self.image_shape
+        )
+
+        self.dataset.point_cloud_cache = PointCloudCache(self.cache_dir, "float16")
+        pts, intensity = self.kitti_utils.get_point_cloud(
+            int(self.sample_name), self.image_shape
+        )
+        self.assertEqual(pts.dtype, np.float32)
+        np.testing.assert_allclose(pts, expected_pts, rtol=1e-3, atol=1e-3)
+        np.testing.assert_allclose(intensity, expected_intensity, atol=1e-3)
+
+    def test_stale_cache_is_rebuilt(self):
+        cache = PointCloudCache(self.cache_dir)
+        source_path = os.path.join(self.cache_dir, "source")
+        open(source_path, "w").close()
+
+        def compute_fn(value):
+            return lambda: (np.full((2, 3), value), np.full((2, 1), value))
+
+        cache.get_point_cloud("000000", self.image_shape, [source_path], compute_fn(1))
+        pts, _ = cache.get_point_cloud(
+            "000000", self.image_shape, [source_path], compute_fn(2)
+        )
+        np.testing.assert_array_equal(pts, np.full((2, 3), 1))
+
+        # Touching the source invalidates the cached file
+        cache_path = cache.get_file_path("000000", self.image_shape)
+        cache_mtime = os.path.getmtime(cache_path)
+        os.utime(source_path, (cache_mtime + 10, cache_mtime + 10))
+
+        pts, _ = cache.get_point_cloud(
+            "000000", self.image_shape, [source_path], compute_fn(3)
+        )
+        np.testing.assert_array_equal(pts, np.full((2, 3), 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
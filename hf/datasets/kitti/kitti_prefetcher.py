@@ -0,0 +1,296 @@
+"""Multi-process batch prefetching for KittiDataset."""
+
+import collections
+import multiprocessing
+import queue
+import traceback
+
+import numpy as np
+
+from hf.core import constants
+
+
+def _worker_loop(dataset, seed_sequence, load_kwargs, task_queue, result_queue):
+    """Loads the sample chunks sent by the prefetcher until a None task
+    is received.
+
+    Each worker seeds its own numpy random stream from seed_sequence, so the
+    point sampling and augmentations of a run are reproducible for a given
+    seed.
+    """
+    np.random.seed(seed_sequence.generate_state(4))
+
+    while True:
+        chunk = task_queue.get()
+        if chunk is None:
+            # Unconsumed results are discarded, don't block on flushing them
+            result_queue.cancel_join_thread()
+            break
+        try:
+            # The dataset is a private copy, so the sample list can be
+            # replaced to load the chunk with the regular loading methods
+            dataset.sample_list = chunk
+            samples = dataset.load_samples(np.arange(len(chunk)), **load_kwargs)
+            result_queue.put((True, samples))
+        except Exception:
+            result_queue.put((False, traceback.format_exc()))
+
+
+class KittiPrefetcher:
+    """Loads batches of a KittiDataset ahead of time in worker processes.
+
+    The prefetcher keeps its own copy of the epoch pointers to schedule
+    chunks of `batch_size` samples in the same order as
+    `KittiDataset.next_batch`. Chunk k is sent to worker k % num_workers and
+    results are consumed in scheduling order, so the batches do not depend on
+    process timing.
+
+    Skipped samples are refilled from the following chunk, and the samples of
+    that chunk beyond a full batch start the next batch. The batches are then
+    the same as the ones of the sequential `remain` refill. When a batch is
+    handed out, the dataset's `_index_in_epoch`, `epochs_completed` and
+    `sample_list` are set to the state right after its last sample, as
+    `KittiDataset.next_batch` leaves them.
+    """
+
+    def __init__(
+        self, dataset, batch_size, shuffle, num_workers, queue_size=4, seed=0, **kwargs
+    ):
+        """
+        Args:
+            dataset: KittiDataset to load samples from
+            batch_size: number of samples in a batch
+            shuffle: whether to shuffle the samples after an epoch is completed
+            num_workers: number of loader processes
+            queue_size: maximum number of chunks loaded ahead
+            seed: base seed of the per-worker random streams, which also
+                depend on the epoch pointers and on the number of worker
+                restarts
+            kwargs: arguments passed to KittiDataset.load_samples
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.num_workers = num_workers
+        self.queue_size = max(queue_size, 1)
+        self.seed = seed
+        self.load_kwargs = kwargs
+
+        # Scheduling pointers, ahead of the dataset's by the loaded chunks
+        self._sample_list = dataset.sample_list
+        self._index_in_epoch = dataset._index_in_epoch
+        self._epochs_completed = dataset.epochs_completed
+
+        self._num_scheduled = 0
+        self._num_consumed = 0
+        self._pending_chunks = collections.deque()
+        self._leftover_samples = []
+        self._num_starts = 0
+
+        self._workers = None
+        self._task_queues = None
+        self._result_queues = None
+
+    def _start_workers(self):
+        # Workers are spawned, forking would copy the session and threads of
+        # the calling process. They load from a pickled copy of the dataset
+        context = multiprocessing.get_context("spawn")
+
+        # Restarted workers, or the workers of a prefetcher resuming from
+        # other pointers, don't repeat the random streams of earlier workers
+        seed_sequence = np.random.SeedSequence(
+            [
+                self.seed % (2 ** 32),
+                self._epochs_completed,
+                self._index_in_epoch,
+                self._num_starts,
+            ]
+        )
+        self._num_starts += 1
+
+        self._task_queues = []
+        self._result_queues = []
+        self._workers = []
+        for worker_seed_sequence in seed_sequence.spawn(self.num_workers):
+            task_queue = context.Queue()
+            result_queue = context.Queue()
+            worker = context.Process(
+                target=_worker_loop,
+                args=(
+                    self.dataset,
+                    worker_seed_sequence,
+                    self.load_kwargs,
+                    task_queue,
+                    result_queue,
+                ),
+            )
+            worker.daemon = True
+            worker.start()
+            self._task_queues.append(task_queue)
+            self._result_queues.append(result_queue)
+            self._workers.append(worker)
+
+    def _shuffle_samples(self):
+        perm = np.arange(len(self._sample_list))
+        np.random.shuffle(perm)
+        self._sample_list = self._sample_list[perm]
+
+    def _next_chunk(self):
+        """Advances the scheduling pointers by one batch, following the
+        epoch and shuffle rules of KittiDataset.next_batch.
+
+        Returns:
+            chunk: array of Sample objects to load
+            start_state: (index_in_epoch, epochs_completed, sample_list) of
+                the first sample of the chunk
+        """
+        num_samples = len(self._sample_list)
+        start = self._index_in_epoch
+
+        # Shuffle only for the first epoch
+        if self._epochs_completed == 0 and start == 0 and self.shuffle:
+            self._shuffle_samples()
+        start_state = (start, self._epochs_completed, self._sample_list)
+
+        if start + self.batch_size >= num_samples:
+            # Finished epoch
+            self._epochs_completed += 1
+            rest_of_epoch = self._sample_list[start:num_samples]
+
+            if self.shuffle:
+                self._shuffle_samples()
+
+            self._index_in_epoch = self.batch_size - (num_samples - start)
+            chunk = np.concatenate(
+                [rest_of_epoch, self._sample_list[0 : self._index_in_epoch]]
+            )
+        else:
+            self._index_in_epoch += self.batch_size
+            chunk = self._sample_list[start : self._index_in_epoch]
+
+        return chunk, start_state
+
+    def _fill_queue(self):
+        while self._num_scheduled - self._num_consumed < self.queue_size:
+            chunk, start_state = self._next_chunk()
+            worker_id = self._num_scheduled % self.num_workers
+            self._task_queues[worker_id].put(chunk)
+            end_state = (
+                self._index_in_epoch,
+                self._epochs_completed,
+                self._sample_list,
+            )
+            self._pending_chunks.append((chunk, start_state, end_state))
+            self._num_scheduled += 1
+
+    def _get_next_chunk_samples(self):
+        """Retrieves the samples of the next scheduled chunk.
+
+        Returns:
+            samples: the loaded samples of the chunk
+            chunk: (chunk, start_state, end_state) of the chunk
+        """
+        worker_id = self._num_consumed % self.num_workers
+        while True:
+            try:
+                success, result = self._result_queues[worker_id].get(timeout=5.0)
+                break
+            except queue.Empty:
+                if not self._workers[worker_id].is_alive():
+                    self.close()
+                    raise RuntimeError(
+                        "Loader worker {} exited unexpectedly".format(worker_id)
+                    )
+
+        self._num_consumed += 1
+        chunk = self._pending_chunks.popleft()
+
+        if not success:
+            self.close()
+            raise RuntimeError(
+                "Loader worker {} failed:\n{}".format(worker_id, result)
+            )
+
+        return result, chunk
+
+    @staticmethod
+    def _state_after(chunk, used_samples):
+        """Returns the (index_in_epoch, epochs_completed, sample_list) state
+        right after the last of used_samples, the first loaded samples of
+        chunk."""
+        chunk_samples, start_state, end_state = chunk
+
+        # Skipped samples are missing from the loaded samples
+        num_used = 0
+        for sample in used_samples:
+            sample_name = sample[constants.KEY_SAMPLE_NAME]
+            while chunk_samples[num_used].name != sample_name:
+                num_used += 1
+            num_used += 1
+
+        start, epochs_completed, sample_list = start_state
+        if start + num_used >= len(sample_list):
+            # Same epoch change as the chunk
+            return (
+                start + num_used - len(sample_list),
+                end_state[1],
+                end_state[2],
+            )
+        return start + num_used, epochs_completed, sample_list
+
+    def next_batch(self):
+        """Retrieves the next prefetched batch.
+
+        Returns:
+            (batch_data, sample_names) as returned by
+                KittiDataset.collate_batch
+        """
+        if self._workers is None:
+            self._start_workers()
+
+        samples_in_batch = self._leftover_samples
+        while len(samples_in_batch) < self.batch_size:
+            self._fill_queue()
+            chunk_samples, chunk = self._get_next_chunk_samples()
+            samples_in_batch.extend(chunk_samples)
+
+        # Samples beyond a full batch (after skipped samples were refilled)
+        # start the next batch, they all come from the last chunk
+        self._leftover_samples = samples_in_batch[self.batch_size :]
+        num_used = len(chunk_samples) - len(self._leftover_samples)
+        (
+            self.dataset._index_in_epoch,
+            self.dataset.epochs_completed,
+            self.dataset.sample_list,
+        ) = self._state_after(chunk, chunk_samples[:num_used])
+        self._fill_queue()
+
+        return self.dataset.collate_batch(samples_in_batch[0 : self.batch_size])
+
+    def close(self):
+        """Stops the worker processes. Chunks and samples loaded ahead are
+        discarded, and loaded again if the prefetcher is restarted."""
+        if self._workers is None:
+            return
+
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+
+        self._workers = None
+        self._task_queues = None
+        self._result_queues = None
+
+        # Restart scheduling from the last batch handed out
+        self._sample_list = self.dataset.sample_list
+        self._index_in_epoch = self.dataset._index_in_epoch
+        self._epochs_completed = self.dataset.epochs_completed
+        self._num_scheduled = self._num_consumed
+        self._pending_chunks.clear()
+        self._leftover_samples = []
@@ -0,0 +1,88 @@
+"""KittiPrefetcher unit test module."""
+
+import unittest
+
+import hf.tests as tests
+
+from hf.builders.dataset_builder import DatasetBuilder
+
+
+class KittiPrefetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fake_kitti_dir = tests.test_path() + "/datasets/Kitti/object"
+
+    def get_fake_dataset(self, num_loader_workers):
+        dataset_config = DatasetBuilder.copy_config(DatasetBuilder.KITTI_UNITTEST)
+        dataset_config.data_split = "val"
+        dataset_config.dataset_dir = self.fake_kitti_dir
+        dataset_config.num_loader_workers = num_loader_workers
+        dataset_config.loader_queue_size = 2
+
+        return DatasetBuilder.build_kitti_dataset(dataset_config)
+
+    def test_same_batches_as_sequential(self):
+        sequential_dataset = self.get_fake_dataset(0)
+        prefetch_dataset = self.get_fake_dataset(2)
+
+        try:
+            for _ in range(5):
+                _, expected_names = sequential_dataset.next_batch(
+                    2, False, model="rpn", pc_sample_pts=16384
+                )
+                _, sample_names = prefetch_dataset.next_batch(
+                    2, False, model="rpn", pc_sample_pts=16384
+                )
+                self.assertEqual(sample_names, expected_names)
+
+                # The pointers follow the batches handed out
+                self.assertEqual(
+                    prefetch_dataset._index_in_epoch,
+                    sequential_dataset._index_in_epoch,
+                )
+                self.assertEqual(
+                    prefetch_dataset.epochs_completed,
+                    sequential_dataset.epochs_completed,
+                )
+        finally:
+            prefetch_dataset.close_prefetcher()
+
+    def test_restart(self):
+        sequential_dataset = self.get_fake_dataset(0)
+        prefetch_dataset = self.get_fake_dataset(2)
+
+        try:
+            for batch_size in [2, 3, 2]:
+                # Changing the batch size restarts the prefetcher, the samples
+                # loaded ahead are loaded again
+                for _ in range(3):
+                    _, expected_names = sequential_dataset.next_batch(
+                        batch_size, False, model="rpn", pc_sample_pts=16384
+                    )
+                    _, sample_names = prefetch_dataset.next_batch(
+                        batch_size, False, model="rpn", pc_sample_pts=16384
+                    )
+                    self.assertEqual(sample_names, expected_names)
+        finally:
+            prefetch_dataset.close_prefetcher()
+
+    def test_epoch_pointers(self):
+        dataset = self.get_fake_dataset(2)
+
+        try:
+            # The workers load ahead, but the pointers follow the batches
+            # handed out
+            dataset.next_batch(2, False, model="rpn", pc_sample_pts=16384)
+            self.assertEqual(dataset.epochs_completed, 0)
+            self.assertGreaterEqual(dataset._index_in_epoch, 2)
+
+            current_epoch = dataset.epochs_completed
+            while current_epoch == dataset.epochs_completed:
+                dataset.next_batch(2, False, model="rpn", pc_sample_pts=16384)
+            self.assertEqual(dataset.epochs_completed, 1)
+        finally:
+            dataset.close_prefetcher()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,333 @@
+"""Packed, memory-mapped storage of a KITTI data split.
+
+A split is packed into a few large files inside `<shard_dir>/<data_split>`:
+
+    names.npy           (N,) sample names
+    points.npy          (P, 4) float32 velodyne points [x, y, z, i] of all
+                        samples, back to back
+    point_offsets.npy   (N + 1,) int64 row offsets into points.npy
+    calib.npy           (N,) structured array of calibration matrices
+    labels.npy          (L,) structured array of object labels
+    label_offsets.npy   (N + 1,) int64 row offsets into labels.npy
+    images.bin          encoded (png) images, back to back
+    image_offsets.npy   (N + 1,) int64 byte offsets into images.bin
+
+Reading a sample then only slices arrays that are already memory mapped,
+instead of opening 4+ small files.
+"""
+
+import argparse
+import os
+import struct
+
+import cv2
+import numpy as np
+
+from hf.core import calib_utils
+from hf.core import obj_utils
+from hf.datasets.kitti.kitti_labels import KittiLabelStore
+from hf.datasets.kitti.kitti_labels import LABEL_DTYPE
+from hf.datasets.kitti.kitti_labels import read_label_array
+
+CALIB_DTYPE = np.dtype(
+    [
+        ("p0", np.float64, (3, 4)),
+        ("p1", np.float64, (3, 4)),
+        ("p2", np.float64, (3, 4)),
+        ("p3", np.float64, (3, 4)),
+        ("r0_rect", np.float64, (3, 3)),
+        ("tr_velodyne_to_cam", np.float64, (3, 4)),
+    ]
+)
+
+# Images start with this signature, followed by the IHDR chunk holding
+# their width and height
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _split_dir(shard_dir, data_split):
+    return os.path.join(os.path.expanduser(shard_dir), data_split)
+
+
+def pack_split(dataset, shard_dir):
+    """Packs the velodyne points, calibrations, labels and images of a
+    dataset's split into shard files.
+
+    Args:
+        dataset: KittiDataset, its data_split is packed
+        shard_dir: output directory, the split is written to
+            shard_dir/data_split
+    """
+    output_dir = _split_dir(shard_dir, dataset.data_split)
+    os.makedirs(output_dir, exist_ok=True)
+
+    sample_names = dataset.load_sample_names(dataset.data_split)
+    num_samples = len(sample_names)
+
+    # The velodyne files hold float32 [x, y, z, i] rows
+    point_counts = [
+        os.path.getsize(dataset.get_velodyne_path(sample_name)) // 16
+        for sample_name in sample_names
+    ]
+    point_offsets = np.concatenate([[0], np.cumsum(point_counts)]).astype(np.int64)
+    points = np.lib.format.open_memmap(
+        os.path.join(output_dir, "points.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(int(point_offsets[-1]), 4),
+    )
+
+    label_offsets = np.zeros(num_samples + 1, dtype=np.int64)
+    image_offsets = np.zeros(num_samples + 1, dtype=np.int64)
+    calibs = np.zeros(num_samples, dtype=CALIB_DTYPE)
+    all_labels = []
+
+    with open(os.path.join(output_dir, "images.bin"), "wb") as images_file:
+        for sample_idx, sample_name in enumerate(sample_names):
+            img_idx = int(sample_name)
+
+            # Points
+            start, end = point_offsets[sample_idx : sample_idx + 2]
+            with open(dataset.get_velodyne_path(sample_name), "rb") as fid:
+                points[start:end] = np.fromfile(fid, np.single).reshape(-1, 4)
+
+            # Calibration
+            frame_calib = calib_utils.read_calibration(dataset.calib_dir, img_idx)
+            for field in CALIB_DTYPE.names:
+                calibs[field][sample_idx] = getattr(frame_calib, field)
+
+            # Labels
+            num_labels = 0
+            if dataset.has_labels:
+                labels = read_label_array(dataset.label_dir, img_idx)
+                all_labels.append(labels)
+                num_labels = len(labels)
+            label_offsets[sample_idx + 1] = label_offsets[sample_idx] + num_labels
+
+            # Images are stored encoded, as read from disk
+            with open(dataset.get_rgb_image_path(sample_name), "rb") as fid:
+                image_bytes = fid.read()
+            images_file.write(image_bytes)
+            image_offsets[sample_idx + 1] = image_offsets[sample_idx] + len(
+                image_bytes
+            )
+
+    points.flush()
+    del points
+
+    if all_labels:
+        labels = np.concatenate(all_labels)
+    else:
+        labels = np.zeros(0, dtype=LABEL_DTYPE)
+
+    np.save(os.path.join(output_dir, "names.npy"), sample_names)
+    np.save(os.path.join(output_dir, "point_offsets.npy"), point_offsets)
+    np.save(os.path.join(output_dir, "calib.npy"), calibs)
+    np.save(os.path.join(output_dir, "labels.npy"), labels)
+    np.save(os.path.join(output_dir, "label_offsets.npy"), label_offsets)
+    np.save(os.path.join(output_dir, "image_offsets.npy"), image_offsets)
+
+
+class KittiShards:
+    """Reads samples from a split packed with pack_split.
+
+    All arrays are memory mapped, points are returned as views into the
+    mapped file.
+    """
+
+    def __init__(self, shard_dir, data_split):
+        """
+        Args:
+            shard_dir: directory the splits were packed into
+            data_split: split to read, e.g. 'train'
+        """
+        split_dir = _split_dir(shard_dir, data_split)
+        if not os.path.isdir(split_dir):
+            raise FileNotFoundError("Shard split does not exist: {}".format(split_dir))
+        self.shard_dir = shard_dir
+        self.data_split = data_split
+        self.split_dir = split_dir
+
+        def load(file_name):
+            return np.load(os.path.join(split_dir, file_name), mmap_mode="r")
+
+        self.sample_names = np.load(os.path.join(split_dir, "names.npy"))
+        self._sample_indices = {
+            name: sample_idx for sample_idx, name in enumerate(self.sample_names)
+        }
+
+        self._points = load("points.npy")
+        self._point_offsets = np.load(os.path.join(split_dir, "point_offsets.npy"))
+        self._calibs = load("calib.npy")
+        self._labels = load("labels.npy")
+        self._label_offsets = np.load(os.path.join(split_dir, "label_offsets.npy"))
+        self._images = np.memmap(
+            os.path.join(split_dir, "images.bin"), dtype=np.uint8, mode="r"
+        )
+        self._image_offsets = np.load(os.path.join(split_dir, "image_offsets.npy"))
+
+    def __reduce__(self):
+        # Pickled copies map the files again instead of copying their content
+        return (KittiShards, (self.shard_dir, self.data_split))
+
+    def _sample_idx(self, img_idx):
+        sample_name = "%06d" % img_idx
+        if sample_name not in self._sample_indices:
+            raise KeyError("Sample {} is not in the shards".format(sample_name))
+        return self._sample_indices[sample_name]
+
+    def memmap_lidar(self, img_idx):
+        """Returns the lidar points of a sample, as calib_utils.memmap_lidar
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            xyzi: (N, 4) read-only view into the memory mapped points
+        """
+        sample_idx = self._sample_idx(img_idx)
+        start, end = self._point_offsets[sample_idx : sample_idx + 2]
+        return self._points[start:end]
+
+    def read_lidar(self, img_idx):
+        """Returns the lidar points of a sample, as calib_utils.read_lidar
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            x, y, z, i: read-only views into the memory mapped points
+        """
+        xyzi = self.memmap_lidar(img_idx)
+        return xyzi[:, 0], xyzi[:, 1], xyzi[:, 2], xyzi[:, 3]
+
+    def read_calibration(self, img_idx):
+        """Returns the calibration of a sample, as calib_utils.read_calibration
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            frame_calib: FrameCalibrationData, the matrices are copies and
+                can be modified
+        """
+        calib = self._calibs[self._sample_idx(img_idx)]
+
+        frame_calib = calib_utils.FrameCalibrationData()
+        for field in CALIB_DTYPE.names:
+            setattr(frame_calib, field, np.array(calib[field]))
+        return frame_calib
+
+    def read_labels(self, img_idx):
+        """Returns the labels of a sample, as obj_utils.read_labels
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            obj_list: list of ObjectLabel, None if the sample has no labels
+        """
+        sample_idx = self._sample_idx(img_idx)
+        start, end = self._label_offsets[sample_idx : sample_idx + 2]
+        if start == end:
+            return None
+
+        obj_list = []
+        for label in self._labels[start:end]:
+            obj = obj_utils.ObjectLabel()
+            for field in LABEL_DTYPE.names:
+                if field == "type":
+                    obj.type = str(label[field])
+                elif field == "t":
+                    obj.t = tuple(float(t) for t in label[field])
+                else:
+                    setattr(obj, field, float(label[field]))
+            obj_list.append(obj)
+        return obj_list
+
+    def get_label_store(self):
+        """Returns the labels of the split as a KittiLabelStore"""
+        return KittiLabelStore(self.sample_names, self._labels, self._label_offsets)
+
+    def read_image(self, img_idx):
+        """Decodes the image of a sample, as cv2.imread
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            image: (H, W, 3) BGR image
+        """
+        sample_idx = self._sample_idx(img_idx)
+        start, end = self._image_offsets[sample_idx : sample_idx + 2]
+        return cv2.imdecode(np.asarray(self._images[start:end]), cv2.IMREAD_COLOR)
+
+    def read_image_size(self, img_idx):
+        """Returns the size of a sample's image, read from the png header
+        without decoding the image
+
+        Args:
+            img_idx: image index
+
+        Returns:
+            image_size: (w, h) image size, as PIL Image.size
+        """
+        sample_idx = self._sample_idx(img_idx)
+        start, end = self._image_offsets[sample_idx : sample_idx + 2]
+        header = bytes(self._images[start : min(start + 24, end)])
+        if header[0:8] == PNG_SIGNATURE and header[12:16] == b"IHDR":
+            return struct.unpack(">II", header[16:24])
+
+        image = self.read_image(img_idx)
+        return image.shape[1], image.shape[0]
+
+
+def main():
+    """Packs the split of a dataset config into shards.
+
+    Example:
+        python hf/datasets/kitti/kitti_shards.py \
+            --pipeline_config hf/configs/rpn_car.config --data_split train \
+            --shard_dir ~/Kitti/object/shards
+    """
+    import hf.builders.config_builder_util as config_builder
+    from hf.builders.dataset_builder import DatasetBuilder
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pipeline_config",
+        type=str,
+        dest="pipeline_config_path",
+        required=True,
+        help="Path to the pipeline config",
+    )
+    parser.add_argument(
+        "--data_split",
+        type=str,
+        dest="data_split",
+        required=True,
+        help="Data split to pack",
+    )
+    parser.add_argument(
+        "--shard_dir",
+        type=str,
+        dest="shard_dir",
+        required=True,
+        help="Output directory of the shards",
+    )
+    args = parser.parse_args()
+
+    _, _, _, dataset_config = config_builder.get_configs_from_pipeline_file(
+        args.pipeline_config_path, is_training=False
+    )
+    dataset_config.data_split = args.data_split
+    # Read the per-file layout
+    dataset_config.shard_dir = ""
+
+    dataset = DatasetBuilder.build_kitti_dataset(dataset_config, use_defaults=False)
+    pack_split(dataset, args.shard_dir)
+    print("Packed {} into {}".format(args.data_split, args.shard_dir))
+
+
+if __name__ == "__main__":
+    main()
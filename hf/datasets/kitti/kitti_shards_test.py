@@ -0,0 +1,81 @@
+"""KittiShards unit test module."""
+
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+import hf.tests as tests
+
+from hf.builders.dataset_builder import DatasetBuilder
+from hf.core import calib_utils
+from hf.core import obj_utils
+from hf.datasets.kitti import kitti_shards
+
+
+class KittiShardsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        dataset_config = DatasetBuilder.copy_config(DatasetBuilder.KITTI_UNITTEST)
+        dataset_config.data_split = "trainval"
+        dataset_config.dataset_dir = tests.test_path() + "/datasets/Kitti/object"
+        cls.dataset = DatasetBuilder.build_kitti_dataset(dataset_config)
+
+        cls.shard_dir = tempfile.mkdtemp()
+        kitti_shards.pack_split(cls.dataset, cls.shard_dir)
+        cls.shards = kitti_shards.KittiShards(cls.shard_dir, "trainval")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.shard_dir)
+
+    def test_same_as_files(self):
+        dataset = self.dataset
+
+        for sample_name in self.shards.sample_names:
+            img_idx = int(sample_name)
+
+            expected_lidar = calib_utils.read_lidar(dataset.velo_dir, img_idx)
+            lidar = self.shards.read_lidar(img_idx)
+            for expected_values, values in zip(expected_lidar, lidar):
+                np.testing.assert_array_equal(values, expected_values)
+
+            expected_calib = calib_utils.read_calibration(dataset.calib_dir, img_idx)
+            calib = self.shards.read_calibration(img_idx)
+            np.testing.assert_array_equal(calib.p2, expected_calib.p2)
+            np.testing.assert_array_equal(calib.r0_rect, expected_calib.r0_rect)
+            np.testing.assert_array_equal(
+                calib.tr_velodyne_to_cam, expected_calib.tr_velodyne_to_cam
+            )
+
+            expected_labels = obj_utils.read_labels(dataset.label_dir, img_idx)
+            self.assertEqual(self.shards.read_labels(img_idx), expected_labels)
+
+            expected_image = cv2.imread(dataset.get_rgb_image_path(sample_name))
+            np.testing.assert_array_equal(
+                self.shards.read_image(img_idx), expected_image
+            )
+            self.assertEqual(
+                self.shards.read_image_size(img_idx),
+                (expected_image.shape[1], expected_image.shape[0]),
+            )
+
+    def test_pickle(self):
+        shards = pickle.loads(pickle.dumps(self.shards))
+
+        self.assertIsInstance(shards._points, np.memmap)
+        for sample_name in self.shards.sample_names:
+            np.testing.assert_array_equal(
+                shards.memmap_lidar(int(sample_name)),
+                self.shards.memmap_lidar(int(sample_name)),
+            )
+
+    def test_missing_sample(self):
+        self.assertRaises(KeyError, self.shards.read_calibration, 999999)
+
+
+if __name__ == "__main__":
+    unittest.main()
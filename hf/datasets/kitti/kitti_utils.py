@@ -2,6 +2,8 @@ import os
 
 import numpy as np
 
+from hf.core import calib_store
+from hf.core import calib_utils
 from hf.core import obj_utils
 
 from hf.core.label_cluster_utils import LabelClusterUtils
@@ -74,21 +76,54 @@ class KittiUtils(object):
         Returns:
             points_rect: (N, 3). The set of points in rect camera coordinates
             points_intensity: (N, 1). The intensity values of the point
+            Both may be read-only when the point cloud cache is enabled
         """
 
+        point_cloud_cache = self.dataset.point_cloud_cache
+        if point_cloud_cache is None:
+            return self._get_fov_point_cloud(img_idx, image_shape)
+
+        return point_cloud_cache.get_point_cloud(
+            "%06d" % img_idx,
+            image_shape,
+            self._get_point_cloud_sources(img_idx),
+            lambda: self._get_fov_point_cloud(img_idx, image_shape),
+        )
+
+    def _get_fov_point_cloud(self, img_idx, image_shape):
+        """Projects the velodyne scan of an image and keeps the points inside
+        of it, see get_point_cloud"""
         # wants im_size in (w, h) order
         im_size = [image_shape[1], image_shape[0]]
 
-        point_cloud = obj_utils.get_lidar_point_cloud(
-            img_idx, self.dataset.calib_dir, self.dataset.velo_dir, im_size=im_size
+        shards = self.dataset.shards
+        if shards is not None:
+            xyzi = shards.memmap_lidar(img_idx)
+        else:
+            xyzi = calib_utils.memmap_lidar(self.dataset.velo_dir, img_idx)
+        velo_to_rect, velo_to_image = self.dataset.get_velo_transforms(
+            "%06d" % img_idx
         )
 
-        points_rect, points_intensity = (
-            point_cloud[:, :-1],
-            point_cloud[:, -1].reshape(-1, 1),
+        points_rect, points_intensity = obj_utils.lidar_to_rect_fov(
+            xyzi, velo_to_rect, velo_to_image, im_size
         )
         return points_rect, points_intensity
 
+    def _get_point_cloud_sources(self, img_idx):
+        """Returns the files the point cloud of an image is computed from"""
+        shards = self.dataset.shards
+        if shards is not None:
+            return [
+                os.path.join(shards.split_dir, "points.npy"),
+                os.path.join(shards.split_dir, "calib.npy"),
+            ]
+
+        return [
+            self.dataset.velo_dir + "/%06d.bin" % img_idx,
+            self.dataset.calib_dir + "/%06d.txt" % img_idx,
+        ]
+
     def get_ground_plane(self, sample_name):
         """Reads the ground plane for the sample
 
@@ -98,8 +133,8 @@ class KittiUtils(object):
         Returns:
             ground_plane: ground plane coefficients
         """
-        ground_plane = obj_utils.get_road_plane(
-            int(sample_name), self.dataset.planes_dir
+        ground_plane = calib_store.get_road_plane(
+            self.dataset.planes_dir, int(sample_name)
         )
         return ground_plane
 
@@ -121,7 +156,7 @@ class KittiUtils(object):
             classes = self.dataset.classes
 
         objects = np.asanyarray(objects)
-        filter_mask = np.ones(len(objects), dtype=np.bool)
+        filter_mask = np.ones(len(objects), dtype=bool)
 
         for obj_idx in range(len(objects)):
             obj = objects[obj_idx]
@@ -142,6 +177,60 @@ class KittiUtils(object):
 
         return objects[filter_mask]
 
+    def filter_label_array(
+        self, labels, classes=None, difficulty=None, max_occlusion=None
+    ):
+        """Vectorized filter_labels, for label arrays of a KittiLabelStore
+
+        Args:
+            labels: (N,) label array
+            classes: (optional) classes to filter by, if None
+                all classes are used
+            difficulty: (optional) KITTI difficulty rating as integer
+            max_occlusion: (optional) maximum occlusion to filter objects
+
+        Returns:
+            filtered label array
+        """
+        if classes is None:
+            classes = self.dataset.classes
+
+        filter_mask = np.isin(labels["type"], classes)
+
+        # Filter by difficulty (occlusion, truncation, and height)
+        if difficulty is not None:
+            filter_mask &= labels["occlusion"] <= self.OCCLUSION[difficulty]
+            filter_mask &= labels["truncation"] <= self.TRUNCATION[difficulty]
+            filter_mask &= (labels["y2"] - labels["y1"]) >= self.HEIGHT[difficulty]
+
+        if max_occlusion:
+            filter_mask &= labels["occlusion"] <= max_occlusion
+
+        return labels[filter_mask]
+
+    def class_strs_to_indices(self, class_strs):
+        """Vectorized class_str_to_index
+
+        Args:
+            class_strs: (N,) object types
+
+        Returns:
+            (N,) int32 class indices, starting at 1
+        """
+        class_strs = np.asarray(class_strs)
+        class_indices = np.zeros(len(class_strs), dtype=np.int32)
+        for class_idx, class_str in enumerate(self.dataset.classes):
+            class_indices[class_strs == class_str] = class_idx + 1
+
+        invalid_classes = class_strs[class_indices == 0]
+        if len(invalid_classes) > 0:
+            raise ValueError(
+                "Invalid class string {}, not in {}".format(
+                    invalid_classes[0], self.dataset.classes
+                )
+            )
+        return class_indices
+
     def _check_difficulty(self, obj, difficulty):
         """This filters an object by difficulty.
         Args:
@@ -5,6 +5,7 @@ import unittest
 
 from hf.core import obj_utils as obj_utils
 from hf.builders.dataset_builder import DatasetBuilder
+from hf.datasets.kitti import kitti_labels
 
 
 class KittiUtilsTest(unittest.TestCase):
@@ -71,6 +72,23 @@ class KittiUtilsTest(unittest.TestCase):
             msg="Wrong number of labels after filtering",
         )
 
+    def test_filter_label_array(self):
+        sample_name = "000007"
+        obj_labels = obj_utils.read_labels(self.label_dir, int(sample_name))
+        labels = kitti_labels.read_label_array(self.label_dir, int(sample_name))
+
+        for difficulty in [None, 0, 1, 2]:
+            filtered_labels = self.dataset.kitti_utils.filter_labels(
+                obj_labels, difficulty=difficulty
+            )
+            filtered_array = self.dataset.kitti_utils.filter_label_array(
+                labels, difficulty=difficulty
+            )
+            self.assertEqual(
+                list(filtered_array["type"]),
+                [obj_label.type for obj_label in filtered_labels],
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,3 @@
+from hf.inference.fused_detector import FusedDetector
+
+__all__ = ["FusedDetector"]
@@ -0,0 +1,247 @@
+"""Runs the RPN and the RCNN of a detector in a single session.
+
+The RPN output tensors are mapped to the RCNN input placeholders inside of
+one graph, so that at test time the RPN features and proposals are never
+written to and read back from disk.
+"""
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.ops import variable_scope
+
+from hf.core import constants
+from hf.core import evaluator_utils
+from hf.core.models.rcnn_model import RcnnModel
+from hf.core.models.rpn_model import RpnModel
+
+RPN_SCOPE = "rpn"
+RCNN_SCOPE = "rcnn"
+# Name the frozen graphs are imported under
+FROZEN_GRAPH_SCOPE = "pointrcnn"
+
+# RPN input placeholders, keyed by the sample dict keys that feed them
+INPUT_TENSOR_NAMES = {
+    constants.KEY_POINT_CLOUD: "rpn/pc_input/{}:0".format(RpnModel.PL_PC_INPUTS),
+    constants.KEY_IMAGE_INPUT: "rpn/img_input/{}:0".format(RpnModel.PL_IMG_INPUT),
+    constants.KEY_STEREO_CALIB_P2: "rpn/sample_info/{}:0".format(
+        RpnModel.PL_CALIB_P2
+    ),
+}
+
+# RCNN input placeholders, keyed by the RPN tensors that replace them
+RPN_TO_RCNN_TENSOR_NAMES = {
+    "rpn/output_pts:0": "pl_rpn_feature/{}:0".format(RcnnModel.PL_RPN_PTS),
+    "rpn/output_fts:0": "pl_rpn_feature/{}:0".format(RcnnModel.PL_RPN_FTS),
+    "rpn/output_foreground_mask:0": "pl_rpn_feature/{}:0".format(
+        RcnnModel.PL_RPN_FG_MASK
+    ),
+    "rpn/output_intensities:0": "pl_rpn_feature/{}:0".format(
+        RcnnModel.PL_RPN_INTENSITY
+    ),
+    "rpn/output_proposals:0": "pl_proposals/{}:0".format(RcnnModel.PL_PROPOSALS),
+    INPUT_TENSOR_NAMES[constants.KEY_IMAGE_INPUT]: "img_input/{}:0".format(
+        RcnnModel.PL_IMG_INPUT
+    ),
+    INPUT_TENSOR_NAMES[constants.KEY_STEREO_CALIB_P2]: "sample_info/{}:0".format(
+        RcnnModel.PL_CALIB_P2
+    ),
+}
+
+# Batch outputs of the RCNN, in the argument order of
+# evaluator_utils.get_final_predictions_and_scores
+OUTPUT_TENSOR_NAMES = [
+    "rcnn/output_reg_boxes_3d:0",
+    "rcnn/output_cls_softmax:0",
+    "rcnn/output_non_empty_box_mask:0",
+    "rcnn/output_nms_indices:0",
+    "rcnn/output_num_boxes_before_padding:0",
+]
+
+
+def _variable_creator(**kwargs):
+    kwargs["use_resource"] = False
+    return variable_scope.default_variable_creator(None, **kwargs)
+
+
+def export_inference_meta_graph(model):
+    """Builds a model in a graph of its own.
+
+    Args:
+        model: an RpnModel or RcnnModel, not built yet, in "test" mode
+
+    Returns:
+        meta_graph_def: the MetaGraphDef of the model, with the saver of all
+            its variables
+    """
+    with tf.Graph().as_default():
+        getter = lambda next_creator, **kwargs: _variable_creator(**kwargs)
+        with variable_scope.variable_creator_scope(getter):
+            model.build()
+        saver = tf.train.Saver()
+        return saver.export_meta_graph(clear_devices=True)
+
+
+class FusedDetector:
+    """Detects the objects of frames with the RPN and the RCNN in one session.
+
+    Use FusedDetector.from_checkpoints or FusedDetector.from_frozen_graph to
+    create one.
+    """
+
+    def __init__(self, sess, scope=""):
+        """
+        Args:
+            sess: session of the fused graph, with its variables restored
+            scope: name the fused graph is imported under in sess.graph
+        """
+        self._sess = sess
+        self._scope = scope
+        prefix = scope + "/" if scope else ""
+        graph = sess.graph
+        self._input_tensors = {
+            key: graph.get_tensor_by_name(prefix + name)
+            for key, name in INPUT_TENSOR_NAMES.items()
+        }
+        self._output_tensors = [
+            graph.get_tensor_by_name(prefix + name) for name in OUTPUT_TENSOR_NAMES
+        ]
+        self.batch_size = (
+            self._input_tensors[constants.KEY_POINT_CLOUD].get_shape()[0].value
+        )
+
+    @classmethod
+    def from_checkpoints(
+        cls,
+        rpn_model,
+        rcnn_model,
+        rpn_checkpoint_path,
+        rcnn_checkpoint_path,
+        session_config=None,
+    ):
+        """Builds the RPN and the RCNN in one graph and restores them.
+
+        Args:
+            rpn_model: RpnModel in "test" mode, not built yet
+            rcnn_model: RcnnModel in "test" mode with the same batch size,
+                not built yet
+            rpn_checkpoint_path: checkpoint of the RPN variables
+            rcnn_checkpoint_path: checkpoint of the RCNN variables
+            session_config: (optional) tf.ConfigProto of the session
+
+        Returns:
+            detector: a FusedDetector
+        """
+        rpn_meta_graph = export_inference_meta_graph(rpn_model)
+        rcnn_meta_graph = export_inference_meta_graph(rcnn_model)
+
+        graph = tf.Graph()
+        with graph.as_default():
+            rpn_saver = tf.train.import_meta_graph(
+                rpn_meta_graph, import_scope=RPN_SCOPE
+            )
+            input_map = {
+                rcnn_name: graph.get_tensor_by_name(rpn_name)
+                for rpn_name, rcnn_name in RPN_TO_RCNN_TENSOR_NAMES.items()
+            }
+            rcnn_saver = tf.train.import_meta_graph(
+                rcnn_meta_graph, import_scope=RCNN_SCOPE, input_map=input_map
+            )
+
+        sess = tf.Session(graph=graph, config=session_config)
+        rpn_saver.restore(sess, rpn_checkpoint_path)
+        rcnn_saver.restore(sess, rcnn_checkpoint_path)
+        return cls(sess)
+
+    @classmethod
+    def from_frozen_graph(cls, frozen_graph_path, session_config=None):
+        """Loads a graph saved by save_frozen_graph.
+
+        Args:
+            frozen_graph_path: path of the serialized GraphDef
+            session_config: (optional) tf.ConfigProto of the session
+
+        Returns:
+            detector: a FusedDetector
+        """
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(frozen_graph_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name=FROZEN_GRAPH_SCOPE)
+
+        sess = tf.Session(graph=graph, config=session_config)
+        return cls(sess, FROZEN_GRAPH_SCOPE)
+
+    def freeze(self):
+        """Returns the GraphDef of the fused graph, variables as constants"""
+        if self._scope:
+            raise ValueError("The graph of the detector is already frozen")
+        output_node_names = [tensor.op.name for tensor in self._output_tensors]
+        return tf.graph_util.convert_variables_to_constants(
+            self._sess, self._sess.graph.as_graph_def(), output_node_names
+        )
+
+    def save_frozen_graph(self, frozen_graph_path):
+        """Serializes the frozen fused graph to frozen_graph_path"""
+        with tf.gfile.GFile(frozen_graph_path, "wb") as f:
+            f.write(self.freeze().SerializeToString())
+
+    def detect(self, point_clouds, images, stereo_calib_p2s):
+        """Detects the objects of a batch of frames.
+
+        Args:
+            point_clouds: (batch_size, P, C) sampled point clouds
+            images: (batch_size, H, W, 3) resized RGB images
+            stereo_calib_p2s: (batch_size, 3, 4) P2 matrices of the resized
+                images
+
+        Returns:
+            predictions_and_scores: a list of (N, 9) arrays per frame, the
+                boxes_3d, class score and class index of each detection,
+                sorted by decreasing score
+        """
+        feed_dict = {
+            self._input_tensors[constants.KEY_POINT_CLOUD]: point_clouds,
+            self._input_tensors[constants.KEY_IMAGE_INPUT]: images,
+            self._input_tensors[constants.KEY_STEREO_CALIB_P2]: stereo_calib_p2s,
+        }
+        outputs = self._sess.run(self._output_tensors, feed_dict=feed_dict)
+        return [
+            evaluator_utils.get_final_predictions_and_scores(
+                *[output[b] for output in outputs]
+            )
+            for b in range(len(point_clouds))
+        ]
+
+    def detect_samples(self, samples):
+        """Detects the objects of any number of samples.
+
+        Args:
+            samples: a list of sample dicts, as returned by
+                KittiDataset.load_samples with model="rpn"
+
+        Returns:
+            predictions_and_scores: a list of (N, 9) arrays per sample, see
+                detect
+        """
+        predictions_and_scores = []
+        for start in range(0, len(samples), self.batch_size):
+            batch_samples = samples[start : start + self.batch_size]
+            num_samples = len(batch_samples)
+            # Repeat the last sample to fill the batch
+            batch_samples += [batch_samples[-1]] * (self.batch_size - num_samples)
+            batch_inputs = [
+                np.stack([sample[key] for sample in batch_samples])
+                for key in [
+                    constants.KEY_POINT_CLOUD,
+                    constants.KEY_IMAGE_INPUT,
+                    constants.KEY_STEREO_CALIB_P2,
+                ]
+            ]
+            predictions_and_scores += self.detect(*batch_inputs)[:num_samples]
+        return predictions_and_scores
+
+    def close(self):
+        self._sess.close()
@@ -0,0 +1,189 @@
+"""Tests for hf.inference.fused_detector"""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from hf.core import constants
+from hf.core import evaluator_utils
+from hf.inference import FusedDetector
+
+
+class FakeRpnModel:
+    """Tensors of the RPN the fused graph connects, in test mode"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def build(self):
+        with tf.variable_scope("pc_input"):
+            pc_inputs = tf.placeholder(
+                tf.float32, [self.batch_size, 8, 4], "pc_inputs_pl"
+            )
+        with tf.variable_scope("img_input"):
+            img_input = tf.placeholder(
+                tf.float32, [self.batch_size, 4, 6, 3], "img_input_pl"
+            )
+        with tf.variable_scope("sample_info"):
+            tf.placeholder(tf.float32, [self.batch_size, 3, 4], "frame_calib_p2")
+        # Same variable name as in the RCNN
+        scale = tf.get_variable("scale", initializer=1.0)
+
+        pts = pc_inputs[:, :, :3] * scale
+        img_fts = tf.tile(tf.reduce_mean(img_input, axis=[1, 2])[:, None], [1, 8, 1])
+        tf.identity(pts, name="output_pts")
+        tf.concat([pts, img_fts], axis=2, name="output_fts")
+        tf.greater(pc_inputs[:, :, 3], 0.0, name="output_foreground_mask")
+        tf.identity(pc_inputs[:, :, 3], name="output_intensities")
+        proposals = tf.concat(
+            [pts[:, :3], tf.ones([self.batch_size, 3, 4]) * scale], axis=2
+        )
+        tf.identity(proposals, name="output_proposals")
+
+
+class FakeRcnnModel:
+    """Tensors of the RCNN the fused graph connects, in test mode"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def build(self):
+        with tf.variable_scope("pl_proposals"):
+            proposals = tf.placeholder(
+                tf.float32, [self.batch_size, None, 7], "proposals_pl"
+            )
+        with tf.variable_scope("pl_rpn_feature"):
+            pts = tf.placeholder(tf.float32, [self.batch_size, 8, 3], "rpn_pts_pl")
+            intensities = tf.placeholder(
+                tf.float32, [self.batch_size, 8], "rpn_intensity_pl"
+            )
+            fg_mask = tf.placeholder(tf.bool, [self.batch_size, 8], "rpn_fg_mask_pl")
+            fts = tf.placeholder(tf.float32, [self.batch_size, 8, 6], "rpn_fts_pl")
+        with tf.variable_scope("img_input"):
+            img_input = tf.placeholder(
+                tf.float32, [self.batch_size, 4, 6, 3], "img_input_pl"
+            )
+        with tf.variable_scope("sample_info"):
+            calib_p2 = tf.placeholder(
+                tf.float32, [self.batch_size, 3, 4], "frame_calib_p2"
+            )
+        scale = tf.get_variable("scale", initializer=1.0)
+
+        offsets = (
+            tf.reduce_sum(pts * tf.to_float(fg_mask)[:, :, None], axis=[1, 2])
+            + tf.reduce_sum(intensities, axis=1)
+            + tf.reduce_sum(fts, axis=[1, 2])
+            + tf.reduce_mean(img_input, axis=[1, 2, 3])
+            + calib_p2[:, 0, 0]
+        )
+        boxes = proposals * scale + offsets[:, None, None]
+        tf.identity(boxes, name="output_reg_boxes_3d")
+        tf.nn.softmax(boxes[:, :, :3], name="output_cls_softmax")
+        tf.greater(boxes[:, :, 0], -1e6, name="output_non_empty_box_mask")
+        tf.tile([[1, 0, 1]], [self.batch_size, 1], name="output_nms_indices")
+        tf.fill([self.batch_size], 2, name="output_num_boxes_before_padding")
+
+
+class FusedDetectorTest(tf.test.TestCase):
+    def save_checkpoint(self, model, scale):
+        checkpoint_path = os.path.join(
+            self.get_temp_dir(), type(model).__name__, "model"
+        )
+        with tf.Graph().as_default():
+            model.build()
+            with tf.variable_scope("", reuse=True):
+                scale_variable = tf.get_variable("scale")
+            with tf.Session() as sess:
+                sess.run(tf.assign(scale_variable, scale))
+                tf.train.Saver().save(sess, checkpoint_path)
+        return checkpoint_path
+
+    def run_separately(self, rpn_model, rcnn_model, checkpoint_paths, samples):
+        """Runs the RPN then the RCNN, as with the RPN outputs on disk"""
+        rpn_names = ["output_pts", "output_fts", "output_foreground_mask"]
+        rpn_names += ["output_intensities", "output_proposals"]
+        rcnn_names = ["pl_rpn_feature/rpn_pts_pl", "pl_rpn_feature/rpn_fts_pl"]
+        rcnn_names += ["pl_rpn_feature/rpn_fg_mask_pl"]
+        rcnn_names += ["pl_rpn_feature/rpn_intensity_pl", "pl_proposals/proposals_pl"]
+        input_names = ["pc_input/pc_inputs_pl", "img_input/img_input_pl"]
+        input_names += ["sample_info/frame_calib_p2"]
+        input_keys = [constants.KEY_POINT_CLOUD, constants.KEY_IMAGE_INPUT]
+        input_keys += [constants.KEY_STEREO_CALIB_P2]
+
+        inputs = [np.stack([sample[key] for sample in samples]) for key in input_keys]
+        outputs = []
+        for model, checkpoint_path in zip([rpn_model, rcnn_model], checkpoint_paths):
+            with tf.Graph().as_default() as graph:
+                model.build()
+                with tf.Session() as sess:
+                    tf.train.Saver().restore(sess, checkpoint_path)
+                    feed_dict = dict(zip(rcnn_names, outputs))
+                    feed_dict.update(zip(input_names[1:], inputs[1:]))
+                    if model is rpn_model:
+                        feed_dict[input_names[0]] = inputs[0]
+                        output_names = rpn_names
+                    else:
+                        output_names = [
+                            "output_reg_boxes_3d",
+                            "output_cls_softmax",
+                            "output_non_empty_box_mask",
+                            "output_nms_indices",
+                            "output_num_boxes_before_padding",
+                        ]
+                    feed_dict = {
+                        graph.get_tensor_by_name(name + ":0"): value
+                        for name, value in feed_dict.items()
+                    }
+                    outputs = sess.run(
+                        [name + ":0" for name in output_names], feed_dict=feed_dict
+                    )
+        return [
+            evaluator_utils.get_final_predictions_and_scores(
+                *[output[b] for output in outputs]
+            )
+            for b in range(len(samples))
+        ]
+
+    def test_fused_detector(self):
+        rng = np.random.RandomState(0)
+        samples = []
+        for _ in range(3):
+            samples.append(
+                {
+                    constants.KEY_POINT_CLOUD: rng.rand(8, 4) - 0.5,
+                    constants.KEY_IMAGE_INPUT: rng.rand(4, 6, 3),
+                    constants.KEY_STEREO_CALIB_P2: rng.rand(3, 4),
+                }
+            )
+        checkpoint_paths = [
+            self.save_checkpoint(FakeRpnModel(2), 2.0),
+            self.save_checkpoint(FakeRcnnModel(2), 0.5),
+        ]
+
+        detector = FusedDetector.from_checkpoints(
+            FakeRpnModel(2), FakeRcnnModel(2), *checkpoint_paths
+        )
+        self.assertEqual(detector.batch_size, 2)
+        # Batches of two, the last one padded
+        predictions = detector.detect_samples(samples)
+        frozen_graph_path = os.path.join(self.get_temp_dir(), "fused.pb")
+        detector.save_frozen_graph(frozen_graph_path)
+        detector.close()
+
+        frozen_detector = FusedDetector.from_frozen_graph(frozen_graph_path)
+        frozen_predictions = frozen_detector.detect_samples(samples)
+        frozen_detector.close()
+
+        expected_predictions = self.run_separately(
+            FakeRpnModel(3), FakeRcnnModel(3), checkpoint_paths, samples
+        )
+        self.assertEqual(len(predictions), 3)
+        for outputs in [predictions, frozen_predictions]:
+            for output, expected_output in zip(outputs, expected_predictions):
+                self.assertEqual(output.shape[1], 9)
+                np.testing.assert_allclose(output, expected_output, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -7,9 +7,13 @@
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#include <vector>
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
 #include <cuda.h>
 #include <cuda_runtime_api.h>
+#endif
 using namespace tensorflow;
 
 REGISTER_OP("ThreeNN")
@@ -57,6 +61,167 @@ static double get_time(){
 }
 
 
+static inline Status CheckInterpolateIndices(const Tensor& idx_tensor, int m) {
+    auto idx_flat = idx_tensor.flat<int>();
+    for (int64 i = 0; i < idx_flat.size(); i++) {
+        if (idx_flat(i) < 0 || idx_flat(i) >= m)
+            return errors::InvalidArgument("ThreeInterpolate expects idx in [0, m)");
+    }
+    return Status::OK();
+}
+
+int point_grid_max_cells_cpu(int m);
+void build_point_grid_cpu(const float *xyz, int m,
+    float *grid_bounds, int *grid_dims, int *cell_starts, int *cell_points);
+void three_nn_cpu(int pt_start, int pt_end, const float *unknown, const float *known,
+    const float *grid_bounds, const int *grid_dims, const int *cell_starts, const int *cell_points,
+    float *dist2, int *idx);
+
+class ThreeNNCpuOp : public OpKernel {
+    public:
+        explicit ThreeNNCpuOp(OpKernelConstruction* context) : OpKernel(context) {}
+
+        void Compute(OpKernelContext* context) override {
+            const Tensor& xyz1_tensor = context->input(0);
+            OP_REQUIRES(context, xyz1_tensor.dims()==3 && xyz1_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeNN expects (b,n,3) xyz1 shape."));
+            int b = xyz1_tensor.shape().dim_size(0);
+            int n = xyz1_tensor.shape().dim_size(1);
+
+            const Tensor& xyz2_tensor = context->input(1);
+            OP_REQUIRES(context, xyz2_tensor.dims()==3 && xyz2_tensor.shape().dim_size(0)==b && xyz2_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeNN expects (b,m,3) xyz2 shape."));
+            int m = xyz2_tensor.shape().dim_size(1);
+
+            Tensor *dist_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0, TensorShape{b,n,3}, &dist_tensor));
+            Tensor *idx_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(1, TensorShape{b,n,3}, &idx_tensor));
+            if (b == 0 || n == 0) return;
+
+            const float *xyz1 = &(xyz1_tensor.flat<float>()(0));
+            const float *xyz2 = m > 0 ? &(xyz2_tensor.flat<float>()(0)) : nullptr;
+            float *dist = &(dist_tensor->flat<float>()(0));
+            int *idx = &(idx_tensor->flat<int>()(0));
+
+            // Voxel grid index of the known points of each batch item
+            const int max_cells = point_grid_max_cells_cpu(m);
+            std::vector<float> grid_bounds(b * 4);
+            std::vector<int> grid_dims(b * 3);
+            std::vector<int> cell_starts(b * (max_cells + 1));
+            std::vector<int> cell_points(b * m + 1);
+
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto build_grids = [&](int64 start, int64 end) {
+                for (int64 i = start; i < end; i++) {
+                    build_point_grid_cpu(xyz2 + i * m * 3, m, &grid_bounds[i * 4], &grid_dims[i * 3],
+                                         &cell_starts[i * (max_cells + 1)], &cell_points[i * m]);
+                }
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b, 30 * m, build_grids);
+
+            auto search = [&](int64 start, int64 end) {
+                for (int64 i = start / n; i * n < end; i++) {
+                    int pt_start = std::max(start - i * n, (int64)0);
+                    int pt_end = std::min(end - i * n, (int64)n);
+                    three_nn_cpu(pt_start, pt_end, xyz1 + i * n * 3, xyz2 + i * m * 3,
+                                 &grid_bounds[i * 4], &grid_dims[i * 3], &cell_starts[i * (max_cells + 1)], &cell_points[i * m],
+                                 dist + i * n * 3, idx + i * n * 3);
+                }
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * n, 1000, search);
+        }
+};
+REGISTER_KERNEL_BUILDER(Name("ThreeNN").Device(DEVICE_CPU), ThreeNNCpuOp);
+
+
+void three_interpolate_cpu(int row_start, int row_end, int c, int m, int n,
+    const float *points, const int *idx, const float *weight, float *out);
+
+class ThreeInterpolateCpuOp: public OpKernel{
+    public:
+        explicit ThreeInterpolateCpuOp(OpKernelConstruction * context):OpKernel(context){}
+
+        void Compute(OpKernelContext * context) override {
+            const Tensor& points_tensor=context->input(0);
+            OP_REQUIRES(context, points_tensor.dims()==3, errors::InvalidArgument("ThreeInterpolate expects (b,c,m) points shape"));
+            int b = points_tensor.shape().dim_size(0);
+            int c = points_tensor.shape().dim_size(1);
+            int m = points_tensor.shape().dim_size(2);
+
+            const Tensor& idx_tensor=context->input(1);
+            OP_REQUIRES(context,idx_tensor.dims()==3 && idx_tensor.shape().dim_size(0)==b && idx_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeInterpolate expects (b,n,3) idx shape"));
+            int n = idx_tensor.shape().dim_size(1);
+            const Tensor& weight_tensor=context->input(2);
+            OP_REQUIRES(context,weight_tensor.dims()==3 && weight_tensor.shape().dim_size(0)==b && weight_tensor.shape().dim_size(1)==n && weight_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeInterpolate expects (b,n,3) weight shape"));
+            OP_REQUIRES_OK(context, CheckInterpolateIndices(idx_tensor, m));
+
+            Tensor * out_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0,TensorShape{b,c,n}, &out_tensor));
+            if (out_tensor->NumElements() == 0) return;
+
+            const float *points = &(points_tensor.flat<float>()(0));
+            const int *idx = &(idx_tensor.flat<int>()(0));
+            const float *weight = &(weight_tensor.flat<float>()(0));
+            float *out = &(out_tensor->flat<float>()(0));
+
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto interpolate = [&](int64 start, int64 end) {
+                three_interpolate_cpu(start, end, c, m, n, points, idx, weight, out);
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * c, 10 * n, interpolate);
+        }
+};
+REGISTER_KERNEL_BUILDER(Name("ThreeInterpolate").Device(DEVICE_CPU),ThreeInterpolateCpuOp);
+
+void three_interpolate_grad_cpu(int row_start, int row_end, int c, int n, int m,
+    const float *grad_out, const int *idx, const float *weight, float *grad_points);
+
+class ThreeInterpolateGradCpuOp: public OpKernel{
+    public:
+        explicit ThreeInterpolateGradCpuOp(OpKernelConstruction * context):OpKernel(context){}
+
+        void Compute(OpKernelContext * context) override {
+            const Tensor& points_tensor=context->input(0);
+            OP_REQUIRES(context, points_tensor.dims()==3, errors::InvalidArgument("ThreeInterpolateGrad expects (b,c,m) points shape"));
+            int b = points_tensor.shape().dim_size(0);
+            int c = points_tensor.shape().dim_size(1);
+            int m = points_tensor.shape().dim_size(2);
+
+            const Tensor& idx_tensor=context->input(1);
+            OP_REQUIRES(context,idx_tensor.dims()==3 && idx_tensor.shape().dim_size(0)==b && idx_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeInterpolateGrad expects (b,n,3) idx shape"));
+            int n = idx_tensor.shape().dim_size(1);
+            const Tensor& weight_tensor=context->input(2);
+            OP_REQUIRES(context,weight_tensor.dims()==3 && weight_tensor.shape().dim_size(0)==b && weight_tensor.shape().dim_size(1)==n && weight_tensor.shape().dim_size(2)==3, errors::InvalidArgument("ThreeInterpolateGrad expects (b,n,3) weight shape"));
+            OP_REQUIRES_OK(context, CheckInterpolateIndices(idx_tensor, m));
+
+            const Tensor& grad_out_tensor=context->input(3);
+            OP_REQUIRES(context,grad_out_tensor.dims()==3 && grad_out_tensor.shape().dim_size(0)==b && grad_out_tensor.shape().dim_size(1)==c && grad_out_tensor.shape().dim_size(2)==n, errors::InvalidArgument("ThreeInterpolateGrad expects (b,c,n) grad_out shape"));
+
+            Tensor * grad_points_tensor = nullptr;
+            OP_REQUIRES_OK(context, context->allocate_output(0,TensorShape{b,c,m}, &grad_points_tensor));
+            auto grad_points_flat = grad_points_tensor->flat<float>();
+            grad_points_flat.setZero();
+            if (grad_out_tensor.NumElements() == 0) return;
+
+            const int *idx = &(idx_tensor.flat<int>()(0));
+            const float *weight = &(weight_tensor.flat<float>()(0));
+            const float *grad_out = &(grad_out_tensor.flat<float>()(0));
+            float *grad_points = &(grad_points_flat(0));
+
+            // Each (b,c) row scatters to its own row of grad_points
+            auto worker_threads = context->device()->tensorflow_cpu_worker_threads();
+            auto scatter = [&](int64 start, int64 end) {
+                three_interpolate_grad_cpu(start, end, c, n, m, grad_out, idx, weight, grad_points);
+            };
+            Shard(worker_threads->num_threads, worker_threads->workers,
+                  b * c, 10 * n, scatter);
+        }
+};
+REGISTER_KERNEL_BUILDER(Name("ThreeInterpolateGrad").Device(DEVICE_CPU),ThreeInterpolateGradCpuOp);
+
+#ifdef WITH_CUDA
 void three_nn_gpu(int b, int n, int m, const float *unknown, 
     const float *known, float *dist2, int *idx);
 
@@ -180,3 +345,4 @@ class ThreeInterpolateGradGpuOp: public OpKernel{
         }
 };
 REGISTER_KERNEL_BUILDER(Name("ThreeInterpolateGrad").Device(DEVICE_GPU),ThreeInterpolateGradGpuOp);
+#endif
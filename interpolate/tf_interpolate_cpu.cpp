@@ -0,0 +1,217 @@
+// CPU versions of the interpolation ops of tf_interpolate_g.cu.
+//
+// ThreeNN buckets the known points of each batch item into a voxel grid of
+// a few points per cell, and searches the cells around each unknown point
+// ring by ring, until no point of the next ring can be closer than its
+// third neighbour. Ties go to the lowest index, so the neighbours are the
+// ones of the GPU kernel.
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+inline int grid_cell_cpu(float value, float min_value, float cell_size, int grid_dim) {
+  float cell = std::floor((value - min_value) / cell_size);
+  if (!(cell >= 0)) return 0;
+  return (int)std::min(cell, (float)(grid_dim - 1));
+}
+
+int point_grid_max_cells_cpu(int m) {
+  // At least the 8 cells of a grid of the largest extent
+  return m / 2 + 8;
+}
+
+void build_point_grid_cpu(const float *xyz, int m,
+    float *grid_bounds, int *grid_dims, int *cell_starts, int *cell_points) {
+  // params: xyz (m, 3)
+  // params: grid_bounds (4) [min_x, min_y, min_z, cell_size]
+  // params: grid_dims (3) number of cells along each axis
+  // params: cell_starts (point_grid_max_cells_cpu(m) + 1) start of the
+  //     points of each cell in cell_points
+  // params: cell_points (m) point indices, sorted by cell then index
+  float min_xyz[3] = {0, 0, 0}, max_xyz[3] = {0, 0, 0};
+  for (int k = 0; k < m; k++) {
+    for (int d = 0; d < 3; d++) {
+      min_xyz[d] = k == 0 ? xyz[d] : std::min(min_xyz[d], xyz[k*3 + d]);
+      max_xyz[d] = k == 0 ? xyz[d] : std::max(max_xyz[d], xyz[k*3 + d]);
+    }
+  }
+  float max_extent = 0;
+  for (int d = 0; d < 3; d++) {
+    // Non finite coordinates end up in the border cells
+    if (!std::isfinite(max_xyz[d] - min_xyz[d])) {
+      min_xyz[d] = max_xyz[d] = 0;
+    }
+    max_extent = std::max(max_extent, max_xyz[d] - min_xyz[d]);
+  }
+  // The finest cells of sizes divided by 1.5 with at most about 2 points
+  // per cell, over the bounding box of the points
+  const int max_cells = point_grid_max_cells_cpu(m);
+  float cell_size = max_extent > 0 ? max_extent : 1.0f;
+  while (true) {
+    float next_cell_size = cell_size / 1.5f;
+    double num_cells = 1;
+    for (int d = 0; d < 3; d++) {
+      num_cells *= std::floor((max_xyz[d] - min_xyz[d]) / next_cell_size) + 1;
+    }
+    if (!(num_cells <= max_cells) || max_extent == 0) break;
+    cell_size = next_cell_size;
+  }
+  for (int d = 0; d < 3; d++) {
+    grid_bounds[d] = min_xyz[d];
+    grid_dims[d] = (int)std::floor((max_xyz[d] - min_xyz[d]) / cell_size) + 1;
+  }
+  grid_bounds[3] = cell_size;
+
+  // Counting sort of the points by cell
+  const int grid_cells = grid_dims[0] * grid_dims[1] * grid_dims[2];
+  std::vector<int> point_cells(m);
+  std::fill(cell_starts, cell_starts + grid_cells + 1, 0);
+  for (int k = 0; k < m; k++) {
+    int cell_x = grid_cell_cpu(xyz[k*3], grid_bounds[0], cell_size, grid_dims[0]);
+    int cell_y = grid_cell_cpu(xyz[k*3 + 1], grid_bounds[1], cell_size, grid_dims[1]);
+    int cell_z = grid_cell_cpu(xyz[k*3 + 2], grid_bounds[2], cell_size, grid_dims[2]);
+    point_cells[k] = (cell_x * grid_dims[1] + cell_y) * grid_dims[2] + cell_z;
+    cell_starts[point_cells[k] + 1]++;
+  }
+  for (int cell = 0; cell < grid_cells; cell++) {
+    cell_starts[cell + 1] += cell_starts[cell];
+  }
+  std::vector<int> cell_fill(cell_starts, cell_starts + grid_cells);
+  for (int k = 0; k < m; k++) {
+    cell_points[cell_fill[point_cells[k]]++] = k;
+  }
+}
+
+struct Neighbours3Cpu {
+  double best[3];
+  int besti[3];
+
+  Neighbours3Cpu() {
+    // As initialized by the GPU kernel
+    for (int i = 0; i < 3; i++) {
+      best[i] = 1e40;
+      besti[i] = 0;
+    }
+  }
+
+  inline void add(float d, int k) {
+    // Sorted by distance then index
+    if (d < best[0] || (d == best[0] && k < besti[0])) {
+      best[2] = best[1]; besti[2] = besti[1];
+      best[1] = best[0]; besti[1] = besti[0];
+      best[0] = d; besti[0] = k;
+    }
+    else if (d < best[1] || (d == best[1] && k < besti[1])) {
+      best[2] = best[1]; besti[2] = besti[1];
+      best[1] = d; besti[1] = k;
+    }
+    else if (d < best[2] || (d == best[2] && k < besti[2])) {
+      best[2] = d; besti[2] = k;
+    }
+  }
+};
+
+// input: unknown (n,3), known (m,3) and its grid of one batch item
+// output: dist2 (n,3), idx (n,3) of the unknown points [pt_start, pt_end)
+void three_nn_cpu(int pt_start, int pt_end, const float *unknown, const float *known,
+    const float *grid_bounds, const int *grid_dims, const int *cell_starts, const int *cell_points,
+    float *dist2, int *idx) {
+  const float cell_size = grid_bounds[3];
+  for (int j = pt_start; j < pt_end; j++) {
+    float ux = unknown[j*3 + 0];
+    float uy = unknown[j*3 + 1];
+    float uz = unknown[j*3 + 2];
+
+    // Cell of the point, which can be out of the grid
+    int cell[3];
+    int min_ring = 0, max_ring = 0;
+    for (int d = 0; d < 3; d++) {
+      float c = std::floor((unknown[j*3 + d] - grid_bounds[d]) / cell_size);
+      c = std::isfinite(c) ? std::min(std::max(c, -1e8f), 1e8f) : 0;
+      cell[d] = (int)c;
+      min_ring = std::max(min_ring, std::max(-cell[d], cell[d] - (grid_dims[d] - 1)));
+      max_ring = std::max(max_ring, std::max(cell[d], grid_dims[d] - 1 - cell[d]));
+    }
+
+    // The rings before min_ring do not reach the grid
+    Neighbours3Cpu neighbours;
+    for (int ring = min_ring; ring <= max_ring; ring++) {
+      int lo[3], hi[3];
+      bool empty = false;
+      for (int d = 0; d < 3; d++) {
+        lo[d] = std::max(cell[d] - ring, 0);
+        hi[d] = std::min(cell[d] + ring, grid_dims[d] - 1);
+        empty = empty || lo[d] > hi[d];
+      }
+      if (!empty) {
+        for (int cell_x = lo[0]; cell_x <= hi[0]; cell_x++) {
+          for (int cell_y = lo[1]; cell_y <= hi[1]; cell_y++) {
+            bool xy_border = std::abs(cell_x - cell[0]) == ring || std::abs(cell_y - cell[1]) == ring;
+            for (int cell_z = lo[2]; cell_z <= hi[2]; cell_z++) {
+              // Only the cells of the ring, the inner ones are done
+              if (!xy_border && std::abs(cell_z - cell[2]) != ring) {
+                cell_z = std::max(cell_z, cell[2] + ring - 1);
+                continue;
+              }
+              int c = (cell_x * grid_dims[1] + cell_y) * grid_dims[2] + cell_z;
+              for (int i = cell_starts[c]; i < cell_starts[c + 1]; i++) {
+                int k = cell_points[i];
+                float x = known[k * 3 + 0];
+                float y = known[k * 3 + 1];
+                float z = known[k * 3 + 2];
+                float d = (ux - x) * (ux - x) + (uy - y) * (uy - y) + (uz - z) * (uz - z);
+                neighbours.add(d, k);
+              }
+            }
+          }
+        }
+      }
+      // The points out of the rings are at least ring cells away, up to
+      // some float rounding of the cells
+      double bound = std::max(ring - 0.01, 0.0) * cell_size;
+      if (neighbours.best[2] < bound * bound) break;
+    }
+
+    for (int i = 0; i < 3; i++) {
+      dist2[j*3 + i] = neighbours.best[i];
+      idx[j*3 + i] = neighbours.besti[i];
+    }
+  }
+}
+
+// input: points (b,c,m), idx (b,n,3), weight (b,n,3)
+// output: out (b,c,n) of the rows [row_start, row_end) of the b*c ones
+void three_interpolate_cpu(int row_start, int row_end, int c, int m, int n,
+    const float *points, const int *idx, const float *weight, float *out) {
+  for (int row = row_start; row < row_end; row++) {
+    int bs_idx = row / c;
+    const float *row_points = points + (long long)row * m;
+    const int *row_idx = idx + (long long)bs_idx * n * 3;
+    const float *row_weight = weight + (long long)bs_idx * n * 3;
+    float *row_out = out + (long long)row * n;
+    for (int pt_idx = 0; pt_idx < n; pt_idx++) {
+      const int *pt_i = row_idx + pt_idx * 3;
+      const float *pt_w = row_weight + pt_idx * 3;
+      row_out[pt_idx] = pt_w[0] * row_points[pt_i[0]] + pt_w[1] * row_points[pt_i[1]] + pt_w[2] * row_points[pt_i[2]];
+    }
+  }
+}
+
+// input: grad_out (b,c,n), idx (b,n,3), weight (b,n,3)
+// output: grad_points (b,c,m) of the rows [row_start, row_end) of the b*c
+//     ones, expected to be zero filled
+void three_interpolate_grad_cpu(int row_start, int row_end, int c, int n, int m,
+    const float *grad_out, const int *idx, const float *weight, float *grad_points) {
+  for (int row = row_start; row < row_end; row++) {
+    int bs_idx = row / c;
+    const float *row_grad_out = grad_out + (long long)row * n;
+    const int *row_idx = idx + (long long)bs_idx * n * 3;
+    const float *row_weight = weight + (long long)bs_idx * n * 3;
+    float *row_grad_points = grad_points + (long long)row * m;
+    for (int pt_idx = 0; pt_idx < n; pt_idx++) {
+      for (int i = 0; i < 3; i++) {
+        row_grad_points[row_idx[pt_idx*3 + i]] += row_grad_out[pt_idx] * row_weight[pt_idx*3 + i];
+      }
+    }
+  }
+}
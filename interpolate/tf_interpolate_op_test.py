@@ -3,6 +3,21 @@ import numpy as np
 from tf_interpolate import three_nn, three_interpolate
 
 
+def three_nn_np(xyz1, xyz2):
+    """Numpy reference of the GPU op, squared distances of the three nearest
+    points, ties going to the lowest index"""
+    batch_size, n = xyz1.shape[:2]
+    dist = np.full((batch_size, n, 3), np.inf, dtype=np.float32)
+    idx = np.zeros((batch_size, n, 3), dtype=np.int32)
+    for i in range(batch_size):
+        for j in range(n):
+            dist2 = np.sum((xyz2[i] - xyz1[i, j]) ** 2, axis=1, dtype=np.float32)
+            nearest = np.argsort(dist2, kind="stable")[:3]
+            dist[i, j, : len(nearest)] = dist2[nearest]
+            idx[i, j, : len(nearest)] = nearest
+    return dist, idx
+
+
 class GroupPointTest(tf.test.TestCase):
     def test(self):
         pass
@@ -26,5 +41,86 @@ class GroupPointTest(tf.test.TestCase):
             pass
 
 
+class InterpolateCpuTest(tf.test.TestCase):
+    def test_three_nn(self):
+        rng = np.random.RandomState(0)
+        # Unknown points out of the known ones and duplicated known points
+        xyz1 = rng.uniform([-10, -1, -10], [30, 3, 30], (2, 1024, 3))
+        xyz2 = rng.uniform([0, 0, 0], [20, 2, 20], (2, 256, 3))
+        xyz2[:, 10:12] = xyz2[:, 9:10]
+        xyz1[:, 0] = xyz2[:, 9]
+        xyz1 = xyz1.astype(np.float32)
+        xyz2 = xyz2.astype(np.float32)
+
+        for num_known in [256, 2]:
+            with tf.device("/cpu:0"):
+                outputs = three_nn(xyz1, xyz2[:, :num_known])
+            with self.test_session() as sess:
+                dist, idx = sess.run(outputs)
+
+            expected_dist, expected_idx = three_nn_np(xyz1, xyz2[:, :num_known])
+            np.testing.assert_array_equal(idx, expected_idx)
+            np.testing.assert_array_equal(dist, expected_dist)
+
+    def test_three_interpolate(self):
+        rng = np.random.RandomState(1)
+        points = rng.rand(2, 64, 16).astype(np.float32)
+        idx = rng.randint(64, size=(2, 128, 3)).astype(np.int32)
+        weight = rng.rand(2, 128, 3).astype(np.float32)
+
+        with tf.device("/cpu:0"):
+            interpolated_points = three_interpolate(points, idx, weight)
+        with self.test_session() as sess:
+            interpolated_points = sess.run(interpolated_points)
+
+        expected_interpolated_points = np.sum(
+            points[np.arange(2)[:, None, None], idx] * weight[..., None], axis=2
+        )
+        np.testing.assert_allclose(
+            interpolated_points, expected_interpolated_points, rtol=1e-5
+        )
+
+    def test_grad(self):
+        with tf.device("/cpu:0"):
+            points = tf.constant(np.random.random((1, 8, 16)).astype("float32"))
+            xyz1 = tf.constant(np.random.random((1, 128, 3)).astype("float32"))
+            xyz2 = tf.constant(np.random.random((1, 8, 3)).astype("float32"))
+            dist, idx = three_nn(xyz1, xyz2)
+            weight = tf.ones_like(dist) / 3.0
+            interpolated_points = three_interpolate(points, idx, weight)
+
+        with self.test_session():
+            err = tf.test.compute_gradient_error(
+                points, (1, 8, 16), interpolated_points, (1, 128, 16)
+            )
+            self.assertLess(err, 1e-4)
+
+    def test_gpu_parity(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest("The GPU kernels are not available")
+        rng = np.random.RandomState(2)
+        points = rng.rand(2, 256, 8).astype(np.float32)
+        xyz1 = rng.rand(2, 1024, 3).astype(np.float32)
+        xyz2 = rng.rand(2, 256, 3).astype(np.float32)
+
+        outputs = []
+        for device in ["/cpu:0", "/gpu:0"]:
+            with tf.device(device):
+                points_tensor = tf.constant(points)
+                dist, idx = three_nn(xyz1, xyz2)
+                weight = 1.0 / tf.maximum(dist, 1e-10)
+                weight = weight / tf.reduce_sum(weight, axis=2, keep_dims=True)
+                interpolated_points = three_interpolate(points_tensor, idx, weight)
+                grad = tf.gradients(
+                    interpolated_points, points_tensor, interpolated_points
+                )[0]
+                outputs.append([dist, idx, interpolated_points, grad])
+        with self.test_session() as sess:
+            cpu_outputs, gpu_outputs = sess.run(outputs)
+
+        for cpu_output, gpu_output in zip(cpu_outputs, gpu_outputs):
+            np.testing.assert_allclose(cpu_output, gpu_output, rtol=1e-5)
+
+
 if __name__ == "__main__":
     tf.test.main()
@@ -7,7 +7,10 @@
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#ifdef WITH_CUDA
 #include <cuda_runtime.h>
+#endif
 
 using namespace tensorflow;
 
@@ -62,6 +65,140 @@ REGISTER_OP("GatherPointGrad")
     return Status::OK();
   });
 
+static inline Status CheckGatherIndices(const Tensor& idx_tensor, int n){
+  auto idx_flat=idx_tensor.flat<int>();
+  for (int64 i=0;i<idx_flat.size();i++){
+    if (idx_flat(i)<0 || idx_flat(i)>=n)
+      return errors::InvalidArgument("GatherPoint expects idx in [0, num_points)");
+  }
+  return Status::OK();
+}
+
+void probsample_cpu(int batch_start, int batch_end, int n, int m, const float * inp_p, const float * inp_r, int * out);
+class ProbSampleCpuOp: public OpKernel{
+  public:
+    explicit ProbSampleCpuOp(OpKernelConstruction* context):OpKernel(context){}
+    void Compute(OpKernelContext * context)override{
+      const Tensor& inp_tensor=context->input(0);
+      const Tensor& inpr_tensor=context->input(1);
+      OP_REQUIRES(context,inp_tensor.dims()==2 && inp_tensor.shape().dim_size(1)>0,errors::InvalidArgument("ProbSample expects (batch_size,num_choices) inp shape"));
+      int b=inp_tensor.shape().dim_size(0);
+      int n=inp_tensor.shape().dim_size(1);
+      OP_REQUIRES(context,inpr_tensor.dims()==2 && inpr_tensor.shape().dim_size(0)==b,errors::InvalidArgument("ProbSample expects (batch_size,num_points) inpr shape"));
+      int m=inpr_tensor.shape().dim_size(1);
+      Tensor * out_tensor=NULL;
+      OP_REQUIRES_OK(context,context->allocate_output(0,TensorShape{b,m},&out_tensor));
+      if (b==0 || m==0) return;
+      const float * inp=&(inp_tensor.flat<float>()(0));
+      const float * inpr=&(inpr_tensor.flat<float>()(0));
+      int * out=&(out_tensor->flat<int>()(0));
+
+      auto worker_threads=context->device()->tensorflow_cpu_worker_threads();
+      auto sample=[&](int64 start, int64 end){
+        probsample_cpu(start,end,n,m,inp,inpr,out);
+      };
+      Shard(worker_threads->num_threads,worker_threads->workers,b,5*n+20*m,sample);
+    }
+};
+REGISTER_KERNEL_BUILDER(Name("ProbSample").Device(DEVICE_CPU), ProbSampleCpuOp);
+
+void farthestpointsampling_cpu(int batch_start, int batch_end, int n, int m, const float * dataset, int * idxs);
+class FarthestPointSampleCpuOp: public OpKernel{
+  public:
+    explicit FarthestPointSampleCpuOp(OpKernelConstruction* context):OpKernel(context) {
+      OP_REQUIRES_OK(context, context->GetAttr("npoint", &npoint_));
+      OP_REQUIRES(context, npoint_ > 0, errors::InvalidArgument("FarthestPointSample expects positive npoint"));
+    }
+    void Compute(OpKernelContext * context)override{
+      int m = npoint_;
+
+      const Tensor& inp_tensor=context->input(0);
+      OP_REQUIRES(context,inp_tensor.dims()==3 && inp_tensor.shape().dim_size(1)>0 && inp_tensor.shape().dim_size(2)==3,errors::InvalidArgument("FarthestPointSample expects (batch_size,num_points,3) inp shape"));
+      int b=inp_tensor.shape().dim_size(0);
+      int n=inp_tensor.shape().dim_size(1);
+      Tensor * out_tensor;
+      OP_REQUIRES_OK(context,context->allocate_output(0,TensorShape{b,m},&out_tensor));
+      if (b==0) return;
+      const float * inp=&(inp_tensor.flat<float>()(0));
+      int * out=&(out_tensor->flat<int>()(0));
+
+      // The samples of a batch item depend on each other, so the batch
+      // items are the unit of work
+      auto worker_threads=context->device()->tensorflow_cpu_worker_threads();
+      auto sample=[&](int64 start, int64 end){
+        farthestpointsampling_cpu(start,end,n,m,inp,out);
+      };
+      Shard(worker_threads->num_threads,worker_threads->workers,b,(int64)10*n*m,sample);
+    }
+    private:
+        int npoint_;
+};
+REGISTER_KERNEL_BUILDER(Name("FarthestPointSample").Device(DEVICE_CPU),FarthestPointSampleCpuOp);
+
+void gatherpoint_cpu(int batch_start, int batch_end, int n, int m, const float * inp, const int * idx, float * out);
+class GatherPointCpuOp: public OpKernel{
+  public:
+    explicit GatherPointCpuOp(OpKernelConstruction * context):OpKernel(context){}
+    void Compute(OpKernelContext * context)override{
+      const Tensor& inp_tensor=context->input(0);
+      OP_REQUIRES(context,inp_tensor.dims()==3 && inp_tensor.shape().dim_size(2)==3,errors::InvalidArgument("GatherPoint expects (batch_size,num_points,3) inp shape"));
+      int b=inp_tensor.shape().dim_size(0);
+      int n=inp_tensor.shape().dim_size(1);
+      const Tensor& idx_tensor=context->input(1);
+      OP_REQUIRES(context,idx_tensor.dims()==2 && idx_tensor.shape().dim_size(0)==b,errors::InvalidArgument("GatherPoint expects (batch_size,num_result) idx shape"));
+      int m=idx_tensor.shape().dim_size(1);
+      OP_REQUIRES_OK(context,CheckGatherIndices(idx_tensor,n));
+      Tensor * out_tensor=NULL;
+      OP_REQUIRES_OK(context,context->allocate_output(0,TensorShape{b,m,3},&out_tensor));
+      if (b==0 || m==0) return;
+      const float * inp=&(inp_tensor.flat<float>()(0));
+      const int * idx=&(idx_tensor.flat<int>()(0));
+      float * out=&(out_tensor->flat<float>()(0));
+
+      auto worker_threads=context->device()->tensorflow_cpu_worker_threads();
+      auto gather=[&](int64 start, int64 end){
+        gatherpoint_cpu(start,end,n,m,inp,idx,out);
+      };
+      Shard(worker_threads->num_threads,worker_threads->workers,b,5*m,gather);
+    }
+};
+REGISTER_KERNEL_BUILDER(Name("GatherPoint").Device(DEVICE_CPU),GatherPointCpuOp);
+
+void scatteraddpoint_cpu(int batch_start, int batch_end, int n, int m, const float * out_g, const int * idx, float * inp_g);
+class GatherPointGradCpuOp: public OpKernel{
+  public:
+    explicit GatherPointGradCpuOp(OpKernelConstruction * context):OpKernel(context){}
+    void Compute(OpKernelContext * context)override{
+      const Tensor& inp_tensor=context->input(0);
+      OP_REQUIRES(context,inp_tensor.dims()==3 && inp_tensor.shape().dim_size(2)==3,errors::InvalidArgument("GatherPointGradCpuOp expects (batch_size,num_points,3) inp"));
+      int b=inp_tensor.shape().dim_size(0);
+      int n=inp_tensor.shape().dim_size(1);
+      const Tensor& idx_tensor=context->input(1);
+      OP_REQUIRES(context,idx_tensor.dims()==2 && idx_tensor.shape().dim_size(0)==b,errors::InvalidArgument("GatherPointGradCpuOp expects (batch_size,num_result) idx shape"));
+      int m=idx_tensor.shape().dim_size(1);
+      OP_REQUIRES_OK(context,CheckGatherIndices(idx_tensor,n));
+      const Tensor& out_g_tensor=context->input(2);
+      OP_REQUIRES(context,out_g_tensor.dims()==3 && out_g_tensor.shape().dim_size(0)==b && out_g_tensor.shape().dim_size(1)==m && out_g_tensor.shape().dim_size(2)==3,errors::InvalidArgument("GatherPointGradCpuOp expects (batch_size,num_result,3) out_g shape"));
+      Tensor * inp_g_tensor=NULL;
+      OP_REQUIRES_OK(context,context->allocate_output(0,TensorShape{b,n,3},&inp_g_tensor));
+      auto inp_g_flat=inp_g_tensor->flat<float>();
+      inp_g_flat.setZero();
+      if (b==0 || m==0) return;
+      const int * idx=&(idx_tensor.flat<int>()(0));
+      const float * out_g=&(out_g_tensor.flat<float>()(0));
+      float * inp_g=&(inp_g_flat(0));
+
+      // Batch items scatter to disjoint parts of inp_g
+      auto worker_threads=context->device()->tensorflow_cpu_worker_threads();
+      auto scatter=[&](int64 start, int64 end){
+        scatteraddpoint_cpu(start,end,n,m,out_g,idx,inp_g);
+      };
+      Shard(worker_threads->num_threads,worker_threads->workers,b,5*m,scatter);
+    }
+};
+REGISTER_KERNEL_BUILDER(Name("GatherPointGrad").Device(DEVICE_CPU),GatherPointGradCpuOp);
+
+#ifdef WITH_CUDA
 void probsampleLauncher(int b,int n,int m,const float * inp_p,const float * inp_r,float * temp,int * out);
 class ProbSampleGpuOp: public OpKernel{
   public:
@@ -176,4 +313,4 @@ class GatherPointGradGpuOp: public OpKernel{
     }
 };
 REGISTER_KERNEL_BUILDER(Name("GatherPointGrad").Device(DEVICE_GPU),GatherPointGradGpuOp);
-
+#endif
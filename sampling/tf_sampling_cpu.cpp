@@ -0,0 +1,87 @@
+/* CPU versions of the sampling ops of tf_sampling_g.cu.
+ *
+ * Each function handles the batch items [batch_start, batch_end), so that
+ * the op kernels can split the batch between threads.
+ */
+#include <algorithm>
+#include <vector>
+
+// input: inp_p (b,n) probabilities, inp_r (b,m) uniform samples in [0,1)
+// output: out (b,m) indices of the first cumulated probability >= r * sum
+void probsample_cpu(int batch_start, int batch_end, int n, int m, const float * inp_p, const float * inp_r, int * out){
+  std::vector<float> cumsum(n);
+  for (int i=batch_start;i<batch_end;i++){
+    float runningsum=0;
+    for (int j=0;j<n;j++){
+      runningsum+=inp_p[i*n+j];
+      cumsum[j]=runningsum;
+    }
+    for (int j=0;j<m;j++){
+      float q=inp_r[i*m+j]*cumsum[n-1];
+      int r=std::lower_bound(cumsum.begin(),cumsum.end(),q)-cumsum.begin();
+      out[i*m+j]=std::min(r,n-1);
+    }
+  }
+}
+
+// input: dataset (b,n,3)
+// output: idxs (b,m) indices of the farthest point sampling, starting from
+//     the first point. Ties go to the lowest index.
+void farthestpointsampling_cpu(int batch_start, int batch_end, int n, int m, const float * dataset, int * idxs){
+  if (m<=0)
+    return;
+  std::vector<float> temp(n);
+  for (int i=batch_start;i<batch_end;i++){
+    const float * xyz=dataset+i*n*3;
+    std::fill(temp.begin(),temp.end(),1e38f);
+    int old=0;
+    idxs[i*m+0]=old;
+    for (int j=1;j<m;j++){
+      int besti=0;
+      float best=-1;
+      float x1=xyz[old*3+0];
+      float y1=xyz[old*3+1];
+      float z1=xyz[old*3+2];
+      for (int k=0;k<n;k++){
+        float x2=xyz[k*3+0];
+        float y2=xyz[k*3+1];
+        float z2=xyz[k*3+2];
+        float d=(x2-x1)*(x2-x1)+(y2-y1)*(y2-y1)+(z2-z1)*(z2-z1);
+        float d2=std::min(d,temp[k]);
+        temp[k]=d2;
+        if (d2>best){
+          best=d2;
+          besti=k;
+        }
+      }
+      old=besti;
+      idxs[i*m+j]=old;
+    }
+  }
+}
+
+// input: inp (b,n,3), idx (b,m)
+// output: out (b,m,3)
+void gatherpoint_cpu(int batch_start, int batch_end, int n, int m, const float * inp, const int * idx, float * out){
+  for (int i=batch_start;i<batch_end;i++){
+    for (int j=0;j<m;j++){
+      int a=idx[i*m+j];
+      out[(i*m+j)*3+0]=inp[(i*n+a)*3+0];
+      out[(i*m+j)*3+1]=inp[(i*n+a)*3+1];
+      out[(i*m+j)*3+2]=inp[(i*n+a)*3+2];
+    }
+  }
+}
+
+// input: out_g (b,m,3), idx (b,m)
+// output: inp_g (b,n,3), expected to be zero filled
+void scatteraddpoint_cpu(int batch_start, int batch_end, int n, int m, const float * out_g, const int * idx, float * inp_g){
+  for (int i=batch_start;i<batch_end;i++){
+    for (int j=0;j<m;j++){
+      int a=idx[i*m+j];
+      inp_g[(i*n+a)*3+0]+=out_g[(i*m+j)*3+0];
+      inp_g[(i*n+a)*3+1]+=out_g[(i*m+j)*3+1];
+      inp_g[(i*n+a)*3+2]+=out_g[(i*m+j)*3+2];
+    }
+  }
+}
@@ -0,0 +1,95 @@
+import tensorflow as tf
+import numpy as np
+from tf_sampling import farthest_point_sample, gather_point, prob_sample
+
+
+def farthest_point_sample_np(npoint, inp):
+    """Numpy reference of the GPU op, starting from the first point, ties
+    going to the lowest index"""
+    batch_size = inp.shape[0]
+    idx = np.zeros((batch_size, npoint), dtype=np.int32)
+    for i in range(batch_size):
+        min_dist = np.full(inp.shape[1], 1e38, dtype=np.float32)
+        for j in range(1, npoint):
+            dist = np.sum((inp[i] - inp[i, idx[i, j - 1]]) ** 2, axis=1)
+            min_dist = np.minimum(min_dist, dist)
+            idx[i, j] = np.argmax(min_dist)
+    return idx
+
+
+class SamplingCpuTest(tf.test.TestCase):
+    def test_farthest_point_sample(self):
+        rng = np.random.RandomState(0)
+        inp = rng.rand(2, 1024, 3).astype(np.float32)
+        inp[:, 10:20] = inp[:, 9:10]
+
+        with tf.device("/cpu:0"):
+            idx = farthest_point_sample(128, inp)
+        with self.test_session() as sess:
+            idx = sess.run(idx)
+
+        expected_idx = farthest_point_sample_np(128, inp)
+        self.assertEqual(len(np.unique(expected_idx[0])), 128)
+        np.testing.assert_array_equal(idx, expected_idx)
+
+    def test_gather_point(self):
+        rng = np.random.RandomState(1)
+        inp = rng.rand(2, 256, 3).astype(np.float32)
+        idx = rng.randint(256, size=(2, 64)).astype(np.int32)
+
+        with tf.device("/cpu:0"):
+            out = gather_point(inp, idx)
+        with self.test_session() as sess:
+            out = sess.run(out)
+
+        np.testing.assert_array_equal(out, inp[np.arange(2)[:, None], idx])
+
+    def test_prob_sample(self):
+        rng = np.random.RandomState(2)
+        inp = rng.rand(2, 32).astype(np.float32)
+        inp[:, 5:10] = 0
+        inpr = rng.rand(2, 256).astype(np.float32)
+
+        with tf.device("/cpu:0"):
+            out = prob_sample(inp, inpr)
+        with self.test_session() as sess:
+            out = sess.run(out)
+
+        cumsum = np.cumsum(inp, axis=1)
+        for i in range(2):
+            expected_out = np.searchsorted(cumsum[i], inpr[i] * cumsum[i, -1])
+            np.testing.assert_array_equal(out[i], np.minimum(expected_out, 31))
+        self.assertFalse(np.any((out >= 5) & (out < 10)))
+
+    def test_grad(self):
+        with tf.device("/cpu:0"):
+            inp = tf.constant(np.random.random((1, 128, 3)).astype("float32"))
+            idx = tf.constant(np.random.randint(128, size=(1, 16)).astype("int32"))
+            out = gather_point(inp, idx)
+
+        with self.test_session():
+            err = tf.test.compute_gradient_error(inp, (1, 128, 3), out, (1, 16, 3))
+            self.assertLess(err, 1e-4)
+
+    def test_gpu_parity(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest("The GPU kernels are not available")
+        inp = np.random.RandomState(3).rand(2, 2048, 3).astype(np.float32)
+
+        outputs = []
+        for device in ["/cpu:0", "/gpu:0"]:
+            with tf.device(device):
+                inp_tensor = tf.constant(inp)
+                idx = farthest_point_sample(256, inp_tensor)
+                out = gather_point(inp_tensor, idx)
+                grad = tf.gradients(out, inp_tensor, out)[0]
+                outputs.append([idx, out, grad])
+        with self.test_session() as sess:
+            cpu_outputs, gpu_outputs = sess.run(outputs)
+
+        for cpu_output, gpu_output in zip(cpu_outputs, gpu_outputs):
+            np.testing.assert_allclose(cpu_output, gpu_output, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    tf.test.main()
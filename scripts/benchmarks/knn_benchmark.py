@@ -0,0 +1,93 @@
+"""Compares the time and the memory of pointfly.knn_indices_general computing
+the whole distance matrix at once, and tile_size query points at a time,
+over increasing numbers of query points.
+
+Points are uniform in a KITTI like box. Each configuration runs in its own
+process, the peak column is the peak resident memory of that process, the
+D column the size of the distance matrix alive at a time.
+
+Usage:
+    python scripts/benchmarks/knn_benchmark.py --num_points 16384 --k 32
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from hf.core import pointfly as pf
+
+
+def run_knn(args, num_queries, tile_size, result_queue):
+    """Runs one configuration, puts its mean duration in seconds and the peak
+    resident memory of the process in MB"""
+    rng = np.random.RandomState(0)
+    low = [-40.0, -1.0, 0.0]
+    high = [40.0, 3.0, 70.0]
+    points = rng.uniform(low, high, (args.batch_size, args.num_points, 3))
+    queries = points[:, rng.choice(args.num_points, num_queries, replace=False)]
+
+    points_pl = tf.placeholder(tf.float32, (args.batch_size, args.num_points, 3))
+    queries_pl = tf.placeholder(tf.float32, (args.batch_size, num_queries, 3))
+    _, indices = pf.knn_indices_general(
+        queries_pl, points_pl, args.k, tile_size=tile_size
+    )
+    feed_dict = {points_pl: points, queries_pl: queries}
+
+    config = tf.ConfigProto(device_count={"GPU": 0})
+    with tf.Session(config=config) as sess:
+        # Warm up
+        sess.run(indices, feed_dict)
+        start_time = time.time()
+        for _ in range(args.num_runs):
+            sess.run(indices, feed_dict)
+        duration = (time.time() - start_time) / args.num_runs
+
+    # ru_maxrss is in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    result_queue.put((duration, peak_mb))
+
+
+def measure(args, num_queries, tile_size):
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(
+        target=run_knn, args=(args, num_queries, tile_size, result_queue)
+    )
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=2)
+    parser.add_argument("--num_points", type=int, default=16384)
+    parser.add_argument("--k", type=int, default=32)
+    parser.add_argument("--tile_size", type=int, default=512)
+    parser.add_argument("--num_runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        "{:<9}{:>8}{:>12}{:>12}{:>12}".format(
+            "queries", "tile", "D MB", "time ms", "peak MB"
+        )
+    )
+    for num_queries in [1024, 4096, args.num_points]:
+        for tile_size in [0, args.tile_size]:
+            duration, peak_mb = measure(args, num_queries, tile_size)
+            num_rows = tile_size if tile_size > 0 else num_queries
+            matrix_mb = args.batch_size * num_rows * args.num_points * 4 / 2.0**20
+            print(
+                "{:<9}{:>8}{:>12.1f}{:>12.2f}{:>12.1f}".format(
+                    num_queries, tile_size, matrix_mb, duration * 1000, peak_mb
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
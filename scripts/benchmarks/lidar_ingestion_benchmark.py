@@ -0,0 +1,105 @@
+"""Compares the memory allocated and the time spent per frame by the
+lidar ingestion paths.
+
+    legacy: obj_utils.get_lidar_point_cloud, then the split of
+            KittiUtils.get_point_cloud
+    fused:  calib_utils.memmap_lidar + obj_utils.lidar_to_rect_fov, with the
+            transforms from calib_store
+
+Allocations are measured with tracemalloc, which numpy reports its array
+buffers to.
+
+Usage:
+    python scripts/benchmarks/lidar_ingestion_benchmark.py \
+        --data_dir hf/tests/datasets/Kitti/object/training
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from hf.core import calib_store
+from hf.core import calib_utils
+from hf.core import obj_utils
+
+
+def legacy_ingestion(data_dir, img_idx, im_size):
+    point_cloud = obj_utils.get_lidar_point_cloud(
+        img_idx, data_dir + "/calib", data_dir + "/velodyne", im_size=im_size
+    )
+    return point_cloud[:, :-1], point_cloud[:, -1].reshape(-1, 1)
+
+
+def fused_ingestion(data_dir, img_idx, im_size):
+    velo_to_rect, velo_to_image = calib_store.get_velo_transforms(
+        data_dir + "/calib", img_idx
+    )
+    xyzi = calib_utils.memmap_lidar(data_dir + "/velodyne", img_idx)
+    return obj_utils.lidar_to_rect_fov(xyzi, velo_to_rect, velo_to_image, im_size)
+
+
+def measure(ingestion_fn, data_dir, img_indices, im_size):
+    """Returns the mean peak bytes, the mean bytes allocated and the mean
+    time per frame."""
+    peak_bytes = []
+    allocated_bytes = []
+    durations = []
+    for img_idx in img_indices:
+        tracemalloc.start()
+        start_time = time.time()
+        outputs = ingestion_fn(data_dir, img_idx, im_size)
+        durations.append(time.time() - start_time)
+
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Everything still alive is the output, the rest was temporary
+        stats = snapshot.statistics("filename")
+        peak_bytes.append(peak)
+        allocated_bytes.append(sum(stat.size for stat in stats))
+        del outputs
+
+    return np.mean(peak_bytes), np.mean(allocated_bytes), np.mean(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        required=True,
+        help="KITTI split directory containing calib/ and velodyne/",
+    )
+    parser.add_argument("--num_frames", type=int, default=20)
+    parser.add_argument("--im_w", type=int, default=1242)
+    parser.add_argument("--im_h", type=int, default=375)
+    args = parser.parse_args()
+
+    velo_files = sorted(os.listdir(args.data_dir + "/velodyne"))[: args.num_frames]
+    img_indices = [int(os.path.splitext(velo_file)[0]) for velo_file in velo_files]
+    im_size = [args.im_w, args.im_h]
+
+    print("Frames: {}".format(len(img_indices)))
+    print("{:<8}{:>16}{:>16}{:>12}".format("path", "peak KB", "retained KB", "ms"))
+    for name, ingestion_fn in [
+        ("legacy", legacy_ingestion),
+        ("fused", fused_ingestion),
+    ]:
+        # Warm up the page cache
+        measure(ingestion_fn, args.data_dir, img_indices, im_size)
+        peak, retained, duration = measure(
+            ingestion_fn, args.data_dir, img_indices, im_size
+        )
+        print(
+            "{:<8}{:>16.1f}{:>16.1f}{:>12.2f}".format(
+                name, peak / 1024, retained / 1024, duration * 1000
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
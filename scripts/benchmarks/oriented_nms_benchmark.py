@@ -0,0 +1,83 @@
+"""Compares the time spent by the pairwise oriented_nms.nms and the grid
+bucketed oriented_nms.nms_boxes_3d, over increasing numbers of proposals.
+
+Proposals are synthetic: most of them are noisy copies of a few objects, the
+rest are spread over the scene. Both versions are checked to keep the same
+boxes. The pairwise version is slow, it is only run up to
+--max_legacy_boxes proposals.
+
+Usage:
+    python scripts/benchmarks/oriented_nms_benchmark.py --max_output_size 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from hf.core import oriented_nms
+from hf.core import rotated_iou
+
+
+def make_proposals(num_boxes, num_objects=30, fg_fraction=0.7):
+    low = [-30.0, 1.5, 5.0, 3.5, 1.5, 1.4, -np.pi]
+    high = [30.0, 1.8, 70.0, 4.5, 1.8, 1.7, np.pi]
+    objects = np.random.uniform(low, high, (num_objects, 7))
+
+    num_fg_boxes = int(num_boxes * fg_fraction)
+    fg_boxes = objects[np.random.randint(num_objects, size=num_fg_boxes)]
+    fg_boxes += np.random.normal(
+        0, [0.5, 0.1, 0.5, 0.2, 0.1, 0.1, 0.2], (num_fg_boxes, 7)
+    )
+    bg_boxes = np.random.uniform(low, high, (num_boxes - num_fg_boxes, 7))
+
+    boxes_3d = np.concatenate([fg_boxes, bg_boxes])
+    scores = np.random.rand(num_boxes)
+    return boxes_3d, scores
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iou_thresh", type=float, default=0.8)
+    parser.add_argument("--max_output_size", type=int, default=100)
+    parser.add_argument("--max_legacy_boxes", type=int, default=1000)
+    parser.add_argument("--num_runs", type=int, default=3)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+
+    print("{:<8}{:>12}{:>12}{:>10}".format("boxes", "nms ms", "grid ms", "speedup"))
+    for num_boxes in [1000, 5000, 9000]:
+        boxes_3d, scores = make_proposals(num_boxes)
+
+        start_time = time.time()
+        for _ in range(args.num_runs):
+            keep = oriented_nms.nms_boxes_3d(
+                boxes_3d, scores, args.iou_thresh, args.max_output_size
+            )
+        grid_duration = (time.time() - start_time) / args.num_runs
+
+        if num_boxes > args.max_legacy_boxes:
+            print("{:<8}{:>12}{:>12.2f}".format(num_boxes, "-", grid_duration * 1000))
+            continue
+
+        corners = rotated_iou.boxes_3d_to_bev_corners(boxes_3d)
+        start_time = time.time()
+        legacy_keep = oriented_nms.nms(
+            corners, scores, args.iou_thresh, args.max_output_size
+        )
+        legacy_duration = time.time() - start_time
+        np.testing.assert_array_equal(keep, legacy_keep)
+
+        print(
+            "{:<8}{:>12.2f}{:>12.2f}{:>10.2f}".format(
+                num_boxes,
+                legacy_duration * 1000,
+                grid_duration * 1000,
+                legacy_duration / grid_duration,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
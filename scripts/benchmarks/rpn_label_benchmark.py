@@ -0,0 +1,128 @@
+"""Compares the time spent by the per-box loop and the batched
+points-in-boxes labelling of KittiDataset.generate_rpn_training_labels,
+over increasing numbers of ground truth boxes.
+
+Scenes are synthetic: points are spread over the camera field of view, with
+a cluster of points around each box. Both versions are checked to give the
+same labels.
+
+Usage:
+    python scripts/benchmarks/rpn_label_benchmark.py --num_points 16384
+"""
+
+import argparse
+import time
+import types
+
+import numpy as np
+
+from hf.core import box_8c_encoder
+from hf.core import obj_utils
+from hf.datasets.kitti.kitti_dataset import KittiDataset
+
+
+def loop_rpn_training_labels(pts_rect, gt_boxes3d, gt_classes, expand_gt_size):
+    """Per-box labelling, as generate_rpn_training_labels used to do"""
+    cls_label = np.zeros((pts_rect.shape[0]), dtype=np.int32)
+    reg_label = np.zeros((pts_rect.shape[0], 7), dtype=np.float32)
+    extend_gt_boxes3d = gt_boxes3d.copy()
+    extend_gt_boxes3d[:, 3:6] += expand_gt_size * 2
+    extend_gt_boxes3d[:, 1] += expand_gt_size
+
+    gt_corners = box_8c_encoder.np_box_3d_to_box_8co(gt_boxes3d)
+    extend_gt_corners = box_8c_encoder.np_box_3d_to_box_8co(extend_gt_boxes3d)
+
+    for k in range(gt_boxes3d.shape[0]):
+        fg_pt_flag = obj_utils.is_point_inside(pts_rect.T, gt_corners[k].T)
+        cls_label[fg_pt_flag] = gt_classes[k]
+        reg_label[fg_pt_flag, :] = gt_boxes3d[k]
+
+        fg_enlarge_flag = obj_utils.is_point_inside(
+            pts_rect.T, extend_gt_corners[k].T
+        )
+        ignore_flag = np.logical_xor(fg_pt_flag, fg_enlarge_flag)
+        cls_label[ignore_flag] = -1
+
+    return cls_label, reg_label
+
+
+def make_scene(num_points, num_boxes):
+    boxes_3d = np.zeros((num_boxes, 7))
+    boxes_3d[:, 0] = np.random.uniform(-20.0, 20.0, num_boxes)
+    boxes_3d[:, 1] = np.random.uniform(1.5, 1.8, num_boxes)
+    boxes_3d[:, 2] = np.random.uniform(5.0, 60.0, num_boxes)
+    boxes_3d[:, 3] = np.random.uniform(3.5, 4.5, num_boxes)
+    boxes_3d[:, 4] = np.random.uniform(1.5, 1.8, num_boxes)
+    boxes_3d[:, 5] = np.random.uniform(1.4, 1.7, num_boxes)
+    boxes_3d[:, 6] = np.random.uniform(-np.pi, np.pi, num_boxes)
+    classes = np.random.randint(1, 4, num_boxes).astype(np.int32)
+
+    # Half of the points around the boxes, the rest anywhere
+    num_box_points = num_points // 2 // num_boxes
+    box_points = [
+        box_3d[0:3] + np.random.uniform([-3, -2, -3], [3, 0.5, 3], (num_box_points, 3))
+        for box_3d in boxes_3d
+    ]
+    num_scene_points = num_points - num_box_points * num_boxes
+    scene_points = np.random.uniform(
+        [-40.0, -1.0, 0.0], [40.0, 2.5, 70.0], (num_scene_points, 3)
+    )
+    points = np.concatenate(box_points + [scene_points]).astype(np.float32)
+
+    return points, boxes_3d, classes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_points", type=int, default=16384)
+    parser.add_argument("--num_scenes", type=int, default=20)
+    parser.add_argument("--expand_gt_size", type=float, default=0.2)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+
+    # generate_rpn_training_labels only reads the expansion size
+    dataset = types.SimpleNamespace(
+        kitti_utils=types.SimpleNamespace(expand_gt_size=args.expand_gt_size)
+    )
+
+    print("{:<8}{:>12}{:>12}{:>10}".format("boxes", "loop ms", "batched ms", "speedup"))
+    for num_boxes in [1, 5, 10, 20, 40, 80]:
+        scenes = [
+            make_scene(args.num_points, num_boxes) for _ in range(args.num_scenes)
+        ]
+
+        start_time = time.time()
+        loop_labels = [
+            loop_rpn_training_labels(points, boxes_3d, classes, args.expand_gt_size)
+            for points, boxes_3d, classes in scenes
+        ]
+        loop_duration = (time.time() - start_time) / len(scenes)
+
+        start_time = time.time()
+        batched_labels = [
+            KittiDataset.generate_rpn_training_labels(
+                dataset, points, boxes_3d, classes
+            )
+            for points, boxes_3d, classes in scenes
+        ]
+        batched_duration = (time.time() - start_time) / len(scenes)
+
+        for (loop_cls, loop_reg), (batched_cls, batched_reg) in zip(
+            loop_labels, batched_labels
+        ):
+            np.testing.assert_array_equal(batched_cls, loop_cls)
+            np.testing.assert_array_equal(batched_reg, loop_reg)
+
+        print(
+            "{:<8}{:>12.2f}{:>12.2f}{:>10.2f}".format(
+                num_boxes,
+                loop_duration * 1000,
+                batched_duration * 1000,
+                loop_duration / batched_duration,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compares the time of the k-nearest neighbor searches of the PointCNN RPN
+of configs/rpn_cars_pointcnn_paper.config, without deduplication, with the
+former tf.py_func deduplication, and with the in graph
+pointfly.find_duplicate_columns.
+
+The former deduplication is reproduced here with np.full, as the np.fill it
+called does not exist. Points are uniform in a KITTI like box, with
+--duplicate_fraction of them copies of others. Both deduplications are checked
+to find the same neighbours.
+
+Usage:
+    python scripts/benchmarks/unique_knn_benchmark.py --batch_size 3
+"""
+
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from hf.core import pointfly as pf
+
+# (points, queries, k) of the xconv then xdconv layers of the config
+CONFIG_KNN_LAYERS = [
+    (16384, 4096, 16),
+    (16384, 4096, 32),
+    (4096, 1024, 16),
+    (4096, 1024, 32),
+    (1024, 256, 16),
+    (1024, 256, 32),
+    (256, 64, 16),
+    (256, 64, 32),
+    (64, 256, 8),
+    (256, 1024, 8),
+    (1024, 4096, 8),
+    (4096, 16384, 8),
+]
+
+
+def find_duplicate_columns_py_func(A):
+    indices_duplicated = np.full((A.shape[0], 1, A.shape[1]), 1, dtype=np.int32)
+    for idx in range(A.shape[0]):
+        _, indices = np.unique(A[idx], return_index=True, axis=0)
+        indices_duplicated[idx, :, indices] = 0
+    return indices_duplicated
+
+
+def knn_indices(queries, points, k, dedup):
+    D = pf.batch_distance_matrix_general(queries, points)
+    if dedup == "py_func":
+        indices_duplicated = tf.py_func(
+            find_duplicate_columns_py_func, [points], tf.int32
+        )
+        D = pf.prepare_for_unique_top_k(D, points, indices_duplicated)
+    elif dedup == "graph":
+        D = pf.prepare_for_unique_top_k(D, points)
+    return tf.nn.top_k(-D, k=k).indices
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=3)
+    parser.add_argument("--duplicate_fraction", type=float, default=0.1)
+    parser.add_argument("--num_runs", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    low = [-40.0, -5.0, 0.0]
+    high = [40.0, 3.0, 100.0]
+
+    print(
+        "{:<8}{:>8}{:>4}{:>12}{:>12}{:>12}".format(
+            "points", "queries", "k", "none ms", "py_func ms", "graph ms"
+        )
+    )
+    total_durations = np.zeros(3)
+    for num_points, num_queries, k in CONFIG_KNN_LAYERS:
+        points = rng.uniform(low, high, (args.batch_size, num_points, 3))
+        num_duplicates = int(num_points * args.duplicate_fraction)
+        points[:, -num_duplicates:] = points[:, :num_duplicates]
+        queries = points[:, rng.randint(num_points, size=num_queries)]
+
+        graph = tf.Graph()
+        with graph.as_default():
+            points_pl = tf.placeholder(tf.float32, (args.batch_size, num_points, 3))
+            queries_pl = tf.placeholder(tf.float32, (args.batch_size, num_queries, 3))
+            outputs = [
+                knn_indices(queries_pl, points_pl, k, dedup)
+                for dedup in ["none", "py_func", "graph"]
+            ]
+        feed_dict = {points_pl: points, queries_pl: queries}
+
+        durations = []
+        results = []
+        with tf.Session(graph=graph) as sess:
+            for output in outputs:
+                # Warm up
+                results.append(sess.run(output, feed_dict))
+                start_time = time.time()
+                for _ in range(args.num_runs):
+                    sess.run(output, feed_dict)
+                durations.append((time.time() - start_time) / args.num_runs)
+        np.testing.assert_array_equal(results[1], results[2])
+        total_durations += durations
+
+        print(
+            "{:<8}{:>8}{:>4}{:>12.2f}{:>12.2f}{:>12.2f}".format(
+                num_points, num_queries, k, *[d * 1000 for d in durations]
+            )
+        )
+    print(
+        "{:<20}{:>12.2f}{:>12.2f}{:>12.2f}".format(
+            "total", *[d * 1000 for d in total_durations]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()